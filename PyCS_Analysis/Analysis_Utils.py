@@ -13,8 +13,19 @@ sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
 from PyCS_Core.Configuration import read_config, _configuration_path
 import pynbody as pyn
 import numpy as np
+from matplotlib.colors import Colormap
 from PyCS_Core.Logging import set_log, log_print, make_error
 from PyCS_Core.PyCS_Errors import *
+from PyCS_Analysis.Caching import load_snapshot_cache, write_snapshot_cache, has_snapshot_cache
+from PyCS_System.SimulationMangement import SnapshotIndex
+from utils import split, chunk, run_task_queue
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import current_process
+from itertools import repeat
+import hashlib
+import json
+import threading
+import queue
 import warnings
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -41,6 +52,30 @@ rho_critical = 8.5e-27 * pyn.units.Unit("kg m^-3")  # universe critical density.
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # --------------------------------------------- Multi-Processing Functions ----------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def mp_convert_snapshots(output_paths: list, overwrite: bool = False) -> None:
+    """
+    Multi-processing snapshot conversion procedure.
+    Parameters
+    ----------
+    output_paths: (``list``): The list of *absolute paths* to the outputs to be converted.
+    overwrite: (``bool``): If ``True``, outputs which already have an up to date cache are converted again.
+
+    Returns: None
+    -------
+
+    """
+    # DEBUGGING
+    # ---------------------------------------------------------------------------------------------------------------- #
+    fdbg_string = "%smp_convert_snapshots: " % _dbg_string
+    log_print("Attempting to convert %s snaps on process %s." % (len(output_paths), current_process().name),
+              fdbg_string, "info")
+
+    # COMPUTING
+    # ---------------------------------------------------------------------------------------------------------------- #
+    for output_path in output_paths:
+        convert_snapshot(output_path, overwrite=overwrite)
+
+
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------ Classes --------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -50,13 +85,24 @@ class SnapView:
 
     Essentially, we use ``PyCS_Analysis.Analysis_Utils.SnapView`` as an interface by which to load snapshots from file.
     in doing so, we automatically make use of the ``align_snapshot`` functionality.
+
+    If ``families`` and / or ``fields`` are declared, only those families are aligned and converted (and only those
+    fields are loaded up front); everything else is left on disk. This keeps the memory footprint of workers which
+    only need, for example, the dark matter density as small as possible.
+
+    If the output has been converted (see ``convert_snapshot``) and ``CONFIG["analysis"]["cache"]["use_snapshot_cache"]``
+    is set, the converted arrays are opened instead of the RAMSES output.
+
+    The view (centering and rotation) is kept as a single composed transform. Changing the camera is O(1); the declared
+    families (all of them if none were declared) are moved into the view when ``SnapView.snapshot`` is read, so
+    everything which reads positions from a ``SnapView`` sees the view.
     """
     cdbg_string = "%sSnapView:" % _dbg_string
 
     # ----------------------------------------------------------------------------------------------------------------------#
     #      DUNDER METHODS                                                                                                  #
     # ----------------------------------------------------------------------------------------------------------------------#
-    def __init__(self, view_parameters=None):
+    def __init__(self, view_parameters=None, families=None, fields=None):
         """
 
         Parameters
@@ -65,6 +111,10 @@ class SnapView:
 
         view_parameters: The viewing parameters, should be ``dict`` with 2 parameters: ``angles = (az,elev)`` and ``center = (x,y,z)``. Note
         that ``center`` should ALWAYS be in the original frame of reference, not in the prime'd reference frame.
+
+        families: The family names (``gas``, ``dm``, ...) which will be used. Defaults to ``None`` (all families).
+
+        fields: The fields to load for the selected families during ``load_snapshot``. Defaults to ``None`` (lazy).
         """
         # Debugging
         # --------------------------------------------------------------------------------------------------------------#
@@ -84,18 +134,20 @@ class SnapView:
             self.vp = view_parameters
 
         # - Adding additional attributes -#
-        self.snapshot = None  # This stores a snapshot object if we eventually create it.
+        self._snapshot = None  # This stores a snapshot object if we eventually create it.
+        self.families = (list(families) if families is not None else None)
+        self.fields = (list(fields) if fields is not None else None)
 
 
     def __setitem__(self, key, value):
         """
-        Allows the user to set the new values of the ``view_parameters`` in such a way as to immediately facilitate the
-        necessary rotation / centering.
+        Allows the user to set the new values of the ``view_parameters``. The change only updates the view transform of
+        the snapshot (O(1)); the particles are moved when they are next rendered (see ``apply_view``).
 
         Parameters
         ----------
-        key: The ``key`` value to alter, can be either ``center`` or
-        value
+        key: The ``key`` value to alter, can be either ``center`` or ``angles``.
+        value: The new value. ``center`` is always given in the original frame of reference.
 
         Returns
         -------
@@ -112,47 +164,35 @@ class SnapView:
             make_error(KeyError,fdbg_string,"The key %s is not a valid key."%key)
 
         if key == "angles":
-            # We are attempting to alter the angles
-            #- Reversing the original angles -#
-            log_print("Rotating %s -> (0,0)"%str(self.vp["angles"]),fdbg_string,"debug")
-
-            self.snapshot.rotate_x(self.vp["angles"][1])
-            self.snapshot.rotate_z(self.vp["angles"][0])
-
-            #- Applying the new rotations -#
-            log_print("Rotating (0,0) -> %s"%str(value),fdbg_string,"debug")
-
-            self.snapshot.rotate_z(-value[0])
-            self.snapshot.rotate_x(-value[1])
-
             self.vp["angles"] = value
         else:
-            # We are attempting to alter the centering
             # Sanitize
-            if isinstance(value,(list,np.ndarray,tuple)):
+            if isinstance(value,(list,np.ndarray,tuple)) and not isinstance(value,pyn.array.SimArray):
                 value = pyn.array.SimArray(value,CONFIG["units"]["default_length_unit"])
 
-            units = value.units
-
-            # logging
-            log_print("Centering on %s."%str(value),fdbg_string,"debug")
+            self.vp["center"] = value
 
-            # Convering to the correct coordinates #
-            angles = [-np.deg2rad(val) for val in self.vp["angles"]]
-            rot_matrix = np.array([[np.cos(angles[0]),-np.sin(angles[0]),0],
-                                   [np.cos(angles[1])*np.sin(angles[0]),np.cos(angles[1])*np.cos(angles[0]),-np.sin(angles[1])],
-                                   [np.sin(angles[1])*np.sin(angles[0]),np.sin(angles[1])*np.cos(angles[0]),np.cos(angles[1])]])
-            
-            value = np.matmul(rot_matrix,np.array(value).transpose())
-            
-            log_print("Transformed under \n%s \nmatrix (angles=%s->%s). New value is %s."%(rot_matrix,self.vp["angles"],str(angles),str(value)),fdbg_string,"debug")
-            
-            self.snapshot["pos"] -= pyn.array.SimArray(value,units)
+        # - Updating the (lazy) view transform; nothing is moved until a renderer asks for it -#
+        if self._snapshot is not None:
+            set_view(self._snapshot, angles=self.vp["angles"], center=self.vp["center"])
 
-            
     # -----------------------------------------------------------------------------------------------------------------#
-    #     Protected Methods                                                                                            #
+    #     Properties                                                                                                   #
     # -----------------------------------------------------------------------------------------------------------------#
+    @property
+    def snapshot(self):
+        """
+        The loaded snapshot, with the declared families moved into the current view (see ``apply_view``). Families which
+        are already in the view aren't touched, so reading the snapshot repeatedly is cheap.
+        """
+        if self._snapshot is not None:
+            apply_view(self._snapshot, self.families)
+
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, snapshot):
+        self._snapshot = snapshot
 
     # -----------------------------------------------------------------------------------------------------------------#
     #     Methods                                                                                                      #
@@ -175,52 +215,161 @@ class SnapView:
 
         # Loading the snapshot
         #--------------------------------------------------------------------------------------------------------------#
-        snapshot = pyn.load(snapshot_path)
-        self.snapshot = snapshot # grabbing a link
+        #  If there is a converted copy in the snapshot cache, it is already aligned and in physical units, so we
+        #  can skip straight to the centering.
+        #
+        if CONFIG["analysis"]["cache"]["use_snapshot_cache"]:
+            snapshot = load_snapshot_cache(snapshot_path, families=self.families, fields=self.fields)
+        else:
+            snapshot = None
+
+        if snapshot is not None:
+            self._snapshot = snapshot
+            log_print("Loaded %s from the snapshot cache." % snapshot_path, fdbg_string, "debug")
+        else:
+            #  If the gas isn't needed, we don't even let pynbody read the AMR / hydro files.
+            #
+            if self.families is not None and "gas" not in self.families:
+                snapshot = pyn.load(snapshot_path, with_gas=False)
+            else:
+                snapshot = pyn.load(snapshot_path)
+            self._snapshot = snapshot # grabbing a link
 
-        # Sanitizing, Aligning, changing boxsize
+            # Sanitizing, Aligning, changing boxsize
+            #----------------------------------------------------------------------------------------------------------#
+            align_snapshot(self._snapshot, families=self.families, fields=self.fields)
+
+        # - Recording where the snapshot came from; this is what the image cache is keyed on -#
+        get_snapshot_state(self._snapshot)["source"] = os.path.abspath(snapshot_path)
+
+        # Managing the View
         #--------------------------------------------------------------------------------------------------------------#
-        #- Santizing -#
+        #  The centering and rotation are only recorded here. They are applied to the particles of the declared
+        #  families when the snapshot is read from the view (see ``SnapView.snapshot`` and ``apply_view``).
+        #
+        set_view(self._snapshot, angles=self.vp["angles"], center=self.vp["center"])
+        log_print("Set the view to center=%s, angles=%s." % (self.vp["center"], str(self.vp["angles"])), fdbg_string,
+                  "debug")
+
+        log_print("Aligned %s." % self._snapshot, fdbg_string, "debug")
+
+
+class SnapshotPrefetcher:
+    """
+    Iterates over a list of snapshot paths, yielding ``(path, snapshot)`` pairs of loaded and aligned snapshots. The
+    next ``depth`` snapshots are read on a background thread while the current one is being processed, so the disk
+    reads overlap with the rendering.
+
+    A new snapshot is only read ahead if the free memory can hold it (estimated from the size of the last snapshot);
+    otherwise the thread waits until the consumer has caught up.
+    """
+    def __init__(self, paths: list, view_parameters=None, families=None, fields=None, depth: int = None):
+        """
+        Initializes the ``SnapshotPrefetcher``.
+        Parameters
+        ----------
+        paths: The list of paths to the ``output_XXXXX`` directories.
+        view_parameters: The view parameters to pass to ``SnapView``.
+        families: The families to load (see ``SnapView``).
+        fields: The fields to align (see ``SnapView``).
+        depth: The number of snapshots to read ahead. Defaults to ``CONFIG["system"]["multiprocessing"]["prefetch_depth"]``.
+            A depth of 0 loads each snapshot when it is asked for.
+        """
+        self.paths = list(paths)
+        self.view_parameters = view_parameters
+        self.families = families
+        self.fields = fields
+        self.depth = (depth if depth is not None else CONFIG["system"]["multiprocessing"]["prefetch_depth"])
+        self.cdbg_string = "%sSnapshotPrefetcher: " % _dbg_string
+
+        # - Threading -#
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(max(self.depth, 1))
+        self._stop = threading.Event()
+        self._waiting = threading.Event()  # set while the consumer is waiting for the next snapshot.
+        self._thread = None
+        self._last_size = 0  # The size (bytes) of the last snapshot read.
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for path in self.paths:
+                yield path, self._load(path)
+            return
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
         try:
-            boxlength = self.snapshot.properties[
-                            "boxsize"] / 2  # This is the distance from (0,0,0) of the center of the sim box.
-        except KeyError:
-            raise IsNotRAMSESError("The simulation is not a RAMSES snapshot.")
-        except AttributeError:
-            raise IsNotRAMSESError("The simulation is not a RAMSES snapshot.")
+            for _ in self.paths:
+                self._waiting.set()
+                path, snapshot, error = self._queue.get()
+                self._waiting.clear()
+                self._slots.release()  # frees a slot for the next read.
 
-        ##- Increasing the boxsize -##
-        self.snapshot.properties["boxsize"] = 2 * self.snapshot.properties["boxsize"]
+                if error is not None:
+                    raise error
 
-        #- Aligning -#
-        self.snapshot["pos"] -= boxlength
+                yield path, snapshot
+                del snapshot
+        finally:
+            self.close()
 
-        ##- Managing Units -##
-        self.snapshot.physical_units()  # convert from raw computational units to CSG units.
+    def close(self) -> None:
+        """
+        Stops the background thread. Any snapshots which were read ahead are discarded.
+        """
+        self._stop.set()
+        self._waiting.set()
+        self._slots.release()
 
-        # Centering
-        #--------------------------------------------------------------------------------------------------------------#
-        #  IN this 1 case, we are able to center with simplicity because we do not need to worry about the
-        #  orientation.
-        #
-        self.snapshot["pos"] -= self.vp["center"]
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
-        log_print("Centered the snapshot at location %s."%self.vp["center"],fdbg_string,"debug")
-        # Managing the View
-        #--------------------------------------------------------------------------------------------------------------#
-        #  REMEMBER: We are not being as careful as is possible. We apply THE Z ROTATION first, then rotate
-        #            about the x-axis as we apply the elevation change.
-        #
-        if self.vp["angles"] != [0,0]:
-            # we actually have angles to apply.
-            self.snapshot.rotate_z(-self.vp["angles"][0])
-            self.snapshot.rotate_x(-self.vp["angles"][1])
+        while not self._queue.empty():
+            self._queue.get()
 
-            log_print("Centered the snapshot on angles %s."%str(self.vp["angles"]),fdbg_string,"debug")
-        else:
-            pass
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Methods                                                                                                      #
+    # -----------------------------------------------------------------------------------------------------------------#
+    def _load(self, path: str) -> pyn.snapshot.SimSnap:
+        view = SnapView(view_parameters=self.view_parameters, families=self.families, fields=self.fields)
+        view.load_snapshot(path)
+        snapshot = view.snapshot
+        view.snapshot = None
+        self._last_size = get_snapshot_nbytes(snapshot)
+        return snapshot
+
+    def _has_room(self) -> bool:
+        """
+        Checks that the free memory can hold another snapshot (the size of the last snapshot read is used).
+        """
+        available = get_available_memory()
+
+        if available is None or not self._last_size:
+            return True
+        return self._last_size <= CONFIG["system"]["multiprocessing"]["prefetch_memory_fraction"] * available
+
+    def _run(self) -> None:
+        fdbg_string = "%s_run: " % self.cdbg_string
+
+        for path in self.paths:
+            self._slots.acquire()
+
+            # - Waiting for memory before every read. Once the consumer is waiting for this snapshot it is read anyway -#
+            while not self._stop.is_set() and not self._waiting.is_set() and not self._has_room():
+                log_print("Not enough free memory to prefetch %s. Waiting." % path, fdbg_string, "debug")
+                self._waiting.wait(1)
 
-        log_print("Aligned %s." % self.snapshot, fdbg_string, "debug")
+            if self._stop.is_set():
+                return
+
+            try:
+                log_print("Prefetching %s." % path, fdbg_string, "debug")
+                self._queue.put((path, self._load(path), None))
+            except BaseException as error:
+                self._queue.put((path, None, error))
+                return
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # --------------------------------------------------- Sub-Functions -----------------------------------------------------#
@@ -277,12 +426,17 @@ def find_gas_COM(snapshot, cutoff_parameter=0.5):
     ####################################################################################################################
 
 
-def align_snapshot(snapshot) -> None:
+def align_snapshot(snapshot, families=None, fields=None) -> None:
     """
     Aligns a RAMSES snapshot and fixes the units.
+
+    If ``families`` is specified, only the positions of those families are loaded and shifted. Arrays which are loaded
+    later are converted to physical units on load, but the positions of any other family will **not** be aligned.
     Parameters
     ----------
     snapshot: The snapshot in question.
+    families: The family names to align. Defaults to ``None`` (all families).
+    fields: Fields to load (and convert) for the aligned families now rather than lazily. Defaults to ``None``.
 
     Returns: None
     -------
@@ -305,13 +459,28 @@ def align_snapshot(snapshot) -> None:
     snapshot.properties["boxsize"] = 2 * snapshot.properties["boxsize"]
 
     ##- Aligning -##
+    if families is None:
+        snapshot["pos"] -= boxlength
+    else:
+        for family in get_families(snapshot, families):
+            snapshot[family]["pos"] -= boxlength
 
-    snapshot["pos"] -= boxlength
+    mark_modified(snapshot, ["pos"])
 
     ##- Filtering -##
 
     ##- Managing Units -##
     snapshot.physical_units()  # convert from raw computational units to CSG units.
+
+    ##- Loading declared fields -##
+    if fields:
+        for family in (get_families(snapshot, families) if families is not None else snapshot.families()):
+            for field in fields:
+                try:
+                    snapshot[family][field]
+                except KeyError:
+                    log_print("Field %s is not available for family %s." % (field, family.name), fdbg_string, "debug")
+
     log_print("Aligned %s." % snapshot, fdbg_string, "debug")
 
 
@@ -353,6 +522,190 @@ def smooth_out(snapshot, family):
     snapshot[fam]["rho"] = pyn.sph.rho(snapshot[fam])
 
 
+def get_render_threads(nproc: int = 1) -> int:
+    """
+    Returns the number of threads each of ``nproc`` processes should render with. If
+    ``CONFIG["system"]["multiprocessing"]["render_threads"]`` is 0, the available cores are split evenly between the
+    processes so that processes x threads matches the cores (or the CPU set given to the job by SLURM).
+
+    Worker processes started by ``run_snapshot_tasks`` inherit their share through the ``PYCS_RENDER_THREADS``
+    environment variable.
+    Parameters
+    ----------
+    nproc: The number of processes which are rendering at once.
+
+    Returns: The number of threads.
+    -------
+
+    """
+    if not CONFIG["system"]["multiprocessing"]["threaded"]:
+        return 1
+    elif os.environ.get("PYCS_RENDER_THREADS"):
+        return int(os.environ["PYCS_RENDER_THREADS"])
+    elif CONFIG["system"]["multiprocessing"]["render_threads"]:
+        return int(CONFIG["system"]["multiprocessing"]["render_threads"])
+
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    return max(cores // max(int(nproc), 1), 1)
+
+
+def get_task_size(n_outputs: int, nproc: int) -> int:
+    """
+    Returns the number of snapshots in each task when ``n_outputs`` snapshots are split over ``nproc`` processes. If
+    ``CONFIG["system"]["multiprocessing"]["task_size"]`` is 0, each process gets about two contiguous runs of snapshots:
+    long enough for the prefetch and the per-task state (i.e. the center search width) to carry over, short enough
+    that a slow run doesn't hold up the end of the queue.
+    Parameters
+    ----------
+    n_outputs: The number of snapshots.
+    nproc: The number of processes.
+
+    Returns: The task size.
+    -------
+
+    """
+    if CONFIG["system"]["multiprocessing"]["task_size"]:
+        return max(int(CONFIG["system"]["multiprocessing"]["task_size"]), 1)
+
+    return max(-(-int(n_outputs) // (2 * max(int(nproc), 1))), 1)
+
+
+def run_snapshot_tasks(function, outputs: list, args: list, kwargs, nproc: int, star: bool = False,
+                       callback=None, error_callback=None) -> list:
+    """
+    Runs ``function`` over ``outputs`` on the dynamic task queue (see ``utils.run_task_queue``). The outputs are
+    grouped into contiguous tasks of ``get_task_size`` snapshots, each of which is called as
+    ``function(([task_outputs,*args],kwargs))`` (or ``function(task_outputs,*args)`` if ``star``).
+    Parameters
+    ----------
+    function: The (module level) function to run.
+    outputs: The outputs to process.
+    args: The additional args for each task.
+    kwargs: The kwargs for each task. Ignored if ``star``.
+    nproc: The number of processes to use.
+    star: True if the function takes its arguments directly.
+    callback: Called with the outputs of each task as soon as the task completes (i.e. to record progress).
+    error_callback: Called with the outputs of each task as soon as the task has failed on every attempt.
+
+    Returns: The list of outputs which failed on every attempt.
+    -------
+
+    """
+    fdbg_string = "%srun_snapshot_tasks: " % _dbg_string
+    settings = CONFIG["system"]["multiprocessing"]
+
+    partition = chunk(outputs, get_task_size(len(outputs), nproc))
+
+    if star:
+        tasks = [(part, *args) for part in partition]
+    else:
+        tasks = [([part, *args], kwargs) for part in partition]
+
+    log_print("Running %s over %s tasks on %s processes." % (function.__name__, len(tasks), nproc), fdbg_string, "debug")
+
+    # - The workers split the cores between them (see ``get_render_threads``) -#
+    environment = os.environ.get("PYCS_RENDER_THREADS")
+    os.environ["PYCS_RENDER_THREADS"] = str(get_render_threads(min(nproc, max(len(tasks), 1))))
+
+    try:
+        _, failures = run_task_queue(function, tasks, nproc, max_tasks_per_child=settings["max_tasks_per_child"],
+                                     retries=settings["task_retries"], star=star,
+                                     callback=((lambda index, _: callback(partition[index])) if callback else None),
+                                     error_callback=((lambda index, _: error_callback(partition[index])) if
+                                                     error_callback else None))
+    finally:
+        if environment is None:
+            del os.environ["PYCS_RENDER_THREADS"]
+        else:
+            os.environ["PYCS_RENDER_THREADS"] = environment
+
+    # - Reporting the failures -#
+    failed = []
+    for index, message in sorted(failures.items()):
+        failed += list(partition[index])
+        log_print("Failed to process %s:\n%s" % (", ".join(partition[index]), message), fdbg_string, "error")
+
+    if len(failed):
+        log_print("%s of %s outputs failed." % (len(failed), len(outputs)), fdbg_string, "warning")
+
+    return failed
+
+
+def get_sequence_key(parameters: dict) -> tuple:
+    """
+    Computes the key of a sequence from its parameters. Sequences with the same parameters share an output directory,
+    so that a sequence can be resumed or extended (see ``SequenceManifest``). Parameters which don't change the frames
+    (``threads``, ``cube``, ``movie``, ``resume``, ``series``) are left out.
+    Parameters
+    ----------
+    parameters: The parameters of the sequence (i.e. the quantity and the plotting kwargs).
+
+    Returns: ``(key, description)``; the description is the JSON of the parameters which were hashed.
+    -------
+
+    """
+    description = json.dumps({key: value for key, value in parameters.items() if
+                              key not in ["threads", "cube", "movie", "resume", "series"]},
+                             sort_keys=True, default=_parameter_string)
+
+    return hashlib.sha1(description.encode()).hexdigest()[:12], description
+
+
+def _parameter_string(value):
+    """
+    JSON fallback for the sequence parameters: colormaps by name and arrays (with their units) as lists.
+    """
+    if isinstance(value, Colormap):
+        return value.name
+    elif isinstance(value, np.ndarray):
+        return [value.tolist(), str(getattr(value, "units", ""))]
+    else:
+        return str(value)
+
+
+def get_snapshot_nbytes(snapshot) -> int:
+    """
+    Returns the number of bytes taken up by the loaded arrays of ``snapshot``. Arrays which are views of another array
+    (i.e. ``x`` of ``pos``) are only counted once.
+    """
+    arrays = [snapshot[key] for key in snapshot.keys()]
+
+    for family in snapshot.families():
+        arrays += [snapshot[family][key] for key in snapshot.family_keys() if key in snapshot[family].keys()]
+
+    buffers = {}
+    for array in arrays:
+        while isinstance(array.base, np.ndarray):
+            array = array.base
+        buffers[id(array)] = array.nbytes
+
+    return int(sum(buffers.values()))
+
+
+def get_available_memory():
+    """
+    Returns the available physical memory (bytes), or ``None`` if it can't be determined on this platform. On Linux
+    this is ``MemAvailable`` from ``/proc/meminfo``, which (unlike the free pages) counts the page cache which can be
+    reclaimed, i.e. the memory mapped snapshot cache.
+    """
+    try:
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024  # reported in kB.
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
 def get_families(snapshot, family_names: list):
     """
     Checks the snapshot for a matching family name.
@@ -378,6 +731,172 @@ def get_families(snapshot, family_names: list):
 
 # PROFILE CREATION Functions
 # ----------------------------------------------------------------------------------------------------------------------#
+#   Binning a profile sorts every particle of the profiled family, which dominates the cost of a profile plot. Profiles
+#   are therefore kept on the snapshot they were made from, keyed by the family, the view and every kwarg of the
+#   profile. The binning itself only depends on the positions, the masses and the weights, so a profile is only rebuilt
+#   once one of those has been marked as modified since. The quantities a profile has already binned (i.e. a derived
+#   ``temp``) are cached inside of it; those of any other modified field are dropped and binned again when asked for.
+#
+
+
+def get_profile(snapshot, family: str = None, **kwargs):
+    """
+    Returns the ``pyn.analysis.profile.Profile`` of ``snapshot`` (or of one of its families) with the given binning,
+    reusing a previously binned profile whenever the kwargs, the family and the view are unchanged and none of the
+    positions, masses or weights have been modified since (see ``mark_modified``). Every quantity of the returned
+    profile is computed lazily, so any number of quantities can be read from a single binning.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot) to profile.
+    family: The family name to profile. Defaults to ``None`` (all families).
+    kwargs: The kwargs to pass to ``pyn.analysis.profile.Profile`` (``ndim``, ``nbins``, ``type``, ``rmin``, ``rmax``,
+        ...).
+
+    Returns: The profile.
+    -------
+
+    """
+    fdbg_string = "%sget_profile: " % _dbg_string
+
+    # - moving the particles into view before the generations are read -#
+    apply_view(snapshot, ([family] if family else None))
+
+    state = get_snapshot_state(snapshot)
+    view = state.get("view", None)
+
+    key = (family,
+           str(view["center"] if view else None),
+           str(np.round(view["matrix"], decimals=10).tolist() if view else None),
+           *sorted((name, str(value)) for name, value in kwargs.items()))
+    weight_by = kwargs.get("weight_by", "mass")
+    token = tuple(state["generations"].get(field, 0) for field in
+                  ["pos", "mass"] + ([weight_by] if isinstance(weight_by, str) else []))
+
+    if not hasattr(snapshot, "_pycs_profiles"):
+        snapshot._pycs_profiles = {}
+
+    if key in snapshot._pycs_profiles and snapshot._pycs_profiles[key][0] == token:
+        log_print("Using the cached %s profile of %s." % (family, snapshot), fdbg_string, "debug")
+        _, profile, generations = snapshot._pycs_profiles[key]
+
+        # - Dropping the binned quantities of the fields which were modified since -#
+        modified = [field for field, generation in state["generations"].items() if
+                    generations.get(field, 0) != generation]
+
+        if len(modified):
+            _invalidate_profile(profile, modified)
+            generations.update(state["generations"])
+
+        return profile
+
+    # - building the profile -#
+    if family:
+        families = get_families(snapshot, [family])
+
+        if not len(families):
+            make_error(ValueError, fdbg_string, "Failed to recognize family input %s" % family)
+            return None
+
+        profile = pyn.analysis.profile.Profile(snapshot[families[0]], **kwargs)
+    else:
+        profile = pyn.analysis.profile.Profile(snapshot, **kwargs)
+
+    snapshot._pycs_profiles[key] = (token, profile, dict(state["generations"]))
+    return profile
+
+
+def _invalidate_profile(profile, fields: list) -> None:
+    """
+    Removes the quantities of ``profile`` which were binned from any of ``fields`` (i.e. ``temp``, ``temp_disp`` and
+    ``d_temp`` for ``temp``, or ``vx`` for ``vel``). Quantities from pynbody's profile registry (``density``,
+    ``v_circ``, ...) may read any field, so they are always removed.
+    """
+    fields = set(fields)
+
+    for name in list(profile._profiles):
+        if name == "n":  # the particle counts of the bins.
+            continue
+
+        source = (name[2:] if name.startswith("d_") else name)
+        for suffix in ["_disp", "_rms", "_med"]:
+            if source.endswith(suffix):
+                source = source[:-len(suffix)]
+
+        sources = {name, source, profile.sim._array_name_1D_to_ND(source)}
+
+        if name.split(",")[0] in pyn.analysis.profile.Profile._profile_registry or len(sources & fields):
+            del profile._profiles[name]
+
+
+def evaluate_chunked(snapshot, name: str, inputs: list, kernel, units, chunk_size: int = None, dtype=None):
+    """
+    Evaluates a derived gas field in fixed-size chunks.
+
+    The output array is allocated once (directly in the snapshot where possible) and ``kernel`` writes each chunk into
+    it in place, so the peak memory is bounded by the output array plus the temporaries of a single chunk.
+    Parameters
+    ----------
+    snapshot: The snapshot.
+    name: The name of the derived field.
+    inputs: The (gas) fields passed to the kernel.
+    kernel: Function ``kernel(out, *inputs)`` which writes one chunk of the field into ``out``. The inputs are plain
+        ``np.ndarray`` chunks in the units of the snapshot; unit conversion factors should be precomputed.
+    units: The units of the output.
+    chunk_size: The number of cells per chunk. Defaults to ``CONFIG["analysis"]["derived_fields"]["chunk_size"]``.
+    dtype: The output dtype. Defaults to ``CONFIG["analysis"]["derived_fields"]["dtype"]``.
+
+    Returns: None
+    -------
+
+    """
+    # Setup
+    ####################################################################################################################
+    if not chunk_size:
+        chunk_size = CONFIG["analysis"]["derived_fields"]["chunk_size"]
+    if not dtype:
+        dtype = CONFIG["analysis"]["derived_fields"]["dtype"]
+
+    gas = snapshot.g
+    buffers = [gas[field].view(np.ndarray) for field in inputs]  # no unit bookkeeping in the loop.
+
+    # - Allocating the output -#
+    #   An existing array of the right dtype is simply overwritten; otherwise we allocate in the snapshot directly so
+    #   that there is no full-size copy when the result is stored.
+    #
+    if name in gas.keys() and gas[name].dtype == np.dtype(dtype) and gas[name].ndim == 1:
+        output = gas[name].view(np.ndarray)
+        in_place = True
+    else:
+        if name in gas.keys():
+            del (snapshot.ancestor if name in snapshot.ancestor.keys() else gas)[name]
+
+        try:
+            gas._create_array(name, dtype=dtype, zeros=False)
+            output = gas[name].view(np.ndarray)
+            in_place = True
+        except (AttributeError, TypeError):
+            output = np.empty(len(gas), dtype=dtype)
+            in_place = False
+
+    # Evaluating
+    ####################################################################################################################
+    for start in range(0, len(gas), chunk_size):
+        stop = min(start + chunk_size, len(gas))
+        kernel(output[start:stop], *[buffer[start:stop] for buffer in buffers])
+
+    if in_place:
+        gas[name].units = pyn.units.Unit(units)
+    else:
+        gas[name] = pyn.array.SimArray(output, pyn.units.Unit(units))
+
+
+def _conversion_factor(array, units) -> float:
+    """
+    The factor which converts ``array`` (in its own units) into ``units``.
+    """
+    return float(array.units.ratio(units, **array.conversion_context()))
+
+
 def make_pseudo_entropy(snapshot):
     """
     Produces a pseudo_entropy array for the gas in the snapshot.
@@ -405,17 +924,20 @@ def make_pseudo_entropy(snapshot):
     # making correct conversions
     ####################################################################################################################
     # - constants -#
-    k_b = boltzmann.in_units("keV K^-1")  # boltzmann constant
+    k_b = float(boltzmann.in_units("keV K^-1"))  # boltzmann constant
     m_p = 1.67262192369e-24  # proton mass (grams)
 
     # - converting units -#
-    rho = snapshot.g["rho"].in_units("g cm^-3")  # converting rho to units of g/cm^3.
-    temp = snapshot.g["temp"].in_units("K")  # grabbing numerical
+    n_factor = _conversion_factor(snapshot.g["rho"], "g cm^-3") / (1.252 * m_p)  # rho -> n_e (cm^-3)
+    t_factor = k_b * _conversion_factor(snapshot.g["temp"], "K")  # T -> k_b T (keV)
 
-    entropy = k_b * temp * (((rho) / (1.252 * m_p)) ** (-2 / 3))
+    def kernel(out, rho, temp):
+        np.multiply(rho, n_factor, out=out)
+        np.power(out, -2 / 3, out=out)
+        np.multiply(out, temp, out=out)
+        np.multiply(out, t_factor, out=out)
 
-    snapshot.g["entropy"] = entropy
-    snapshot.g["entropy"].units = pyn.units.Unit("keV cm^2")
+    evaluate_chunked(snapshot, "entropy", ["rho", "temp"], kernel, "keV cm^2")
 
 
 def make_mach_number(snapshot):
@@ -437,20 +959,49 @@ def make_mach_number(snapshot):
     fdbg_string = "%smake_mach_number: " % _dbg_string
     log_print("Attempting to generate mach number array for %s." % snapshot, fdbg_string, "debug")
 
-    # Generating the underlying velocity
-    ####################################################################################################################
-    # - Comutations -#
-    snapshot.g["v2"] = np.sum(snapshot.g["vel"] ** 2, axis=1)  # generates the square velocity.
-
     # Computing the MACH number
     ####################################################################################################################
-    snapshot.g["mach"] = np.sqrt((snapshot.g["rho"] * snapshot.g["v2"]) / ((5 / 3) * snapshot.g["p"]))
+    factor = float((snapshot.g["rho"].units * snapshot.g["vel"].units ** 2 / snapshot.g["p"].units).dimensionless_constant(
+        **snapshot.g["rho"].conversion_context())) / (5 / 3)
+
+    def kernel(out, rho, vel, p):
+        np.einsum("ij,ij->i", vel, vel, out=out, casting="same_kind")  # the square velocity.
+        np.multiply(out, rho, out=out)
+        np.divide(out, p, out=out)
+        np.multiply(out, factor, out=out)
+        np.sqrt(out, out=out)
+
+    evaluate_chunked(snapshot, "mach", ["rho", "vel", "p"], kernel, "1")
+
 
 def generate_speed_of_sound(snapshot):
+    """
+    Generates the (adiabatic, gamma = 5/3) speed of sound of the gas in the snapshot in km/s.
+
+    We use the formula c_s = sqrt(gamma * p / rho)
+
+    Parameters
+    ----------
+    snapshot: The snapshot object to construct the array for.
+
+    Returns: None
+    -------
+
+    """
     fdbg_string = "%sgenerate_speed_of_sound: " % _dbg_string
-    log_print("Attempting to generate mach number array for %s." % snapshot, fdbg_string, "debug")
+    log_print("Attempting to generate speed of sound array for %s." % snapshot, fdbg_string, "debug")
+
+    factor = (5 / 3) * float((snapshot.g["p"].units / snapshot.g["rho"].units).ratio(
+        "km^2 s^-2", **snapshot.g["p"].conversion_context()))
+
+    def kernel(out, rho, p):
+        np.divide(p, rho, out=out, casting="same_kind")
+        np.multiply(out, factor, out=out)
+        np.sqrt(out, out=out)
+
+    evaluate_chunked(snapshot, "sound_speed", ["rho", "p"], kernel, "km s^-1")
+
 
-    snapshot.g["sound_speed"] =np.sqrt(((5 / 3) * snapshot.g["p"])/(snapshot.g["rho"]))
 def generate_xray_emissivity(snapshot) -> None:
     """
     Generates the x-ray emissivity associated with the given snapshot.
@@ -474,11 +1025,317 @@ def generate_xray_emissivity(snapshot) -> None:
     fdbg_string = "%sgenerate_xray_emissivity: " % _dbg_string
     log_print("Generating the x-ray emissivity array for snapshot %s." % (snapshot), fdbg_string, "debug")
 
-    # - Producing the necessary computation -#
-    snapshot.g["xray"] = pyn.array.SimArray(
-        (3.0e-27) * np.sqrt(snapshot.g["temp"].in_units("K") / pyn.units.Unit("1 K")) * (((snapshot.g["rho"].in_units(
-            "kg cm^-3") / pyn.units.Unit("kg cm^-3")) / (m_p.in_units("kg") * mass_fraction)) ** 2),
-        pyn.units.Unit("erg cm^-3 s^-1"))
+    # - Precomputing the conversions -#
+    n_factor = _conversion_factor(snapshot.g["rho"], "kg cm^-3") / float(m_p.in_units("kg") * mass_fraction)
+    t_factor = _conversion_factor(snapshot.g["temp"], "K")
+
+    def kernel(out, rho, temp):
+        np.multiply(rho, n_factor, out=out)
+        np.square(out, out=out)
+        np.multiply(out, np.sqrt(temp * t_factor), out=out)
+        np.multiply(out, 3.0e-27, out=out)
+
+    evaluate_chunked(snapshot, "xray", ["rho", "temp"], kernel, "erg cm^-3 s^-1")
+
+
+# DERIVED FIELD REGISTRY
+# ----------------------------------------------------------------------------------------------------------------------#
+#   Every derived field declares the fields it is computed from. ``derive_fields`` computes each field at most once per
+#   snapshot and recomputes it only once one of its inputs has been marked as modified (see ``mark_modified``).
+#
+derived_fields = {
+    "entropy"    : {
+        "function": make_pseudo_entropy,
+        "inputs"  : ["rho", "temp"],
+        "families": ["gas"],
+        "unit"    : "keV cm^2",
+        "fancy"   : "Entropy"
+    },
+    "mach"       : {
+        "function": make_mach_number,
+        "inputs"  : ["rho", "vel", "p"],
+        "families": ["gas"],
+        "unit"    : "",
+        "fancy"   : "Mach Number"
+    },
+    "xray"       : {
+        "function": generate_xray_emissivity,
+        "inputs"  : ["rho", "temp"],
+        "families": ["gas"],
+        "unit"    : "erg cm^-3 s^-1",
+        "fancy"   : r"\epsilon^{ff}"
+    },
+    "sound_speed": {
+        "function": generate_speed_of_sound,
+        "inputs"  : ["rho", "p"],
+        "families": ["gas"],
+        "unit"    : "km s^-1",
+        "fancy"   : r"c_{s,\rho}"
+    }
+}
+
+
+def get_snapshot_state(snapshot) -> dict:
+    """
+    Returns the PyCS bookkeeping attached to the **base** snapshot of ``snapshot``. The state holds a generation counter
+    for each field which has been marked as modified and the input generations each derived field was computed from.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot).
+
+    Returns: The state ``dict``.
+    -------
+
+    """
+    ancestor = snapshot.ancestor
+
+    if not hasattr(ancestor, "_pycs_state"):
+        ancestor._pycs_state = {"generations": {}, "derived": {}}
+
+    return ancestor._pycs_state
+
+
+def mark_modified(snapshot, fields: list) -> None:
+    """
+    Marks ``fields`` as modified so that any derived field computed from them is recomputed on the next request.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot) which was modified.
+    fields: The names of the modified fields.
+
+    Returns: None
+    -------
+
+    """
+    state = get_snapshot_state(snapshot)
+
+    for field in fields:
+        state["generations"][field] = state["generations"].get(field, 0) + 1
+
+
+def derive_fields(snapshot, qtys: list) -> None:
+    """
+    Makes sure that each of the derived fields in ``qtys`` exists and is up to date. Quantities which are not in the
+    ``derived_fields`` registry are ignored, so it is safe to pass every quantity a plot needs.
+
+    Derived fields are always computed on the base snapshot so that a later request on a different sub-snapshot can
+    reuse them.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot).
+    qtys: The quantities which are needed.
+
+    Returns: None
+    -------
+
+    """
+    fdbg_string = "%sderive_fields: " % _dbg_string
+    state = get_snapshot_state(snapshot)
+
+    for qty in qtys:
+        if qty not in derived_fields:
+            continue
+
+        # - Checking for a valid memoized copy -#
+        input_generations = {field: state["generations"].get(field, 0) for field in derived_fields[qty]["inputs"]}
+
+        exists = (qty in snapshot.ancestor.keys()) or (qty in snapshot.ancestor.family_keys())
+
+        if state["derived"].get(qty, None) == input_generations and exists:
+            log_print("Using the memoized %s array." % qty, fdbg_string, "debug")
+            continue
+
+        # - Computing -# only a recomputation modifies the field; nothing can have read it before it first existed.
+        recomputed = qty in state["derived"]
+        derived_fields[qty]["function"](snapshot.ancestor)
+        state["derived"][qty] = input_generations
+
+        if recomputed:
+            mark_modified(snapshot, [qty])
+
+
+# VIEW TRANSFORMS
+# ----------------------------------------------------------------------------------------------------------------------#
+#   A view is the composed transform pos' = R (pos - c) with R = R_x(-elevation) R_z(-azimuth), which is the same
+#   convention as rotating with ``rotate_z(-az)`` followed by ``rotate_x(-elev)``. Setting a view is O(1); the particles
+#   of a family are only moved (in a single pass) when ``apply_view`` is called for that family.
+#
+def get_view_matrix(angles) -> np.ndarray:
+    """
+    Returns the rotation matrix R = R_x(-elevation) R_z(-azimuth) for ``angles = (azimuth, elevation)`` in degrees.
+    """
+    azimuth, elevation = [-np.deg2rad(float(angle)) for angle in angles]
+
+    r_z = np.array([[np.cos(azimuth), -np.sin(azimuth), 0],
+                    [np.sin(azimuth), np.cos(azimuth), 0],
+                    [0, 0, 1]])
+    r_x = np.array([[1, 0, 0],
+                    [0, np.cos(elevation), -np.sin(elevation)],
+                    [0, np.sin(elevation), np.cos(elevation)]])
+
+    return np.matmul(r_x, r_z)
+
+
+def set_view(snapshot, angles=None, center=None) -> None:
+    """
+    Sets the view of the snapshot. Nothing is moved until ``apply_view`` is called.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot).
+    angles: ``(azimuth, elevation)`` in degrees. Defaults to ``(0,0)``.
+    center: The view center **in the original frame**. Floats are taken to be in the default length unit.
+
+    Returns: None
+    -------
+
+    """
+    if angles is None:
+        angles = [0, 0]
+    if center is None:
+        center = pyn.array.SimArray([0, 0, 0], CONFIG["units"]["default_length_unit"])
+    elif not isinstance(center, pyn.array.SimArray):
+        center = pyn.array.SimArray(center, CONFIG["units"]["default_length_unit"])
+
+    get_snapshot_state(snapshot)["view"] = {"matrix": get_view_matrix(angles), "center": center}
+
+
+def get_view_transform(snapshot, family, units=None):
+    """
+    Returns the transform which takes the positions of ``family`` from the view they are in to the current view of the
+    snapshot (``pos_view = pos @ matrix.T + shift``) without moving anything.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot).
+    family: The ``pyn.family.Family``.
+    units: The units of ``shift``. Defaults to the units of the positions.
+
+    Returns: ``(matrix, shift)`` or ``None`` if the family is already in the view.
+    -------
+
+    """
+    state = get_snapshot_state(snapshot)
+
+    if "view" not in state:
+        return None
+
+    target = state["view"]
+    current = state.get("applied", {}).get(family.name, {"matrix": np.identity(3), "center": target["center"] * 0})
+
+    if current is target:
+        return None
+
+    # - Composing: pos_new = M pos_current + t with M = R_new R_current^T and t = R_new (c_current - c_new) -#
+    units = (units if units else snapshot.ancestor[family]["pos"].units)
+    matrix = np.matmul(target["matrix"], current["matrix"].transpose())
+    shift = np.matmul(target["matrix"], np.array(current["center"].in_units(units)) -
+                      np.array(target["center"].in_units(units)))
+
+    if np.allclose(matrix, np.identity(3)) and not np.any(shift):
+        return None  # The views are identical (i.e. the default view).
+
+    return matrix, shift
+
+
+def apply_view(snapshot, families=None, chunk_size: int = None) -> None:
+    """
+    Brings the positions and velocities of the given families into the current view of the snapshot. Families which
+    are already in the current view are left untouched, and a family which is in an older view is moved directly to
+    the new one, so each family costs at most one pass per view change. Velocities which haven't been loaded yet are
+    left on disk; they are rotated into the view of their family when they are first loaded.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot).
+    families: The family names to bring into view. Defaults to ``None`` (all families).
+    chunk_size: The number of particles moved at once. Defaults to ``CONFIG["analysis"]["derived_fields"]["chunk_size"]``.
+
+    Returns: None
+    -------
+
+    """
+    fdbg_string = "%sapply_view: " % _dbg_string
+    state = get_snapshot_state(snapshot)
+
+    if "view" not in state:
+        return None
+
+    if not chunk_size:
+        chunk_size = CONFIG["analysis"]["derived_fields"]["chunk_size"]
+
+    base = snapshot.ancestor
+    applied = state.setdefault("applied", {})
+
+    moved = []
+
+    for family in (base.families() if families is None else get_families(base, families)):
+        transform = get_view_transform(snapshot, family)
+
+        if transform is not None:
+            log_print("Moving family %s into the view." % family.name, fdbg_string, "debug")
+            _transform_array(base[family]["pos"], transform[0], transform[1], chunk_size)
+            moved.append("pos")
+
+            if "vel" in base[family].keys():
+                _transform_array(base[family]["vel"], transform[0], np.zeros(3), chunk_size)
+                moved.append("vel")
+            else:
+                _attach_view_loader(base)
+
+        applied[family.name] = state["view"]
+
+    if len(moved):
+        # - The arrays were written directly, so pynbody's derived arrays (r, rxy, ...) are invalidated on the base -#
+        for field in set(moved):
+            base._dirty(field)
+
+        mark_modified(snapshot, list(set(moved)))
+
+
+def _transform_array(array, matrix, offset, chunk_size) -> None:
+    """
+    Transforms ``array`` in place (``array = array @ matrix.T + offset``) ``chunk_size`` rows at a time.
+    """
+    array = array.view(np.ndarray)
+
+    for start in range(0, len(array), chunk_size):
+        stop = min(start + chunk_size, len(array))
+        array[start:stop] = np.matmul(array[start:stop], matrix.transpose()) + offset
+
+
+def _attach_view_loader(snapshot) -> None:
+    """
+    Wraps the array loader of the base ``snapshot`` so that velocities which are loaded after their family was moved
+    into a view (see ``apply_view``) are rotated into that view as they are loaded.
+    """
+    state = get_snapshot_state(snapshot)
+
+    if state.get("view_loader", False):
+        return
+
+    base = snapshot.ancestor
+    load = base._load_array
+
+    def load_array(array_name, fam=None):
+        load(array_name, fam)
+
+        if array_name != "vel":
+            return
+
+        for family in (base.families() if fam is None else [fam]):
+            view = state.get("applied", {}).get(family.name, None)
+
+            if view is None or np.allclose(view["matrix"], np.identity(3)):
+                continue
+
+            # - The array was only just loaded, so it is still where the loader put it -#
+            if "vel" in base._arrays:
+                array = base._arrays["vel"][base._get_family_slice(family)]
+            else:
+                array = base._family_arrays["vel"][family]
+
+            _transform_array(array, view["matrix"], np.zeros(3), CONFIG["analysis"]["derived_fields"]["chunk_size"])
+
+    base._load_array = load_array
+    state["view_loader"] = True
 
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -534,6 +1391,91 @@ def split_binary_collision(snapshot):
     return snaps
 
 
+def convert_snapshot(snapshot_path: str, overwrite: bool = False):
+    """
+    Converts a single RAMSES output into the snapshot cache (see ``PyCS_Analysis.Caching``). The output is loaded,
+    aligned and converted to physical units exactly once; every later ``SnapView.load_snapshot`` call then reads the
+    cached arrays instead.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+    overwrite: If ``True``, the cache is rewritten even if it is up to date.
+
+    Returns: The path of the cache, or ``None`` if nothing was written.
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%sconvert_snapshot: " % _dbg_string
+    log_print("Attempting to convert %s." % snapshot_path, fdbg_string, "debug")
+
+    if has_snapshot_cache(snapshot_path) and not overwrite:
+        log_print("%s is already converted. Skipping." % snapshot_path, fdbg_string, "debug")
+        return None
+
+    # Loading and converting
+    ####################################################################################################################
+    fields = CONFIG["analysis"]["cache"]["fields"]
+
+    snapshot = pyn.load(snapshot_path)
+    align_snapshot(snapshot, families=list(fields.keys()))
+
+    try:
+        return write_snapshot_cache(snapshot, snapshot_path, fields=fields)
+    except OSError as error:
+        make_error(OSError, fdbg_string, "Failed to write the snapshot cache for %s: %s" % (snapshot_path, error))
+        return None
+
+
+def convert_simulation(simulation_directory: str,
+                       nproc: int = 1,
+                       tmin: float = None,
+                       tmax: float = None,
+                       stride: int = 1,
+                       overwrite: bool = False) -> None:
+    """
+    Converts each of the outputs of a simulation into the snapshot cache.
+    Parameters
+    ----------
+    simulation_directory: (``str``) The simulation directory.
+    nproc: (``int``) The number of processes to use.
+    tmin: (``float``) The minimum output time (Gyr) to include.
+    tmax: (``float``) The maximum output time (Gyr) to include.
+    stride: (``int``) Only convert every ``stride``-th output.
+    overwrite: (``bool``) If ``True``, outputs which are already converted are converted again.
+
+    Returns: None
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%sconvert_simulation: " % _dbg_string
+    log_print("Attempting to convert the simulation at %s." % simulation_directory, fdbg_string, "debug")
+
+    # Finding the outputs
+    ####################################################################################################################
+    output_paths = [os.path.join(simulation_directory, directory) for directory in
+                    SnapshotIndex.load(simulation_directory).select(tmin=tmin, tmax=tmax, stride=stride)]
+
+    if not len(output_paths):
+        log_print("Failed to find any output files for this simulation. Exiting.", fdbg_string, "info")
+        return None
+
+    # Converting
+    ####################################################################################################################
+    nproc = np.amin([len(output_paths), nproc])  # Prevents empty processes.
+
+    if nproc > 1:
+        with ProcessPoolExecutor(max_workers=nproc) as executor:
+            list(executor.map(mp_convert_snapshots, split(output_paths, nproc), repeat(overwrite)))
+    else:
+        mp_convert_snapshots(output_paths, overwrite=overwrite)
+
+    log_print("Converted %s outputs of %s." % (len(output_paths), simulation_directory), fdbg_string, "info")
+
+
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # -----------------------------------------------------   MAIN   --------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
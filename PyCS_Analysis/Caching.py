@@ -0,0 +1,522 @@
+"""
+
+        On-disk caches for converted simulation data.
+
+    The snapshot cache stores each RAMSES output once, already aligned and in physical units, as one ``.npy`` array per
+    family and field together with a small ``metadata.toml`` sidecar. The arrays are opened with ``mmap_mode="r"`` so
+    that parallel workers reading the same output share pages through the OS cache.
+
+    The image cache stores rendered image arrays as compressed ``.npz`` files, addressed by a hash of the output and the
+    render parameters (quantity, family, units, width, resolution, view, ...). It is kept under
+    ``CONFIG["analysis"]["cache"]["image_cache_size"]`` by removing the least recently used images.
+
+"""
+import os
+import pathlib as pt
+import sys
+import hashlib
+import json
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+from PyCS_Core.Configuration import read_config, _configuration_path
+import pynbody as pyn
+import numpy as np
+import toml
+from PyCS_Core.Logging import set_log, log_print, make_error
+from PyCS_Core.PyCS_Errors import *
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Analysis"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# -------------------------------------------------- Fixed Variables ----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_snapshot_cache_version = 1  # Bump this if the layout of the snapshot cache changes.
+_metadata_filename = "metadata.toml"
+_image_cache_version = 1  # Bump this if the renderers change in a way which invalidates cached images.
+_image_cache_written = [0, False]  # Bytes written by this process since the cache was last trimmed, trimmed yet?
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# --------------------------------------------------- Sub-Functions -----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def get_cache_directory(*subdirectories):
+    """
+    Returns the path to (a sub-directory of) the cache directory, or ``None`` if no cache directory is configured.
+    Parameters
+    ----------
+    subdirectories: Sub-directories to join onto the cache directory.
+
+    Returns: The path or ``None``.
+    -------
+
+    """
+    if "cache_directory" not in CONFIG["system"]["directories"]:
+        return None
+    elif CONFIG["system"]["directories"]["cache_directory"] in [None, "None"]:
+        return None
+    else:
+        return os.path.join(CONFIG["system"]["directories"]["cache_directory"], *subdirectories)
+
+
+def _source_stamp(snapshot_path):
+    """
+    The modification time of the RAMSES info file; used to detect outputs which have been rewritten.
+    """
+    info_path = os.path.join(snapshot_path, "info_%s.txt" % pt.Path(snapshot_path).name.replace("output_", ""))
+    try:
+        return os.path.getmtime(info_path)
+    except OSError:
+        return 0.0
+
+
+def _simulation_key(snapshot_path):
+    """
+    The name of the simulation's cache directories: its directory name and a short hash of its absolute path.
+    """
+    simulation_directory = str(pt.Path(os.path.abspath(snapshot_path)).parent)
+    return "%s-%s" % (pt.Path(simulation_directory).name, hashlib.md5(simulation_directory.encode()).hexdigest()[:8])
+
+
+def get_snapshot_cache_path(snapshot_path):
+    """
+    Determines the location of the snapshot cache for the output at ``snapshot_path``. Simulations are keyed by their
+    directory name and a short hash of their absolute path so that identically named simulations don't collide.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+
+    Returns: The cache path or ``None`` if caching is not configured.
+    -------
+
+    """
+    snapshot_path = os.path.abspath(snapshot_path)
+    return get_cache_directory("snapshots", _simulation_key(snapshot_path), pt.Path(snapshot_path).name)
+
+
+def has_snapshot_cache(snapshot_path) -> bool:
+    """
+    Checks if a complete and up to date snapshot cache exists for ``snapshot_path``.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+
+    Returns: True if the cache can be used.
+    -------
+
+    """
+    cache_path = get_snapshot_cache_path(snapshot_path)
+
+    if not cache_path or not os.path.isfile(os.path.join(cache_path, _metadata_filename)):
+        return False
+
+    try:
+        metadata = toml.load(os.path.join(cache_path, _metadata_filename))
+    except Exception:
+        return False
+
+    return (metadata.get("version", None) == _snapshot_cache_version and
+            metadata.get("source_stamp", None) == _source_stamp(snapshot_path))
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ----------------------------------------------------- Functions -------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def write_snapshot_cache(snapshot, snapshot_path, fields=None, dtype=None):
+    """
+    Writes an **already aligned** snapshot (see ``align_snapshot``) to the snapshot cache.
+
+    The metadata sidecar is written last so that an interrupted conversion is never mistaken for a valid cache.
+    Parameters
+    ----------
+    snapshot: The aligned snapshot in physical units.
+    snapshot_path: The path to the ``output_XXXXX`` directory the snapshot was loaded from.
+    fields: dict of ``{family_name: [fields]}``. Defaults to ``CONFIG["analysis"]["cache"]["fields"]``.
+    dtype: The dtype of the stored arrays. Defaults to ``CONFIG["analysis"]["cache"]["snapshot_dtype"]``.
+
+    Returns: The path of the cache.
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%swrite_snapshot_cache: " % _dbg_string
+    log_print("Writing the snapshot cache for %s." % snapshot_path, fdbg_string, "debug")
+
+    # Setup
+    ####################################################################################################################
+    cache_path = get_snapshot_cache_path(snapshot_path)
+
+    if not cache_path:
+        make_error(OSError, fdbg_string, "There is no cache directory configured. Please update the installation.")
+
+    if not fields:
+        fields = CONFIG["analysis"]["cache"]["fields"]
+
+    if not dtype:
+        dtype = CONFIG["analysis"]["cache"]["snapshot_dtype"]
+
+    # - Removing any stale metadata -#
+    if os.path.isfile(os.path.join(cache_path, _metadata_filename)):
+        os.remove(os.path.join(cache_path, _metadata_filename))
+
+    metadata = {
+        "version"     : _snapshot_cache_version,
+        "source"      : os.path.abspath(snapshot_path),
+        "source_stamp": _source_stamp(snapshot_path),
+        "dtype"       : dtype,
+        "properties"  : {
+            "time"   : str(snapshot.properties["time"].in_units("Gyr")) + " Gyr",
+            "boxsize": str(snapshot.properties["boxsize"].in_units("kpc")) + " kpc",
+            "a"      : float(snapshot.properties.get("a", 1.0)),
+            "h"      : float(snapshot.properties.get("h", 1.0))
+        },
+        "families"    : {},
+        "fields"      : {}
+    }
+
+    # Writing the arrays
+    ####################################################################################################################
+    for family in snapshot.families():
+        if family.name not in fields:
+            continue
+
+        family_path = os.path.join(cache_path, family.name)
+        pt.Path(family_path).mkdir(parents=True, exist_ok=True)
+
+        metadata["families"][family.name] = len(snapshot[family])
+        metadata["fields"][family.name] = {}
+
+        for field in fields[family.name]:
+            try:
+                array = snapshot[family][field]
+            except KeyError:
+                log_print("Family %s has no field %s; skipping." % (family.name, field), fdbg_string, "debug")
+                continue
+
+            # - Writing through a temporary file so a mapped array of a running load is never truncated -#
+            path = os.path.join(family_path, "%s.npy" % field)
+            temporary_path = "%s.%s.tmp" % (path, os.getpid())
+            with open(temporary_path, "wb") as file:
+                np.save(file, np.asarray(array, dtype=dtype))
+            os.replace(temporary_path, path)
+
+            metadata["fields"][family.name][field] = str(array.units)
+
+    # - Writing the sidecar -#
+    with open(os.path.join(cache_path, _metadata_filename), "w") as file:
+        toml.dump(metadata, file)
+
+    log_print("Wrote the snapshot cache for %s to %s." % (snapshot_path, cache_path), fdbg_string, "debug")
+    return cache_path
+
+
+def _map_array(snapshot, family, field, array) -> None:
+    """
+    Attaches ``array`` to ``snapshot`` as the ``field`` of ``family``. In a snapshot of a single family the array itself
+    becomes the snapshot array, so a memory mapped array stays mapped. pynbody keeps the arrays of several families in
+    one contiguous array (and refuses snapshot level access to family level arrays), so in that case the family is
+    copied in. Load a single family (``families=``) to keep the arrays mapped.
+    """
+    if len(snapshot.families()) != 1:
+        snapshot[family][field] = array
+        return
+
+    # - Mirrors SimSnap._create_array without allocating a new array -#
+    array.sim = snapshot
+    array._name = field
+    array.family = None
+    snapshot._arrays[field] = array
+
+    if array.ndim == 2:
+        for i, name in enumerate(snapshot._array_name_ND_to_1D(field)):
+            snapshot._arrays[name] = array[:, i]
+            snapshot._arrays[name]._name = name
+
+
+def _attach_loader(snapshot, snapshot_path, cache_path, metadata, families=None) -> None:
+    """
+    Makes the cached fields which weren't opened up front lazily loadable, and lets fields which aren't in the cache
+    at all be read from the RAMSES output itself. The output is only opened the first time such a field is asked for;
+    fields which pynbody can derive are left to pynbody.
+    """
+    fdbg_string = "%sload_snapshot_cache: " % _dbg_string
+    source = []  # The RAMSES output, once it has been opened.
+
+    def loadable_keys(fam=None):
+        cached = [set(metadata["fields"][family.name]) for family in
+                  ([fam] if fam is not None else snapshot.families())]
+        return (list(set.intersection(*cached)) if cached else [])
+
+    def load_array(array_name, fam=None):
+        if fam is None:
+            raise OSError("Arrays of a cached snapshot are loaded family by family.")
+
+        if array_name in metadata["fields"][fam.name]:
+            _map_array(snapshot, fam, array_name, _open_cached_array(cache_path, fam.name, array_name,
+                                                                     metadata["fields"][fam.name][array_name]))
+            return
+        elif array_name == "pos" or array_name in snapshot.derivable_keys():
+            # The positions of the output aren't aligned, and derivable arrays are pynbody's business.
+            raise OSError("%s is not in the snapshot cache." % array_name)
+
+        if not len(source):
+            log_print("%s is not in the snapshot cache of %s; reading it from the output." % (array_name, snapshot_path),
+                      fdbg_string, "info")
+            source.append(pyn.load(snapshot_path, with_gas=(families is None or "gas" in families)))
+            source[0].physical_units()
+
+        try:
+            array = source[0][fam][array_name]
+        except KeyError:
+            raise OSError("%s is not available for %s in %s." % (array_name, fam.name, snapshot_path))
+
+        _map_array(snapshot, fam, array_name, pyn.array.SimArray(array, array.units))
+
+    snapshot.loadable_keys = loadable_keys
+    snapshot._load_array = load_array
+
+
+def _open_cached_array(cache_path, family_name, field, units):
+    """
+    Opens a cached array as a copy-on-write memory map: pages are shared between the processes reading the output
+    until one of them writes to them (e.g. when the view is applied).
+    """
+    array = np.load(os.path.join(cache_path, family_name, "%s.npy" % field), mmap_mode="c").view(pyn.array.SimArray)
+    array.units = units
+    return array
+
+
+def load_snapshot_cache(snapshot_path, families=None, fields=None):
+    """
+    Opens the snapshot cache for ``snapshot_path`` as a ``pyn.snapshot.SimSnap``. Only the requested families are
+    opened and only the requested fields (and the positions) are attached up front; the other cached fields are loaded
+    lazily and fields which aren't cached are read from the RAMSES output when they are first used. The arrays are
+    memory mapped from disk (see ``_map_array``).
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+    families: The family names to load. Defaults to ``None`` (all cached families).
+    fields: The fields to attach up front. Defaults to ``None`` (all cached fields).
+
+    Returns: The aligned snapshot, or ``None`` if there is no usable cache.
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%sload_snapshot_cache: " % _dbg_string
+
+    if not has_snapshot_cache(snapshot_path):
+        return None
+
+    cache_path = get_snapshot_cache_path(snapshot_path)
+    metadata = toml.load(os.path.join(cache_path, _metadata_filename))
+    log_print("Loading %s from the snapshot cache at %s." % (snapshot_path, cache_path), fdbg_string, "debug")
+
+    # Building the snapshot
+    ####################################################################################################################
+    cached_families = {family: count for family, count in metadata["families"].items() if
+                       count and (families is None or family in families)}
+
+    snapshot = pyn.new(**cached_families)
+
+    # - pyn.new fills pos, vel and mass with zeros; every array comes from the cache (or the output) instead -#
+    for name in list(snapshot.keys()):
+        del snapshot[name]
+
+    for key in ["time", "boxsize"]:
+        snapshot.properties[key] = pyn.units.Unit(metadata["properties"][key])
+    for key in ["a", "h"]:
+        snapshot.properties[key] = metadata["properties"][key]
+
+    for family in snapshot.families():
+        for field, units in metadata["fields"][family.name].items():
+            if fields is not None and field not in fields and field != "pos":
+                continue
+
+            _map_array(snapshot, family, field, _open_cached_array(cache_path, family.name, field, units))
+
+    _attach_loader(snapshot, snapshot_path, cache_path, metadata, families=families)
+
+    return snapshot
+
+
+def get_image_cache_key(snapshot_path, parameters: dict) -> str:
+    """
+    Computes the content address of an image of the output at ``snapshot_path`` rendered with ``parameters``. The key
+    changes if the output is rewritten or if ``_image_cache_version`` is bumped.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+    parameters: The render parameters. Must be JSON serializable.
+
+    Returns: The key (a hex digest).
+    -------
+
+    """
+    description = {
+        "version"     : _image_cache_version,
+        "source"      : os.path.abspath(snapshot_path),
+        "source_stamp": _source_stamp(snapshot_path),
+        "parameters"  : parameters
+    }
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def get_image_cache_path(snapshot_path, key):
+    """
+    Determines the location of the cached image ``key`` of the output at ``snapshot_path``.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+    key: The key of the image (see ``get_image_cache_key``).
+
+    Returns: The path or ``None`` if caching is not configured.
+    -------
+
+    """
+    snapshot_path = os.path.abspath(snapshot_path)
+    directory = get_cache_directory("images", _simulation_key(snapshot_path), pt.Path(snapshot_path).name)
+
+    return (os.path.join(directory, "%s.npz" % key) if directory else None)
+
+
+def write_image_cache(snapshot_path, key, array, parameters: dict, dtype=None):
+    """
+    Writes an image array to the image cache. The file is written under a temporary name and moved into place, so
+    concurrent workers never read a partial file.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory the image was rendered from.
+    key: The key of the image (see ``get_image_cache_key``).
+    array: The image array.
+    parameters: The render parameters; stored alongside the array.
+    dtype: The dtype of the stored array. Defaults to ``CONFIG["analysis"]["cache"]["image_dtype"]``.
+
+    Returns: The path of the cached image.
+    -------
+
+    """
+    fdbg_string = "%swrite_image_cache: " % _dbg_string
+    path = get_image_cache_path(snapshot_path, key)
+
+    if not path:
+        make_error(OSError, fdbg_string, "There is no cache directory configured. Please update the installation.")
+
+    if not dtype:
+        dtype = CONFIG["analysis"]["cache"]["image_dtype"]
+
+    pt.Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    metadata = {"version": _image_cache_version, "source": os.path.abspath(snapshot_path), "parameters": parameters}
+
+    temporary_path = "%s.%s.tmp" % (path, os.getpid())
+    with open(temporary_path, "wb") as file:
+        np.savez_compressed(file, image=np.asarray(array, dtype=dtype), metadata=json.dumps(metadata))
+    os.replace(temporary_path, path)
+
+    log_print("Cached image %s of %s." % (key, snapshot_path), fdbg_string, "debug")
+
+    # - Keeping the cache under its size limit -# the cache is only scanned after 1% of the limit has been written.
+    limit = float(CONFIG["analysis"]["cache"]["image_cache_size"]) * 1e9
+    _image_cache_written[0] += os.path.getsize(path)
+
+    if limit and (not _image_cache_written[1] or _image_cache_written[0] > limit / 100):
+        trim_image_cache(limit)
+
+    return path
+
+
+def load_image_cache(snapshot_path, key):
+    """
+    Reads the cached image ``key`` of the output at ``snapshot_path``.
+    Parameters
+    ----------
+    snapshot_path: The path to the ``output_XXXXX`` directory.
+    key: The key of the image (see ``get_image_cache_key``).
+
+    Returns: ``(array, parameters)`` or ``None`` if the image isn't cached.
+    -------
+
+    """
+    path = get_image_cache_path(snapshot_path, key)
+
+    if not path or not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path) as file:
+            array, metadata = file["image"], json.loads(str(file["metadata"]))
+    except Exception as exception:
+        log_print("Failed to read the cached image %s (%s)." % (path, exception), "%sload_image_cache: " % _dbg_string,
+                  "warning")
+        return None
+
+    # - Marking the image as recently used (see ``trim_image_cache``) -#
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return array, metadata["parameters"]
+
+
+def trim_image_cache(limit=None) -> int:
+    """
+    Removes the least recently used (read or written) images until the image cache is no larger than ``limit``.
+    Parameters
+    ----------
+    limit: The maximum size of the image cache in bytes. Defaults to ``CONFIG["analysis"]["cache"]["image_cache_size"]``
+        (in GB). ``0`` for no limit.
+
+    Returns: The number of images which were removed.
+    -------
+
+    """
+    fdbg_string = "%strim_image_cache: " % _dbg_string
+    directory = get_cache_directory("images")
+
+    if limit is None:
+        limit = float(CONFIG["analysis"]["cache"]["image_cache_size"]) * 1e9
+
+    _image_cache_written[:] = [0, True]
+
+    if not limit or not directory or not os.path.isdir(directory):
+        return 0
+
+    images = []
+    for path in pt.Path(directory).rglob("*.npz"):
+        try:
+            status = path.stat()
+        except OSError:  # removed by another process.
+            continue
+        images.append((status.st_mtime, status.st_size, path))
+
+    size, removed = sum(image[1] for image in images), 0
+
+    for _, image_size, path in sorted(images, key=lambda image: image[0]):
+        if size <= limit:
+            break
+
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+
+        size -= image_size
+
+    if removed:
+        log_print("Removed %s images from the image cache (now %.2f GB)." % (removed, size / 1e9), fdbg_string, "info")
+
+    return removed
@@ -0,0 +1,262 @@
+"""
+
+        Sequence cubes: the image arrays of a whole image sequence stored in a single HDF5 file.
+
+    A cube holds an ``images`` dataset of shape ``(time, ny, nx)``, chunked in tiles of ``chunk_frames`` frames by
+    ``chunk_pixels x chunk_pixels`` pixels so that both single frames and pixel time-series can be read without
+    decompressing the whole file, together with the ``time`` (Gyr) and ``outputs`` of each frame. Frames are kept in time
+    order and each output appears once.
+            Written by: Eliza Diggins
+"""
+import os
+import pathlib as pt
+import sys
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+from PyCS_Core.Configuration import read_config, _configuration_path
+from PyCS_Core.Logging import set_log, log_print, make_error
+from PyCS_Core.PyCS_Errors import *
+import numpy as np
+import h5py
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Analysis"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# -------------------------------------------------- Fixed Variables ----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_cube_parts_directory = ".cube_parts"  # Where the workers of a sequence leave their frames for the cube.
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Classes --------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+class ImageCube:
+    """
+    A sequence cube on disk. The file is only opened for the duration of each read or append, so a cube can be read
+    while it is still being extended.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes the ``ImageCube``. The file is created on the first ``append``.
+        Parameters
+        ----------
+        path: The path to the ``.h5`` file.
+        """
+        self.path = path
+        self.cdbg_string = "%sImageCube: " % _dbg_string
+
+    def __repr__(self):
+        return "ImageCube(%s, frames=%s)" % (self.path, len(self))
+
+    def __len__(self):
+        if not os.path.isfile(self.path):
+            return 0
+
+        with h5py.File(self.path, "r") as file:
+            return file["images"].shape[0]
+
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Writing                                                                                                      #
+    # -----------------------------------------------------------------------------------------------------------------#
+    def append(self, image, time: float, output: str = "", attributes: dict = None):
+        """
+        Adds a frame to the cube, creating the file if it doesn't exist. A frame of an output which is already in the
+        cube is overwritten, so rerunning a sequence never duplicates frames, and a frame which is earlier than the last
+        one is inserted in time order.
+        Parameters
+        ----------
+        image: The ``(ny, nx)`` image array.
+        time: The time of the frame in Gyr.
+        output: The name of the output the frame was rendered from.
+        attributes: The attributes of the sequence (``qty``, ``units``, ``width``, ...). Only used when the file is
+            created.
+
+        Returns: The index of the frame.
+        -------
+
+        """
+        fdbg_string = "%sappend: " % self.cdbg_string
+        image = np.asarray(image)
+
+        if image.ndim != 2:
+            make_error(ValueError, fdbg_string, "Frames must be 2D arrays, not %s." % str(image.shape))
+
+        with h5py.File(self.path, "a") as file:
+            if "images" not in file:
+                self._create(file, image.shape, attributes)
+            elif file["images"].shape[1:] != image.shape:
+                make_error(ValueError, fdbg_string, "Frame of shape %s doesn't match the cube %s." % (
+                    str(image.shape), str(file["images"].shape[1:])))
+
+            outputs = list(file["outputs"].asstr()[:])
+
+            if output and output in outputs:
+                index = outputs.index(output)
+            else:
+                size = len(outputs)
+                index = int(np.searchsorted(file["time"][:], time, side="right"))
+
+                for name in ["images", "time", "outputs"]:
+                    file[name].resize(size + 1, axis=0)
+
+                    if index < size:  # the later frames move up by one.
+                        file[name][index + 1:] = file[name][index:size]
+
+            for name, value in [("images", image), ("time", time), ("outputs", output)]:
+                file[name][index] = value
+
+        log_print("Wrote frame %s (%s) to %s." % (index, output, self.path), fdbg_string, "debug")
+        return index
+
+    @staticmethod
+    def _create(file, shape, attributes):
+        """
+        Creates the datasets of a new cube.
+        """
+        settings = CONFIG["Visualization"]["Images"]["Cube"]
+        chunks = (settings["chunk_frames"], min(settings["chunk_pixels"], shape[0]),
+                  min(settings["chunk_pixels"], shape[1]))
+
+        if settings["compression"] in [None, "none", "None"]:
+            compression = {}
+        elif settings["compression"] == "gzip":
+            compression = {"compression": "gzip", "compression_opts": settings["compression_level"], "shuffle": True}
+        else:
+            compression = {"compression": settings["compression"], "shuffle": True}
+
+        file.create_dataset("images", shape=(0,) + tuple(shape), maxshape=(None,) + tuple(shape),
+                            dtype=settings["dtype"], chunks=chunks, **compression)
+        file.create_dataset("time", shape=(0,), maxshape=(None,), dtype="float64", chunks=(1024,))
+        file.create_dataset("outputs", shape=(0,), maxshape=(None,), dtype=h5py.string_dtype(), chunks=(1024,))
+        file["time"].attrs["units"] = "Gyr"
+
+        for key, value in (attributes if attributes else {}).items():
+            if value is not None:
+                file.attrs[key] = (value if not isinstance(value, (list, tuple)) else np.asarray(value, dtype="S"))
+
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Reading                                                                                                      #
+    # -----------------------------------------------------------------------------------------------------------------#
+    @property
+    def attributes(self) -> dict:
+        """The attributes of the sequence."""
+        with h5py.File(self.path, "r") as file:
+            return dict(file.attrs)
+
+    @property
+    def times(self):
+        """The time of each frame in Gyr."""
+        with h5py.File(self.path, "r") as file:
+            return file["time"][:]
+
+    @property
+    def outputs(self) -> list:
+        """The output of each frame."""
+        with h5py.File(self.path, "r") as file:
+            return list(file["outputs"].asstr()[:])
+
+    def __getitem__(self, item):
+        """
+        Reads a hyperslab of the ``(time, ny, nx)`` image dataset (i.e. ``cube[10]``, ``cube[:, 200:300, 200:300]``).
+        Only the chunks which overlap the selection are read.
+        """
+        with h5py.File(self.path, "r") as file:
+            return file["images"][item]
+
+    def frame(self, index: int):
+        """
+        Reads a single frame.
+        Parameters
+        ----------
+        index: The index of the frame.
+
+        Returns: The ``(ny, nx)`` image array.
+        -------
+
+        """
+        return self[index]
+
+    def pixel_series(self, y: int, x: int):
+        """
+        Reads the time-series of a single pixel.
+        Parameters
+        ----------
+        y: The row of the pixel.
+        x: The column of the pixel.
+
+        Returns: ``(times, values)``.
+        -------
+
+        """
+        return self.times, self[:, y, x]
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ----------------------------------------------------- Functions -------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def write_cube_part(sequence_directory, output, image, time):
+    """
+    Leaves a rendered frame in the sequence directory for ``assemble_image_cube``. Frames are rendered out of order by
+    several processes, so they are only appended to the cube (by one process) once the sequence is done.
+    Parameters
+    ----------
+    sequence_directory: The output directory of the sequence.
+    output: The name of the output (``output_XXXXX``).
+    image: The image array.
+    time: The time of the frame in Gyr.
+
+    Returns: None
+    -------
+
+    """
+    parts_directory = os.path.join(sequence_directory, _cube_parts_directory)
+    pt.Path(parts_directory).mkdir(parents=True, exist_ok=True)
+
+    path = os.path.join(parts_directory, "%s.npz" % output)
+    with open(path + ".tmp", "wb") as file:
+        np.savez(file, image=np.asarray(image, dtype=CONFIG["Visualization"]["Images"]["Cube"]["dtype"]),
+                 time=float(time))
+    os.replace(path + ".tmp", path)
+
+
+def assemble_image_cube(sequence_directory, cube_path, attributes: dict = None) -> ImageCube:
+    """
+    Writes the frames left by ``write_cube_part`` to the cube at ``cube_path`` in output order, and removes them. Frames
+    of outputs which are already in the cube replace them (see ``ImageCube.append``).
+    Parameters
+    ----------
+    sequence_directory: The output directory of the sequence.
+    cube_path: The path to the cube. It is created if it doesn't exist.
+    attributes: The attributes of the sequence (see ``ImageCube.append``).
+
+    Returns: The ``ImageCube``.
+    -------
+
+    """
+    fdbg_string = "%sassemble_image_cube: " % _dbg_string
+    parts_directory = os.path.join(sequence_directory, _cube_parts_directory)
+    cube = ImageCube(cube_path)
+
+    parts = sorted(pt.Path(parts_directory).glob("*.npz")) if os.path.isdir(parts_directory) else []
+
+    for part in parts:
+        with np.load(part) as file:
+            cube.append(file["image"], float(file["time"]), output=part.stem, attributes=attributes)
+        os.remove(part)
+
+    if os.path.isdir(parts_directory) and not len(os.listdir(parts_directory)):
+        os.rmdir(parts_directory)
+
+    log_print("Wrote %s frames to %s." % (len(parts), cube_path), fdbg_string, "info")
+    return cube
@@ -16,16 +16,13 @@ import matplotlib.pyplot as plt
 from PyCS_Core.Configuration import read_config, _configuration_path
 import pynbody as pyn
 import gc
-from itertools import repeat
-from utils import split
 from PyCS_Core.Logging import log_print, make_error, set_log
-from PyCS_System.SimulationMangement import SimulationLog, ICLog
-from PyCS_Analysis.Analysis_Utils import align_snapshot
+from PyCS_System.SimulationMangement import SimulationLog, ICLog, SnapshotIndex
+from PyCS_Analysis.Analysis_Utils import align_snapshot, SnapshotPrefetcher, run_snapshot_tasks
 from PyCS_Analysis.Images import generate_image_array
 import toml
 from datetime import datetime
 from multiprocessing import current_process
-from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -361,6 +358,123 @@ the ``self.dm`` object which comes from the first snapshot and the DM from the s
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------- Sub-Functions -------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def find_halo_centers(snapshot, width, resolution: int = 1000, footprint: int = 20, ncores: int = 2,
+                      name: str = None) -> pd.DataFrame:
+    """
+    Locates the ``ncores`` densest dark matter halos of an (already loaded and aligned) snapshot.
+    Parameters
+    ----------
+    snapshot: (``pyn.snapshot.SimSnap``) The snapshot to search.
+    width: (``pyn.units.CompositeUnit``) The width of the search region.
+    resolution: (``int``) The resolution of the image used to locate the halos.
+    footprint: (``int``) The interpolation footprint size.
+    ncores: (``int``) The number of halos to locate.
+    name: (``str``) The name used for the debugging figure.
+
+    Returns: ``pd.DataFrame`` with a row for each halo.
+    -------
+
+    """
+    # DEBUGGING
+    # ---------------------------------------------------------------------------------------------------------------- #
+    fdbg_string = "%sfind_halo_centers: " % _dbg_string
+    time = snapshot.properties["time"].in_units("Gyr")
+
+    # Generating the image array
+    # ---------------------------------------------------------------------------------------------------------------- #
+    log_print("Image width will be %s." % width, fdbg_string, "debug")
+    image_array = generate_image_array(snapshot, "rho", families=["dm"], width=width, resolution=resolution)
+
+    # - Image manipulations - #
+    image_array = np.log10(image_array)  # reduce to a logarithm for easier processing.
+    image_array = scipy.ndimage.gaussian_filter(image_array, sigma=25)
+    # grabbing maxima
+    tmp_max = (image_array == scipy.ndimage.maximum_filter(image_array, footprint, mode="constant", cval=0))
+
+    densities = sorted([image_array[tuple(j)] for j in np.argwhere(tmp_max == True)], reverse=True)[:ncores]
+
+    cores = [np.argwhere(image_array == d)[0] for d in densities]
+
+    log_print("Located %s maximal cores as %s in array coordinates." % (ncores, cores), fdbg_string, "debug")
+
+    # Analysis
+    # ---------------------------------------------------------------------------------------------------------------- #
+    # grabbing positions
+    x, y = np.meshgrid(np.linspace(-width.in_units("kpc") / 2, width.in_units("kpc") / 2, resolution),
+                       np.linspace(-width.in_units("kpc") / 2, width.in_units("kpc") / 2, resolution))
+
+    true_x, true_y = [x[c[0], c[1]] for c in cores], [y[c[0], c[1]] for c in cores]
+
+    if CONFIG["system"]["system_testing_debug"]:
+        fig = plt.figure()
+        ax1 = fig.add_subplot(111)
+        ax1.imshow(image_array, origin="lower", extent=[-width.in_units("kpc") / 2, width.in_units("kpc") / 2,
+                                                        -width.in_units("kpc") / 2, width.in_units("kpc") / 2])
+        ax1.scatter(true_x, true_y, marker="x", color="red")
+        plt.savefig(os.path.join(CONFIG["system"]["directories"]["unit_test_dump"], "DMPS_get_center_%s_%s.png" % (
+            name, datetime.now().strftime('%m-%d-%Y_%H-%M-%S'))))
+
+        del ax1, fig
+    # - GC -#
+    del image_array, densities, cores, tmp_max
+    gc.collect()
+
+    return pd.DataFrame({
+        "Time": [time for i in true_x],
+        "rank": [i + 1 for i in range(len(true_x))],
+        "x_val": true_x,
+        "y_val": true_y,
+        "z_val": [0] * len(true_x)
+    })
+
+
+def get_next_center_width(center_frame: pd.DataFrame):
+    """
+    Determines the search width for the next snapshot from the halo centers of the previous one.
+    Parameters
+    ----------
+    center_frame: (``pd.DataFrame``) The output of ``find_halo_centers``.
+
+    Returns: ``pyn.units.CompositeUnit``
+    -------
+
+    """
+    fdbg_string = "%sget_next_center_width: " % _dbg_string
+    separation = np.sqrt(np.sum(np.array(center_frame["x_val"]) ** 2 + np.array(center_frame["y_val"]) ** 2))
+
+    log_print("The distance between the two clusters is %s, we are setting the next image width at 2.5*w = %s" % (
+        separation, int(2.5 * separation)), fdbg_string, "debug")
+
+    return pyn.units.Unit("%s kpc" % int(2.5 * separation))
+
+
+def write_centers_dataset(temp_directory: str, simulation: str) -> str:
+    """
+    Joins the per-snapshot center frames in ``temp_directory`` into the ``centers.csv`` dataset of ``simulation``.
+    Parameters
+    ----------
+    temp_directory: (``str``) The directory containing the per-snapshot ``.csv`` files.
+    simulation: (``str``) The ``SimulationName``.
+
+    Returns: The path to the dataset.
+    -------
+
+    """
+    full_frame = pd.DataFrame({})  # this will be populated with the correct frame
+
+    for file in os.listdir(temp_directory):
+        tmp_frame = pd.read_csv(os.path.join(temp_directory, file))
+
+        full_frame = full_frame.append(tmp_frame, ignore_index=True)
+
+    if not os.path.exists(os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation)):
+        pt.Path(os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation)).mkdir(parents=True)
+    full_frame.to_csv(os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation, "centers.csv"),
+                      index=False)
+
+    return os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation, "centers.csv")
+
+
 def mp_get_centers(output_paths: list, temp_directory: str, resolution, width, footprint, ncores):
     """
     Multi-processing find center procedure.
@@ -394,15 +508,11 @@ def mp_get_centers(output_paths: list, temp_directory: str, resolution, width, f
 
     # COMPUTING
     # ---------------------------------------------------------------------------------------------------------------- #
-    for id, output_path in enumerate(output_paths):  # cycle through all of the output paths for this case.
+    #  Only the dark matter is needed to locate the halos. The next output is read in the background.
+    #
+    for output_path, snap in SnapshotPrefetcher(output_paths, families=["dm"]):
         log_print("Finding center of %s on %s." % (output_path, current_process().name), fdbg_string, "debug")
 
-        # Opening the simulation and proceeding with typical alignment procedures
-        # ------------------------------------------------------------------------------------------------------------ #
-        snap = pyn.load(output_path)
-        align_snapshot(snap)
-        time = snap.properties["time"].in_units("Gyr")
-
         # Width management
         # --------------------------------------------------------------------------------------------------------------#
 
@@ -416,58 +526,15 @@ def mp_get_centers(output_paths: list, temp_directory: str, resolution, width, f
             # There is a set width
             pass
 
-        # Generating the image array
+        # Locating the halos
         # ------------------------------------------------------------------------------------------------------------ #
-        log_print("Image width will be %s." % width, fdbg_string, "debug")
-        image_array = generate_image_array(snap, "rho", families=["dm"], width=width, resolution=resolution)
+        output_frame = find_halo_centers(snap, width, resolution=resolution, footprint=footprint, ncores=ncores,
+                                         name=pt.Path(output_path).name)
 
         # - Garbage collection -#
         del snap
         gc.collect()
 
-        # - Image manipulations - #
-        image_array = np.log10(image_array)  # reduce to a logarithm for easier processing.
-        image_array = scipy.ndimage.gaussian_filter(image_array, sigma=25)
-        # grabbing maxima
-        tmp_max = (image_array == scipy.ndimage.maximum_filter(image_array, footprint, mode="constant", cval=0))
-
-        densities = sorted([image_array[tuple(j)] for j in np.argwhere(tmp_max == True)], reverse=True)[:ncores]
-
-        cores = [np.argwhere(image_array == d)[0] for d in densities]
-
-        log_print("Located %s maximal cores as %s in array coordinates." % (ncores, cores), fdbg_string, "debug")
-
-        # Analysis
-        # ------------------------------------------------------------------------------------------------------------ #
-        # grabbing positions
-        x, y = np.meshgrid(np.linspace(-width.in_units("kpc") / 2, width.in_units("kpc") / 2, resolution),
-                           np.linspace(-width.in_units("kpc") / 2, width.in_units("kpc") / 2, resolution))
-
-        true_x, true_y = [x[c[0], c[1]] for c in cores], [y[c[0], c[1]] for c in cores]
-
-        if CONFIG["system"]["system_testing_debug"]:
-            fig = plt.figure()
-            ax1 = fig.add_subplot(111)
-            ax1.imshow(image_array, origin="lower", extent=[-width.in_units("kpc") / 2, width.in_units("kpc") / 2,
-                                                            -width.in_units("kpc") / 2, width.in_units("kpc") / 2])
-            ax1.scatter(true_x, true_y, marker="x", color="red")
-            plt.savefig(os.path.join(CONFIG["system"]["directories"]["unit_test_dump"], "DMPS_get_center_%s_%s.png" % (
-                pt.Path(output_path).name, datetime.now().strftime('%m-%d-%Y_%H-%M-%S'))))
-
-            del ax1, fig
-        # - GC -#
-        del image_array, densities, cores, tmp_max
-        gc.collect()
-        # Writing the data
-        # ------------------------------------------------------------------------------------------------------------ #
-        output_frame = pd.DataFrame({
-            "Time": [time for i in true_x],
-            "rank": [i + 1 for i in range(len(true_x))],
-            "x_val": true_x,
-            "y_val": true_y,
-            "z_val": [0] * ncores
-        })
-
         # - Writing - #
         output_frame.to_csv(os.path.join(temp_directory, "%s.csv" % pt.Path(output_path).name))
         log_print("Finished %s on %s." % (output_path, current_process().name), fdbg_string, "debug")
@@ -476,14 +543,7 @@ def mp_get_centers(output_paths: list, temp_directory: str, resolution, width, f
         # --------------------------------------------------------------------------------------------------------------#
         if no_width:
             # We have to set the width from the data
-            log_print(
-                "The distance between the two clusters is %s, we are setting the next image width at 2.1*w = %s" % (
-                np.sqrt(np.sum(np.array(true_x) ** 2 + np.array(true_y) ** 2)),
-                int(2.1 * np.sqrt(np.sum(np.array(true_x) ** 2 + np.array(true_y) ** 2)))),
-                fdbg_string, "debug")
-
-            set_width = pyn.units.Unit(
-                "%s kpc" % int(2.5 * np.sqrt(np.sum(np.array(true_x) ** 2 + np.array(true_y) ** 2))))
+            set_width = get_next_center_width(output_frame)
         else:
             pass
 
@@ -499,7 +559,10 @@ def get_centers(simulation: str,
                 width=None,
                 footprint: int = 20,
                 ncores: int = 2,
-                nproc: int = 1) -> None:
+                nproc: int = 1,
+                tmin: float = None,
+                tmax: float = None,
+                stride: int = 1) -> None:
     """
     Finds the dark matter halo centers of the given simulation. This can be used to track any number of halos through
     the simulation using the parameter ``ncores``, which controls the number of maxima that we search for in the processing.
@@ -521,6 +584,12 @@ def get_centers(simulation: str,
 
     nproc: (``int``) The number of processes to use in the computation.
 
+    tmin: (``float``) The minimum output time (Gyr) to include.
+
+    tmax: (``float``) The maximum output time (Gyr) to include.
+
+    stride: (``int``) Only process every ``stride``-th output.
+
     Returns: None.
 
     -------
@@ -543,13 +612,10 @@ def get_centers(simulation: str,
         return None
 
     # - Finding the corresponding output directory and loading a list of outputs. -#
-    rm_output_directories = {
-        int(directory.split("_")[1]): os.path.join(simlog[simulation_key]["SimulationLocation"], directory) for
-        directory in
-        os.listdir(simlog[simulation_key]["SimulationLocation"]) if
-        "output" in directory}
-
-    output_directories = [rm_output_directories[key] for key in sorted(list(rm_output_directories.keys()))]
+    output_directories = [os.path.join(simlog[simulation_key]["SimulationLocation"], directory) for directory in
+                          SnapshotIndex.load(simlog[simulation_key]["SimulationLocation"]).select(tmin=tmin,
+                                                                                                  tmax=tmax,
+                                                                                                  stride=stride)]
 
     if not len(output_directories):  # The outputs are empty
         log_print("Failed to find any output files for this simulation. Exiting.", fdbg_string, "debug")
@@ -577,37 +643,20 @@ def get_centers(simulation: str,
     if nproc > 1:
         ## We are using multiprocessing ##
 
-        # Managing partition
-        # --------------------------------------------------------------------------------------------------------------#
-        simulation_partition = split(output_directories, nproc)
-
-        # Passing to the process pool
+        # Passing to the task queue
         # --------------------------------------------------------------------------------------------------------------#
-        with ProcessPoolExecutor() as executor:
-            executor.map(mp_get_centers,
-                         simulation_partition,
-                         repeat(tmp_output_directory),
-                         repeat(resolution),
-                         repeat(width),
-                         repeat(footprint),
-                         repeat(ncores))
+        #  The tasks are contiguous runs of snapshots (see get_task_size) and the width estimate is carried from one
+        #  snapshot to the next within each run, so it only restarts at boxsize/4 once per task.
+        #
+        run_snapshot_tasks(mp_get_centers, output_directories,
+                           [tmp_output_directory, resolution, width, footprint, ncores], None, nproc, star=True)
     else:
         ## Single Process implementation ##
         mp_get_centers(output_directories, tmp_output_directory, resolution, width, footprint, ncores)
 
     # Joining into database
     # ------------------------------------------------------------------------------------------------------------------#
-    full_frame = pd.DataFrame({})  # this will be populated with the correct frame
-
-    for file in os.listdir(tmp_output_directory):
-        tmp_frame = pd.read_csv(os.path.join(tmp_output_directory, file))
-
-        full_frame = full_frame.append(tmp_frame, ignore_index=True)
-
-    if not os.path.exists(os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation)):
-        pt.Path(os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation)).mkdir(parents=True)
-    full_frame.to_csv(os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation, "centers.csv"),
-                      index=False)
+    write_centers_dataset(tmp_output_directory, simulation)
     shutil.rmtree(tmp_output_directory)
 
 
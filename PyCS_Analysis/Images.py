@@ -14,20 +14,25 @@ import numpy as np
 import scipy.ndimage
 from PyCS_Core.Configuration import read_config, _configuration_path
 import pynbody as pyn
-from PyCS_Analysis.plot_utils import get_color_binary_colormap
+from PyCS_Analysis.plot_utils import get_color_binary_colormap, write_fast_frame, FrameWriter, MovieStream
+from PyCS_Analysis.SPH_utils import deposit_images, sample_points
+from PyCS_Analysis.Caching import get_cache_directory, get_image_cache_key, write_image_cache, load_image_cache
+from PyCS_Analysis.Cubes import write_cube_part, assemble_image_cube, ImageCube
 from PyCS_Core.Logging import set_log, log_print, make_error
-from PyCS_Analysis.Analysis_Utils import get_families, align_snapshot, make_pseudo_entropy, make_mach_number, \
-    generate_xray_emissivity, SnapView, generate_speed_of_sound
+from PyCS_Analysis.Analysis_Utils import get_families, align_snapshot, derive_fields, derived_fields, \
+    apply_view, set_view, get_snapshot_state, get_view_transform, SnapshotPrefetcher, run_snapshot_tasks, get_render_threads, \
+    get_sequence_key, get_task_size
 from PyCS_Core.PyCS_Errors import *
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
-from PyCS_System.SimulationMangement import SimulationLog
-from utils import split
+from PyCS_System.SimulationMangement import SimulationLog, SnapshotIndex, SequenceManifest
+from utils import split, chunk, run_task_queue
 from datetime import datetime
 from concurrent.futures import ProcessPoolExecutor
-from multiprocessing import current_process
+from multiprocessing import current_process, get_context, get_all_start_methods
 import matplotlib as mpl
 import gc
+import toml
 import warnings
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -68,6 +73,10 @@ __pynbody_image_defaults = {
     "width": CONFIG["Visualization"]["Images"]["default_width"]
 }  # Kwargs to pass into pyn.plot.sph.image
 
+__pycs_unsupported_kwargs = ["weight", "z_camera", "kernel", "restrict_depth", "approximate_fast", "denoise",
+                             "fill_val", "x2"]  # pyn.plot.sph.image kwargs which change the array but aren't in pycs.
+__renderer_warnings = set()  # The sets of unsupported kwargs which have already been warned about.
+
 __contour_defaults = {
     "contours": CONFIG["Visualization"]["Images"]["Contours"]["default_contours"],
     "qty": CONFIG["Visualization"]["Images"]["Contours"]["default_contour_qty"],
@@ -133,35 +142,35 @@ __quantities = {
         }
     },
     "entropy": {
-        "unit": "keV cm^2",
-        "fancy": "Entropy",
-        "families": ["gas"],
+        "unit": derived_fields["entropy"]["unit"],
+        "fancy": derived_fields["entropy"]["fancy"],
+        "families": derived_fields["entropy"]["families"],
         "default_settings": {
             "cmap": plt.cm.jet,
             "log": True
         }
     },
     "mach": {
-        "unit": "",
-        "fancy": "Mach Number",
-        "families": ["gas"],
+        "unit": derived_fields["mach"]["unit"],
+        "fancy": derived_fields["mach"]["fancy"],
+        "families": derived_fields["mach"]["families"],
         "default_settings": {
             "cmap": plt.cm.hot
         }
     },
     "xray": {
-        "unit": "erg cm^-3 s^-1",
-        "fancy": r"\epsilon^{ff}",
-        "families": ["gas"],
+        "unit": derived_fields["xray"]["unit"],
+        "fancy": derived_fields["xray"]["fancy"],
+        "families": derived_fields["xray"]["families"],
         "default_settings": {
             "cmap": plt.cm.cividis,
             "log": True
         }
     },
     "sound_speed": {
-        "unit": "km s^-1",
-        "fancy": r"c_{s,\rho}",
-        "families": ["gas"],
+        "unit": derived_fields["sound_speed"]["unit"],
+        "fancy": derived_fields["sound_speed"]["fancy"],
+        "families": derived_fields["sound_speed"]["families"],
         "default_settings": {
             "cmap": plt.cm.hot,
             "log": True
@@ -207,6 +216,42 @@ def fancy_qty(qty):
     return __quantities[qty]["fancy"]
 
 
+def get_required_families(qty, families=None, contour_kwargs=None):
+    """
+    Determines which families need to be loaded in order to plot ``qty`` (and its contours).
+    Parameters
+    ----------
+    qty: The quantity to plot.
+    families: The families passed to the plotting function (if any).
+    contour_kwargs: The contour kwargs passed to the plotting function (if any).
+
+    Returns: list of family names, or ``None`` if every family may be needed.
+    -------
+
+    """
+    def _families(q, fams):
+        if fams:
+            return ([fams] if isinstance(fams, str) else list(fams))
+        elif q in __quantities:
+            return list(__quantities[q]["families"])
+        else:
+            return None
+
+    required = _families(qty, families)
+
+    # - Contours use the same defaulting rules as make_plot -#
+    contour_kwargs = {**__contour_defaults, **{key: value for key, value in (contour_kwargs or {}).items() if value}}
+
+    if contour_kwargs["contours"]:
+        contour_families = _families(contour_kwargs["qty"], contour_kwargs.get("families"))
+
+        if required is None or contour_families is None:
+            return None
+        required += [family for family in contour_families if family not in required]
+
+    return required
+
+
 def fix_array(array, qty, units):
     """
     Run on all outputting arrays using the fixed units and the quantity. This can be used to correct for issues in the array ahead of time.
@@ -303,29 +348,81 @@ def mp_make_plot(arg):
     else:
         view_kwargs = None
 
+    angles = kwargs.pop("angles", None)  # camera sweep angles, if any.
+    cube = kwargs.pop("cube", False)  # leave the frames for the sequence cube?
+    stream = kwargs.pop("movie", None)  # the ``MovieClient`` of a streamed movie.
+
+    families = get_required_families(args[3], kwargs.get("families"), kwargs.get("contour_kwargs"))
+
     # MAIN
     # ------------------------------------------------------------------------------------------------------------------#
-    for simulation in args[0]:  # cycle through all of the output folders.
-        path = os.path.join(args[2], simulation)
-        # - Aligning the snap -#
-        try:
-            # - Cleanup -#
-            if view_kwargs:
-                view = SnapView(view_parameters=view_kwargs)  # grabbing the view
-                view.load_snapshot(path)
-                snap = view.snapshot
-                view.snapshot = None
-                gc.collect()
+    #  The next snapshot is read and aligned in the background while the current one is plotted.
+    #
+    prefetcher = SnapshotPrefetcher([os.path.join(args[2], simulation) for simulation in args[0]],
+                                    view_parameters=view_kwargs, families=families)
+    renderer = FrameRenderer()  # one figure for all of this worker's frames.
+    writer = FrameWriter(stream=stream)  # the PNGs are written while the next frame is rendered.
+
+    try:
+        for path, snap in prefetcher:  # cycle through all of the output folders.
+            gc.collect()
+            end_file = os.path.join(args[1], "Image_%s.png" % (pt.Path(path).name.replace("output_", "")))
+
+            if angles:
+                make_plot_sweep(snap, args[3], angles, end_file, nproc=1, renderer=renderer, writer=writer, **kwargs)
             else:
-                snap = pyn.load(path)
-                align_snapshot(snap)
+                image_array = make_plot(snap, args[3], end_file=end_file, renderer=renderer, writer=writer, **kwargs)
+
+                if cube:
+                    write_cube_part(args[1], pt.Path(path).name, image_array,
+                                    snap.properties["time"].in_units("Gyr"))
+
+            del snap
+
+    except MemoryError:
+        log_print("Ran out of memory", fdbg_string, "critical")
+        exit()
+    finally:
+        renderer.close()
+        writer.close()
 
-        except MemoryError:
-            log_print("Ran out of memory", fdbg_string, "critical")
-            exit()
+        if stream:
+            stream.close()
 
-        make_plot(snap, args[3], end_file=os.path.join(args[1], "Image_%s.png" % (simulation.replace("output_", ""))),
-                  **kwargs)
+
+_sweep_snapshot = None  # The snapshot shared with the (forked) camera sweep workers.
+
+
+def mp_make_sweep_plot(arg):
+    """
+    Multiprocessing camera sweep function. The snapshot is not passed through ``arg``; it is inherited from the parent
+    process through ``_sweep_snapshot``. The args parameter should have the format
+
+    arg = ([angles:list,end_file,qty,center],{**kwargs})
+    Parameters
+    ----------
+    arg: The args and kwargs for the plotting process.
+
+    Returns: None
+    -------
+
+    """
+    fdbg_string = _dbg_string + "mp_make_sweep_plot: "
+    log_print("Rendering the camera angles %s. [Process: %s]" % (arg[0][0], current_process().name), fdbg_string,
+              "debug")
+
+    args, kwargs = arg
+    renderer = FrameRenderer()
+    writer = FrameWriter()  # the PNGs are written while the next frame is rendered.
+
+    try:
+        for angle in args[0]:
+            set_view(_sweep_snapshot, angles=angle, center=args[3])
+            make_plot(_sweep_snapshot, args[2], end_file=get_sweep_filename(args[1], angle), renderer=renderer,
+                      writer=writer, **kwargs)  # ``save`` is set by ``make_plot_sweep``.
+    finally:
+        renderer.close()
+        writer.close()
 
 
 def mp_make_gas_dm_plot(arg):
@@ -359,28 +456,304 @@ def mp_make_gas_dm_plot(arg):
     else:
         view_kwargs = None
 
+    stream = kwargs.pop("movie", None)  # the ``MovieClient`` of a streamed movie.
+
     # MAIN
     # ------------------------------------------------------------------------------------------------------------------#
-    for simulation in args[0]:  # cycle through all of the output folders.
-        path = os.path.join(args[2], simulation)
-        # - Aligning the snap -#
-        try:
-            # - Cleanup -#
-            if view_kwargs:
-                view = SnapView(view_parameters=view_kwargs)  # grabbing the view
-                view.load_snapshot(path)
-                snap = view.snapshot
-                view.snapshot = None
-                gc.collect()
-            else:
-                snap = pyn.load(path)
-                align_snapshot(snap)
+    prefetcher = SnapshotPrefetcher([os.path.join(args[2], simulation) for simulation in args[0]],
+                                    view_parameters=view_kwargs, families=["dm", "gas"])
+    renderer = FrameRenderer()  # one figure for all of this worker's frames.
+    writer = FrameWriter(stream=stream)  # the PNGs are written while the next frame is rendered.
+
+    try:
+        for path, snap in prefetcher:  # cycle through all of the output folders.
+            gc.collect()
+            make_gas_dm_image(snap,
+                              end_file=os.path.join(args[1], "Image_%s.png" % (pt.Path(path).name.replace("output_", ""))),
+                              renderer=renderer, writer=writer,
+                              **kwargs)
+            del snap
 
-        except MemoryError:
-            log_print("Ran out of memory", fdbg_string, "critical")
-            exit()
-        make_gas_dm_image(snap, end_file=os.path.join(args[1], "Image_%s.png" % (simulation.replace("output_", ""))),
-                          **kwargs)
+    except MemoryError:
+        log_print("Ran out of memory", fdbg_string, "critical")
+        exit()
+    finally:
+        renderer.close()
+        writer.close()
+
+        if stream:
+            stream.close()
+
+
+def mp_get_frame_samples(arg) -> list:
+    """
+    Multiprocessing worker of the color limit pass (see ``get_sequence_color_limits``). The args parameter should have
+    the format
+
+    arg = ([simulations:list,simulation_directory,qty],{**kwargs})
+    Parameters
+    ----------
+    arg: The args and kwargs for the sampling process. The kwargs are passed to ``get_frame_sample``.
+
+    Returns: The list of samples (see ``get_frame_sample``), in the order of the simulations.
+    -------
+
+    """
+    fdbg_string = _dbg_string + "mp_get_frame_samples: "
+    log_print("Sampling %s outputs. [Process: %s]" % (len(arg[0][0]), current_process().name), fdbg_string, "debug")
+
+    args, kwargs = arg
+    kwargs = kwargs.copy()
+    view_kwargs = kwargs.pop("view_kwargs", None)
+
+    prefetcher = SnapshotPrefetcher([os.path.join(args[1], simulation) for simulation in args[0]],
+                                    view_parameters=view_kwargs,
+                                    families=get_required_families(args[2], kwargs.get("families", None)))
+
+    return [get_frame_sample(snap, args[2], **kwargs) for _, snap in prefetcher]
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Classes --------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+class FrameRenderer:
+    """
+    A figure which is kept between the frames of a sequence. The figure, axes, colorbars and labels are built for the
+    first frame; as long as the layout (quantity, units, width, colormap, ...) doesn't change, later frames only update
+    the image data, the color limits, the contours and the title text.
+
+    Each worker of a sequence keeps its own ``FrameRenderer``; call ``close`` once the sequence is done.
+    """
+
+    def __init__(self):
+        self.figure = None
+        self.layout = None
+        self.artists = {}
+
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Figure Management                                                                                            #
+    # -----------------------------------------------------------------------------------------------------------------#
+    def _new_figure(self, layout, figsize):
+        """
+        Replaces the current figure with an empty one for ``layout``.
+        """
+        self.close()
+        self.figure = plt.figure(figsize=figsize)
+        self.layout = layout
+        self.artists = {}
+
+    def save(self, end_file, writer=None):
+        """
+        Saves the current frame to ``end_file``, on the threads of ``writer`` (a ``FrameWriter``) if one is given.
+        """
+        if writer is not None:
+            writer.write_figure(self.figure, end_file)
+        else:
+            self.figure.savefig(end_file)
+
+    def close(self):
+        """
+        Closes the figure.
+        """
+        if self.figure is not None:
+            plt.close(self.figure)
+
+        self.figure, self.layout, self.artists = None, None, {}
+
+    @staticmethod
+    def _remove_contours(contour_set):
+        """
+        Removes a contour set from its axes (a single artist in newer matplotlib versions, a list of collections in
+        older ones).
+        """
+        if isinstance(contour_set, mpl.artist.Artist):
+            contour_set.remove()
+        else:
+            for collection in contour_set.collections:
+                collection.remove()
+
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Frames                                                                                                       #
+    # -----------------------------------------------------------------------------------------------------------------#
+    def draw_image(self, image_array, qty, time, time_units=pyn.units.Unit(CONFIG["units"]["default_time_unit"]),
+                   title=None, log=False, vmin=None, vmax=None, length_units=CONFIG["units"]["default_length_unit"],
+                   contour_array=None, contour_plot_kwargs=None, contour_label=None, units=None,
+                   width=CONFIG["Visualization"]["Images"]["default_width"],
+                   cmap=CONFIG["Visualization"]["ColorMaps"]["default_image_colormap"]):
+        """
+        Draws a ``make_plot`` frame (see ``plot_image_array`` for the parameters).
+        """
+        # Setup
+        # --------------------------------------------------------------------------------------------------------------#
+        units = (pyn.units.Unit(units) if units else set_units(qty))
+
+        if isinstance(time_units, str):
+            time_units = pyn.units.Unit(time_units)
+
+        contours = contour_array is not None
+
+        if contours:
+            contour_plot_kwargs = dict(contour_plot_kwargs)  # the levels are filled in below.
+
+            for key in ["vmin", "vmax", "log", "levels", "nlevels", "color", "legend"]:
+                contour_plot_kwargs.setdefault(key, None)
+
+        # - Managing the Extends -# This allows us to set the right ticks and axes.
+        numerical_width = float(pyn.units.Unit(width).in_units(length_units))
+        extent = [-numerical_width / 2, numerical_width / 2, -numerical_width / 2, numerical_width / 2]
+
+        # - Color management and vmin/vmax - #
+        # ------------------------------------#
+        # Setting vmin/vmax as necessary.
+        if not vmin:
+            vmin = np.amin(image_array)
+        if not vmax:
+            vmax = np.amax(image_array)
+
+        # managing log
+        if log:
+            vmin = (vmin if vmin > 0 else np.amin(image_array[np.where(image_array > 0)]))
+
+        # Building the figure
+        # --------------------------------------------------------------------------------------------------------------#
+        layout = ("image", qty, str(units), numerical_width, str(length_units), getattr(cmap, "name", cmap), bool(log),
+                  (contour_label, contour_plot_kwargs["color"], contour_plot_kwargs["legend"]) if contours else None,
+                  bool(title))
+
+        if layout != self.layout:
+            self._new_figure(layout, tuple(CONFIG["Visualization"]["default_figure_size"]))
+            axes = self.figure.add_subplot(111)
+
+            color_norm = (mpl.colors.LogNorm(vmin=vmin, vmax=vmax, clip=True) if log else
+                          mpl.colors.Normalize(vmin=vmin, vmax=vmax, clip=True))
+            image = axes.imshow(image_array, origin="lower", cmap=cmap, extent=extent, norm=color_norm)
+
+            # - Colorbar -#
+            self.figure.colorbar(image, ax=axes,
+                                 label=r"$\mathrm{%s} \;\left[\mathrm{%s}\right]$" % (fancy_qty(qty), units.latex()))
+
+            # - Legend -#
+            if contours and contour_plot_kwargs["legend"]:
+                axes.legend(handles=[Line2D([], [], color=contour_plot_kwargs["color"], label=contour_label)],
+                            loc="upper right")
+
+            # - AXES LABELS -#
+            axes.set_ylabel(r"$y\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
+            axes.set_xlabel(r"$x\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
+
+            self.artists = {"axes"    : axes,
+                            "image"   : image,
+                            "title"   : axes.set_title("", fontsize=10),
+                            "suptitle": (self.figure.suptitle("", y=0.93) if title else None),
+                            "contours": None}
+        else:
+            self.artists["image"].set_data(image_array)
+            self.artists["image"].set_clim(vmin, vmax)  # the colorbar follows the norm.
+
+        axes = self.artists["axes"]
+
+        # Contours
+        # --------------------------------------------------------------------------------------------------------------#
+        if self.artists["contours"] is not None:
+            self._remove_contours(self.artists["contours"])
+            self.artists["contours"] = None
+
+        if contours:
+            # Setting image limits #
+            if not contour_plot_kwargs["vmin"]:
+                contour_plot_kwargs["vmin"] = np.amin(contour_array)
+
+            if not contour_plot_kwargs["vmax"]:
+                contour_plot_kwargs["vmax"] = np.amax(contour_array)
+
+            # Generating levels
+            # ----------------------------------------------------------------------------------------------------------#
+            if not contour_plot_kwargs["levels"]:
+                contour_plot_kwargs["levels"] = (np.linspace(contour_plot_kwargs["vmin"],
+                                                             contour_plot_kwargs["vmax"],
+                                                             contour_plot_kwargs["nlevels"]) if not contour_plot_kwargs[
+                    "log"] else
+                                                 np.logspace(np.log10(np.amax([contour_plot_kwargs["vmin"], 1])),
+                                                             np.log10(contour_plot_kwargs["vmax"]),
+                                                             contour_plot_kwargs["nlevels"]))
+
+            self.artists["contours"] = axes.contour(np.linspace(extent[0], extent[1], contour_array.shape[0]),
+                                                    np.linspace(extent[0], extent[1], contour_array.shape[1]),
+                                                    contour_array,
+                                                    levels=contour_plot_kwargs["levels"],
+                                                    colors=contour_plot_kwargs["color"])
+
+        # Text Management #
+        # --------------------------------------------------------------------------------------------------------------#
+        self.artists["title"].set_text(r"$t = \mathrm{%s\;%s},\;\;\mathrm{Quantity:\;%s}\;[\mathrm{%s}]$" % (
+            np.round(time.in_units(time_units), decimals=2),
+            time_units.latex(),
+            fancy_qty(qty),
+            units.latex()))
+
+        if title:
+            self.artists["suptitle"].set_text(title)
+
+    def draw_gas_dm(self, final_image, extent, time, norms, colors, unit_array,
+                    time_units=pyn.units.Unit(CONFIG["units"]["default_time_unit"]),
+                    length_units=CONFIG["units"]["default_length_unit"]):
+        """
+        Draws a ``make_gas_dm_image`` frame.
+        Parameters
+        ----------
+        final_image: The merged RGB image (see ``merge_alpha_images``).
+        extent: The extent of the image.
+        time: The time of the snapshot.
+        norms: The ``(gas, dm)`` norms.
+        colors: The ``(gas, dm)`` colors.
+        unit_array: The ``(dm, gas)`` units.
+        time_units: The time units to display.
+        length_units: The length units to use for the x/y axis.
+        """
+        layout = ("gas_dm", tuple(extent), tuple(colors), tuple(str(unit) for unit in unit_array), str(length_units))
+
+        if layout != self.layout:
+            # - Figure settings -#
+            l = 8  # the size of the actual image in inches
+            a1, a2, b1, b2 = (0.1, 0.03, 0.1, 0.1)  # these are the subplot margins
+            w, h = l / ((0.74) * (1 - (a1 + a2))), l / (1 - (b1 + b2))
+            axis_ratio = h / w
+
+            # - Making the figure -#
+            self._new_figure(layout, (8, 8 * axis_ratio))
+            axes = self.figure.add_subplot(111)
+            image = axes.imshow(final_image, extent=extent)
+
+            # - AXES LABELS -#
+            axes.set_ylabel(r"$y\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
+            axes.set_xlabel(r"$x\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
+            axes.set_facecolor("black")
+
+            # - Adding colorbars -#
+            cmap_gas, cmap_dm = tuple([get_color_binary_colormap(col) for col in colors])  # grabs the correct colormaps
+
+            bar_gas, bar_dm = plt.cm.ScalarMappable(norm=norms[0], cmap=cmap_gas), plt.cm.ScalarMappable(norm=norms[1],
+                                                                                                         cmap=cmap_dm)
+            self.figure.colorbar(bar_gas, ax=axes, label=r"X-ray Emissivity / $%s$" % unit_array[1].latex(),
+                                 fraction=0.1, pad=0.05)
+            self.figure.colorbar(bar_dm, ax=axes, label=r"Dark Matter Density / $%s$" % unit_array[0].latex(),
+                                 fraction=0.1, pad=0.01)
+
+            # - adjusting subplots -#
+            self.figure.subplots_adjust(left=a1, right=1 - a2, bottom=b1, top=1 - b2)
+
+            self.artists = {"axes": axes, "image": image, "bars": (bar_gas, bar_dm),
+                            "title": axes.set_title("", fontsize=10)}
+        else:
+            self.artists["image"].set_data(final_image)
+
+            for bar, norm in zip(self.artists["bars"], norms):
+                bar.set_clim(norm.vmin, norm.vmax)
+
+        # - TITLES -#
+        self.artists["title"].set_text("Comparative Distribution of Dark Matter and Baryonic Matter\n" +
+                                       r"$t = \mathrm{%s\;%s}$" % (np.round(time.in_units(time_units), decimals=2),
+                                                                   time_units.latex()))
 
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -389,35 +762,111 @@ def mp_make_gas_dm_plot(arg):
 # NOTES:
 #    generate_image_array maps snapshots -> image arrays,
 #       Then, make_plot maps -> snapshots -> images actually saved.
+#    plot_image_array is the figure stage of make_plot; restyle_image_sequence uses it to redraw cached arrays.
 #
 #
 #
 #
 #
 # --#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#--#
-def generate_image_array(snapshot, qty, families=None, **kwargs):
+def get_sweep_filename(end_file, angles) -> str:
     """
-    Generates the plot array for a specific snapshot and quantity.
+    Returns the file name used for the ``angles`` view in a camera sweep. ``Image_00010.png`` becomes
+    ``Image_00010_az30_el-15.png``.
     Parameters
     ----------
-    snapshot: The SimSnap object to use in the plotting.
-    qty: The qty to plot.
-    families: The families to include in the plot. Defaults to all.
-    kwargs: Additional kwargs to pass to the plotting system.
+    end_file: The file name of the un-swept image.
+    angles: The ``(azimuth, elevation)`` of the view in degrees.
 
-    Returns: Numpy array.
+    Returns: The file name.
     -------
 
     """
-    # DEBUGGING
-    ########################################################################################################################
-    fdbg_string = _dbg_string + "generate_image_array: "
-    log_print("Plotting %s for families %s and qty %s." % (qty, families, snapshot), fdbg_string, "debug")
+    path = pt.Path(end_file)
+    return str(path.with_name("%s_az%g_el%g%s" % (path.stem, float(angles[0]), float(angles[1]), path.suffix)))
 
-    # KWARG MANAGEMENT
-    ########################################################################################################################
 
-    # - families -#
+def get_sequence_frames(output, angles=None) -> list:
+    """
+    Returns the frame files which an image sequence writes for ``output``.
+    Parameters
+    ----------
+    output: The output directory name (``output_XXXXX``).
+    angles: The camera sweep angles, if any.
+
+    Returns: list of file names.
+    -------
+
+    """
+    end_file = "Image_%s.png" % pt.Path(output).name.replace("output_", "")
+
+    return ([get_sweep_filename(end_file, angle) for angle in angles] if angles else [end_file])
+
+
+def get_movie_stream(output_directory, output_directories) -> MovieStream:
+    """
+    Creates the ``MovieStream`` of a sequence. The movie is placed where ``run_Movify`` would put the movie of
+    ``output_directory`` and its frames are the ``Image_XXXXX`` frames of ``output_directories``.
+    Parameters
+    ----------
+    output_directory: The output directory of the sequence.
+    output_directories: The outputs of the sequence, in order.
+
+    Returns: The ``MovieStream``.
+    -------
+
+    """
+    movie_directory = pt.Path(output_directory.replace(CONFIG["system"]["directories"]["figures_directory"],
+                                                       CONFIG["system"]["directories"]["movies_directory"])).parent
+    movie_directory.mkdir(parents=True, exist_ok=True)
+
+    return MovieStream(str(movie_directory / ("%s.mp4" % pt.Path(output_directory).name)),
+                       ["Image_%s" % pt.Path(output).name.replace("output_", "") for output in output_directories])
+
+
+def write_frame_record(end_file, record: dict):
+    """
+    Writes the frame record of a saved image next to it (``Image_00010.png`` -> ``Image_00010.toml``). The record holds
+    the image cache keys of the frame and the settings it was drawn with, so that it can be redrawn without the
+    snapshot (see ``restyle_image_sequence``).
+    Parameters
+    ----------
+    end_file: The file the image was saved to.
+    record: The record.
+
+    Returns: The path of the record.
+    -------
+
+    """
+    path = pt.Path(end_file).with_suffix(".toml")
+
+    # - TOML has no null; unset settings are simply left out -#
+    record = {key: value for key, value in record.items() if value is not None}
+    if "contours" in record:
+        record["contours"] = {key: value for key, value in record["contours"].items() if value is not None}
+
+    with open(path, "w") as file:
+        toml.dump(record, file)
+
+    return str(path)
+
+
+def get_image_targets(snapshot, qty, families=None, units=None, av_z=False) -> list:
+    """
+    Builds the render targets (see ``generate_image_arrays``) for an image of ``qty`` summed over ``families``.
+    Parameters
+    ----------
+    snapshot: The SimSnap object to use in the plotting.
+    qty: The qty to plot.
+    families: The families to include in the plot. Defaults to the families of the quantity (or all).
+    units: The units of the image. Defaults to ``set_units(qty)``.
+    av_z: True to average along the line of sight.
+
+    Returns: List of ``(family, qty, units, av_z)`` tuples.
+    -------
+
+    """
+    fdbg_string = _dbg_string + "get_image_targets: "
 
     if families:  # There are families, we need to get them to a usable format.
         families = get_families(snapshot, families)
@@ -431,8 +880,109 @@ def generate_image_array(snapshot, qty, families=None, **kwargs):
         except KeyError:
             families = snapshot.families()
 
-    # - Getting defaults -#
+    units = str(pyn.units.Unit(units) if units is not None else set_units(qty))
+
+    return [(family.name, qty, units, bool(av_z)) for family in families]
+
+
+def get_image_cache_keys(snapshot, targets, **kwargs) -> dict:
+    """
+    Computes the image cache keys (see ``Caching.get_image_cache_key``) of the render targets. The key covers the
+    output the snapshot was loaded from, the target, the width, the resolution, the view, the renderer (see
+    ``get_renderer``) and the renderer options.
+    Parameters
+    ----------
+    snapshot: The SimSnap object to use in the plotting.
+    targets: The list of targets (see ``get_image_targets``).
+    kwargs: The image kwargs (see ``generate_image_arrays``). ``width`` and ``resolution`` default to
+        ``__pynbody_image_defaults``.
+
+    Returns: ``{target: key}``. The keys are ``None`` if the image cache is disabled or the snapshot wasn't loaded by
+        ``SnapView`` (and so has no known source).
+    -------
+
+    """
+    state = get_snapshot_state(snapshot)
+
+    if not CONFIG["analysis"]["cache"]["use_image_cache"] or "source" not in state or not get_cache_directory():
+        return {target: None for target in targets}
+
+    view = state.get("view", {"matrix": np.identity(3), "center": pyn.array.SimArray([0, 0, 0], "kpc")})
+
+    width = (kwargs.get("width", None) if kwargs.get("width", None) else __pynbody_image_defaults["width"])
+    resolution = (kwargs.get("resolution", None) if kwargs.get("resolution", None) else
+                  __pynbody_image_defaults["resolution"])
+
+    parameters = {
+        "renderer"  : get_renderer(**kwargs),
+        "options"   : {key: str(kwargs[key]) for key in __pycs_unsupported_kwargs if kwargs.get(key, None) is not None},
+        "width"     : float(pyn.units.Unit(width).in_units("kpc")),
+        "resolution": int(resolution),
+        "matrix"    : np.round(view["matrix"], decimals=10).tolist(),
+        "center"    : np.round(np.asarray(view["center"].in_units("kpc"), dtype="float64"), decimals=6).tolist()
+    }
+
+    return {target: get_image_cache_key(state["source"], dict(parameters, target=list(target))) for target in targets}
+
+
+def get_renderer(**kwargs) -> str:
+    """
+    Returns the renderer (see ``CONFIG["Visualization"]["Images"]["renderer"]``) used for an image with ``kwargs``. The
+    ``pycs`` renderer doesn't implement every option of ``pyn.plot.sph.image``, so images which set one of them fall
+    back to the ``pynbody`` renderer (with a warning) rather than silently ignoring it.
+    Parameters
+    ----------
+    kwargs: The image kwargs.
+
+    Returns: ``"pycs"`` or ``"pynbody"``.
+    -------
+
+    """
+    fdbg_string = _dbg_string + "get_renderer: "
+    renderer = CONFIG["Visualization"]["Images"]["renderer"]
+
+    if renderer == "pycs":
+        unsupported = [key for key in __pycs_unsupported_kwargs if kwargs.get(key, None) is not None]
 
+        if len(unsupported):
+            if tuple(unsupported) not in __renderer_warnings:
+                log_print("The pycs renderer doesn't support %s; using the pynbody renderer." % ", ".join(unsupported),
+                          fdbg_string, "warning")
+                __renderer_warnings.add(tuple(unsupported))
+
+            renderer = "pynbody"
+
+    return renderer
+
+
+def generate_image_arrays(snapshot, targets, cache_keys=None, **kwargs) -> dict:
+    """
+    Generates the image arrays of a list of ``(family, qty, units, av_z)`` targets. With the ``pycs`` renderer (see
+    ``CONFIG["Visualization"]["Images"]["renderer"]``) all of the targets of a family which share a kernel are
+    deposited in a single pass over the particles (see ``SPH_utils.deposit_images``).
+
+    Targets which are in the image cache (see ``get_image_cache_keys``) are read from it instead of being rendered, and
+    newly rendered targets are added to it.
+    Parameters
+    ----------
+    snapshot: The SimSnap object to use in the plotting.
+    targets: The list of targets (see ``get_image_targets``). The quantities of the targets which aren't cached are
+        derived here (see ``derive_fields``), so cached frames never touch the particle data.
+    cache_keys: The image cache keys of the targets, if they are already known (see ``get_image_cache_keys``).
+    kwargs: Additional kwargs. ``width``, ``resolution`` and ``threads`` (the number of render threads, see
+        ``get_render_threads``) are used; the rest are passed to ``pyn.plot.sph.image`` by the ``pynbody`` renderer.
+
+    Returns: ``{target: array}``.
+    -------
+
+    """
+    # DEBUGGING
+    ########################################################################################################################
+    fdbg_string = _dbg_string + "generate_image_arrays: "
+    log_print("Rendering %s targets for %s." % (len(targets), snapshot), fdbg_string, "debug")
+
+    # KWARG MANAGEMENT
+    ########################################################################################################################
     for key, value in __pynbody_image_defaults.items():  # cycle through all of the defaults
         if key not in kwargs:
             kwargs[key] = value
@@ -441,36 +991,184 @@ def generate_image_array(snapshot, qty, families=None, **kwargs):
         else:
             pass
 
-    # - Managing units -#
+    for key in ["units", "av_z", "families", "qty"]:  # these are set by the targets.
+        kwargs.pop(key, None)
 
-    if "units" not in kwargs:  # there are not yet specified units
-        kwargs["units"] = set_units(qty)
+    threads = kwargs.pop("threads", None)
+    if not threads:
+        threads = get_render_threads()
 
-    # - Managing fix units -#
-    if qty == "temp":  # ----> we feed this into the fix units function.
-        fix_units = kwargs["units"]
-        kwargs["units"] = pyn.units.Unit("K")
-    else:
-        fix_units = kwargs["units"]
+    renderer = get_renderer(**kwargs)
+
+    # - Reading from the image cache -#
+    if cache_keys is None:
+        cache_keys = get_image_cache_keys(snapshot, targets, **kwargs)
+
+    source = get_snapshot_state(snapshot).get("source", None)
+    cached = {}
+
+    for target, key in cache_keys.items():
+        entry = (load_image_cache(source, key) if key else None)
+
+        if entry is not None:
+            cached[target] = entry[0]
+
+    if len(cached) == len(cache_keys):
+        log_print("Read all %s targets from the image cache." % len(cached), fdbg_string, "debug")
+        return cached
+
+    # - Managing fix units -# temperatures are rendered in K and fixed afterwards (see ``fix_array``).
+    render_targets = {target: (target[0], target[1], ("K" if target[1] == "temp" else target[2]), target[3]) for
+                      target in targets if target not in cached}
+
+    derive_fields(snapshot, list(set(target[1] for target in render_targets)))
 
     # PLOTTING #
     ########################################################################################################################
-    # - Generating the empty array -#
-    output_array = np.zeros((kwargs["resolution"], kwargs["resolution"]))
-
-    for family in families:
-        ### Cycle through each family and generate the image array.
-        # try:
-        output_array += pyn.plot.sph.image(snapshot[family], qty=qty, noplot=True, **kwargs, threaded=False)
-        log_print("Plotted family %s for snapshot %s and quantity %s." % (family.name, snapshot, qty),
-                  fdbg_string, "info")
-    # except Exception:
-    #    log_print("Failed to plot family %s for snapshot %s and quantity %s." % (family.name, snapshot, qty),
-    #              fdbg_string, "error")
+    rendered_families = list(set(target[0] for target in render_targets))
+
+    if renderer == "pycs":
+        if get_snapshot_state(snapshot).get("shared", False):
+            # - The particles are shared with other processes (see ``make_plot_sweep``); the renderer moves a copy -#
+            views = {family.name: get_view_transform(snapshot, family, "kpc") for family in
+                     get_families(snapshot, rendered_families)}
+        else:
+            apply_view(snapshot, rendered_families)  # only the rendered families are moved.
+            views = None
+
+        images = deposit_images(snapshot, list(set(render_targets.values())), kwargs["width"], kwargs["resolution"],
+                                threads=threads, views=views)
+    else:
+        families = {family.name: family for family in snapshot.families()}
+
+        if get_snapshot_state(snapshot).get("shared", False):
+            # - The particles are shared with other processes; each family is rendered from a copy in the view -#
+            subsnaps = {family: get_view_copy(snapshot, families[family],
+                                              ["pos", "smooth", "mass", "rho"] +
+                                              [target[1] for target in render_targets if target[0] == family])
+                        for family in rendered_families}
+        else:
+            apply_view(snapshot, rendered_families)
+            subsnaps = {family: snapshot[families[family]] for family in rendered_families}
+
+        images = {}
+
+        for target in set(render_targets.values()):
+            images[target] = pyn.plot.sph.image(subsnaps[target[0]], qty=target[1], units=target[2],
+                                                av_z=target[3], noplot=True, **kwargs, threaded=threads)
+            log_print("Plotted target %s for snapshot %s." % (str(target), snapshot), fdbg_string, "info")
 
     # RETURNING
     ########################################################################################################################
-    return fix_array(output_array, qty, fix_units)
+    images = {target: fix_array(images[render_target], target[1], target[2]) for target, render_target in
+              render_targets.items()}
+
+    for target, image in images.items():
+        if cache_keys[target]:
+            write_image_cache(source, cache_keys[target], image,
+                              {"target": list(target), "width": str(kwargs["width"]),
+                               "resolution": int(kwargs["resolution"])})
+
+    images.update(cached)
+    return images
+
+
+def get_view_copy(snapshot, family, fields) -> pyn.snapshot.SimSnap:
+    """
+    Returns a new snapshot of the particles of ``family`` with copies of ``fields`` in which the positions are in the
+    current view of ``snapshot`` (see ``get_view_transform``). Nothing in ``snapshot`` is moved or written to, so this
+    is how the ``pynbody`` renderer renders particles which are shared with other processes (see ``make_plot_sweep``).
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot).
+    family: The ``pyn.family.Family`` to copy.
+    fields: The fields to copy. Fields which the family doesn't have are skipped.
+
+    Returns: The copy.
+    -------
+
+    """
+    source = snapshot[family]
+    copy = pyn.new(**{family.name: len(source)})
+    copy.properties.update(snapshot.properties)
+
+    for field in dict.fromkeys(fields):
+        try:
+            copy[field] = source[field]
+        except KeyError:
+            continue
+
+    transform = get_view_transform(snapshot, family, copy["pos"].units)
+
+    if transform is not None:
+        copy["pos"] = pyn.array.SimArray(np.matmul(copy["pos"].view(np.ndarray), transform[0].transpose()) +
+                                         transform[1], copy["pos"].units)
+
+    return copy
+
+
+def generate_image_array(snapshot, qty, families=None, **kwargs):
+    """
+    Generates the plot array for a specific snapshot and quantity.
+    Parameters
+    ----------
+    snapshot: The SimSnap object to use in the plotting.
+    qty: The qty to plot.
+    families: The families to include in the plot. Defaults to all.
+    kwargs: Additional kwargs to pass to the plotting system.
+
+    Returns: Numpy array.
+    -------
+
+    """
+    # DEBUGGING
+    ########################################################################################################################
+    fdbg_string = _dbg_string + "generate_image_array: "
+    log_print("Plotting %s for families %s and qty %s." % (qty, families, snapshot), fdbg_string, "debug")
+
+    targets = get_image_targets(snapshot, qty, families=families, units=kwargs.get("units", None),
+                                av_z=kwargs.get("av_z", False))
+    images = generate_image_arrays(snapshot, targets, **kwargs)
+
+    return sum(np.asarray(images[target]) for target in targets)
+
+
+def generate_point_samples(snapshot, qty, points, families=None, units=None, av_z=False) -> pyn.array.SimArray:
+    """
+    Evaluates ``qty`` at each of the ``points`` with the same conventions as ``generate_image_array`` (i.e. the value of
+    the pixel centered on each point) but without rendering an image. See ``SPH_utils.sample_points``.
+    Parameters
+    ----------
+    snapshot: The SimSnap object to sample.
+    qty: The qty to sample.
+    points: ``(n,3)`` SimArray of the sample points (in the current view).
+    families: The families to include. Defaults to the families of the quantity (or all).
+    units: The units of the samples. Defaults to ``set_units(qty)``.
+    av_z: True to average along the line of sight.
+
+    Returns: ``SimArray`` of the ``n`` samples.
+    -------
+
+    """
+    # DEBUGGING
+    ########################################################################################################################
+    fdbg_string = _dbg_string + "generate_point_samples: "
+    log_print("Sampling %s at %s points of %s." % (qty, len(points), snapshot), fdbg_string, "debug")
+
+    targets = get_image_targets(snapshot, qty, families=families, units=units, av_z=av_z)
+
+    if not len(targets):
+        make_error(SnapshotError, fdbg_string, "%s has none of the families of %s." % (snapshot, qty))
+
+    # - Managing fix units -# temperatures are sampled in K and fixed afterwards (see ``fix_array``).
+    sample_targets = {target: (target[0], target[1], ("K" if target[1] == "temp" else target[2]), target[3]) for
+                      target in targets}
+
+    apply_view(snapshot, list(set(target[0] for target in targets)))
+    samples = sample_points(snapshot, list(set(sample_targets.values())), points)
+
+    return pyn.array.SimArray(sum(np.asarray(fix_array(samples[sample_targets[target]], target[1], target[2])) for
+                                  target in targets), targets[0][2])
 
 
 def make_plot(snapshot,
@@ -484,7 +1182,10 @@ def make_plot(snapshot,
               vmin=None,
               vmax=None,
               length_units=CONFIG["units"]["default_length_unit"],
-              **kwargs) -> None:
+              fast=False,
+              renderer=None,
+              writer=None,
+              **kwargs) -> np.ndarray:
     """
     ``make_plot`` generates a plot of ``qty`` with the associated parameters.
     Parameters
@@ -500,9 +1201,13 @@ def make_plot(snapshot,
     vmin: color minimum
     vmax: color maximum.
     length_units: The length units to use for the x/y axis.
+    fast: True to write the image with the fast frame writer (see ``write_fast_image``) instead of matplotlib. Only
+        used when saving; contours are not drawn.
+    renderer: A ``FrameRenderer`` to draw into; sequences pass the same one for every frame (see ``plot_image_array``).
+    writer: A ``FrameWriter`` to encode and write the image on; sequences pass the same one for every frame.
     kwargs: additional kwargs to pass.
 
-    Returns: None
+    Returns: The image array.
     -------
 
     """
@@ -582,34 +1287,17 @@ def make_plot(snapshot,
     #                                                                                                                  #
     #                                                                                                                  #
     # ---------------------------------------------------------------------------------------------------------------- #
-    ### Making the figure ###
-    figure = plt.figure(figsize=tuple(CONFIG["Visualization"]["default_figure_size"]))
-    axes = figure.add_subplot(111)
-
-    # - Managing the Extends -# This allows us to set the right ticks and axes.
-    numerical_width = float(pyn.units.Unit(kwargs["width"]).in_units(length_units))
-    extent = [-numerical_width / 2, numerical_width / 2, -numerical_width / 2, numerical_width / 2]
-
     # FETCHING DATA
     # ------------------------------------------------------------------------------------------------------------------#
 
-    ##- deriving arrays -##
-    qty_list = ([qty] if not contours else [qty, contour_qty])  # The quantities that we are going to need.
-    if "entropy" in qty_list:
-        make_pseudo_entropy(snapshot)
-    if "mach" in qty_list:
-        make_mach_number(snapshot)
-    if "xray" in qty_list:
-        generate_xray_emissivity(snapshot)
-    if "sound_speed" in qty_list:
-        generate_speed_of_sound(snapshot)
-
-    # Building the base image array #
-    # -------------------------------#
-    image_array = generate_image_array(snapshot, qty, families=families, **kwargs)
+    # Building the image arrays #
+    # --------------------------#
+    #  The base image and the contour image are rendered together so that the families they share are only
+    #  traversed once. The quantities are only derived if they aren't cached (see ``generate_image_arrays``).
+    #
+    image_targets = get_image_targets(snapshot, qty, families=families, units=kwargs["units"],
+                                      av_z=kwargs.get("av_z", False))
 
-    # Building the contour image array #
-    # ----------------------------------#
     if contours:
         # Managing smoothing if necessary #
         if "smoothing_kernel" in contour_kwargs:
@@ -617,112 +1305,190 @@ def make_plot(snapshot,
             del contour_kwargs["smoothing_kernel"]
         else:
             smoothing_kernel = None
+
+        contour_targets = get_image_targets(snapshot, contour_qty, families=contour_kwargs.get("families", None),
+                                            units=contour_kwargs.get("units", None),
+                                            av_z=contour_kwargs.get("av_z", False))
+    else:
+        contour_targets = []
+
+    # - The cache keys are also used to record the frame (see below) -#
+    cache_keys = get_image_cache_keys(snapshot, image_targets + contour_targets, **kwargs)
+
+    images = generate_image_arrays(snapshot, image_targets + contour_targets, cache_keys=cache_keys, **kwargs)
+    image_array = sum(np.asarray(images[target]) for target in image_targets)
+
+    # Building the contour image array #
+    # ----------------------------------#
+    if contours:
         # - We need to grab the correct contour images -#
-        contour_array = generate_image_array(snapshot, contour_qty, **contour_kwargs)
+        contour_array = sum(np.asarray(images[target]) for target in contour_targets)
 
         if smoothing_kernel:
             contour_array = scipy.ndimage.gaussian_filter(contour_array, smoothing_kernel)
     else:
         contour_array = None
 
-    # Aesthetic Management
+    # Plotting
     # ------------------------------------------------------------------------------------------------------------------#
+    if contours:
+        # - making the legend label -#
+        contour_label = fancy_qty(contour_qty)
 
-    # - Color management and vmin/vmax - #
-    # ------------------------------------#
-    # Setting vmin/vmax as necessary.
-    if not vmin:
-        vmin = np.amin(image_array)
-    if not vmax:
-        vmax = np.amax(image_array)
-
-    # managing log
-    if log:
-        vmin = (vmin if vmin > 0 else np.amin(image_array[np.where(image_array > 0)]))
-        color_norm = mpl.colors.LogNorm(vmin=vmin, vmax=vmax, clip=True)
+        if contour_kwargs.get("families", None):
+            contour_label += " (%s)" % contour_kwargs["families"]
+
+        if contour_kwargs.get("av_z", False):
+            contour_label += " - projected"
     else:
-        color_norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax, clip=True)
+        contour_label = None
+
+    # - Recording the frame -# saved frames which are fully cached can be restyled (see ``restyle_image_sequence``).
+    if save and end_file and all(cache_keys.values()):
+        record = {
+            "source"      : get_snapshot_state(snapshot)["source"],
+            "qty"         : qty,
+            "time"        : "%s Gyr" % float(snapshot.properties["time"].in_units("Gyr")),
+            "units"       : str(kwargs["units"]),
+            "width"       : str(kwargs["width"]),
+            "cmap"        : getattr(kwargs["cmap"], "name", kwargs["cmap"]),
+            "time_units"  : str(time_units),
+            "length_units": str(length_units),
+            "log"         : bool(log),
+            "vmin"        : vmin,
+            "vmax"        : vmax,
+            "title"       : title,
+            "image_keys"  : [cache_keys[target] for target in image_targets]
+        }
 
-    # - PLOTTING - #
-    # --------------#
-    image = axes.imshow(image_array, origin="lower", cmap=kwargs["cmap"], extent=extent, norm=color_norm)
+        if contours:
+            record["contours"] = dict(contour_plot_kwargs, qty=contour_qty, label=contour_label,
+                                      smoothing_kernel=smoothing_kernel,
+                                      keys=[cache_keys[target] for target in contour_targets])
 
-    # Contour plotting procedure and management #
-    # -------------------------------------------#
-    if contours:
-        # Setting image limits #
-        if not contour_plot_kwargs["vmin"]:
-            contour_plot_kwargs["vmin"] = np.amin(contour_array)
+        write_frame_record(end_file, record)
 
-        if not contour_plot_kwargs["vmax"]:
-            contour_plot_kwargs["vmax"] = np.amax(contour_array)
+    if fast and save:
+        if contours:
+            log_print("The fast frame writer doesn't draw contours; ignoring them.", fdbg_string, "warning")
 
-        # Generating levels
-        # --------------------------------------------------------------------------------------------------------------#
-        if not contour_plot_kwargs["levels"]:
-            contour_plot_kwargs["levels"] = (np.linspace(contour_plot_kwargs["vmin"],
-                                                         contour_plot_kwargs["vmax"],
-                                                         contour_plot_kwargs["nlevels"]) if not contour_plot_kwargs[
-                "log"] else
-                                             np.logspace(np.log10(np.amax([contour_plot_kwargs["vmin"], 1])),
-                                                         np.log10(contour_plot_kwargs["vmax"]),
-                                                         contour_plot_kwargs["nlevels"]))
-
-        # Plotting the contours
-        # --------------------------------------------------------------------------------------------------------------#
-        axes.contour(np.linspace(extent[0], extent[1], contour_array.shape[0]),
-                     np.linspace(extent[0], extent[1], contour_array.shape[1]),
-                     contour_array,
-                     levels=contour_plot_kwargs["levels"],
-                     colors=contour_plot_kwargs["color"])
+        write_fast_image(image_array, qty, snapshot.properties["time"], end_file, time_units=time_units, title=title,
+                         log=log, vmin=vmin, vmax=vmax, units=kwargs["units"], cmap=kwargs["cmap"], writer=writer)
+    else:
+        plot_image_array(image_array, qty, snapshot.properties["time"], save=save, end_file=end_file,
+                         time_units=time_units, title=title, log=log, vmin=vmin, vmax=vmax, length_units=length_units,
+                         contour_array=contour_array, contour_plot_kwargs=(contour_plot_kwargs if contours else None),
+                         contour_label=contour_label, units=kwargs["units"], width=kwargs["width"],
+                         cmap=kwargs["cmap"], renderer=renderer, writer=writer)
 
-        # Creating the contour legend
-        # --------------------------------------------------------------------------------------------------------------#
-        if contour_plot_kwargs["legend"]:
-            # making the label
-            legend_label = fancy_qty(contour_qty)
+    return image_array
 
-            if contour_kwargs["families"]:
-                legend_label += " (%s)" % contour_kwargs["families"]
 
-            if contour_kwargs["av_z"]:
-                legend_label += " - projected"
+def write_fast_image(image_array, qty, time, end_file, time_units=pyn.units.Unit(CONFIG["units"]["default_time_unit"]),
+                     title=None, log=False, vmin=None, vmax=None, units=None, cmap=None, writer=None) -> None:
+    """
+    Writes an image array with the fast frame writer (``plot_utils.write_fast_frame``): the PNG is written directly
+    with a pre-rendered colorbar and the time and title as plain text. Meant for long movie sequences.
+    Parameters
+    ----------
+    image_array: The image array.
+    qty: The quantity of the image.
+    time: The time of the snapshot.
+    end_file: The save location to use.
+    time_units: The time units to display.
+    title: The title of the plot.
+    log: True to use log, False to use normal.
+    vmin: color minimum
+    vmax: color maximum.
+    units: The units of the image. Defaults to ``set_units(qty)``.
+    cmap: The colormap. Defaults to the default image colormap.
+    writer: A ``FrameWriter`` to encode and write the PNG on. Defaults to writing it here.
 
-            legend_elements = [
-                Line2D([], [], color=contour_plot_kwargs["color"], label=legend_label)]
+    Returns: None
+    -------
 
-            axes.legend(handles=legend_elements, loc="upper right")
+    """
+    units = (pyn.units.Unit(units) if units else set_units(qty))
+    time_units = pyn.units.Unit(time_units)
 
-    # Colorbar Management
-    # ------------------------------------------------------------------------------------------------------------------#
-    plt.colorbar(image, label=r"$\mathrm{%s} \;\left[\mathrm{%s}\right]$" % (fancy_qty(qty), kwargs["units"].latex()))
+    annotation = "t = %.2f %s" % (float(time.in_units(time_units)), time_units)
+    if title:
+        annotation = "%s\n%s" % (title, annotation)
+
+    write_fast_frame(image_array, end_file, (cmap if cmap else __pynbody_image_defaults["cmap"]), vmin=vmin,
+                     vmax=vmax, log=log, annotation=annotation, writer=writer,
+                     label=r"$\mathrm{%s} \;\left[\mathrm{%s}\right]$" % (fancy_qty(qty), units.latex()))
+
+
+def plot_image_array(image_array,
+                     qty,
+                     time,
+                     save=CONFIG["Visualization"]["default_figure_save"],
+                     end_file=None,
+                     time_units=pyn.units.Unit(CONFIG["units"]["default_time_unit"]),
+                     title=None,
+                     log=False,
+                     vmin=None,
+                     vmax=None,
+                     length_units=CONFIG["units"]["default_length_unit"],
+                     contour_array=None,
+                     contour_plot_kwargs=None,
+                     contour_label=None,
+                     renderer=None,
+                     writer=None,
+                     **kwargs) -> None:
+    """
+    Draws an image array which has already been rendered (the figure stage of ``make_plot``).
+    Parameters
+    ----------
+    image_array: The image array.
+    qty: The quantity of the image.
+    time: The time of the snapshot.
+    save: True to save, False to show.
+    end_file: The save location to use.
+    time_units: The time units to display.
+    title: The title of the plot.
+    log: True to use log, False to use normal.
+    vmin: color minimum
+    vmax: color maximum.
+    length_units: The length units to use for the x/y axis.
+    contour_array: The image array of the contours. ``None`` for no contours.
+    contour_plot_kwargs: The contour plotting kwargs (``vmin``, ``vmax``, ``log``, ``levels``, ``nlevels``, ``color``
+        and ``legend``).
+    contour_label: The legend label of the contours.
+    renderer: A ``FrameRenderer`` to draw into. Its figure is kept for the next frame. Defaults to a new figure which
+        is closed once it has been saved.
+    writer: A ``FrameWriter`` to encode and write the PNG on. Defaults to writing it here.
+    kwargs: ``units``, ``width`` and ``cmap`` of the image.
+
+    Returns: None
+    -------
 
-    # Text Management #
+    """
+    # Setup
     # ------------------------------------------------------------------------------------------------------------------#
-    # - TITLES - #
-    plt.title(r"$t = \mathrm{%s\;%s},\;\;\mathrm{Quantity:\;%s}\;[\mathrm{%s}]$" % (
-        np.round(snapshot.properties["time"].in_units(time_units), decimals=2),
-        time_units.latex(),
-        fancy_qty(qty),
-        kwargs["units"].latex()), fontsize=10)
-    if title:
-        plt.suptitle(title, y=0.93)
+    for key, value in __pynbody_image_defaults.items():  # cycle through all of the defaults
+        if not kwargs.get(key, None):
+            kwargs[key] = value
+
+    reuse = renderer is not None and save
+    renderer = (renderer if reuse else FrameRenderer())
 
-    # - AXES LABELS -#
-    axes.set_ylabel(r"$y\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
-    axes.set_xlabel(r"$x\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
+    # Drawing
+    # ------------------------------------------------------------------------------------------------------------------#
+    renderer.draw_image(image_array, qty, time, time_units=time_units, title=title, log=log, vmin=vmin, vmax=vmax,
+                        length_units=length_units, contour_array=contour_array,
+                        contour_plot_kwargs=contour_plot_kwargs, contour_label=contour_label,
+                        units=kwargs.get("units", None), width=kwargs["width"], cmap=kwargs["cmap"])
 
     # Saving
     #########################################################################################################################
     if save:
-        plt.savefig(end_file)
-        del image_array
-        axes.cla()
-        del axes
-        plt.figure().clear()
-        plt.clf()
-        plt.close('all')
-        gc.collect()
+        renderer.save(end_file, writer=writer)
+
+        if not reuse:
+            renderer.close()
+            gc.collect()
     else:
         plt.show()
 
@@ -737,6 +1503,8 @@ def make_gas_dm_image(snapshot,
                       colors=None,
                       time_units=pyn.units.Unit(CONFIG["units"]["default_time_unit"]),
                       length_units=CONFIG["units"]["default_length_unit"],
+                      renderer=None,
+                      writer=None,
                       **kwargs):
     # Intro debugging
     ####################################################################################################################
@@ -773,9 +1541,16 @@ def make_gas_dm_image(snapshot,
     # Generating the plots
     ####################################################################################################################
     # building the images #
-    generate_xray_emissivity(snapshot)
-    dark_matter_array = generate_image_array(snapshot, "rho", families=["dm"], units=unit_array[0], **kwargs)
-    baryonic_array = generate_image_array(snapshot, "xray", families=["gas"], units=unit_array[1], **kwargs)
+    derive_fields(snapshot, ["xray"])
+    dark_matter_targets = get_image_targets(snapshot, "rho", families=["dm"], units=unit_array[0],
+                                            av_z=kwargs.get("av_z", False))
+    baryonic_targets = get_image_targets(snapshot, "xray", families=["gas"], units=unit_array[1],
+                                         av_z=kwargs.get("av_z", False))
+
+    images = generate_image_arrays(snapshot, dark_matter_targets + baryonic_targets, **kwargs)
+    dark_matter_array = sum(np.asarray(images[target]) for target in dark_matter_targets)
+    baryonic_array = sum(np.asarray(images[target]) for target in baryonic_targets)
+    del images
 
     # - creating norms -#
     if not vmax_dm:
@@ -809,53 +1584,21 @@ def make_gas_dm_image(snapshot,
     final_image = merge_alpha_images([norm_gas(baryonic_array), norm_dm(dark_matter_array)], colors)
     # - cleaning up -#
     del baryonic_array, dark_matter_array
-    gc.collect()
     # Plotting
     ####################################################################################################################
-    # - Figure settings -#
-    l = 8  # the size of the actual image in inches
-    a1, a2, b1, b2 = (0.1, 0.03, 0.1, 0.1)  # these are the subplot margins
-    w, h = l / ((0.74) * (1 - (a1 + a2))), l / (1 - (b1 + b2))
-    axis_ratio = h / w
-    # - Making the figure -#
-    fig = plt.figure(figsize=(8, 8 * axis_ratio))
-    axes = fig.add_subplot(111)
-
-    axes.imshow(final_image, extent=extent)
-
-    # - TITLES -#
-    plt.title("Comparative Distribution of Dark Matter and Baryonic Matter\n" + r"$t = \mathrm{%s\;%s}$" % (
-        np.round(snapshot.properties["time"].in_units(time_units), decimals=2),
-        time_units.latex()), fontsize=10)
-
-    # - AXES LABELS -#
-    axes.set_ylabel(r"$y\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
-    axes.set_xlabel(r"$x\;\;\left[\mathrm{%s}\right]$" % (pyn.units.Unit(length_units).latex()))
-    axes.set_facecolor("black")
-
-    # - Adding colorbars -#
-
-    ##- Fetching the necessary colormaps -##
-    cmap_gas, cmap_dm = tuple([get_color_binary_colormap(col) for col in colors])  # grabs the correct colormaps
-
-    # creating the mapables #
-    bar_gas, bar_dm = plt.cm.ScalarMappable(norm=norm_gas, cmap=cmap_gas), plt.cm.ScalarMappable(norm=norm_dm,
-                                                                                                 cmap=cmap_dm)
-    plt.colorbar(bar_gas, label=r"X-ray Emissivity / $%s$" % unit_array[1].latex(), fraction=0.1, pad=0.05)
-    plt.colorbar(bar_dm, label=r"Dark Matter Density / $%s$" % unit_array[0].latex(), fraction=0.1, pad=0.01)
-
-    # - adjusting subplots -#
-    plt.subplots_adjust(left=a1, right=1 - a2, bottom=b1, top=1 - b2)
+    reuse = renderer is not None and save
+    renderer = (renderer if reuse else FrameRenderer())
+
+    renderer.draw_gas_dm(final_image, extent, snapshot.properties["time"], (norm_gas, norm_dm), colors, unit_array,
+                         time_units=time_units, length_units=length_units)
+
     # - saving -#
     if save:
-        plt.savefig(end_file)
-
-        axes.cla()
-        del axes
-        plt.figure().clear()
-        plt.clf()
-        plt.close('all')
-        gc.collect()
+        renderer.save(end_file, writer=writer)
+
+        if not reuse:
+            renderer.close()
+            gc.collect()
     else:
         plt.show()
 
@@ -863,16 +1606,228 @@ def make_gas_dm_image(snapshot,
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ----------------------------------------------------- Functions -------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
-def generate_image_sequence(simulation_directory, qty, multiprocess=True, nproc=3, **kwargs):
+def make_plot_sweep(snapshot, qty, angles, end_file, nproc=1, **kwargs) -> list:
+    """
+    Renders ``qty`` for ``snapshot`` from each of the camera ``angles``. The snapshot is only loaded once; each angle
+    only changes the view transform (see ``set_view``) around the current view center. With ``nproc > 1`` the angles
+    are split over forked workers which share the particle data copy-on-write; the workers never write to it (each
+    render transforms its own copy of the positions, see ``generate_image_arrays``).
+    Parameters
+    ----------
+    snapshot: The snapshot to plot.
+    qty: The quantity to plot.
+    angles: The list of ``(azimuth, elevation)`` pairs in degrees.
+    end_file: The un-swept file name. Each angle is saved to ``get_sweep_filename(end_file, angle)``.
+    nproc: The number of processes to use.
+    kwargs: Additional kwargs to pass to ``make_plot``. A ``renderer`` (see ``FrameRenderer``) and ``writer`` (see
+        ``plot_utils.FrameWriter``) are only used when rendering serially.
+
+    Returns: The list of files written.
+    -------
+
+    """
+    global _sweep_snapshot
+    # Debugging
+    # ------------------------------------------------------------------------------------------------------------------#
+    fdbg_string = _dbg_string + "make_plot_sweep: "
+    log_print("Rendering %s for %s from %s camera angles." % (qty, snapshot, len(angles)), fdbg_string, "debug")
+
+    # Setup
+    # ------------------------------------------------------------------------------------------------------------------#
+    view = get_snapshot_state(snapshot).get("view", {})
+    center = view.get("center", None)  # The sweep rotates about the current center.
+    kwargs["save"] = True
+    renderer = kwargs.pop("renderer", None)  # only used by the serial sweep; figures can't be sent to workers.
+    writer = kwargs.pop("writer", None)
+
+    # Rendering
+    # ------------------------------------------------------------------------------------------------------------------#
+    if nproc > 1 and "fork" in get_all_start_methods():
+        #  Everything the renderer reads is loaded (or derived) once here, so the workers share it. The workers never
+        #  move the shared particles; the renderer moves its own copy of the positions (see ``generate_image_arrays``).
+        #
+        state = get_snapshot_state(snapshot)
+        derive_fields(snapshot, [qty])
+
+        for family, target_qty, _, _ in get_image_targets(snapshot, qty, families=kwargs.get("families", None),
+                                                          units=kwargs.get("units", None),
+                                                          av_z=kwargs.get("av_z", False)):
+            for field in ["pos", "smooth", "mass", "rho", target_qty]:
+                try:
+                    snapshot[get_families(snapshot, [family])[0]][field]
+                except KeyError:
+                    pass
+
+        _sweep_snapshot = snapshot  # inherited by the forked workers.
+        state["shared"] = True
+
+        partition = split(list(angles), nproc)
+        arg = [([partition[i], end_file, qty, center], kwargs) for i in range(len(partition))]
+
+        try:
+            with ProcessPoolExecutor(max_workers=nproc, mp_context=get_context("fork")) as executor:
+                list(executor.map(mp_make_sweep_plot, arg))
+        finally:
+            _sweep_snapshot = None
+            state.pop("shared", None)
+    else:
+        if nproc > 1:
+            log_print("Forked workers are unavailable on this platform. Rendering the sweep serially.", fdbg_string,
+                      "warning")
+
+        local_renderer, local_writer = renderer is None, writer is None
+        renderer = (FrameRenderer() if local_renderer else renderer)
+        writer = (FrameWriter() if local_writer else writer)
+
+        for angle in angles:
+            set_view(snapshot, angles=angle, center=center)
+            make_plot(snapshot, qty, end_file=get_sweep_filename(end_file, angle), renderer=renderer, writer=writer,
+                      **kwargs)
+
+        if local_renderer:
+            renderer.close()
+        if local_writer:
+            writer.close()
+
+        # - Restoring the original view -#
+        if "matrix" in view:
+            get_snapshot_state(snapshot)["view"] = view
+
+    return [get_sweep_filename(end_file, angle) for angle in angles]
+
+
+def get_frame_sample(snapshot, qty, families=None, units=None, av_z=False, width=None, resolution=None,
+                     sample_resolution=None, threads=None) -> np.ndarray:
+    """
+    Returns a sample of the image array of ``qty`` for the color limit pass (see ``get_sequence_color_limits``). If
+    the full resolution arrays are in the image cache they are read (and thinned out to ``sample_resolution``) without
+    deriving anything; otherwise the image is rendered at ``sample_resolution`` and cached. At the full resolution (the
+    default) the sample holds the true extremes of the frame, and the main pass reads the render from the cache.
+    Parameters
+    ----------
+    snapshot: The snapshot to sample.
+    qty: The quantity to sample.
+    families: The families to include.
+    units: The units of the image.
+    av_z: True to average through the slice.
+    width: The width of the image.
+    resolution: The resolution of the full image.
+    sample_resolution: The resolution to sample at. Defaults to
+        ``CONFIG["Visualization"]["Images"]["Normalization"]["resolution"]``; ``0`` is the full resolution.
+    threads: The number of render threads.
+
+    Returns: The flattened (``float32``) sample.
+    -------
+
+    """
+    width = (width if width else __pynbody_image_defaults["width"])
+    resolution = int(resolution if resolution else __pynbody_image_defaults["resolution"])
+    sample_resolution = int(sample_resolution if sample_resolution else
+                            CONFIG["Visualization"]["Images"]["Normalization"]["resolution"])
+    sample_resolution = (min(sample_resolution, resolution) if sample_resolution > 0 else resolution)
+    units = (pyn.units.Unit(units) if units else set_units(qty))
+
+    targets = get_image_targets(snapshot, qty, families=families, units=units, av_z=av_z)
+
+    # - Reading the full resolution arrays if they are all cached -#
+    source = get_snapshot_state(snapshot).get("source", None)
+    entries = [(load_image_cache(source, key) if key else None) for key in
+               get_image_cache_keys(snapshot, targets, width=width, resolution=resolution).values()]
+
+    if all(entry is not None for entry in entries):
+        step = max(resolution // sample_resolution, 1)
+        image_array = sum(np.asarray(entry[0]) for entry in entries)[::step, ::step]
+    else:
+        images = generate_image_arrays(snapshot, targets, width=width, resolution=sample_resolution, threads=threads)
+        image_array = sum(np.asarray(images[target]) for target in targets)
+
+    return np.asarray(image_array, dtype="float32").ravel()
+
+
+def get_sequence_color_limits(simulation_directory, outputs, qty, log=False, percentiles=None, nproc=1, **kwargs):
+    """
+    Computes a single pair of color limits for a whole image sequence, so that the color scale doesn't change from frame
+    to frame. An evenly spaced subset of the outputs (at most
+    ``CONFIG["Visualization"]["Images"]["Normalization"]["samples"]``, always including the first and the last) is
+    sampled (see ``get_frame_sample``) and the limits are taken over all of the samples together.
+    Parameters
+    ----------
+    simulation_directory: The location of the simulation datafiles.
+    outputs: The outputs of the sequence.
+    qty: The quantity of the sequence.
+    log: True if the sequence is plotted logarithmically. Only the positive pixels are then used.
+    percentiles: ``(lower, upper)`` percentiles to use as the limits. Defaults to the minimum and maximum.
+    nproc: The number of processes to use.
+    kwargs: ``view_kwargs`` and the kwargs of ``get_frame_sample``.
+
+    Returns: ``(vmin, vmax)``.
+    -------
+
+    """
+    fdbg_string = _dbg_string + "get_sequence_color_limits: "
+    n_samples = int(CONFIG["Visualization"]["Images"]["Normalization"]["samples"])
+
+    if n_samples > 0 and len(outputs) > n_samples:
+        outputs = [outputs[index] for index in np.unique(np.linspace(0, len(outputs) - 1, n_samples).round().astype(int))]
+
+    log_print("Sampling %s outputs of %s for the color limits of %s." % (len(outputs), simulation_directory, qty),
+              fdbg_string, "debug")
+
+    # Sampling
+    ########################################################################################################################
+    if nproc > 1:
+        tasks = [([part, simulation_directory, qty], kwargs) for part in
+                 chunk(outputs, get_task_size(len(outputs), nproc))]
+        results, failures = run_task_queue(mp_get_frame_samples, tasks, nproc,
+                                           retries=CONFIG["system"]["multiprocessing"]["task_retries"])
+
+        for index, message in failures.items():
+            log_print("Failed to sample %s:\n%s" % (", ".join(tasks[index][0][0]), message), fdbg_string, "error")
+
+        samples = [sample for result in results if result for sample in result]
+    else:
+        samples = mp_get_frame_samples(([outputs, simulation_directory, qty], kwargs))
+
+    samples = (np.concatenate(samples) if len(samples) else np.array([], dtype="float32"))
+    samples = samples[np.isfinite(samples) & ((samples > 0) if log else True)]
+
+    if not samples.size:
+        make_error(ValueError, fdbg_string, "Failed to find any usable pixels for the color limits of %s." % qty)
+
+    # Limits
+    ########################################################################################################################
+    if percentiles:
+        vmin, vmax = (float(value) for value in np.percentile(samples, [float(value) for value in percentiles]))
+    else:
+        vmin, vmax = float(np.amin(samples)), float(np.amax(samples))
+
+    log_print("Using the color limits (%s, %s) for %s." % (vmin, vmax, qty), fdbg_string, "info")
+    return vmin, vmax
+
+
+def generate_image_sequence(simulation_directory, qty, multiprocess=True, nproc=3, tmin=None, tmax=None, stride=1,
+                            **kwargs):
     """
     Generates a sequence of images for the simulation using the given simulation and the given qty.
     Parameters
     ----------
     simulation_directory: The location of the simulation datafiles.
     qty: The quantity in question.
-    kwargs: The additional kwargs to pass to the plotting system.
-
-    Returns
+    tmin: The minimum output time (Gyr) to include.
+    tmax: The maximum output time (Gyr) to include.
+    stride: Only plot every ``stride``-th output.
+    kwargs: The additional kwargs to pass to the plotting system. Passing ``angles=[(az,elev),...]`` renders a camera
+        sweep of each output (see ``make_plot_sweep``). Passing ``cube=True`` also writes the image arrays of the
+        sequence to ``<qty>_cube.h5`` in the output directory (see ``Cubes.ImageCube``). Passing ``global_norm=True``
+        (or ``global_norm=(lower, upper)`` percentiles) uses the same color limits for every frame (see
+        ``get_sequence_color_limits``); a ``vmin`` or ``vmax`` which is passed is kept. Passing ``movie=True`` streams
+        the frames into a movie (see ``get_movie_stream``) instead of writing PNGs.
+
+        The sequence is written to a directory keyed by its parameters (see ``get_sequence_key``), and outputs whose
+        frames are already there (see ``SequenceManifest``) are skipped; pass ``resume=False`` to render them again
+        (and rebuild the cube). Movies always use every output; a cube also gets the finished outputs it is missing.
+
+    Returns: The list of outputs which failed (multiprocessing only).
     -------
 
     """
@@ -899,32 +1854,97 @@ def generate_image_sequence(simulation_directory, qty, multiprocess=True, nproc=
     if not "av_z" in kwargs:  # We need to use av_z for the naming convention so we add it if it doesn't exist.
         kwargs["av_z"] = False
 
+    sequence_key, description = get_sequence_key(dict(kwargs, qty=qty))
     output_directory = os.path.join(CONFIG["system"]["directories"]["figures_directory"], simulation_name,
-                                    "%s-(I-%s)" % (qty, kwargs["av_z"]), datetime.now().strftime('%m-%d-%Y_%H-%M-%S'))
+                                    "%s-(I-%s)" % (qty, kwargs["av_z"]), sequence_key)
 
     if not os.path.exists(output_directory):
         pt.Path.mkdir(pt.Path(output_directory), parents=True)
     ##- Debugging -##
     log_print("Saving %s figures to %s." % (qty, output_directory), fdbg_string, "debug")
 
+    ##- Sequence cube -##
+    cube = kwargs.get("cube", False)
+    cube_path = os.path.join(output_directory, "%s_cube.h5" % qty)
+
+    if cube and kwargs.get("angles", None):
+        make_error(ValueError, fdbg_string, "Sequence cubes can't be written for camera sweeps.")
+
+    ##- Movie -##
+    movie = kwargs.pop("movie", False)
+
+    if movie and kwargs.get("angles", None):
+        make_error(ValueError, fdbg_string, "Movies can't be streamed for camera sweeps.")
+
     ### Getting snapshot directories ###
-    output_directories = [dir for dir in os.listdir(simulation_directory) if
-                          "output" in dir]  # grab all of the output directories.
+    index = SnapshotIndex.load(simulation_directory)
+    output_directories = index.select(tmin=tmin, tmax=tmax, stride=stride)
     log_print("Found %s figures to plot." % len(output_directories), fdbg_string, "debug")
 
+    ##- Manifest -##
+    manifest = SequenceManifest(output_directory)
+
+    if not kwargs.pop("resume", True):
+        manifest.clear(files=[cube_path])
+
+    ##- Global color limits -##
+    #  The limits of an earlier run of the sequence are kept so that resumed frames match the finished ones.
+    #
+    global_norm = kwargs.pop("global_norm", False)
+
+    if global_norm and not (kwargs.get("vmin", None) and kwargs.get("vmax", None)):
+        if len(manifest.outputs()) and "vmin" in manifest.settings and "vmax" in manifest.settings:
+            vmin, vmax = manifest.settings["vmin"], manifest.settings["vmax"]
+        else:
+            vmin, vmax = get_sequence_color_limits(simulation_directory, output_directories, qty,
+                                                   log=kwargs.get("log", False),
+                                                   percentiles=(global_norm if global_norm is not True else None),
+                                                   nproc=(nproc if multiprocess else 1),
+                                                   **{key: kwargs[key] for key in
+                                                      ["view_kwargs", "families", "units", "av_z", "width",
+                                                       "resolution", "threads"] if key in kwargs})
+        kwargs["vmin"], kwargs["vmax"] = (kwargs.get("vmin", None) or vmin), (kwargs.get("vmax", None) or vmax)
+
+    manifest.describe(simulation=simulation_name, parameters=description, vmin=kwargs.get("vmin", None),
+                      vmax=kwargs.get("vmax", None))
+
+    ##- Selecting the outputs to plot -##
+    if movie:
+        plotted = output_directories
+    else:
+        plotted = manifest.pending(index, output_directories)
+
+        if cube:  # finished outputs which aren't in the cube (i.e. it was deleted) are rendered again for it.
+            cubed = (set(ImageCube(cube_path).outputs) if os.path.isfile(cube_path) else set())
+            plotted = [output for output in output_directories if output in plotted or output not in cubed]
+
+        log_print("%s of %s outputs are already finished." % (len(output_directories) - len(plotted),
+                                                             len(output_directories)), fdbg_string, "info")
+
+    stream = (get_movie_stream(output_directory, output_directories) if movie else None)
+
+    def _skip(outputs):  # leaves failed outputs out of the movie as soon as they fail, so later frames aren't held.
+        for output in outputs:
+            stream.skip("Image_%s" % pt.Path(output).name.replace("output_", ""))
+
+    def _complete(outputs):  # records the finished outputs in the manifest.
+        if not movie:
+            manifest.complete(index, {output: get_sequence_frames(output, kwargs.get("angles", None)) for output in
+                                      outputs})
+
     # Plotting
     ########################################################################################################################
     if multiprocess and nproc > 1:
         # MULTIPROCESSING
         ####################################################################################################################
-        # - Creating the partition -#
-        partition = split(output_directories, nproc)  # Maximally efficient splitting for the partition.
-
-        arg = [([partition[i], output_directory, simulation_directory, qty], kwargs) for i in range(len(partition))]
-        with ProcessPoolExecutor() as executor:
-            executor.map(mp_make_plot, arg)
+        # - Each contiguous run of snapshots (see get_task_size) goes to the next free worker -#
+        failed = run_snapshot_tasks(mp_make_plot, plotted, [output_directory, simulation_directory, qty],
+                                    dict(kwargs, movie=(stream.listen() if stream else None)), nproc,
+                                    callback=_complete, error_callback=(_skip if stream else None))
 
     else:
+        failed = []
+
         # CAMERA MANAGEMENT
         # ------------------------------------------------------------------------------------------------------------------#
         if "view_kwargs" in kwargs:
@@ -933,36 +1953,189 @@ def generate_image_sequence(simulation_directory, qty, multiprocess=True, nproc=
         else:
             view_kwargs = None
 
+        angles = kwargs.pop("angles", None)  # camera sweep angles, if any.
+        kwargs.pop("cube", None)
+
+        families = get_required_families(qty, kwargs.get("families"), kwargs.get("contour_kwargs"))
+
         # Running
         # --------------------------------------------------------------------------------------------------------------#
-        for output_direct in output_directories:  # we are plotting each of these.
-            snap_number = output_direct.replace("output_", "")  # this is just the snapshot number
-
-            # - Cleanup -#
-            if view_kwargs:
-                view = SnapView(view_parameters=view_kwargs)  # grabbing the view
-                view.load_snapshot(os.path.join(simulation_directory, output_direct))
-                snapshot = view.snapshot
-                view.snapshot = None
-                gc.collect()
-            else:
-                snapshot = pyn.load(os.path.join(simulation_directory, output_direct))
-                align_snapshot(snapshot)
+        prefetcher = SnapshotPrefetcher([os.path.join(simulation_directory, output) for output in plotted],
+                                        view_parameters=view_kwargs, families=families)
+        renderer = FrameRenderer()  # one figure for all of the frames.
+        writer = FrameWriter(stream=stream)  # the PNGs are written while the next frame is rendered.
+
+        for path, snapshot in prefetcher:  # we are plotting each of these.
+            snap_number = pt.Path(path).name.replace("output_", "")  # this is just the snapshot number
+            gc.collect()
 
             # - Plotting -#
-            make_plot(snapshot, qty, end_file=os.path.join(output_directory, "Image_%s.png" % snap_number), save=True,
-                      **kwargs)
+            end_file = os.path.join(output_directory, "Image_%s.png" % snap_number)
+
+            if angles:
+                make_plot_sweep(snapshot, qty, angles, end_file, nproc=1, renderer=renderer, writer=writer, **kwargs)
+            else:
+                image_array = make_plot(snapshot, qty, end_file=end_file, save=True, renderer=renderer, writer=writer,
+                                        **kwargs)
+
+                if cube:
+                    write_cube_part(output_directory, pt.Path(path).name, image_array,
+                                    snapshot.properties["time"].in_units("Gyr"))
+
+            # - A frame still in the writer's queue is recorded too; if it never gets written, it's missing from the
+            #   directory and so stays pending (see ``SequenceManifest.pending``).
+            _complete([pt.Path(path).name])
+
+        renderer.close()
+        writer.close()
+
+    # Finishing the movie
+    ########################################################################################################################
+    if stream:
+        stream.close()
+
+    # Writing the sequence cube
+    ########################################################################################################################
+    #  The frames are written by this process alone, in output order, once all of them are rendered. Frames of outputs
+    #  which are already in the cube replace them.
+    #
+    if cube:
+        assemble_image_cube(output_directory, cube_path,
+                            attributes={"simulation": simulation_name,
+                                        "qty": qty,
+                                        "units": str(pyn.units.Unit(kwargs["units"]) if kwargs.get("units", None)
+                                                     else set_units(qty)),
+                                        "width": str(kwargs.get("width", None) or __pynbody_image_defaults["width"]),
+                                        "resolution": int(kwargs.get("resolution", None) or
+                                                          __pynbody_image_defaults["resolution"]),
+                                        "av_z": bool(kwargs["av_z"]),
+                                        "families": kwargs.get("families", None)})
+
+    return failed
+
+
+def restyle_image_sequence(sequence_directory, output_directory=None, contour_kwargs=None, **kwargs) -> list:
+    """
+    Redraws an image sequence from the image cache with new plot settings. Nothing is rendered: each frame is drawn from
+    the cached arrays listed in its frame record (see ``write_frame_record``), so only the cosmetic settings can be
+    changed.
+    Parameters
+    ----------
+    sequence_directory: The directory of the sequence (containing the ``Image_XXXXX.toml`` frame records).
+    output_directory: The directory to write the restyled frames to. Defaults to a new ``restyled`` sub-directory.
+    contour_kwargs: Contour settings to override (``vmin``, ``vmax``, ``log``, ``levels``, ``nlevels``, ``color``,
+        ``legend``). Passing ``{"contours": False}`` drops the contours.
+    kwargs: The settings to override (``vmin``, ``vmax``, ``log``, ``cmap``, ``title``, ``time_units``,
+        ``length_units``). Any setting not passed is taken from the frame record. Passing ``fast=True`` uses the fast
+        frame writer (see ``write_fast_image``).
+
+    Returns: The list of frames which could not be redrawn (their arrays are no longer cached).
+    -------
+
+    """
+    # DEBUGGING
+    ########################################################################################################################
+    fdbg_string = _dbg_string + "restyle_image_sequence: "
+    log_print("Restyling the image sequence at %s with %s." % (sequence_directory, kwargs), fdbg_string, "debug")
+
+    # SETUP
+    ########################################################################################################################
+    records = sorted(pt.Path(sequence_directory).glob("*.toml"))
+
+    if not len(records):
+        make_error(OSError, fdbg_string, "There are no frame records in %s." % sequence_directory)
+
+    if not output_directory:
+        output_directory = os.path.join(sequence_directory, "restyled",
+                                        datetime.now().strftime('%m-%d-%Y_%H-%M-%S'))
+
+    pt.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    contour_kwargs = (contour_kwargs.copy() if contour_kwargs else {})
+    draw_contours = contour_kwargs.pop("contours", True)
+    fast = kwargs.pop("fast", False)
+
+    if fast:
+        draw_contours = False  # the fast writer doesn't draw contours.
 
+    # Redrawing
+    ########################################################################################################################
+    failed = []
+    renderer = FrameRenderer()  # one figure for all of the frames.
+    writer = FrameWriter()  # the PNGs are written while the next frame is rendered.
+
+    for record_path in records:
+        record = toml.load(record_path)
+
+        # - Reading the arrays -#
+        entries = [load_image_cache(record["source"], key) for key in record["image_keys"]]
+        contours = (record.get("contours", None) if draw_contours else None)
+
+        if contours:
+            contour_entries = [load_image_cache(record["source"], key) for key in contours["keys"]]
+        else:
+            contour_entries = []
+
+        if any(entry is None for entry in entries + contour_entries):
+            log_print("The arrays of %s are no longer cached; skipping." % record_path.stem, fdbg_string, "warning")
+            failed.append(record_path.stem)
+            continue
+
+        image_array = sum(entry[0] for entry in entries)
+
+        if contours:
+            contour_array = sum(entry[0] for entry in contour_entries)
+
+            if contours.get("smoothing_kernel", None):
+                contour_array = scipy.ndimage.gaussian_filter(contour_array, contours["smoothing_kernel"])
+
+            contour_plot_kwargs = {key: contours.get(key, None) for key in
+                                   ["vmin", "vmax", "log", "levels", "nlevels", "color", "legend"]}
+            contour_plot_kwargs.update(contour_kwargs)
+        else:
+            contour_array, contour_plot_kwargs = None, None
+
+        # - Drawing -#
+        settings = {key: record.get(key, None) for key in
+                    ["vmin", "vmax", "log", "cmap", "title", "time_units", "length_units", "units", "width"]}
+        settings.update({key: value for key, value in kwargs.items() if value is not None})
+
+        settings = {key: value for key, value in settings.items() if value is not None}
+        end_file = os.path.join(output_directory, "%s.png" % record_path.stem)
+
+        if fast:
+            for key in ["length_units", "width"]:  # there are no axes in a fast frame.
+                settings.pop(key, None)
+            write_fast_image(image_array, record["qty"], pyn.units.Unit(record["time"]), end_file, writer=writer,
+                             **settings)
+        else:
+            plot_image_array(image_array, record["qty"], pyn.units.Unit(record["time"]), save=True, end_file=end_file,
+                             contour_array=contour_array, contour_plot_kwargs=contour_plot_kwargs,
+                             contour_label=(contours.get("label", None) if contours else None),
+                             renderer=renderer, writer=writer, **settings)
 
-def generate_dm_baryon_image_sequence(simulation_directory, multiprocess=True, nproc=3, **kwargs):
+    renderer.close()
+    writer.close()
+
+    log_print("Restyled %s of %s frames into %s." % (len(records) - len(failed), len(records), output_directory),
+              fdbg_string, "info")
+    return failed
+
+
+def generate_dm_baryon_image_sequence(simulation_directory, multiprocess=True, nproc=3, tmin=None, tmax=None, stride=1,
+                                      **kwargs):
     """
     Generates a sequence of baryon/dm images for the simulation using the given simulation.
     Parameters
     ----------
     simulation_directory: The location of the simulation datafiles.
-    kwargs: The additional kwargs to pass to the plotting system.
+    tmin: The minimum output time (Gyr) to include.
+    tmax: The maximum output time (Gyr) to include.
+    stride: Only plot every ``stride``-th output.
+    kwargs: The additional kwargs to pass to the plotting system. Passing ``movie=True`` streams the frames into a
+        movie (see ``get_movie_stream``) instead of writing PNGs.
 
-    Returns
+    Returns: The list of outputs which failed (multiprocessing only).
     -------
 
     """
@@ -1000,23 +2173,29 @@ def generate_dm_baryon_image_sequence(simulation_directory, multiprocess=True, n
     log_print("Saving figures to %s." % (output_directory), fdbg_string, "debug")
 
     ### Getting snapshot directories ###
-    output_directories = [dir for dir in os.listdir(simulation_directory) if
-                          "output" in dir]  # grab all of the output directories.
+    output_directories = SnapshotIndex.load(simulation_directory).select(tmin=tmin, tmax=tmax, stride=stride)
     log_print("Found %s figures to plot." % len(output_directories), fdbg_string, "debug")
 
+    ##- Movie -##
+    stream = (get_movie_stream(output_directory, output_directories) if kwargs.pop("movie", False) else None)
+
+    def _skip(outputs):  # leaves failed outputs out of the movie as soon as they fail, so later frames aren't held.
+        for output in outputs:
+            stream.skip("Image_%s" % pt.Path(output).name.replace("output_", ""))
+
     # Plotting
     ########################################################################################################################
     if multiprocess and nproc > 1:
         # MULTIPROCESSING
         ####################################################################################################################
-        # - Creating the partition -#
-        partition = split(output_directories, nproc)  # Maximally efficient splitting for the partition.
-
-        arg = [([partition[i], output_directory, simulation_directory], kwargs) for i in range(len(partition))]
-        with ProcessPoolExecutor() as executor:
-            executor.map(mp_make_gas_dm_plot, arg)
+        # - Each contiguous run of snapshots (see get_task_size) goes to the next free worker -#
+        failed = run_snapshot_tasks(mp_make_gas_dm_plot, output_directories, [output_directory, simulation_directory],
+                                    dict(kwargs, movie=(stream.listen() if stream else None)), nproc,
+                                    error_callback=(_skip if stream else None))
 
     else:
+        failed = []
+
         # CAMERA MANAGEMENT
         # ------------------------------------------------------------------------------------------------------------------#
         if "view_kwargs" in kwargs:
@@ -1027,24 +2206,30 @@ def generate_dm_baryon_image_sequence(simulation_directory, multiprocess=True, n
 
         # Running
         # --------------------------------------------------------------------------------------------------------------#
-        for output_direct in output_directories:  # we are plotting each of these.
-            snap_number = output_direct.replace("output_", "")  # this is just the snapshot number
-            # - Cleanup -#
-            if view_kwargs:
-                view = SnapView(view_parameters=view_kwargs)  # grabbing the view
-                view.load_snapshot(os.path.join(simulation_directory, output_direct))
-                snapshot = view.snapshot
-                view.snapshot = None
-                gc.collect()
-            else:
-                snapshot = pyn.load(os.path.join(simulation_directory, output_direct))
-                align_snapshot(snapshot)
+        prefetcher = SnapshotPrefetcher([os.path.join(simulation_directory, output) for output in output_directories],
+                                        view_parameters=view_kwargs, families=["dm", "gas"])
+        renderer = FrameRenderer()  # one figure for all of the frames.
+        writer = FrameWriter(stream=stream)  # the PNGs are written while the next frame is rendered.
+
+        for path, snapshot in prefetcher:  # we are plotting each of these.
+            snap_number = pt.Path(path).name.replace("output_", "")  # this is just the snapshot number
+            gc.collect()
 
             # - Plotting -#
             make_gas_dm_image(snapshot, end_file=os.path.join(output_directory, "Image_%s.png" % snap_number),
-                              save=True,
+                              save=True, renderer=renderer, writer=writer,
                               **kwargs)
 
+        renderer.close()
+        writer.close()
+
+    # Finishing the movie
+    ########################################################################################################################
+    if stream:
+        stream.close()
+
+    return failed
+
 
 # Functions for generating profiles
 # ----------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,458 @@
+"""
+
+        Single pass post-processing: each snapshot is loaded and aligned once and every declared product is made from
+        the snapshot in memory before moving on to the next one.
+
+"""
+### Imports ###
+# adding the system path to allow us to import the important modules
+import os
+import pathlib as pt
+import sys
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+from PyCS_Core.Configuration import read_config, _configuration_path
+from PyCS_Core.Logging import set_log, log_print, make_error
+from PyCS_Core.PyCS_Errors import *
+from PyCS_Analysis.Analysis_Utils import SnapshotPrefetcher, run_snapshot_tasks
+from PyCS_Analysis.Images import make_plot, make_gas_dm_image, FrameRenderer
+from PyCS_Analysis.plot_utils import FrameWriter
+from PyCS_Analysis.Images import get_required_families as get_image_families
+from PyCS_Analysis.Profiles import make_profile_plot
+from PyCS_Analysis.Profiles import get_required_families as get_profile_families
+from PyCS_Analysis.Dynamics import find_halo_centers, get_next_center_width, write_centers_dataset
+from PyCS_Analysis.builtin_functions import find_overdensity_radii
+from PyCS_System.SimulationMangement import SimulationLog, SnapshotIndex
+import pynbody as pyn
+import toml
+from copy import deepcopy
+from datetime import datetime
+from multiprocessing import current_process
+import shutil
+import gc
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Analysis"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+simlog = SimulationLog.load_default()
+
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# -------------------------------------------------- Fixed Variables ----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_default_pipeline_path = os.path.join(CONFIG["system"]["directories"]["bin_directory"], "configs",
+                                      "pipeline_config.ini")
+_product_types = ["image", "dm-b", "profile", "centers", "radii"]
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# --------------------------------------------------- Sub-Functions -----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def read_pipeline_file(path: str = _default_pipeline_path) -> dict:
+    """
+    Reads a pipeline file. The file is a TOML file with an optional ``[view]`` table (``center`` in kpc and
+    ``angles``) and an array of ``[[products]]`` tables, each of which has a ``type`` (one of ``image``, ``dm-b``,
+    ``profile``, ``centers`` or ``radii``), a ``qty`` (images and profiles only) and an optional ``kwargs`` table which
+    is passed on to the corresponding plotting function. A ``radii`` product with ``center = "halo"`` is measured from
+    the main halo found by a ``centers`` product, which has to come before it.
+    Parameters
+    ----------
+    path: The path to the pipeline file.
+
+    Returns: The ``dict`` of pipeline settings.
+    -------
+
+    """
+    fdbg_string = "%sread_pipeline_file: " % _dbg_string
+    log_print("Reading the pipeline file at %s." % path, fdbg_string, "debug")
+
+    # Reading
+    ####################################################################################################################
+    try:
+        pipeline = toml.load(path)
+    except FileNotFoundError:
+        make_error(FileNotFoundError, fdbg_string, "Failed to find the pipeline file %s." % path)
+        return None
+
+    # Validating
+    ####################################################################################################################
+    if "products" not in pipeline or not len(pipeline["products"]):
+        make_error(ValueError, fdbg_string, "The pipeline file %s doesn't declare any products." % path)
+
+    for id, product in enumerate(pipeline["products"]):
+        if product.get("type", None) not in _product_types:
+            make_error(ValueError, fdbg_string, "Product %s has type %s, which is not one of %s." % (
+                id, product.get("type", None), _product_types))
+
+        if product["type"] in ["image", "profile"] and "qty" not in product:
+            make_error(ValueError, fdbg_string, "Product %s (%s) needs a qty." % (id, product["type"]))
+
+        if "kwargs" not in product:
+            product["kwargs"] = {}
+
+        if product["type"] == "radii" and product["kwargs"].get("center", None) == "halo" and not any(
+                earlier["type"] == "centers" for earlier in pipeline["products"][:id]):
+            make_error(ValueError, fdbg_string, "Product %s (radii) is centered on the halo, but no centers product "
+                                                "comes before it." % id)
+
+    return pipeline
+
+
+def get_view_kwargs(pipeline: dict):
+    """
+    Converts the ``[view]`` table of a pipeline into ``SnapView`` view parameters.
+    Parameters
+    ----------
+    pipeline: The pipeline settings.
+
+    Returns: The view parameters or ``None`` if there is no view.
+    -------
+
+    """
+    if "view" not in pipeline:
+        return None
+
+    view_kwargs = {}
+    if "center" in pipeline["view"]:
+        view_kwargs["center"] = pyn.array.SimArray([float(i) for i in pipeline["view"]["center"]], "kpc")
+    if "angles" in pipeline["view"]:
+        view_kwargs["angles"] = [float(i) for i in pipeline["view"]["angles"]]
+
+    return view_kwargs
+
+
+def get_pipeline_families(products: list):
+    """
+    Determines the families which must be loaded to make every one of the ``products``.
+    Parameters
+    ----------
+    products: The products in the pipeline.
+
+    Returns: list of family names, or ``None`` if every family may be needed.
+    -------
+
+    """
+    families = []
+
+    for product in products:
+        if product["type"] == "image":
+            product_families = get_image_families(product["qty"], product["kwargs"].get("families"),
+                                                  product["kwargs"].get("contour_kwargs"))
+        elif product["type"] == "profile":
+            product_families = get_profile_families(product["kwargs"])
+        elif product["type"] == "dm-b":
+            product_families = ["dm", "gas"]
+        elif product["type"] == "radii":
+            product_families = product["kwargs"].get("families", None)
+        else:
+            product_families = ["dm"]
+
+        if product_families is None:
+            return None
+        families += [family for family in product_families if family not in families]
+
+    return families
+
+
+def setup_products(simulation_name: str, products: list) -> list:
+    """
+    Creates the output directories for each of the products. These follow the naming conventions of the individual
+    sequence generators so that the output of a pipeline run is indistinguishable from separate runs.
+    Parameters
+    ----------
+    simulation_name: The name of the simulation.
+    products: The products in the pipeline.
+
+    Returns: The products with an ``output_directory`` added.
+    -------
+
+    """
+    timestamp = datetime.now().strftime('%m-%d-%Y_%H-%M-%S')
+
+    for id, product in enumerate(products):
+        if product["type"] == "image":
+            if "av_z" not in product["kwargs"]:
+                product["kwargs"]["av_z"] = False
+            product["output_directory"] = os.path.join(CONFIG["system"]["directories"]["figures_directory"],
+                                                       simulation_name, "%s-(I-%s)" % (
+                                                           product["qty"], product["kwargs"]["av_z"]), timestamp)
+        elif product["type"] == "dm-b":
+            if "av_z" not in product["kwargs"]:
+                product["kwargs"]["av_z"] = False
+            product["output_directory"] = os.path.join(CONFIG["system"]["directories"]["figures_directory"],
+                                                       simulation_name, "%s-(I-%s)" % (
+                                                           "DM-B", product["kwargs"]["av_z"]), timestamp)
+        elif product["type"] == "profile":
+            if "ndim" not in product["kwargs"]:
+                product["kwargs"]["ndim"] = 3
+            product["output_directory"] = os.path.join(CONFIG["system"]["directories"]["figures_directory"],
+                                                       simulation_name, "%s-(ndim=%s)_Profiles" % (
+                                                           product["qty"], product["kwargs"]["ndim"]), timestamp)
+        elif product["type"] == "radii":
+            product["output_directory"] = os.path.join(CONFIG["system"]["directories"]["temp_directory"],
+                                                       "Radii_%s_%s_%s" % (simulation_name, id, timestamp))
+        else:
+            product["output_directory"] = os.path.join(CONFIG["system"]["directories"]["temp_directory"],
+                                                       "Dyn_%s_%s_%s" % (simulation_name, id, timestamp))
+
+        pt.Path(product["output_directory"]).mkdir(parents=True, exist_ok=True)
+
+    return products
+
+
+def make_products(snapshot, snapshot_name: str, products: list, state: dict) -> None:
+    """
+    Makes each of the ``products`` from a single loaded snapshot.
+    Parameters
+    ----------
+    snapshot: The aligned snapshot.
+    snapshot_name: The name of the output (``output_XXXXX``).
+    products: The products (see ``setup_products``).
+    state: ``dict`` of per-product state carried from one snapshot to the next (i.e. the halo search width, the
+        latest halo center, the figure of each plot product and the frame writer). Close it with
+        ``close_product_state``.
+
+    Returns: None
+    -------
+
+    """
+    fdbg_string = "%smake_products: " % _dbg_string
+    snap_number = snapshot_name.replace("output_", "")
+
+    if "writer" not in state:
+        state["writer"] = FrameWriter()  # the PNGs are written while the next product is made.
+
+    for id, product in enumerate(products):
+        log_print("Making product %s (%s) for %s." % (id, product["type"], snapshot_name), fdbg_string, "debug")
+
+        # - The plotting functions consume their kwargs, so each one gets its own copy -#
+        kwargs = deepcopy(product["kwargs"])
+
+        if product["type"] in ["image", "dm-b"] and ("renderer", id) not in state:
+            state[("renderer", id)] = FrameRenderer()  # each plot product keeps its own figure.
+
+        if product["type"] == "image":
+            make_plot(snapshot, product["qty"],
+                      end_file=os.path.join(product["output_directory"], "Image_%s.png" % snap_number), save=True,
+                      renderer=state[("renderer", id)], writer=state["writer"], **kwargs)
+        elif product["type"] == "dm-b":
+            make_gas_dm_image(snapshot, end_file=os.path.join(product["output_directory"], "Image_%s.png" % snap_number),
+                              save=True, renderer=state[("renderer", id)], writer=state["writer"], **kwargs)
+        elif product["type"] == "profile":
+            make_profile_plot(snapshot, product["qty"],
+                              end_file=os.path.join(product["output_directory"], "Profile_%s.png" % snap_number),
+                              save=True, writer=state["writer"], **kwargs)
+        elif product["type"] == "radii":
+            overdensities = kwargs.get("overdensities", [2500, 1000, 500, 200])
+            center = kwargs.get("center", None)
+
+            if center == "halo":  # the main halo of this snapshot (see the centers product).
+                if state.get("halo_center", (None,))[0] != snapshot_name:
+                    make_error(SnapshotError, fdbg_string, "No halo center was found for %s." % snapshot_name)
+                center = state["halo_center"][1]
+            elif center is not None:
+                center = pyn.array.SimArray([float(i) for i in center], "kpc")
+
+            radii, masses = find_overdensity_radii(snapshot, overdensities=overdensities,
+                                                   families=kwargs.get("families", None), center=center)
+
+            with open(os.path.join(product["output_directory"], "%s.csv" % snapshot_name), "w") as file:
+                file.write(",".join(["output", "time"] + ["r_%s" % x for x in overdensities] +
+                                    ["M_%s" % x for x in overdensities]) + "\n")
+                file.write(",".join([snapshot_name, str(float(snapshot.properties["time"].in_units("Gyr")))] +
+                                    [str(value) for value in list(radii) + list(masses)]) + "\n")
+        else:
+            # - Managing the search width in the same way as mp_get_centers -#
+            if kwargs.get("width"):
+                width = pyn.units.Unit(kwargs["width"])
+            elif id in state:
+                width = state[id]
+            else:
+                width = snapshot.properties["boxsize"] / 4
+
+            center_frame = find_halo_centers(snapshot, width,
+                                             resolution=kwargs.get("resolution", 1000),
+                                             footprint=kwargs.get("footprint", 20),
+                                             ncores=kwargs.get("ncores", 2),
+                                             name=snapshot_name)
+            center_frame.to_csv(os.path.join(product["output_directory"], "%s.csv" % snapshot_name))
+
+            if len(center_frame):  # the densest (rank 1) halo, in the view.
+                state["halo_center"] = (snapshot_name, pyn.array.SimArray(
+                    [float(center_frame[axis].iloc[0]) for axis in ["x_val", "y_val", "z_val"]], "kpc"))
+
+            if not kwargs.get("width"):
+                state[id] = get_next_center_width(center_frame)
+
+        gc.collect()
+
+
+def write_radii_dataset(temp_directory: str, simulation: str) -> str:
+    """
+    Joins the per-snapshot overdensity radii in ``temp_directory`` into the ``overdensity_radii.csv`` dataset of
+    ``simulation`` in time order (``r_x`` in the default length unit, ``M_x`` in the default mass unit).
+    Parameters
+    ----------
+    temp_directory: The directory containing the per-snapshot ``.csv`` files.
+    simulation: The ``SimulationName``.
+
+    Returns: The path to the dataset.
+    -------
+
+    """
+    header, rows = None, []
+
+    for file in sorted(os.listdir(temp_directory)):
+        with open(os.path.join(temp_directory, file), "r") as csv_file:
+            header, row = csv_file.read().splitlines()[:2]
+        rows.append(row)
+
+    rows.sort(key=lambda row: float(row.split(",")[1]))  # by time.
+
+    dataset_directory = os.path.join(CONFIG["system"]["directories"]["datasets_directory"], simulation)
+    pt.Path(dataset_directory).mkdir(parents=True, exist_ok=True)
+
+    with open(os.path.join(dataset_directory, "overdensity_radii.csv"), "w") as csv_file:
+        csv_file.write("\n".join(([header] if header else []) + rows) + "\n")
+
+    return os.path.join(dataset_directory, "overdensity_radii.csv")
+
+
+def close_product_state(state: dict) -> None:
+    """
+    Closes the figures and waits for the frame writer held in the product ``state`` (see ``make_products``).
+    Parameters
+    ----------
+    state: The product state.
+
+    Returns: None
+    -------
+
+    """
+    for key in [key for key in state if isinstance(key, tuple) and key[0] == "renderer"]:
+        state.pop(key).close()
+
+    if "writer" in state:
+        state.pop("writer").close()
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# --------------------------------------------- Multi-Processing Functions ----------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def mp_run_pipeline(arg):
+    """
+    Multiprocessing pipeline function. The args parameter should have the format
+
+    arg = ([simulations:list,simulation_directory,products:list],{**kwargs})
+    Parameters
+    ----------
+    arg: The args and kwargs for the pipeline process.
+
+    Returns: None
+    -------
+
+    """
+    # Intro Debugging
+    ########################################################################################################################
+    fdbg_string = _dbg_string + "mp_run_pipeline: "
+    log_print("Running the pipeline with args %s. [Process: %s]" % (arg, current_process().name), fdbg_string,
+              "debug")
+
+    # Main script
+    ########################################################################################################################
+    args, kwargs = arg  # splitting the args and kwargs out of the tuple
+    view_kwargs = kwargs.get("view_kwargs", None)
+    families = get_pipeline_families(args[2])
+    state = {}
+
+    prefetcher = SnapshotPrefetcher([os.path.join(args[1], simulation) for simulation in args[0]],
+                                    view_parameters=view_kwargs, families=families)
+
+    try:
+        for path, snap in prefetcher:  # cycle through all of the output folders.
+            make_products(snap, pt.Path(path).name, args[2], state)
+
+            del snap
+            gc.collect()
+
+    except MemoryError:
+        log_print("Ran out of memory", fdbg_string, "critical")
+        exit()
+    finally:
+        close_product_state(state)
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ----------------------------------------------------- Functions -------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def run_pipeline(simulation_directory, pipeline=_default_pipeline_path, nproc=1, tmin=None, tmax=None, stride=1):
+    """
+    Runs the post-processing pipeline on the simulation. Each snapshot is read and aligned **once** and every product
+    declared in the pipeline is made from it before moving on.
+    Parameters
+    ----------
+    simulation_directory: The location of the simulation datafiles.
+    pipeline: The path to the pipeline file or an already loaded pipeline ``dict`` (see ``read_pipeline_file``).
+    nproc: The number of processes to use.
+    tmin: The minimum output time (Gyr) to include.
+    tmax: The maximum output time (Gyr) to include.
+    stride: Only process every ``stride``-th output.
+
+    Returns: None
+    -------
+
+    """
+    # DEBUGGING
+    ########################################################################################################################
+    fdbg_string = _dbg_string + "run_pipeline: "
+    log_print("Running the pipeline %s on %s." % (pipeline, simulation_directory), fdbg_string, "debug")
+
+    # SETUP
+    ########################################################################################################################
+    # - File Management -#
+    if not os.path.isdir(simulation_directory):  # Checking that the simulation directory exists
+        make_error(OSError, fdbg_string, "The simulation directory %s doesn't appear to exist." % simulation_directory)
+
+    if not isinstance(pipeline, dict):
+        pipeline = read_pipeline_file(pipeline)
+
+    ##- Getting the simulation name -##
+    try:
+        simulation_name = simlog.match("SimulationLocation", "SimulationName", simulation_directory)[0]
+    except Exception:
+        ## Something went wrong ##
+        simulation_name = pt.Path(simulation_directory).name
+
+    products = setup_products(simulation_name, pipeline["products"])
+    view_kwargs = get_view_kwargs(pipeline)
+
+    ### Getting snapshot directories ###
+    output_directories = SnapshotIndex.load(simulation_directory).select(tmin=tmin, tmax=tmax, stride=stride)
+    log_print("Found %s snapshots to process for %s products." % (len(output_directories), len(products)),
+              fdbg_string, "info")
+
+    # Running
+    ########################################################################################################################
+    if nproc > 1:
+        # - Each contiguous run of snapshots (see get_task_size) goes to the next free worker -#
+        run_snapshot_tasks(mp_run_pipeline, output_directories, [simulation_directory, products],
+                           {"view_kwargs": view_kwargs}, nproc)
+    else:
+        mp_run_pipeline(([output_directories, simulation_directory, products], {"view_kwargs": view_kwargs}))
+
+    # Finishing products
+    ########################################################################################################################
+    for product in products:
+        if product["type"] == "centers":
+            write_centers_dataset(product["output_directory"], simulation_name)
+            shutil.rmtree(product["output_directory"])
+        elif product["type"] == "radii":
+            write_radii_dataset(product["output_directory"], simulation_name)
+            shutil.rmtree(product["output_directory"])
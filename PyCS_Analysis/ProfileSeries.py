@@ -0,0 +1,282 @@
+"""
+
+        Profile series: the binned profiles of every snapshot of a simulation stored in a single HDF5 file.
+
+    Each series lives in the group ``<qty>/<family>/<sequence_key>`` of the file (the family is ``all`` for profiles of
+    the whole snapshot) and is stored column by column: ``time`` (Gyr), ``outputs``, ``bin_edges`` and ``values``, with
+    one row per snapshot. The units, the binning and the parameters of the sequence are kept as attributes, so a
+    radius-time map of a quantity is a single read of ``values``.
+            Written by: Eliza Diggins
+"""
+import os
+import pathlib as pt
+import sys
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+from PyCS_Core.Configuration import read_config, _configuration_path
+from PyCS_Core.Logging import set_log, log_print, make_error
+from PyCS_Core.PyCS_Errors import *
+import numpy as np
+import h5py
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Analysis"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# -------------------------------------------------- Fixed Variables ----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_series_parts_directory = ".series_parts"  # Where the workers of a sequence leave their profiles for the series.
+_series_filename = "profile_series.h5"  # The name of the series file in the figures directory of a simulation.
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Classes --------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+class ProfileSeries:
+    """
+    The profile series file of a simulation. The file is only opened for the duration of each read or write, so a
+    series can be read while it is still being extended.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes the ``ProfileSeries``. The file is created on the first ``append``.
+        Parameters
+        ----------
+        path: The path to the ``.h5`` file.
+        """
+        self.path = path
+        self.cdbg_string = "%sProfileSeries: " % _dbg_string
+
+    def __repr__(self):
+        return "ProfileSeries(%s, series=%s)" % (self.path, len(self.keys()))
+
+    @staticmethod
+    def get_group(qty: str, family: str, key: str) -> str:
+        """The group of the ``qty`` series of ``family`` with the sequence key ``key``."""
+        return "%s/%s/%s" % (qty, (family if family else "all"), key)
+
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Writing                                                                                                      #
+    # -----------------------------------------------------------------------------------------------------------------#
+    def append(self, group: str, record: dict, output: str = "", attributes: dict = None):
+        """
+        Writes the profile of a single snapshot to a series. A snapshot which is already in the series is overwritten,
+        so rerunning a sequence never duplicates rows.
+        Parameters
+        ----------
+        group: The group of the series (see ``get_group``).
+        record: The profile (see ``Profiles.get_profile_record``). ``time``, ``bin_edges`` and ``values`` are stored,
+            ``units`` and ``length_units`` become attributes of the series.
+        output: The name of the output the profile was made from.
+        attributes: The attributes of the sequence (binning, parameters, ...). Only used when the series is created.
+
+        Returns: The row of the profile.
+        -------
+
+        """
+        fdbg_string = "%sappend: " % self.cdbg_string
+        edges, values = np.asarray(record["bin_edges"]), np.asarray(record["values"])
+
+        if edges.shape != (len(values) + 1,):
+            make_error(ValueError, fdbg_string, "%s bin edges don't match %s values." % (edges.shape, values.shape))
+
+        with h5py.File(self.path, "a") as file:
+            if group not in file:
+                self._create(file, group, len(values),
+                             dict(attributes if attributes else {}, units=record["units"],
+                                  length_units=record["length_units"]))
+            elif file[group]["values"].shape[1] != len(values):
+                make_error(ValueError, fdbg_string, "A profile of %s bins doesn't match the series %s (%s bins)." % (
+                    len(values), group, file[group]["values"].shape[1]))
+
+            series = file[group]
+            outputs = list(series["outputs"].asstr()[:])
+
+            if output and output in outputs:
+                index = outputs.index(output)
+            else:
+                index = series["time"].shape[0]
+
+                for name in ["time", "outputs", "bin_edges", "values"]:
+                    series[name].resize(index + 1, axis=0)
+
+            for name, value in [("time", record["time"]), ("outputs", output), ("bin_edges", edges),
+                                ("values", values)]:
+                series[name][index] = value
+
+        log_print("Wrote the profile of %s to row %s of %s." % (output, index, group), fdbg_string, "debug")
+        return index
+
+    @staticmethod
+    def _create(file, group, nbins, attributes):
+        """
+        Creates the datasets of a new series.
+        """
+        settings = CONFIG["analysis"]["profiles"]["series"]
+
+        if settings["compression"] in [None, "none", "None"]:
+            compression = {}
+        elif settings["compression"] == "gzip":
+            compression = {"compression": "gzip", "compression_opts": settings["compression_level"], "shuffle": True}
+        else:
+            compression = {"compression": settings["compression"], "shuffle": True}
+
+        series = file.create_group(group)
+        series.create_dataset("time", shape=(0,), maxshape=(None,), dtype="float64", chunks=(1024,))
+        series.create_dataset("outputs", shape=(0,), maxshape=(None,), dtype=h5py.string_dtype(), chunks=(1024,))
+        series.create_dataset("bin_edges", shape=(0, nbins + 1), maxshape=(None, nbins + 1), dtype=settings["dtype"],
+                              chunks=(settings["chunk_rows"], nbins + 1), **compression)
+        series.create_dataset("values", shape=(0, nbins), maxshape=(None, nbins), dtype=settings["dtype"],
+                              chunks=(settings["chunk_rows"], nbins), **compression)
+        series["time"].attrs["units"] = "Gyr"
+
+        for key, value in attributes.items():
+            if value is not None:
+                series.attrs[key] = (value if not isinstance(value, (list, tuple)) else np.asarray(value, dtype="S"))
+
+    # -----------------------------------------------------------------------------------------------------------------#
+    #     Reading                                                                                                      #
+    # -----------------------------------------------------------------------------------------------------------------#
+    def keys(self) -> list:
+        """The groups of every series in the file."""
+        if not os.path.isfile(self.path):
+            return []
+
+        groups = []
+        with h5py.File(self.path, "r") as file:
+            file.visititems(lambda name, item: groups.append(name) if (
+                    isinstance(item, h5py.Group) and "values" in item) else None)
+
+        return groups
+
+    def find(self, qty: str, family: str = None) -> list:
+        """
+        Finds the series of ``qty`` (for ``family`` if it is specified).
+        Parameters
+        ----------
+        qty: The quantity.
+        family: The family. Defaults to any family.
+
+        Returns: The list of matching groups.
+        -------
+
+        """
+        return [group for group in self.keys() if
+                group.split("/")[0] == qty and (family is None or group.split("/")[1] == family)]
+
+    def attributes(self, group: str) -> dict:
+        """The attributes of a series."""
+        with h5py.File(self.path, "r") as file:
+            return dict(file[group].attrs)
+
+    def read(self, group: str, rows=slice(None)) -> dict:
+        """
+        Reads a series in time order.
+        Parameters
+        ----------
+        group: The group of the series.
+        rows: The rows (in time order) to read. Defaults to all of them.
+
+        Returns: ``dict`` with the ``time``, ``outputs``, ``bin_edges`` and ``values`` arrays and the ``attributes``.
+        -------
+
+        """
+        with h5py.File(self.path, "r") as file:
+            series = file[group]
+            order = np.argsort(series["time"][:], kind="stable")[rows]
+
+            return {
+                "time"      : series["time"][:][order],
+                "outputs"   : np.asarray(series["outputs"].asstr()[:])[order],
+                "bin_edges" : series["bin_edges"][:][order],
+                "values"    : series["values"][:][order],
+                "attributes": dict(series.attrs)
+            }
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ----------------------------------------------------- Functions -------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def get_series_path(simulation_name: str) -> str:
+    """
+    Returns the path to the profile series file of a simulation.
+    Parameters
+    ----------
+    simulation_name: The name of the simulation.
+
+    Returns: The path.
+    -------
+
+    """
+    return os.path.join(CONFIG["system"]["directories"]["figures_directory"], simulation_name, _series_filename)
+
+
+def write_series_part(sequence_directory, output, record: dict):
+    """
+    Leaves the profile of a snapshot in the sequence directory for ``assemble_profile_series``. Profiles are made out of
+    order by several processes, so they are only written to the series (by one process) once the sequence is done.
+    Parameters
+    ----------
+    sequence_directory: The output directory of the sequence.
+    output: The name of the output (``output_XXXXX``).
+    record: The profile (see ``Profiles.get_profile_record``).
+
+    Returns: None
+    -------
+
+    """
+    parts_directory = os.path.join(sequence_directory, _series_parts_directory)
+    pt.Path(parts_directory).mkdir(parents=True, exist_ok=True)
+
+    path = os.path.join(parts_directory, "%s.npz" % output)
+    with open(path + ".tmp", "wb") as file:
+        np.savez(file, time=float(record["time"]), bin_edges=np.asarray(record["bin_edges"]),
+                 values=np.asarray(record["values"]), units=str(record["units"]),
+                 length_units=str(record["length_units"]))
+    os.replace(path + ".tmp", path)
+
+
+def assemble_profile_series(sequence_directory, series_path, group, attributes: dict = None) -> ProfileSeries:
+    """
+    Writes the profiles left by ``write_series_part`` to ``group`` of the series at ``series_path`` in output order,
+    and removes them.
+    Parameters
+    ----------
+    sequence_directory: The output directory of the sequence.
+    series_path: The path to the series file. It is created if it doesn't exist.
+    group: The group of the series (see ``ProfileSeries.get_group``).
+    attributes: The attributes of the sequence (see ``ProfileSeries.append``).
+
+    Returns: The ``ProfileSeries``.
+    -------
+
+    """
+    fdbg_string = "%sassemble_profile_series: " % _dbg_string
+    parts_directory = os.path.join(sequence_directory, _series_parts_directory)
+    series = ProfileSeries(series_path)
+
+    parts = sorted(pt.Path(parts_directory).glob("*.npz")) if os.path.isdir(parts_directory) else []
+
+    for part in parts:
+        with np.load(part) as file:
+            record = {key: file[key] for key in ["bin_edges", "values"]}
+            record.update(time=float(file["time"]), units=str(file["units"]), length_units=str(file["length_units"]))
+
+        series.append(group, record, output=part.stem, attributes=attributes)
+        os.remove(part)
+
+    if os.path.isdir(parts_directory) and not len(os.listdir(parts_directory)):
+        os.rmdir(parts_directory)
+
+    log_print("Wrote %s profiles to %s:%s." % (len(parts), series_path, group), fdbg_string, "info")
+    return series
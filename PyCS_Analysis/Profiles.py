@@ -19,14 +19,14 @@ import matplotlib.pyplot as plt
 import gc
 import warnings
 from multiprocessing import current_process
-from PyCS_Analysis.Analysis_Utils import align_snapshot,make_pseudo_entropy,make_mach_number,generate_xray_emissivity,SnapView
-from PyCS_System.SimulationMangement import SimulationLog
-from PyCS_Analysis.builtin_functions import hydrostatic_mass
-from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
-from PyCS_Analysis.Images import generate_image_array,set_units
+from PyCS_Analysis.Analysis_Utils import align_snapshot,derive_fields,derived_fields,apply_view,\
+    SnapshotPrefetcher,run_snapshot_tasks,get_sequence_key,get_profile
+from PyCS_System.SimulationMangement import SimulationLog, SnapshotIndex, SequenceManifest
+from PyCS_Analysis.builtin_functions import hydrostatic_mass, hydrostatic_mass_bands
+from PyCS_Analysis.Images import generate_point_samples
+from PyCS_Analysis.plot_utils import FrameWriter
+from PyCS_Analysis.ProfileSeries import ProfileSeries, get_series_path, write_series_part, assemble_profile_series
 import numpy as np
-from utils import split
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------ Setup ----------------------------------------------------------#
@@ -71,8 +71,7 @@ __pynbody_profile_defaults = {
 __pynbody_line_profile_defaults = {
     "nsamples": CONFIG["analysis"]["profiles"]["linear"]["default_n_samples"],
     "rmin": CONFIG["analysis"]["profiles"]["linear"]["default_rmin"],
-    "rmax": CONFIG["analysis"]["profiles"]["linear"]["default_rmax"],
-    "resolution": CONFIG["analysis"]["profiles"]["linear"]["default_sample_resolution"]
+    "rmax": CONFIG["analysis"]["profiles"]["linear"]["default_rmax"]
 }
 
 # ---# QUANTITY SPECIFIC DEFAULTS #-------------------------------------------------------------------------------------#
@@ -145,22 +144,28 @@ __quantities = {
         "families": ["gas"]
     },
     "entropy": {
-        "unit": {3: "keV cm^2",
-                 2: "keV cm^2"},
-        "fancy": "Entropy",
-        "families": ["gas"]
+        "unit": {3: derived_fields["entropy"]["unit"],
+                 2: derived_fields["entropy"]["unit"]},
+        "fancy": derived_fields["entropy"]["fancy"],
+        "families": derived_fields["entropy"]["families"]
     },
     "mach": {
-        "unit": {3: "",
-                 2: ""},
-        "fancy": "Mach Number",
-        "families": ["gas"]
+        "unit": {3: derived_fields["mach"]["unit"],
+                 2: derived_fields["mach"]["unit"]},
+        "fancy": derived_fields["mach"]["fancy"],
+        "families": derived_fields["mach"]["families"]
     },
     "xray": {
-        "unit": {3:"erg cm^-3 s^-1",
-                 2:"erg cm^-2 s^-1"},
-        "fancy": r"\epsilon^{ff}",
-        "families": ["gas"]
+        "unit": {3: derived_fields["xray"]["unit"],
+                 2: "erg cm^-2 s^-1"},
+        "fancy": derived_fields["xray"]["fancy"],
+        "families": derived_fields["xray"]["families"]
+    },
+    "sound_speed": {
+        "unit": {3: derived_fields["sound_speed"]["unit"],
+                 2: derived_fields["sound_speed"]["unit"]},
+        "fancy": derived_fields["sound_speed"]["fancy"],
+        "families": derived_fields["sound_speed"]["families"]
     }
 }
 
@@ -200,6 +205,77 @@ def fancy_qty(qty):
     return __quantities[qty]["fancy"]
 
 
+def get_required_families(kwargs):
+    """
+    Determines which families need to be loaded for a profile with the given kwargs. Only an explicit ``family``
+    without a ``Lambda`` comparison function can be restricted; everything else may need the whole snapshot.
+    Parameters
+    ----------
+    kwargs: The kwargs passed to the profile plotting functions.
+
+    Returns: list of family names, or ``None`` if every family may be needed.
+    -------
+
+    """
+    if kwargs.get("family") and not kwargs.get("Lambda"):
+        return [kwargs["family"]]
+    else:
+        return None
+
+
+def get_profile_family(qty, kwargs):
+    """
+    Determines the family a ``qty`` profile with the given kwargs is made of (see ``_raw_make_profile_plot``).
+    Parameters
+    ----------
+    qty: The quantity.
+    kwargs: The kwargs passed to the profile plotting functions.
+
+    Returns: The family name, or ``None`` for a profile of the whole snapshot.
+    -------
+
+    """
+    if kwargs.get("family"):
+        return kwargs["family"]
+    elif len(__quantities[qty]["families"]) < 2:
+        return __quantities[qty]["families"][0]
+    else:
+        return None
+
+
+def get_profile_record(snapshot, qty, **kwargs) -> dict:
+    """
+    Collects the binned ``qty`` profile of ``snapshot`` for a profile series (see ``ProfileSeries``). The profile is the
+    one the profile plots use (see ``get_profile``), so recording a profile which was just plotted doesn't rebin.
+    Parameters
+    ----------
+    snapshot: The snapshot.
+    qty: The quantity.
+    kwargs: The kwargs passed to the profile plotting functions. Only the binning, ``family``, ``units_x`` and
+        ``units_y`` are used.
+
+    Returns: ``dict`` with the ``time`` (Gyr), ``bin_edges``, ``values``, ``units`` and ``length_units``.
+    -------
+
+    """
+    _prof_kwargs = {key: kwargs.get(key, value) for key, value in __pynbody_profile_defaults.items() if
+                    kwargs.get(key, value) is not None}
+
+    derive_fields(snapshot, [qty])
+    profile = get_profile(snapshot, get_profile_family(qty, kwargs), **_prof_kwargs)
+
+    units = str(kwargs.get("units_y", __quantities[qty]["unit"][_prof_kwargs["ndim"]]))
+    edges = profile["bin_edges"].in_units(kwargs.get("units_x", CONFIG["units"]["default_length_unit"]))
+
+    return {
+        "time"        : float(snapshot.properties["time"].in_units("Gyr")),
+        "bin_edges"   : np.asarray(edges),
+        "values"      : np.asarray(fix_array_u(profile[qty], qty, units).in_units(units)),
+        "units"       : units,
+        "length_units": str(kwargs.get("units_x", CONFIG["units"]["default_length_unit"]))
+    }
+
+
 def fix_array_u(array, qty, units):
     """
     Run on all outputting arrays using the fixed units and the quantity. This can be used to correct for issues in the array ahead of time.
@@ -261,29 +337,36 @@ def mp_make_profile(arg):
     else:
         view_kwargs = None
 
-    for snapshot_name in args[0]:
-        # We cycle through each of the snapshot locations
-        path = os.path.join(args[2], snapshot_name)  # proper location of the snapshot.
-
-        # Snapshot management
-        ################################################################################################################
-        try:
-            # - Cleanup -#
-            view = SnapView(view_parameters=view_kwargs)  # grabbing the view
-            view.load_snapshot(path)
-            snap = view.snapshot
-            view.snapshot = None
+    families = get_required_families(kwargs)
+    series = kwargs.pop("series", False)  # leave the binned profiles for the profile series?
+
+    #  The next snapshot is read and aligned in the background while the current one is profiled.
+    #
+    prefetcher = SnapshotPrefetcher([os.path.join(args[2], snapshot_name) for snapshot_name in args[0]],
+                                    view_parameters=view_kwargs, families=families)
+    writer = FrameWriter()  # the PNGs are written while the next profile is computed.
+
+    try:
+        for path, snap in prefetcher:
             gc.collect()
 
-        except MemoryError:
-            log_print("Ran out of memory", fdbg_string, "critical")
-            exit()
+            # Running main command
+            ############################################################################################################
+            make_profile_plot(snap, args[3],
+                              end_file=os.path.join(args[1], "Profile_%s.png" % (
+                                  pt.Path(path).name.replace("output_", ""))),
+                              writer=writer,
+                              **kwargs)
 
-        # Running main command
-        ################################################################################################################
-        make_profile_plot(snap, args[3],
-                          end_file=os.path.join(args[1], "Profile_%s.png" % (snapshot_name.replace("output_", ""))),
-                          **kwargs)
+            if series:
+                write_series_part(args[1], pt.Path(path).name, get_profile_record(snap, args[3], **kwargs))
+            del snap
+
+    except MemoryError:
+        log_print("Ran out of memory", fdbg_string, "critical")
+        exit()
+    finally:
+        writer.close()
 
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -308,8 +391,9 @@ def _raw_make_line_profile_plot(snapshot,
     2. We begin by fetching ``rmin`` and ``rmax`` and ``n_sample`` from ``**kwargs``. If any of these are not found, we grab the
     default values from ``CONFIG``.
 
-    3. The data from step 2 is used to generate the ``image`` array and the image array is then sampled such that
-    we obtain the desired profile. We then use the correct sampling proceedure to match ``logx`` if necessary.
+    3. The smoothed field is evaluated directly at the ``n_sample`` points along the positive ``x`` axis between ``rmin``
+    and ``rmax`` (see ``generate_point_samples``). Only the particles whose kernels reach the ray are used, so no image
+    is rendered.
 
     4. The sampled data is then returned and further post-processing occurs.
 
@@ -345,7 +429,7 @@ def _raw_make_line_profile_plot(snapshot,
                 pass
 
     #- removing potential hidden overlap settings -#
-    removed_keys = [key for key in list(__pynbody_profile_defaults.keys()) + ["profile"] if (key not in __pynbody_line_profile_defaults) and (key in kwargs)]
+    removed_keys = [key for key in list(__pynbody_profile_defaults.keys()) + ["profile", "resolution"] if (key not in __pynbody_line_profile_defaults) and (key in kwargs)]
 
     for key in removed_keys:
         del kwargs[key]
@@ -363,60 +447,26 @@ def _raw_make_line_profile_plot(snapshot,
     # Deriving arrays if necessary
     # ------------------------------------------------------------------------------------------------------------------#
     ##- deriving arrays -##
-    if qty == "entropy":
-        make_pseudo_entropy(snapshot)
-    elif qty == "mach":
-        make_mach_number(snapshot)
-    elif qty == "xray":
-        generate_xray_emissivity(snapshot)
-
-    # Creating the base image
-    #------------------------------------------------------------------------------------------------------------------#
-
-    #- Managing necessary kwargs -#
-    image_kwargs = {} # we eventually push these to the generate image stage.
+    derive_fields(snapshot, [qty])
 
+    # Sampling the ray
+    #------------------------------------------------------------------------------------------------------------------#
     ##- managing units -##
-    if "units_y" in kwargs:
-        image_kwargs["units"] = kwargs["units_y"]
-        z_units = kwargs["units_y"] # grab for future use!
-        del kwargs["units_y"] # remove from kwargs.
-    else:
-        z_units = str(set_units(qty,ndim=3))
-
-    if "units_x" in kwargs:
-        w_units = kwargs["units_x"]
-        del kwargs["units_x"]
-    else:
-        w_units = CONFIG["units"]["default_length_unit"]
-    ##- managing width -##
-    image_kwargs["width"] = 2*_prof_kwargs["rmax"].in_units(snapshot["pos"].units)
-
-    ##- managing resolution -##
-    image_kwargs["resolution"] = _prof_kwargs["resolution"]
+    units_y = kwargs.pop("units_y", None) # None -> the image units of the quantity.
+    w_units = kwargs.pop("units_x", CONFIG["units"]["default_length_unit"])
 
     ##- managing families -##
-    if not "family" in kwargs:
-        image_kwargs["families"] = None
-    else:
-        image_kwargs["families"]= kwargs["family"]
-        del kwargs["family"]
+    families = kwargs.pop("family", None)
 
-    #- GENERATING THE IMAGE ARRAY -#
-
-    image_array = generate_image_array(snapshot,qty=qty,**image_kwargs)
-    # Image Analysis
-    #------------------------------------------------------------------------------------------------------------------#
-    #- Setting base points -#
-    p0, p1 = ((_prof_kwargs["resolution"]/2,_prof_kwargs["resolution"]/2),(_prof_kwargs["resolution"]-1,_prof_kwargs["resolution"]/2)) # these are the location points for the profile (pixel units)
+    #- Setting the sample points -# these sit on the positive x axis of the current view.
     num = _prof_kwargs["nsamples"] # the number of sample points.
-    snapx,snapy = np.linspace(p0[0],p1[0],num),np.linspace(p0[1],p1[1],num)
-    #- Setting proper coordinates -#
-    #TODO: Why doesn't the case below work?
-    #y = pyn.array.SimArray(scipy.ndimage.map_coordinates(image_array,np.vstack((snapx,snapy)),mode='nearest'),pyn.units.Unit(z_units))
-    y = pyn.array.SimArray(image_array[snapy.astype(np.int), snapx.astype(np.int)])
     x = pyn.array.SimArray(np.linspace(_prof_kwargs["rmin"].in_units(w_units),_prof_kwargs["rmax"].in_units(w_units),num),w_units)
 
+    points = pyn.array.SimArray(np.zeros((num, 3)), w_units)
+    points[:, 0] = x
+
+    y = generate_point_samples(snapshot, qty, points, families=families, units=units_y)
+
 
     # Setting up plotting
     #------------------------------------------------------------------------------------------------------------------#
@@ -482,13 +532,21 @@ def _raw_make_line_profile_plot(snapshot,
         if isinstance(Lambda, str):
             # This lambda function is actually a string, so we check for built-in options
             if Lambda in ["HSE", "hse"]:
+                apply_view(snapshot, ["gas"])
                 Lambda = hydrostatic_mass(snapshot, independent_unit=x.units, dependent_unit=y.units)
+
+                # - bootstrap error band (lambda_kwargs={"bootstrap": n}) -#
+                if lambda_kwargs.get("bootstrap", 0):
+                    lower, upper = hydrostatic_mass_bands(snapshot, x, independent_unit=x.units,
+                                                          dependent_unit=y.units, n_bootstrap=lambda_kwargs["bootstrap"])
+                    axes.fill_between(x, lower, upper, color=lambda_kwargs["color"], alpha=0.25, lw=0)
             else:
                 make_error(ValueError, fdbg_string, "Lambda present %s is not valid." % Lambda)
                 return None
 
         # Dealing with the key word args
-        plt_func(x, Lambda(x), label=(Lambda_label if Lambda_label else ""), **lambda_kwargs)
+        plt_func(x, Lambda(x), label=(Lambda_label if Lambda_label else ""),
+                 **{key: value for key, value in lambda_kwargs.items() if key != "bootstrap"})
 
     # Returning
     ####################################################################################################################
@@ -556,12 +614,7 @@ def _raw_make_profile_plot(snapshot,
     # Deriving arrays
     #------------------------------------------------------------------------------------------------------------------#
     ##- deriving arrays -##
-    if qty == "entropy":
-        make_pseudo_entropy(snapshot)
-    elif qty == "mach":
-        make_mach_number(snapshot)
-    elif qty == "xray":
-        generate_xray_emissivity(snapshot)
+    derive_fields(snapshot, [qty])
     # Creating the profile in question
     ####################################################################################################################
     if not profile:
@@ -577,7 +630,7 @@ def _raw_make_profile_plot(snapshot,
                 return None
 
             # - creating the profile -#
-            profile = pyn.analysis.profile.Profile(snapshot[family], **_prof_kwargs)
+            profile = get_profile(snapshot, family.name, **_prof_kwargs)
             del kwargs["family"]
         else:
             # Families was not specified, -> we need to grab allowable families.
@@ -592,10 +645,10 @@ def _raw_make_profile_plot(snapshot,
                     make_error(ValueError, fdbg_string, "Failed to recognize default family input %s" % (__quantities[qty]["families"][0]))
                     return None
                 # Making the correct profile
-                profile = pyn.analysis.profile.Profile(snapshot[family], **_prof_kwargs)
+                profile = get_profile(snapshot, family.name, **_prof_kwargs)
             else:
                 # We can use !ANY! profile without family restriction so we just pass over.
-                profile = pyn.analysis.profile.Profile(snapshot, **_prof_kwargs)
+                profile = get_profile(snapshot, **_prof_kwargs)
 
     # Attempting to generate plotted items
     ####################################################################################################################
@@ -688,13 +741,21 @@ def _raw_make_profile_plot(snapshot,
         if isinstance(Lambda, str):
             # This lambda function is actually a string, so we check for built-in options
             if Lambda in ["HSE", "hse"]:
+                apply_view(snapshot, ["gas"])
                 Lambda = hydrostatic_mass(snapshot, independent_unit=x.units, dependent_unit=y.units)
+
+                # - bootstrap error band (lambda_kwargs={"bootstrap": n}) -#
+                if lambda_kwargs.get("bootstrap", 0):
+                    lower, upper = hydrostatic_mass_bands(snapshot, x, independent_unit=x.units,
+                                                          dependent_unit=y.units, n_bootstrap=lambda_kwargs["bootstrap"])
+                    axes.fill_between(x, lower, upper, color=lambda_kwargs["color"], alpha=0.25, lw=0)
             else:
                 make_error(ValueError, fdbg_string, "Lambda present %s is not valid." % Lambda)
                 return None
 
         # Dealing with the key word args
-        plt_func(x, Lambda(x), label=(Lambda_label if Lambda_label else ""), **lambda_kwargs)
+        plt_func(x, Lambda(x), label=(Lambda_label if Lambda_label else ""),
+                 **{key: value for key, value in lambda_kwargs.items() if key != "bootstrap"})
 
     # Returning
     ####################################################################################################################
@@ -710,6 +771,7 @@ def make_profile_plot(snapshot,
                       save=CONFIG["Visualization"]["default_figure_save"],
                       end_file=CONFIG["system"]["directories"]["figures_directory"],
                       time_units=pyn.units.Unit(CONFIG["units"]["default_time_unit"]),
+                      writer=None,
                       **kwargs):
     """
     Plots the ``qty`` profile of the input ``snapshot``. User can select an additional ``Lambda`` and ``Lambda_label`` to
@@ -732,6 +794,8 @@ def make_profile_plot(snapshot,
 
     end_file: The filename and path to which the figure should be saved.
 
+    writer: (*optional*) A ``FrameWriter`` to encode and write the figure on. Defaults to writing it here.
+
     kwargs: additional kwargs for pyn.analysis.profile.Profile and plt.plot.
 
     Returns: None
@@ -828,7 +892,10 @@ def make_profile_plot(snapshot,
     # Saving
     #########################################################################################################################
     if save:
-        plt.savefig(end_file)
+        if writer is not None:
+            writer.write_figure(fig, end_file)
+        else:
+            plt.savefig(end_file)
 
         del profile
         axes.cla()
@@ -989,16 +1056,24 @@ def make_profiles_plot(snapshot,
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 
 
-def generate_profile_sequence(simulation_directory, qty, multiprocess=True, nproc=3, **kwargs):
+def generate_profile_sequence(simulation_directory, qty, multiprocess=True, nproc=3, tmin=None, tmax=None, stride=1,
+                              **kwargs):
     """
     Generates a sequence of profiles for the simulation using the given simulation and the given qty.
     Parameters
     ----------
     simulation_directory: The location of the simulation datafiles.
     qty: The quantity in question.
-    kwargs: The additional kwargs to pass to the plotting system.
-
-    Returns
+    tmin: The minimum output time (Gyr) to include.
+    tmax: The maximum output time (Gyr) to include.
+    stride: Only plot every ``stride``-th output.
+    kwargs: The additional kwargs to pass to the plotting system. The sequence is written to a directory keyed by its
+        parameters (see ``get_sequence_key``), and outputs whose profiles are already there (see ``SequenceManifest``)
+        are skipped; pass ``resume=False`` to plot them again. Unless ``series=False`` (see
+        ``CONFIG["analysis"]["profiles"]["series"]``), the binned profiles of shell sequences are also written to the
+        profile series of the simulation (see ``ProfileSeries``).
+
+    Returns: The list of outputs which failed (multiprocessing only).
     -------
 
     """
@@ -1026,9 +1101,16 @@ def generate_profile_sequence(simulation_directory, qty, multiprocess=True, npro
     if not "ndim" in kwargs:
         kwargs["ndim"] = 3
 
+    resume = kwargs.pop("resume", True)
+    series = kwargs.pop("series", CONFIG["analysis"]["profiles"]["series"]["enabled"])
+
+    if series and kwargs.get("mode", "shell") != "shell":
+        log_print("Profile series are only written for shell profiles.", fdbg_string, "warning")
+        series = False
+
+    sequence_key, description = get_sequence_key(dict(kwargs, qty=qty))
     output_directory = os.path.join(CONFIG["system"]["directories"]["figures_directory"], simulation_name,
-                                    "%s-(ndim=%s)_Profiles" % (qty, kwargs["ndim"]),
-                                    datetime.now().strftime('%m-%d-%Y_%H-%M-%S'))
+                                    "%s-(ndim=%s)_Profiles" % (qty, kwargs["ndim"]), sequence_key)
 
     if not os.path.exists(output_directory):
         pt.Path.mkdir(pt.Path(output_directory), parents=True)
@@ -1037,10 +1119,24 @@ def generate_profile_sequence(simulation_directory, qty, multiprocess=True, npro
     log_print("Saving %s figures to %s." % (qty, output_directory), fdbg_string, "debug")
 
     ### Getting snapshot directories ###
-    output_directories = [dir for dir in os.listdir(simulation_directory) if
-                          "output" in dir]  # grab all of the output directories.
+    index = SnapshotIndex.load(simulation_directory)
+    output_directories = index.select(tmin=tmin, tmax=tmax, stride=stride)
     log_print("Found %s figures to plot." % len(output_directories), fdbg_string, "debug")
 
+    ##- Selecting the outputs to plot -##
+    manifest = SequenceManifest(output_directory)
+
+    if not resume:
+        manifest.clear()
+
+    manifest.describe(simulation=simulation_name, parameters=description)
+    plotted = manifest.pending(index, output_directories)
+    log_print("%s of %s outputs are already finished." % (len(output_directories) - len(plotted),
+                                                         len(output_directories)), fdbg_string, "info")
+
+    def _complete(outputs):  # records the finished outputs in the manifest.
+        manifest.complete(index, {output: ["Profile_%s.png" % output.replace("output_", "")] for output in outputs})
+
     # Camera Management
     #------------------------------------------------------------------------------------------------------------------#
     if "view_kwargs" in kwargs:
@@ -1053,29 +1149,42 @@ def generate_profile_sequence(simulation_directory, qty, multiprocess=True, npro
     if multiprocess and nproc > 1:
         # MULTIPROCESSING
         ####################################################################################################################
-        # - Creating the partition -#
-        partition = split(output_directories, nproc)  # Maximally efficient splitting for the partition.
-
-        arg = [([partition[i], output_directory, simulation_directory, qty], kwargs) for i in range(len(partition))]
-        with ProcessPoolExecutor() as executor:
-            executor.map(mp_make_profile, arg)
+        # - Each contiguous run of snapshots (see get_task_size) goes to the next free worker -#
+        failed = run_snapshot_tasks(mp_make_profile, plotted, [output_directory, simulation_directory, qty],
+                                    dict(kwargs, view_kwargs=view_kwargs, series=series), nproc, callback=_complete)
 
     else:
-        for output_direct in output_directories:  # we are plotting each of these.
-            snap_number = output_direct.replace("output_", "")  # this is just the snapshot number
-
-            # - Cleanup -#
-            view = SnapView(view_parameters=view_kwargs)  # grabbing the view
-            view.load_snapshot(os.path.join(simulation_directory, output_direct))
-            snapshot = view.snapshot
-            view.snapshot = None
+        failed = []
+        families = get_required_families(kwargs)
+
+        prefetcher = SnapshotPrefetcher([os.path.join(simulation_directory, output) for output in plotted],
+                                        view_parameters=view_kwargs, families=families)
+        writer = FrameWriter()  # the PNGs are written while the next profile is computed.
+
+        for path, snapshot in prefetcher:  # we are plotting each of these.
+            snap_number = pt.Path(path).name.replace("output_", "")  # this is just the snapshot number
             gc.collect()
 
             # - Plotting -#
             make_profile_plot(snapshot, qty, end_file=os.path.join(output_directory, "Profile_%s.png" % snap_number),
-                              save=True,
+                              save=True, writer=writer,
                               **kwargs)
 
+            if series:
+                write_series_part(output_directory, pt.Path(path).name, get_profile_record(snapshot, qty, **kwargs))
+            _complete([pt.Path(path).name])  # a profile which never gets written stays pending.
+
+        writer.close()
+
+    # Writing the profile series
+    ########################################################################################################################
+    if series:
+        assemble_profile_series(output_directory, get_series_path(simulation_name),
+                                ProfileSeries.get_group(qty, get_profile_family(qty, kwargs), sequence_key),
+                                attributes={"simulation": simulation_name, "parameters": description})
+
+    return failed
+
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # -----------------------------------------------------   MAIN   --------------------------------------------------------#
@@ -0,0 +1,479 @@
+"""
+
+        NumPy SPH deposition for images.
+
+    ``pyn.plot.sph.image`` renders one quantity of one family per call, so every additional quantity costs another full
+    pass over the particles. ``deposit_images`` computes the pixel footprint and kernel weights of each particle **once**
+    and deposits every requested quantity of that family from the same weights. ``sample_points`` evaluates the same
+    sums at a set of points (i.e. along a ray) without rendering an image at all.
+
+    Images follow the conventions of ``pyn.plot.sph.image``:
+
+    - **slice** images evaluate the 3D kernel on the ``z=0`` plane.
+    - **column** images (units of ``qty * length``) integrate the projected kernel along the line of sight.
+    - **averaged** images (``av_z``) are the density weighted average of the quantity along the line of sight.
+
+"""
+import os
+import pathlib as pt
+import sys
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+from PyCS_Core.Configuration import read_config, _configuration_path
+import pynbody as pyn
+import numpy as np
+from PyCS_Core.Logging import set_log, log_print, make_error
+from PyCS_Core.PyCS_Errors import *
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from threading import Lock
+from scipy.spatial import cKDTree
+from itertools import chain
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Analysis"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# -------------------------------------------------- Fixed Variables ----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_kernel_support = 2.0  # The kernel vanishes beyond 2h.
+_smoothing_floor = 0.55  # Smoothing lengths are floored at this many pixels so every particle reaches a pixel center.
+_n_kernel_samples = 1000  # The number of samples in the projected kernel table.
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# --------------------------------------------------- Sub-Functions -----------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def cubic_spline_kernel(q: np.ndarray) -> np.ndarray:
+    """
+    The (3D) cubic spline kernel for ``h=1``. This is the default kernel of ``pynbody``.
+    Parameters
+    ----------
+    q: The distances in units of the smoothing length.
+
+    Returns: The kernel values.
+    -------
+
+    """
+    return np.where(q < 1.0,
+                    1.0 - 1.5 * q ** 2 + 0.75 * q ** 3,
+                    0.25 * np.clip(2.0 - q, 0.0, None) ** 3) / np.pi
+
+
+def _build_kernel_tables():
+    """
+    Tabulates the cubic spline kernel and its line of sight integral (``h=1``) on ``q**2`` in ``[0,4]``. A trailing
+    zero is appended so that any ``q**2`` beyond the support can simply be clipped onto it.
+    """
+    q2 = np.linspace(0, _kernel_support ** 2, _n_kernel_samples)
+    z = np.linspace(0, _kernel_support, _n_kernel_samples)
+    samples = cubic_spline_kernel(np.sqrt(q2[:, None] + z[None, :] ** 2))
+    projected = 2 * np.sum((samples[:, 1:] + samples[:, :-1]) / 2, axis=1) * (z[1] - z[0])  # trapezoid rule.
+
+    return np.append(cubic_spline_kernel(np.sqrt(q2)), 0.0), np.append(projected, 0.0)
+
+
+_kernel_tables = dict(zip([False, True], _build_kernel_tables()))  # projected -> table.
+
+
+def tabulated_kernel(q2: np.ndarray, projected: bool = False) -> np.ndarray:
+    """
+    The tabulated cubic spline kernel for ``h=1``.
+    Parameters
+    ----------
+    q2: The **squared** distances in units of the smoothing length.
+    projected: True for the projected (2D) kernel, False for the 3D kernel.
+
+    Returns: The kernel values.
+    -------
+
+    """
+    index = np.minimum(q2 * ((_n_kernel_samples - 1) / _kernel_support ** 2), _n_kernel_samples).astype(np.int64)
+    return _kernel_tables[projected][index]
+
+
+def get_image_mode(array_units, units, av_z: bool = False) -> str:
+    """
+    Determines if an image of a quantity with ``array_units`` in ``units`` is a slice, a column or an average.
+    Parameters
+    ----------
+    array_units: The units of the particle array.
+    units: The requested units of the image.
+    av_z: True for a line of sight average.
+
+    Returns: ``"slice"``, ``"column"`` or ``"average"``.
+    -------
+
+    """
+    if av_z:
+        return "average"
+
+    try:
+        pyn.units.Unit(array_units).ratio(units)
+        return "slice"
+    except pyn.units.UnitsException:
+        (pyn.units.Unit(array_units) * pyn.units.Unit("kpc")).ratio(units)  # raises if the units are just wrong.
+        return "column"
+
+
+def _deposit(images, flat_index, weights, values, lock=None):
+    """
+    Adds ``weights * values[target]`` to each of the ``images`` at the (flattened) pixel indices. Only the band of
+    pixels between the smallest and the largest index is summed, and the band is added under ``lock`` (if given) so
+    that several threads can deposit into the same images.
+    """
+    if not flat_index.size:
+        return
+
+    start, stop = np.amin(flat_index), np.amax(flat_index) + 1
+    bands = {key: np.bincount(flat_index - start, weights=(weights * value[:, None, None]).ravel(),
+                              minlength=stop - start) for key, value in values.items()}
+
+    with (lock if lock is not None else nullcontext()):
+        for key, band in bands.items():
+            images[key][start:stop] += band
+
+
+def _group_targets(snapshot, targets: list) -> dict:
+    """
+    Groups the ``(family, qty, units, av_z)`` targets into passes. Targets of the same family which use the same kernel
+    (slice or projection) share one pass.
+
+    Returns: ``{(family, projected): [(target, mode), ...]}``.
+    """
+    fdbg_string = "%s_group_targets: " % _dbg_string
+    families = {family.name: family for family in snapshot.families()}
+
+    passes = {}
+    for target in targets:
+        family, qty, units, av_z = target
+
+        if family not in families:
+            make_error(SnapshotError, fdbg_string, "Family %s was not found." % family)
+
+        array = snapshot[families[family]][qty]
+        mode = get_image_mode(array.units, units, av_z)
+        passes.setdefault((family, mode != "slice"), []).append((target, mode))
+
+    return passes
+
+
+def _get_pass_values(subsnap, members: list) -> dict:
+    """
+    Builds the per particle values which are summed with the kernel for each ``(target, mode)`` of a pass.
+    """
+    volume = np.asarray((subsnap["mass"] / subsnap["rho"]).in_units("kpc^3"))
+
+    values = {}
+    for target, mode in members:
+        quantity = np.asarray(subsnap[target[1]])
+
+        if mode == "average":
+            values[target] = np.asarray(subsnap["mass"]) * quantity  # the density weighted numerator.
+            values["__weight__"] = np.asarray(subsnap["mass"])
+        else:
+            values[target] = volume * quantity
+
+    return values
+
+
+def _finish_target(subsnap, target, mode: str, sums: dict) -> pyn.array.SimArray:
+    """
+    Turns the kernel sums of a pass into the ``target`` array in the requested units.
+    """
+    array_units = subsnap[target[1]].units
+
+    if mode == "average":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            array = np.nan_to_num(sums[target] / sums["__weight__"])
+    else:
+        array = sums[target]
+        array_units = (array_units * pyn.units.Unit("kpc") if mode == "column" else array_units)
+
+    return pyn.array.SimArray(array, array_units).in_units(target[2])
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ----------------------------------------------------- Functions -------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def deposit_family(subsnap, values: dict, width: float, resolution: int, projected: bool,
+                   chunk_size: int = None, threads: int = 1, view=None) -> dict:
+    """
+    Deposits each of the per particle ``values`` of a single family onto a ``resolution x resolution`` grid covering
+    ``[-width/2,width/2]^2`` in a single pass over the particles.
+
+    The footprint and kernel weights of each particle are computed once. The particles are grouped by the radius of
+    their footprint (in pixels) so that each group is a single vectorized operation.
+    Parameters
+    ----------
+    subsnap: The family sub-snapshot (already in the correct view, unless ``view`` is given).
+    values: ``{key: np.ndarray}`` of the per particle values to deposit. These are multiplied by the kernel (in
+        ``kpc^-3`` for slices or ``kpc^-2`` for projections) and summed.
+    width: The width of the image in ``kpc``.
+    resolution: The number of pixels on each side.
+    projected: True to use the projected kernel, False for a slice at ``z=0``.
+    chunk_size: The maximum number of (particle, pixel) pairs evaluated at once (split between the threads). Defaults
+        to ``CONFIG["analysis"]["derived_fields"]["chunk_size"]``.
+    threads: The number of threads to deposit with.
+    view: ``(matrix, shift)`` (``shift`` in ``kpc``) taking the positions into the view (see ``get_view_transform``).
+        Only the copy of the positions made here is transformed; the snapshot isn't written to.
+
+    Returns: ``{key: np.ndarray}`` of the ``(resolution,resolution)`` images (rows are ``y``).
+    -------
+
+    """
+    fdbg_string = "%sdeposit_family: " % _dbg_string
+
+    if not chunk_size:
+        chunk_size = CONFIG["analysis"]["derived_fields"]["chunk_size"]
+
+    chunk_size = max(chunk_size // max(threads, 1), 1)  # each thread evaluates its share at once.
+    pixel = width / resolution
+    x1 = -width / 2
+    images = {key: np.zeros(resolution * resolution) for key in values}
+
+    # Selecting the particles which touch the image
+    # ------------------------------------------------------------------------------------------------------------------#
+    position = np.asarray(subsnap["pos"].in_units("kpc"))
+    if view is not None:
+        position = np.matmul(position, view[0].transpose()) + view[1]
+
+    smooth = np.maximum(np.asarray(subsnap["smooth"].in_units("kpc")), _smoothing_floor * pixel)
+    reach = _kernel_support * smooth
+
+    selection = (np.abs(position[:, 0]) < width / 2 + reach) & (np.abs(position[:, 1]) < width / 2 + reach)
+    if not projected:
+        selection &= np.abs(position[:, 2]) < reach
+
+    position, smooth = position[selection], smooth[selection]
+    values = {key: np.asarray(value)[selection] for key, value in values.items()}
+    log_print("Depositing %s values for %s particles." % (len(values), len(smooth)), fdbg_string, "debug")
+
+    if not len(smooth):
+        return {key: image.reshape((resolution, resolution)) for key, image in images.items()}
+
+    # - The pixel containing each particle and the footprint radius (in pixels) -#
+    center_pixel = np.floor((position[:, :2] - x1) / pixel).astype(np.int64)
+    radius = np.ceil(_kernel_support * smooth / pixel).astype(np.int64)
+
+    # Building the jobs
+    # ------------------------------------------------------------------------------------------------------------------#
+    #  The particles are grouped by footprint radius and each group is cut into jobs of at most ``chunk_size``
+    #  (particle, pixel) pairs. The footprint is separable: the x and y offsets are computed per axis and only
+    #  broadcast to the (particle, x, y) cube for the kernel itself. The members of a group are ordered by row, so each
+    #  job only covers a narrow band of rows of the image (see ``_deposit``).
+    #
+    jobs = []
+    for r in np.unique(radius):
+        members = np.where(radius == r)[0]
+        members = members[np.argsort(center_pixel[members, 1], kind="stable")]
+
+        if (2 * r + 1) ** 2 > chunk_size:
+            # - Huge footprints are clipped to the image one particle at a time -#
+            jobs += [(r, None, members[i:i + 1]) for i in range(len(members))]
+        else:
+            step = max(min(chunk_size // (2 * r + 1) ** 2, -(-len(members) // threads)), 1)
+            jobs += [(r, np.arange(-r, r + 1)[None, :], members[i:i + step]) for i in range(0, len(members), step)]
+
+    lock = Lock()
+
+    def deposit_jobs(job_list):
+        for r, offset, chunk in job_list:
+            if offset is None:
+                i0, j0 = center_pixel[chunk[0]]
+                ix = np.arange(max(i0 - r, 0), min(i0 + r + 1, resolution))[None, :]
+                iy = np.arange(max(j0 - r, 0), min(j0 + r + 1, resolution))[None, :]
+            else:
+                ix = center_pixel[chunk, 0][:, None] + offset
+                iy = center_pixel[chunk, 1][:, None] + offset
+
+            h2 = smooth[chunk][:, None] ** 2
+            dx2 = (x1 + (ix + 0.5) * pixel - position[chunk, 0][:, None]) ** 2 / h2
+            dy2 = (x1 + (iy + 0.5) * pixel - position[chunk, 1][:, None]) ** 2 / h2
+
+            if projected:
+                weights = tabulated_kernel(dx2[:, :, None] + dy2[:, None, :], projected=True)
+
+                # - Projections conserve the deposited total, even for footprints of a few pixels -#
+                if offset is not None:
+                    norm = np.sum(weights, axis=(1, 2)) * pixel ** 2
+                    weights /= np.where(norm > 0, norm, 1)[:, None, None]
+                else:
+                    weights /= h2[:, :, None]
+            else:
+                dz2 = position[chunk, 2][:, None, None] ** 2 / h2[:, :, None]
+                weights = tabulated_kernel(dx2[:, :, None] + dy2[:, None, :] + dz2) / (h2[:, :, None] ** 1.5)
+
+            # - Pixels beyond the edges of the image get no weight -#
+            inside_x, inside_y = (ix >= 0) & (ix < resolution), (iy >= 0) & (iy < resolution)
+            if not (np.all(inside_x) and np.all(inside_y)):
+                weights *= inside_x[:, :, None] & inside_y[:, None, :]
+
+            flat_index = (np.clip(iy, 0, resolution - 1)[:, None, :] * resolution +
+                          np.clip(ix, 0, resolution - 1)[:, :, None])
+
+            _deposit(images, np.broadcast_to(flat_index, weights.shape).ravel(), weights,
+                     {key: value[chunk] for key, value in values.items()}, lock=lock)
+
+    # Depositing
+    # ------------------------------------------------------------------------------------------------------------------#
+    #  Each thread deposits an interleaved share of the jobs straight into the shared images, one band of rows at a
+    #  time, so the memory doesn't grow with the number of threads.
+    #
+    if threads > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(deposit_jobs, [jobs[i::threads] for i in range(threads)]))
+    else:
+        deposit_jobs(jobs)
+
+    return {key: image.reshape((resolution, resolution)) for key, image in images.items()}
+
+
+def deposit_images(snapshot, targets: list, width, resolution: int, chunk_size: int = None, threads: int = 1,
+                   views: dict = None) -> dict:
+    """
+    Renders each of the ``targets`` with one pass over the particles of each family and kernel type.
+    Parameters
+    ----------
+    snapshot: The snapshot (already in the correct view, see ``apply_view``, unless ``views`` are given).
+    targets: List of ``(family, qty, units, av_z)`` tuples. The arrays must already exist (see ``derive_fields``).
+    width: The width of the images.
+    resolution: The number of pixels on each side.
+    chunk_size: The maximum number of (particle, pixel) pairs evaluated at once.
+    threads: The number of threads to deposit each pass with.
+    views: ``{family name: (matrix, shift) or None}`` of the transforms into the view (see ``deposit_family``).
+
+    Returns: ``{target: pyn.array.SimArray}``.
+    -------
+
+    """
+    fdbg_string = "%sdeposit_images: " % _dbg_string
+    width = float(pyn.units.Unit(width).in_units("kpc")) if not isinstance(width, (int, float)) else float(width)
+    families = {family.name: family for family in snapshot.families()}
+
+    # Depositing
+    # ------------------------------------------------------------------------------------------------------------------#
+    output = {}
+    for (family, projected), members in _group_targets(snapshot, targets).items():
+        subsnap = snapshot[families[family]]
+        values = _get_pass_values(subsnap, members)
+
+        images = deposit_family(subsnap, values, width, resolution, projected, chunk_size=chunk_size, threads=threads,
+                                view=(views.get(family, None) if views else None))
+
+        for target, mode in members:
+            output[target] = _finish_target(subsnap, target, mode, images)
+
+        log_print("Rendered %s targets of %s in one pass." % (len(members), family), fdbg_string, "debug")
+
+    return output
+
+
+def sample_family(subsnap, values: dict, points: np.ndarray, projected: bool, chunk_size: int = None) -> dict:
+    """
+    Evaluates the kernel sums of each of the per particle ``values`` of a single family at the given ``points``.
+
+    Only the particles whose kernel reaches one of the points are used. They are found by querying a KD-tree of the
+    points with the position and kernel radius of each particle, so the cost scales with the number of (particle,
+    point) overlaps rather than with the area of an image.
+    Parameters
+    ----------
+    subsnap: The family sub-snapshot (already in the correct view).
+    values: ``{key: np.ndarray}`` of the per particle values to sum (see ``deposit_family``).
+    points: ``(n,3)`` array of the sample points in ``kpc``. Projections ignore the ``z`` coordinate.
+    projected: True to use the projected kernel (the line of sight through each point), False for the 3D kernel.
+    chunk_size: The maximum number of particles queried at once. Defaults to
+        ``CONFIG["analysis"]["derived_fields"]["chunk_size"]``.
+
+    Returns: ``{key: np.ndarray}`` of the ``n`` sums.
+    -------
+
+    """
+    fdbg_string = "%ssample_family: " % _dbg_string
+
+    if not chunk_size:
+        chunk_size = CONFIG["analysis"]["derived_fields"]["chunk_size"]
+
+    dimensions = (2 if projected else 3)
+    points = np.asarray(points, dtype="float64")[:, :dimensions]
+    samples = {key: np.zeros(len(points)) for key in values}
+
+    # Selecting the particles which can reach a point
+    # ------------------------------------------------------------------------------------------------------------------#
+    position = np.asarray(subsnap["pos"].in_units("kpc"))[:, :dimensions]
+    smooth = np.asarray(subsnap["smooth"].in_units("kpc"))
+    reach = _kernel_support * smooth
+
+    selection = np.all((position > np.amin(points, axis=0) - reach[:, None]) &
+                       (position < np.amax(points, axis=0) + reach[:, None]), axis=1)
+
+    position, smooth, reach = position[selection], smooth[selection], reach[selection]
+    values = {key: np.asarray(value)[selection] for key, value in values.items()}
+    log_print("Sampling %s values from %s particles." % (len(values), len(smooth)), fdbg_string, "debug")
+
+    # Summing
+    # ------------------------------------------------------------------------------------------------------------------#
+    tree = cKDTree(points)
+
+    for start in range(0, len(smooth), chunk_size):
+        stop = min(start + chunk_size, len(smooth))
+        neighbours = tree.query_ball_point(position[start:stop], reach[start:stop], return_sorted=False)
+
+        counts = np.fromiter((len(members) for members in neighbours), dtype=np.int64, count=stop - start)
+        if not np.sum(counts):
+            continue
+
+        particle = np.repeat(np.arange(start, stop), counts)
+        point = np.fromiter(chain.from_iterable(neighbours), dtype=np.int64, count=np.sum(counts))
+
+        h2 = smooth[particle] ** 2
+        weights = tabulated_kernel(np.sum((points[point] - position[particle]) ** 2, axis=1) / h2, projected=projected)
+        weights /= (h2 if projected else h2 ** 1.5)
+
+        for key, value in values.items():
+            samples[key] += np.bincount(point, weights=weights * value[particle], minlength=len(points))
+
+    return samples
+
+
+def sample_points(snapshot, targets: list, points, chunk_size: int = None) -> dict:
+    """
+    Evaluates each of the ``targets`` at the given ``points`` with one pass over the particles of each family and
+    kernel type. The samples follow the same slice, column and average conventions as ``deposit_images``.
+    Parameters
+    ----------
+    snapshot: The snapshot (already in the correct view, see ``apply_view``).
+    targets: List of ``(family, qty, units, av_z)`` tuples. The arrays must already exist (see ``derive_fields``).
+    points: ``(n,3)`` array (or ``SimArray``) of the sample points. Plain arrays are taken to be in ``kpc``.
+    chunk_size: The maximum number of particles queried at once.
+
+    Returns: ``{target: pyn.array.SimArray}``.
+    -------
+
+    """
+    fdbg_string = "%ssample_points: " % _dbg_string
+    points = (points.in_units("kpc") if isinstance(points, pyn.array.SimArray) else np.asarray(points))
+    families = {family.name: family for family in snapshot.families()}
+
+    output = {}
+    for (family, projected), members in _group_targets(snapshot, targets).items():
+        subsnap = snapshot[families[family]]
+        values = _get_pass_values(subsnap, members)
+
+        samples = sample_family(subsnap, values, points, projected, chunk_size=chunk_size)
+
+        for target, mode in members:
+            output[target] = _finish_target(subsnap, target, mode, samples)
+
+        log_print("Sampled %s targets of %s in one pass." % (len(members), family), fdbg_string, "debug")
+
+    return output
@@ -12,6 +12,7 @@ import numpy as np
 from PyCS_Core.Logging import set_log, log_print, make_error
 from PyCS_Core.Configuration import read_config, _configuration_path
 from PyCS_Core.PyCS_Errors import *
+from PyCS_Analysis.Analysis_Utils import get_profile, get_families, apply_view
 from scipy.integrate import solve_ivp
 import pynbody as pyn
 import warnings
@@ -49,34 +50,147 @@ def smooth_func(function, bandwidth=10):
     return lambda r: np.convolve(function(r), np.ones(bandwidth) / bandwidth, mode="same")
 
 
-def find_rx(snapshot, p=500 * rho_critical):
+def evaluate_binned(r_vals, values, r, interpolate: bool = False) -> np.ndarray:
     """
-    Determines the maximal radius of the ``snapshot`` at which the total density is >= ``p``.
+    Evaluates a binned radial profile at the radii ``r``. By default each radius takes the value of the last bin whose
+    radius is ``<= r`` (radii below the first bin take the first bin); ``interpolate=True`` interpolates linearly between
+    the bins instead. Both are a single ``searchsorted`` over the bins, so the cost is ``O(n_r log(n_bins))``.
     Parameters
     ----------
-    snapshot: The snapshot to analyze.
-    p: The density to look for.
+    r_vals: The (increasing) radii of the bins.
+    values: The values of the bins. Arrays of shape ``(..., n_bins)`` evaluate every row at once.
+    r: The radii to evaluate at, in the units of ``r_vals``.
+    interpolate: True to interpolate linearly between bins.
 
-    Returns: The radius of the specified density.
+    Returns: The values at ``r`` (shape ``(..., n_r)``).
+    -------
+
+    """
+    r_vals, values, r = np.asarray(r_vals), np.asarray(values), np.asarray(r)
+
+    if interpolate:
+        index = np.clip(np.searchsorted(r_vals, r, side="right"), 1, len(r_vals) - 1)
+        fraction = np.clip((r - r_vals[index - 1]) / (r_vals[index] - r_vals[index - 1]), 0, 1)
+        return values[..., index - 1] * (1 - fraction) + values[..., index] * fraction
+    else:
+        return values[..., np.clip(np.searchsorted(r_vals, r, side="right") - 1, 0, len(r_vals) - 1)]
+
+
+def _hse_factor(mu, independent_unit, dependent_unit) -> float:
+    """
+    The constant k/(mu G m_p) in ``dependent_unit K^-1 independent_unit^-1``.
+    """
+    return float((boltzmann_constant / (mu * G * m_p)).in_units("%s K^-1 %s^-1" % (dependent_unit, independent_unit)))
+
+
+def _hse_mass_bins(gas_profile, mu, independent_unit, dependent_unit) -> tuple:
+    """
+    Computes the hydrostatic mass of each bin of a gas profile from the mass weighted temperature and density of the
+    bins and their ``pyn`` derivatives (``np.gradient`` with the width of the first bin).
+
+    Returns: ``(r_vals, masses)`` in ``independent_unit`` and ``dependent_unit``.
+    """
+    temp_g = np.asarray(gas_profile["temp"].in_units("K"))
+    rho_g = np.asarray(gas_profile["rho"].in_units("Msol kpc^-3"))
+    dtemp_g = np.asarray(gas_profile["d_temp"].in_units("K %s^-1" % str(independent_unit)))
+    drho_g = np.asarray(gas_profile["d_rho"].in_units("Msol kpc^-3 %s^-1" % str(independent_unit)))
+    r_vals = np.asarray(gas_profile["rbins"].in_units(independent_unit))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        masses = -1 * _hse_factor(mu, independent_unit, dependent_unit) * temp_g * (r_vals ** 2) * (
+                (drho_g / rho_g) + (dtemp_g / temp_g))
+
+    return r_vals, masses
+
+
+def find_overdensity_radii(snapshot,
+                           overdensities=(2500, 1000, 500, 200),
+                           reference=rho_critical,
+                           families=None,
+                           center=None) -> tuple:
+    """
+    Finds the overdensity radii ``r_x`` (the largest radius whose **mean enclosed** density is at least ``x`` times the
+    ``reference`` density) and the enclosed masses ``M_x`` for every overdensity in a single pass.
+
+    The particle radii are sorted once and the cumulative mass gives the mean enclosed density at each particle. The
+    running maximum of that density from the outside in is monotonic, so each threshold is a single ``searchsorted``.
+    Parameters
+    ----------
+    snapshot: The snapshot (or sub-snapshot) to analyze.
+    overdensities: The overdensities ``x`` to find.
+    reference: The reference density (defaults to the critical density).
+    families: The family names to include. Defaults to ``None`` (all families).
+    center: The center to measure radii from, in the current view. Defaults to the origin of the view.
+
+    Returns: ``(radii, masses)`` SimArrays (in the default length and mass units) with one entry per overdensity. An
+        overdensity which is never reached gives ``nan``.
     -------
 
     """
     # Intro debugging
     ####################################################################################################################
-    fdbg_string = "%sfind_rx: "
-    log_print("Looking for %s radius in %s." % (p, snapshot), fdbg_string, "debug")
+    fdbg_string = "%sfind_overdensity_radii: " % _dbg_string
+    log_print("Looking for the %s radii of %s." % (list(overdensities), snapshot), fdbg_string, "debug")
 
     # Setup
     ####################################################################################################################
-    # - generating the necessary profile -#
-    profile = pyn.analysis.profile.Profile(snapshot, nbins=1000, ndim=3)
+    apply_view(snapshot, families)
+    subsnaps = ([snapshot] if families is None else [snapshot[family] for family in get_families(snapshot, families)])
+
+    if not len(subsnaps):
+        make_error(SnapshotError, fdbg_string, "Families %s were not found in %s." % (families, snapshot))
+        return None  # IDE calming
 
-    rbins, density = profile["rbins"], profile["density"]
+    position = np.concatenate([np.asarray(subsnap["pos"].in_units("kpc")) for subsnap in subsnaps])
+    mass = np.concatenate([np.asarray(subsnap["mass"].in_units("Msol")) for subsnap in subsnaps])
+
+    if center is not None:
+        position -= np.asarray(center.in_units("kpc") if isinstance(center, pyn.array.SimArray) else center)
 
     # Computing
     ####################################################################################################################
-    rbins = rbins[np.where(density >= p)]
-    return np.amax(rbins)
+    # - sorting the radii once -#
+    radii = np.sqrt(np.sum(position ** 2, axis=1))
+    order = np.argsort(radii, kind="stable")
+    radii, enclosed_mass = radii[order], np.cumsum(mass[order])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_density = enclosed_mass / ((4 / 3) * np.pi * radii ** 3)
+
+    # - envelope: the largest mean density at or beyond each radius (non-increasing) -#
+    envelope = np.maximum.accumulate(np.nan_to_num(mean_density, nan=0.0)[::-1])[::-1]
+
+    thresholds = np.array([float(x * reference.in_units("Msol kpc^-3")) for x in overdensities])
+    index = np.searchsorted(-envelope, -thresholds, side="right") - 1  # the last particle with envelope >= threshold.
+
+    found = index >= 0
+    r_x = np.where(found, radii[np.maximum(index, 0)], np.nan)
+    m_x = np.where(found, enclosed_mass[np.maximum(index, 0)], np.nan)
+
+    return (pyn.array.SimArray(r_x, "kpc").in_units(CONFIG["units"]["default_length_unit"]),
+            pyn.array.SimArray(m_x, "Msol").in_units(CONFIG["units"]["default_mass_unit"]))
+
+
+def find_rx(snapshot, p=500 * rho_critical):
+    """
+    Determines the maximal radius of the ``snapshot`` at which the mean enclosed density is >= ``p``. Use
+    ``find_overdensity_radii`` to find several radii (and their masses) at once.
+    Parameters
+    ----------
+    snapshot: The snapshot to analyze.
+    p: The density to look for.
+
+    Returns: The radius of the specified density.
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%sfind_rx: " % _dbg_string
+    log_print("Looking for %s radius in %s." % (p, snapshot), fdbg_string, "debug")
+
+    radii, _ = find_overdensity_radii(snapshot, overdensities=[1], reference=p)
+    return pyn.array.SimArray(radii[0], radii.units)
 
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -89,12 +203,16 @@ def hydrostatic_mass(subsnap,
                      mu: float = mass_fraction,
                      independent_unit=CONFIG["units"]["default_length_unit"],
                      dependent_unit=CONFIG["units"]["default_mass_unit"],
+                     interpolate: bool = None,
+                     bandwidth: int = 10,
                      **kwargs):
     """
     Constructs the mass profile base on the hydrostatic assumption and spherical symmetry.
 
     M(<r) = ((k*T*r^2)/(mu*m_p*G))*[(dln(rho)/dr) + (dln(T)/dr)]
 
+    The mass of each bin is computed once, and the returned function only looks the bins up (see ``evaluate_binned``).
+
     Parameters
     ----------
     kwargs: additional kwargs to pass to pyn.analysis.profile.Profile()
@@ -102,6 +220,9 @@ def hydrostatic_mass(subsnap,
     mu: The ICM mass fraction.
     independent_unit: The length unit to use as input. Must match the data length unit.
     dependent_unit: The output unit to use as the mass unit. Must match the data mass unit.
+    interpolate: True to interpolate between the bins rather than use the value of the containing bin. Defaults to
+        ``CONFIG["analysis"]["profiles"]["hse"]["interpolate"]``.
+    bandwidth: The width (in samples) of the moving average applied to each evaluation. ``1`` to disable.
 
     Returns: Lambda function - M(<r) - in ``dependent_units`` = Lf(r - in ``independent_units``)
     -------
@@ -114,50 +235,224 @@ def hydrostatic_mass(subsnap,
 
     # Setup
     ####################################################################################################################
+    if interpolate is None:
+        interpolate = CONFIG["analysis"]["profiles"]["hse"]["interpolate"]
+
     # - managing unit types -#
     if isinstance(independent_unit, str):
         independent_unit = pyn.units.Unit(independent_unit)
     if isinstance(dependent_unit, str):
         dependent_unit = pyn.units.Unit(dependent_unit)
 
-    # Collecting necessary datasets
+    # Computing the binned masses
     ####################################################################################################################
     try:
         # - generating the profile -#
-        gas_profile = pyn.analysis.profile.Profile(subsnap.g, ndim=3, **kwargs)
-
-        # - extracting important arrays
-        temp_g = gas_profile["temp"].in_units("K")
-        rho_g = gas_profile["rho"].in_units("Msol kpc^-3")
-        dtemp_g = gas_profile["d_temp"].in_units("K %s^-1" % str(independent_unit))
-        drho_g = gas_profile["d_rho"].in_units("Msol kpc^-3 %s^-1" % str(independent_unit))
-        r_vals = gas_profile["rbins"].in_units(independent_unit)
+        gas_profile = get_profile(subsnap, "gas", ndim=3, **kwargs)
+        r_vals, masses = _hse_mass_bins(gas_profile, mu, independent_unit, dependent_unit)
     except Exception:
         make_error(SnapshotError, fdbg_string, "Failed to extract a gas profile from %s." % subsnap)
         return None  # IDE calming
 
-    # Generate the r-lambda
-    ####################################################################################################################
-    r_index = lambda r: np.piecewise(r,
-                                     [(r >= r_vals[i]) & (r < r_vals[i + 1]) for i, rs in enumerate(r_vals[:-1])] + [
-                                         (r >= r_vals[-1])],
-                                     [int(i) for i in
-                                      list(range(len(r_vals)))])  # generates the r-indexing array function
     # Generating the lambda-function
     ####################################################################################################################
-    # - Coercing units -#
-    k_temp = boltzmann_constant.in_units("%s m^2 s^-2 K^-1" % str(dependent_unit))  # convert k to M m^2/s^2
-    G_temp = G.in_units("m^2 s^-2 kg^-1 %s" % str(independent_unit))
-    m_p_temp = m_p.in_units("kg")
-
-    # - constructing the lambda function -#
-    hydro_func = lambda r: -1 * ((k_temp) / (mu * G_temp * m_p_temp)) * (
-            (temp_g[r_index(r).astype("int32")]) * (r_vals[r_index(r).astype("int32")] ** 2)) * (
-                                   ((1 / rho_g[r_index(r).astype("int32")]) * (drho_g[r_index(r).astype("int32")]))
-                                   + ((1 / temp_g[r_index(r).astype("int32")]) * (
-                               dtemp_g[r_index(r).astype("int32")])))
-
-    return smooth_func(hydro_func)
+    hydro_func = lambda r: evaluate_binned(r_vals, masses, r, interpolate=interpolate)
+
+    return (smooth_func(hydro_func, bandwidth=bandwidth) if bandwidth > 1 else hydro_func)
+
+
+def hydrostatic_mass_bins(subsnap,
+                          mu: float = mass_fraction,
+                          independent_unit=CONFIG["units"]["default_length_unit"],
+                          dependent_unit=CONFIG["units"]["default_mass_unit"],
+                          **kwargs) -> tuple:
+    """
+    Computes the binned hydrostatic mass of ``subsnap`` (see ``hydrostatic_mass``) without building a lookup.
+    Parameters
+    ----------
+    subsnap: the Pynbody snapshot or sub-snapshot to analyze. **Must be pre-aligned and centered**
+    mu: The ICM mass fraction.
+    independent_unit: The length unit of the bins.
+    dependent_unit: The mass unit of the masses.
+    kwargs: additional kwargs to pass to pyn.analysis.profile.Profile()
+
+    Returns: ``(r_vals, masses)`` arrays in ``independent_unit`` and ``dependent_unit``.
+    -------
+
+    """
+    fdbg_string = "%shydrostatic_mass_bins: " % _dbg_string
+    independent_unit, dependent_unit = (pyn.units.Unit(unit) if isinstance(unit, str) else unit for unit in
+                                        [independent_unit, dependent_unit])
+
+    try:
+        return _hse_mass_bins(get_profile(subsnap, "gas", ndim=3, **kwargs), mu, independent_unit, dependent_unit)
+    except Exception:
+        make_error(SnapshotError, fdbg_string, "Failed to extract a gas profile from %s." % subsnap)
+
+
+def hydrostatic_mass_profiles(snapshots: list,
+                              r,
+                              mu: float = mass_fraction,
+                              independent_unit=CONFIG["units"]["default_length_unit"],
+                              dependent_unit=CONFIG["units"]["default_mass_unit"],
+                              interpolate: bool = None,
+                              **kwargs) -> np.ndarray:
+    """
+    Evaluates the hydrostatic mass (see ``hydrostatic_mass``) of each of the ``snapshots`` at the same radii ``r``.
+    Snapshots which share their binning are looked up together in a single ``searchsorted``.
+
+    Each entry may also be the ``(r_vals, masses)`` of a snapshot (see ``hydrostatic_mass_bins``), so that long series
+    can be binned one snapshot at a time (i.e. as they are read) instead of holding every snapshot in memory.
+    Parameters
+    ----------
+    snapshots: The (pre-aligned and centered) snapshots or sub-snapshots, or their ``(r_vals, masses)`` (in
+        ``independent_unit`` and ``dependent_unit``).
+    r: The radii (in ``independent_unit``) to evaluate at.
+    mu: The ICM mass fraction.
+    independent_unit: The length unit of ``r``.
+    dependent_unit: The mass unit of the output.
+    interpolate: True to interpolate between the bins rather than use the value of the containing bin. Defaults to
+        ``CONFIG["analysis"]["profiles"]["hse"]["interpolate"]``.
+    kwargs: additional kwargs to pass to pyn.analysis.profile.Profile()
+
+    Returns: ``(n_snapshots, n_r)`` array of the masses in ``dependent_unit``. Snapshots without a usable gas profile
+        give a row of ``nan``.
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%shydrostatic_mass_profiles: " % _dbg_string
+    log_print("Evaluating the hydrostatic masses of %s snapshots." % len(snapshots), fdbg_string, "debug")
+
+    if interpolate is None:
+        interpolate = CONFIG["analysis"]["profiles"]["hse"]["interpolate"]
+
+    r = np.asarray(r, dtype="float64")
+    output = np.full((len(snapshots), r.size), np.nan)
+
+    # Computing the binned masses
+    ####################################################################################################################
+    groups = {}  # r_vals -> [(row, masses)], so that snapshots with the same bins are evaluated together.
+
+    for row, snapshot in enumerate(snapshots):
+        if isinstance(snapshot, tuple):
+            r_vals, masses = (np.asarray(array, dtype="float64") for array in snapshot)
+        else:
+            try:
+                r_vals, masses = hydrostatic_mass_bins(snapshot, mu, independent_unit, dependent_unit, **kwargs)
+            except SnapshotError:
+                log_print("Failed to extract a gas profile from %s." % snapshot, fdbg_string, "warning")
+                continue
+
+        groups.setdefault(r_vals.tobytes(), (r_vals, []))[1].append((row, masses))
+
+    # Evaluating
+    ####################################################################################################################
+    for r_vals, members in groups.values():
+        rows = [row for row, _ in members]
+        output[rows] = evaluate_binned(r_vals, np.vstack([masses for _, masses in members]), r.ravel(),
+                                       interpolate=interpolate)
+
+    return output
+
+
+def hydrostatic_mass_bands(subsnap,
+                           r,
+                           mu: float = mass_fraction,
+                           independent_unit=CONFIG["units"]["default_length_unit"],
+                           dependent_unit=CONFIG["units"]["default_mass_unit"],
+                           n_bootstrap: int = None,
+                           percentiles=None,
+                           interpolate: bool = None,
+                           bandwidth: int = 10,
+                           seed: int = None,
+                           **kwargs) -> tuple:
+    """
+    Bootstrap error band of the hydrostatic mass (see ``hydrostatic_mass``) of ``subsnap`` at the radii ``r``.
+
+    Each realization resamples the gas particles with replacement (as Poisson weights) and recomputes the hydrostatic
+    mass with the estimator of ``hydrostatic_mass``: the mass weighted temperature and density of each bin of the gas
+    profile, their ``pyn`` derivatives and the same moving average.
+    Parameters
+    ----------
+    subsnap: the Pynbody snapshot or sub-snapshot to analyze. **Must be pre-aligned and centered**
+    r: The radii (in ``independent_unit``) to evaluate at.
+    mu: The ICM mass fraction.
+    independent_unit: The length unit of ``r``.
+    dependent_unit: The mass unit of the output.
+    n_bootstrap: The number of realizations. Defaults to ``CONFIG["analysis"]["profiles"]["hse"]["bootstrap_samples"]``.
+    percentiles: The ``(lower, upper)`` percentiles of the band. Defaults to
+        ``CONFIG["analysis"]["profiles"]["hse"]["band_percentiles"]``.
+    interpolate: True to interpolate between the bins rather than use the value of the containing bin. Defaults to
+        ``CONFIG["analysis"]["profiles"]["hse"]["interpolate"]``.
+    bandwidth: The width (in samples) of the moving average applied to each evaluation. ``1`` to disable.
+    seed: The seed of the resampling.
+    kwargs: additional kwargs to pass to pyn.analysis.profile.Profile()
+
+    Returns: ``(lower, upper)`` arrays in ``dependent_unit``.
+    -------
+
+    """
+    # Intro debugging
+    ####################################################################################################################
+    fdbg_string = "%shydrostatic_mass_bands: " % _dbg_string
+
+    if n_bootstrap is None:
+        n_bootstrap = CONFIG["analysis"]["profiles"]["hse"]["bootstrap_samples"]
+    if percentiles is None:
+        percentiles = tuple(CONFIG["analysis"]["profiles"]["hse"]["band_percentiles"])
+    if interpolate is None:
+        interpolate = CONFIG["analysis"]["profiles"]["hse"]["interpolate"]
+
+    log_print("Bootstrapping the hydrostatic mass of %s (%s samples)." % (subsnap, n_bootstrap), fdbg_string, "debug")
+
+    # Setup
+    ####################################################################################################################
+    try:
+        gas_profile = get_profile(subsnap, "gas", ndim=3, **kwargs)
+        edges = np.asarray(gas_profile["bin_edges"].in_units(independent_unit))
+        r_vals = np.asarray(gas_profile["rbins"].in_units(independent_unit))
+
+        gas = get_families(subsnap, ["gas"])[0]
+        radii = np.asarray(subsnap[gas]["r"].in_units(independent_unit))
+        particle_mass = np.asarray(subsnap[gas]["mass"].in_units("Msol"))
+        particle_temp = np.asarray(subsnap[gas]["temp"].in_units("K"))
+        particle_rho = np.asarray(subsnap[gas]["rho"].in_units("Msol kpc^-3"))
+    except Exception:
+        make_error(SnapshotError, fdbg_string, "Failed to extract a gas profile from %s." % subsnap)
+        return None  # IDE calming
+
+    # - only the particles inside the bins contribute -#
+    bins = np.searchsorted(edges, radii, side="right") - 1
+    inside = (bins >= 0) & (bins < len(r_vals))
+    bins, particle_mass = bins[inside], particle_mass[inside]
+    particle_temp, particle_rho = particle_temp[inside], particle_rho[inside]
+
+    spacing = np.gradient(r_vals)[0]  # the derivatives of pyn profiles use the width of the first bin.
+    factor = _hse_factor(mu, independent_unit, dependent_unit)
+    rng = np.random.default_rng(seed)
+
+    # Resampling
+    ####################################################################################################################
+    samples = np.empty((n_bootstrap, np.size(r)))
+
+    for i in range(n_bootstrap):
+        weights = particle_mass * rng.poisson(1.0, len(particle_mass))
+        mass = np.bincount(bins, weights=weights, minlength=len(r_vals))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            temp = np.bincount(bins, weights=weights * particle_temp, minlength=len(r_vals)) / mass
+            rho = np.bincount(bins, weights=weights * particle_rho, minlength=len(r_vals)) / mass
+
+            masses = -1 * factor * temp * (r_vals ** 2) * (
+                    (np.gradient(rho, spacing) / rho) + (np.gradient(temp, spacing) / temp))
+
+        hydro_func = (lambda x, masses=masses: evaluate_binned(r_vals, masses, x, interpolate=interpolate))
+        samples[i] = (smooth_func(hydro_func, bandwidth=bandwidth) if bandwidth > 1 else hydro_func)(np.ravel(r))
+
+    lower, upper = np.nanpercentile(samples, percentiles, axis=0)
+    return lower, upper
 
 
 def dehnen_profile(mass,
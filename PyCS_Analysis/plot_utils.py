@@ -19,9 +19,19 @@ import numpy as np
 
 sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
 from PyCS_Core.Configuration import read_config, _configuration_path
-from PyCS_Core.Logging import set_log
+from PyCS_Core.Logging import set_log, log_print, make_error
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import current_process, parent_process
+from multiprocessing.connection import Listener, Client
+import subprocess
+import shutil
+import tempfile
+import threading
 import warnings
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -39,6 +49,12 @@ if not CONFIG["system"]["logging"]["warnings"]:
 
 #- grabbing a color dictionary -#
 _available_colors = {**mpl.colors.XKCD_COLORS,**mpl.colors.BASE_COLORS,**mpl.colors.CSS4_COLORS}
+
+#- pre-rendered colorbar strips for the fast frame writer, keyed by their settings -#
+_colorbar_strips = {}
+_max_colorbar_strips = 16
+_movie_connections = {}  # (pid, address) -> the connection a worker sends all of its movie frames through.
+_movie_lock = threading.Lock()
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ---------------------------------------------------- Functions --------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -76,6 +92,529 @@ def get_color_binary_colormap(color: str) -> mpl.colors.ListedColormap:
     #- returning -#
     return mpl.colors.ListedColormap(replicated_array)
 
+
+def get_color_limits(array, vmin=None, vmax=None, log=False) -> tuple:
+    """
+    Fills in the color limits of an image the way ``make_plot`` does: the extremes of the array, with a positive
+    minimum for logarithmic scales.
+    Parameters
+    ----------
+    array: The image array.
+    vmin: color minimum.
+    vmax: color maximum.
+    log: True to use a logarithmic scale.
+
+    Returns: ``(vmin, vmax)``
+    -------
+
+    """
+    if not vmin:
+        vmin = np.amin(array)
+    if not vmax:
+        vmax = np.amax(array)
+
+    if log and vmin <= 0:
+        positive = array[array > 0]
+        vmin = (np.amin(positive) if positive.size else 1)
+
+    return float(vmin), float(vmax)
+
+
+def apply_colormap(array, cmap, vmin, vmax, log=False) -> np.ndarray:
+    """
+    Maps an image array to RGBA pixels through a look up table of the colormap, without building a figure.
+    Parameters
+    ----------
+    array: The ``(ny, nx)`` image array.
+    cmap: The colormap (or its name).
+    vmin: color minimum.
+    vmax: color maximum.
+    log: True to use a logarithmic scale. Non-positive pixels get the colormap's "bad" color.
+
+    Returns: ``(ny, nx, 4)`` array of ``uint8``.
+    -------
+
+    """
+    cmap = plt.get_cmap(cmap)
+    lut = (cmap(np.arange(cmap.N)) * 255).astype("uint8")
+    array = np.asarray(array, dtype="float64")
+
+    if log:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            array = np.log10(array)
+        vmin, vmax = np.log10(vmin), np.log10(vmax)
+
+    scale = (cmap.N / (vmax - vmin) if vmax > vmin else 0)  # the same binning as ``Colormap.__call__``.
+    bad = ~np.isfinite(array)
+
+    indices = np.clip((np.where(bad, vmin, array) - vmin) * scale, 0, cmap.N - 1).astype("intp")
+    pixels = lut[indices]
+    pixels[bad] = (np.asarray(cmap.get_bad()) * 255).astype("uint8")
+
+    return pixels
+
+
+def get_colorbar_strip(cmap, vmin, vmax, log, height, label=None) -> np.ndarray:
+    """
+    Renders (or fetches from ``_colorbar_strips``) a vertical colorbar strip of the given height with matplotlib. The
+    strip only depends on the color settings, so a sequence with fixed limits renders it once.
+    Parameters
+    ----------
+    cmap: The colormap (or its name).
+    vmin: color minimum.
+    vmax: color maximum.
+    log: True to use a logarithmic scale.
+    height: The height of the strip in pixels.
+    label: The colorbar label.
+
+    Returns: ``(height, width, 4)`` array of ``uint8``.
+    -------
+
+    """
+    cmap = plt.get_cmap(cmap)
+    width = CONFIG["Visualization"]["Images"]["Fast"]["colorbar_width"]
+    key = (cmap.name, float(vmin), float(vmax), bool(log), int(height), width, label)
+
+    if key not in _colorbar_strips:
+        if len(_colorbar_strips) >= _max_colorbar_strips:
+            _colorbar_strips.clear()
+
+        dpi = 100
+        figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_axes([0.1, 0.05, 0.2, 0.9])
+        norm = (mpl.colors.LogNorm(vmin=vmin, vmax=vmax) if log else mpl.colors.Normalize(vmin=vmin, vmax=vmax))
+        figure.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=cmap), cax=axes, label=label)
+
+        canvas.draw()
+        _colorbar_strips[key] = np.asarray(canvas.buffer_rgba())[:height, :width].copy()
+
+    return _colorbar_strips[key]
+
+
+def write_fast_frame(array, end_file, cmap, vmin=None, vmax=None, log=False, label=None, annotation=None, writer=None):
+    """
+    Writes an image array straight to a PNG: the array is colored with ``apply_colormap``, a pre-rendered colorbar
+    (``get_colorbar_strip``) is attached on the right and ``annotation`` is drawn in the top left corner. No
+    matplotlib figure is built for the frame itself.
+    Parameters
+    ----------
+    array: The ``(ny, nx)`` image array (``origin="lower"``).
+    end_file: The file to write.
+    cmap: The colormap (or its name).
+    vmin: color minimum. Defaults to the minimum of the array.
+    vmax: color maximum. Defaults to the maximum of the array.
+    log: True to use a logarithmic scale.
+    label: The colorbar label.
+    annotation: Text to draw on the image.
+    writer: A ``FrameWriter`` to encode and write the PNG on. Defaults to writing it here.
+
+    Returns: None
+    -------
+
+    """
+    vmin, vmax = get_color_limits(array, vmin, vmax, log)
+    pixels = apply_colormap(array, cmap, vmin, vmax, log=log)[::-1]  # rows are stored bottom up.
+
+    strip = get_colorbar_strip(cmap, vmin, vmax, log, pixels.shape[0], label=label)
+    frame = Image.fromarray(np.concatenate([pixels, strip], axis=1), mode="RGBA")
+
+    if annotation:
+        ImageDraw.Draw(frame).text((10, 10), annotation, fill=(255, 255, 255, 255), font=ImageFont.load_default())
+
+    if writer is not None:
+        writer.write_image(frame, end_file, compress_level=CONFIG["Visualization"]["Images"]["Fast"]["png_compression"])
+    else:
+        _save_image(frame, end_file, compress_level=CONFIG["Visualization"]["Images"]["Fast"]["png_compression"])
+
+
+def _write_png(pixels, end_file, dpi):
+    """
+    Encodes an RGBA buffer and writes it to ``end_file``.
+    """
+    _save_image(Image.fromarray(pixels, mode="RGBA"), end_file, dpi=(dpi, dpi))
+
+
+def _save_image(image, end_file, **kwargs):
+    """
+    Writes a PIL image as a PNG. The file is written next to ``end_file`` and moved into place, so ``end_file`` either
+    doesn't exist or is complete (see ``SequenceManifest``).
+    """
+    temporary_file = "%s.tmp" % end_file
+    image.save(temporary_file, format="PNG", **kwargs)
+    os.replace(temporary_file, end_file)
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ----------------------------------------------------- Classes ---------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+class FrameWriter:
+    """
+    Encodes and writes finished frames on a small pool of threads, so that the next frame can be rendered while the
+    last one is compressed and written. At most ``queue_size`` frames are waiting at once; ``submit`` blocks when the
+    queue is full, which bounds the memory held by pending frames.
+
+    If a ``stream`` (a ``MovieStream`` or ``MovieClient``) is given, the frames are sent to it as raw RGB pixels instead
+    of being written as PNGs. The frame is named by the stem of its file (i.e. ``Image_00012``).
+
+    Errors raised while writing are re-raised by ``close``.
+    """
+
+    def __init__(self, threads: int = None, queue_size: int = None, stream=None):
+        """
+        Initializes the ``FrameWriter``.
+        Parameters
+        ----------
+        threads: The number of writer threads. Defaults to ``CONFIG["Visualization"]["writer_threads"]``. With 0
+            threads, frames are written synchronously.
+        queue_size: The maximum number of pending frames. Defaults to ``CONFIG["Visualization"]["writer_queue"]``.
+        stream: The movie stream to send the frames to, if any. The stream is not closed by ``close``.
+        """
+        self.threads = (threads if threads is not None else CONFIG["Visualization"]["writer_threads"])
+        self.queue_size = max(queue_size if queue_size is not None else CONFIG["Visualization"]["writer_queue"], 1)
+        self.stream = stream
+        self.cdbg_string = "%sFrameWriter: " % _dbg_string
+
+        self._executor = (ThreadPoolExecutor(max_workers=self.threads) if self.threads > 0 else None)
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _done(self, future):
+        self._slots.release()
+
+        if future.exception() is not None:
+            self._errors.append(future.exception())
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Runs ``function(*args, **kwargs)`` on a writer thread. Blocks while the queue is full.
+        """
+        if self._executor is None:
+            function(*args, **kwargs)
+            return None
+
+        self._slots.acquire()
+        self._executor.submit(function, *args, **kwargs).add_done_callback(self._done)
+
+    def write_figure(self, figure, end_file):
+        """
+        Draws ``figure`` on this thread and hands a copy of its pixels to a writer thread. The figure can be changed
+        or closed as soon as this returns.
+        Parameters
+        ----------
+        figure: The matplotlib figure.
+        end_file: The PNG file to write.
+
+        Returns: None
+        -------
+
+        """
+        if not hasattr(figure.canvas, "buffer_rgba"):  # not an Agg canvas; matplotlib has to write it.
+            figure.savefig(end_file)
+            return None
+
+        figure.canvas.draw()
+
+        if self.stream is not None:
+            self.submit(self.stream.add, pt.Path(end_file).stem, np.asarray(figure.canvas.buffer_rgba())[:, :, :3].copy())
+        else:
+            self.submit(_write_png, np.asarray(figure.canvas.buffer_rgba()).copy(), end_file, figure.dpi)
+
+    def write_image(self, image, end_file, **kwargs):
+        """
+        Hands a PIL image to a writer thread.
+        Parameters
+        ----------
+        image: The PIL image. It mustn't be changed afterwards.
+        end_file: The PNG file to write.
+        kwargs: Additional kwargs for ``Image.save``.
+
+        Returns: None
+        -------
+
+        """
+        if self.stream is not None:
+            self.submit(self.stream.add, pt.Path(end_file).stem, np.asarray(image.convert("RGB")))
+        else:
+            self.submit(_save_image, image, end_file, **kwargs)
+
+    def close(self):
+        """
+        Waits for the pending frames and stops the threads. Re-raises the first error of a writer thread.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        if len(self._errors):
+            log_print("%s frames failed to write." % len(self._errors), "%sclose: " % self.cdbg_string, "error")
+            error, self._errors = self._errors[0], []
+            raise error
+
+
+class MovieStream:
+    """
+    Encodes a movie while its frames are produced: raw RGB frames are piped straight into an ``ffmpeg`` process, so no
+    intermediate PNGs are written. Frames may arrive in any order (i.e. from several workers); each is held in a reorder
+    buffer until all of the frames before it have been written or skipped. Only
+    ``CONFIG["Visualization"]["Movies"]["buffer"]`` frames are held in memory; later ones are spilled to disk until
+    their turn comes.
+
+    Workers in other processes send their frames through a ``MovieClient`` (see ``listen``).
+    """
+
+    def __init__(self, output_path: str, frames: list, framerate: int = None):
+        """
+        Initializes the ``MovieStream``. ``ffmpeg`` is started when the first frame is written.
+        Parameters
+        ----------
+        output_path: The movie file to write.
+        frames: The names of the frames, in the order of the movie.
+        framerate: The frame rate. Defaults to ``CONFIG["Visualization"]["Movies"]["framerate"]``.
+        """
+        self.cdbg_string = "%sMovieStream: " % _dbg_string
+
+        if not shutil.which(CONFIG["Visualization"]["Movies"]["ffmpeg"]):
+            make_error(OSError, self.cdbg_string, "Failed to find %s." % CONFIG["Visualization"]["Movies"]["ffmpeg"])
+
+        self.output_path = output_path
+        self.frames = list(frames)
+        self.framerate = (framerate if framerate else CONFIG["Visualization"]["Movies"]["framerate"])
+        self.shape = None
+
+        self._indices = {frame: index for index, frame in enumerate(self.frames)}
+        self._buffer = {}  # index -> pixels (the path of the spilled pixels, None for skipped frames)
+        self._next = 0
+        self._held = 0  # the number of frames in memory.
+        self._limit = int(CONFIG["Visualization"]["Movies"]["buffer"])
+        self._spill_directory = None
+        self._process = None
+        self._lock = threading.Lock()
+        self._listener, self._accepting, self._threads = None, None, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _start(self, shape):
+        self.shape = shape
+        command = [CONFIG["Visualization"]["Movies"]["ffmpeg"], "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "%sx%s" % (shape[1], shape[0]),
+                   "-framerate", str(self.framerate), "-i", "-",
+                   "-c:v", CONFIG["Visualization"]["Movies"]["codec"], "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                   "-pix_fmt", "yuv420p", self.output_path]
+
+        log_print("Streaming %s frames to %s." % (len(self.frames), self.output_path), self.cdbg_string, "debug")
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def _write(self, pixels):
+        if self._process is None:
+            self._start(pixels.shape)
+
+        if pixels.shape != self.shape:  # frames have to share a size; pad / crop to the first one.
+            frame = np.zeros(self.shape, dtype="uint8")
+            rows, columns = min(self.shape[0], pixels.shape[0]), min(self.shape[1], pixels.shape[1])
+            frame[:rows, :columns] = pixels[:rows, :columns]
+            pixels = frame
+
+        self._process.stdin.write(np.ascontiguousarray(pixels, dtype="uint8").tobytes())
+
+    def _flush(self):
+        while self._next in self._buffer:
+            pixels = self._buffer.pop(self._next)
+
+            if isinstance(pixels, str):
+                spilled, pixels = pixels, np.load(pixels)
+                os.remove(spilled)
+            elif pixels is not None:
+                self._held -= 1
+
+            if pixels is not None:
+                self._write(pixels)
+
+            self._next += 1
+
+    def _hold(self, index, pixels):
+        if self._limit > 0 and self._held >= self._limit:
+            if self._spill_directory is None:
+                self._spill_directory = tempfile.mkdtemp(prefix=".movie_frames_",
+                                                         dir=os.path.dirname(os.path.abspath(self.output_path)))
+
+            path = os.path.join(self._spill_directory, "%s.npy" % index)
+            np.save(path, pixels)
+            self._buffer[index] = path
+        else:
+            self._buffer[index] = pixels
+            self._held += 1
+
+    def add(self, frame: str, pixels: np.ndarray):
+        """
+        Adds a frame. It is written as soon as all of the frames before it have been. A frame which has already been
+        written or skipped (i.e. sent again by a retried task) is ignored.
+        Parameters
+        ----------
+        frame: The name of the frame.
+        pixels: The ``(ny, nx, 3)`` array of ``uint8``.
+
+        Returns: None
+        -------
+
+        """
+        if frame not in self._indices:
+            log_print("%s isn't a frame of %s; ignoring it." % (frame, self.output_path), self.cdbg_string, "warning")
+            return None
+
+        with self._lock:
+            index = self._indices[frame]
+
+            if index < self._next or index in self._buffer:
+                return None
+
+            if index == self._next:
+                self._write(pixels)
+                self._next += 1
+            else:
+                self._hold(index, pixels)
+
+            self._flush()
+
+    def skip(self, frame: str):
+        """
+        Leaves a frame (i.e. a failed one) out of the movie, unless it has already arrived.
+        """
+        if frame in self._indices:
+            with self._lock:
+                self._buffer.setdefault(self._indices[frame], None)
+                self._flush()
+
+    def listen(self):
+        """
+        Starts accepting frames from other processes.
+
+        Returns: A (picklable) ``MovieClient`` for the workers.
+        -------
+
+        """
+        if self._listener is None:
+            self._listener = Listener(authkey=current_process().authkey)
+            self._accepting = threading.Thread(target=self._accept, daemon=True)
+            self._accepting.start()
+
+        return MovieClient(self._listener.address)
+
+    def _accept(self):
+        while True:
+            connection = self._listener.accept()
+
+            if self._accepting is None:  # the wake up connection from ``close``.
+                connection.close()
+                break
+
+            thread = threading.Thread(target=self._receive, args=(connection,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _receive(self, connection):
+        with connection:
+            while True:
+                try:
+                    self.add(*connection.recv())
+                except (EOFError, OSError):  # the client is done (or died).
+                    break
+
+    def close(self):
+        """
+        Waits for the workers' connections to close, writes the remaining frames (skipping any which never arrived) and
+        finishes the movie.
+        """
+        if self._listener is not None:
+            # - Waking the accepting thread up with a last connection -#
+            accepting, self._accepting = self._accepting, None
+            Client(self._listener.address, authkey=current_process().authkey).close()
+            accepting.join()
+
+            self._listener.close()
+            self._listener = None
+
+            for thread in self._threads:  # each ends once its worker's connection is closed.
+                thread.join()
+
+        with self._lock:
+            missing = [self.frames[index] for index in range(self._next, len(self.frames)) if
+                       index not in self._buffer]
+
+            if len(missing):
+                log_print("%s frames never arrived and were skipped: %s." % (len(missing), missing),
+                          self.cdbg_string, "warning")
+
+            for index in range(self._next, len(self.frames)):
+                self._buffer.setdefault(index, None)
+            self._flush()
+
+        if self._process is not None:
+            self._process.stdin.close()
+
+            if self._process.wait():
+                make_error(OSError, self.cdbg_string, "ffmpeg failed to write %s." % self.output_path)
+
+            self._process = None
+            log_print("Wrote the movie %s." % self.output_path, self.cdbg_string, "info")
+
+        if self._spill_directory is not None:
+            shutil.rmtree(self._spill_directory, ignore_errors=True)
+            self._spill_directory = None
+
+
+class MovieClient:
+    """
+    Sends frames to a ``MovieStream`` in another process (see ``MovieStream.listen``). It can be pickled and passed to
+    the workers; it connects when the first frame is sent. A worker process keeps a single connection for all of its
+    tasks, which is closed when the worker exits.
+    """
+
+    def __init__(self, address):
+        self.address = address
+
+    def __getstate__(self):
+        return {"address": self.address}
+
+    def __setstate__(self, state):
+        self.__init__(state["address"])
+
+    def add(self, frame: str, pixels: np.ndarray):
+        """
+        Sends a frame to the stream.
+        """
+        key = (os.getpid(), self.address)
+
+        with _movie_lock:
+            if key not in _movie_connections:
+                _movie_connections[key] = Client(self.address, authkey=current_process().authkey)
+
+            _movie_connections[key].send((frame, pixels))
+
+    def close(self):
+        """
+        Ends a task. The connection of a worker process is kept for its next tasks; in the main process it is closed,
+        which the stream treats as the sender being done.
+        """
+        if parent_process() is not None:
+            return None
+
+        with _movie_lock:
+            connection = _movie_connections.pop((os.getpid(), self.address), None)
+
+            if connection is not None:
+                connection.close()
+
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------- Main ----------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
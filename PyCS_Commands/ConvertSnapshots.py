@@ -0,0 +1,73 @@
+"""
+
+        Command for converting each snapshot of a simulation into the snapshot cache.
+
+"""
+import os
+import pathlib as pt
+import sys
+
+# adding the system path to allow us to import the important modules
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+import argparse
+from PyCS_Core.Configuration import read_config, _configuration_path
+from PyCS_Core.Logging import set_log, make_error
+from colorama import Fore, Style
+from PyCS_Analysis.Analysis_Utils import convert_simulation
+from PyCS_System.SimulationMangement import SimulationLog
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Commands"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+simlog = SimulationLog.load_default()
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ MAIN -----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+if __name__ == '__main__':
+    # Argument Parsing
+    ########################################################################################################################
+    parser = argparse.ArgumentParser()  # setting up the command line argument parser
+    parser.add_argument("-sim", "--simulation_name", default=None, help="The simulation name to use")
+    parser.add_argument("-simdir", "--simulation_directory", default=None,
+                        help="The simulation directory. Only one needs to be specified")
+    parser.add_argument("-ow", "--overwrite", action="store_true", help="Convert outputs which are already cached.")
+    parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
+    parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
+    parser.add_argument("-np", "--nproc", type=int, default=1, help="The number of processors to use.")
+    parser.add_argument("-tmin", "--tmin", type=float, default=None, help="The minimum output time (Gyr) to include.")
+    parser.add_argument("-tmax", "--tmax", type=float, default=None, help="The maximum output time (Gyr) to include.")
+    parser.add_argument("-stride", "--stride", type=int, default=None, help="Only use every n-th output.")
+    args = parser.parse_args()
+
+    # Setup
+    ########################################################################################################################
+    set_log(_filename, output_type=args.output_type, level=args.logging_level)
+    cdbg_string = Fore.CYAN + Style.BRIGHT + _dbg_string + Style.RESET_ALL + " [" + Fore.GREEN + "Command Wizard" + Style.RESET_ALL + "]"
+    # ArgCHECK
+    ########################################################################################################################
+    if args.simulation_directory:  # we were given a simulation directory
+        simulation_directory = args.simulation_directory
+    elif args.simulation_name:  # we were given a simulation name instead.
+        matches = simlog.match("SimulationName", "SimulationLocation", args.simulation_name)
+        if not len(matches):
+            make_error(KeyError, _dbg_string, "Failed to find the simulation %s." % args.simulation_name)
+            exit()
+        simulation_directory = matches[0]
+    else:
+        raise OSError("%s: Failed to find either -sim or -simdir. At least one is necessary..." % cdbg_string)
+
+    if CONFIG["system"]["directories"]["cache_directory"] in [None, "None"]:
+        raise OSError("%s: There is no cache directory configured. Please update the installation." % cdbg_string)
+
+    # Running
+    ########################################################################################################################
+    convert_simulation(simulation_directory, nproc=args.nproc, tmin=args.tmin, tmax=args.tmax,
+                       stride=(args.stride if args.stride else 1), overwrite=args.overwrite)
@@ -51,6 +51,9 @@ if __name__ == '__main__':
     parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
     parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
     parser.add_argument("-np", "--nproc", type=int, default=1, help="The number of processors to use.")
+    parser.add_argument("-tmin", "--tmin", type=float, default=None, help="The minimum output time (Gyr) to include.")
+    parser.add_argument("-tmax", "--tmax", type=float, default=None, help="The maximum output time (Gyr) to include.")
+    parser.add_argument("-stride", "--stride", type=int, default=None, help="Only use every n-th output.")
     args = parser.parse_args()
 
     # Setup
@@ -77,4 +80,5 @@ if __name__ == '__main__':
         width = None
     # Running
     ########################################################################################################################
-    get_centers(simulation_name,resolution=int(args.resolution),width=width,footprint=int(args.footprint),ncores=int(args.cores),nproc=args.nproc)
\ No newline at end of file
+    get_centers(simulation_name,resolution=int(args.resolution),width=width,footprint=int(args.footprint),ncores=int(args.cores),nproc=args.nproc,
+                tmin=args.tmin,tmax=args.tmax,stride=(args.stride if args.stride else 1))
\ No newline at end of file
@@ -57,8 +57,13 @@ if __name__ == '__main__':
     parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
     parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
     parser.add_argument("-np", "--nproc", type=int, default=1, help="The number of processors to use.")
+    parser.add_argument("-nt", "--threads", type=int, default=None, help="The number of render threads (per process).")
     parser.add_argument("-orig","--origin",help="The location of the origin. Array floats in kpc.",nargs="+",default=None)
     parser.add_argument("-cam","--camera",help="The location of the camera (az,elev).",nargs="+",default=None)
+    parser.add_argument("-tmin", "--tmin", type=float, default=None, help="The minimum output time (Gyr) to include.")
+    parser.add_argument("-tmax", "--tmax", type=float, default=None, help="The maximum output time (Gyr) to include.")
+    parser.add_argument("-stride", "--stride", type=int, default=None, help="Only use every n-th output.")
+    parser.add_argument("-movie","--movie",action="store_true",help="Stream the frames into a movie instead of writing PNGs.")
     args = parser.parse_args()
 
     # Setup
@@ -138,7 +143,12 @@ if __name__ == '__main__':
         "units": args.units,
         "time_units": args.time_units,
         "colors": colors,
-        "view_kwargs":view_params
+        "view_kwargs":view_params,
+        "tmin": args.tmin,
+        "tmax": args.tmax,
+        "stride": args.stride,
+        "threads": args.threads,
+        "movie": args.movie
     }
     kwargs = {key: value for key, value in kwargs.items() if value != None}
     # Running
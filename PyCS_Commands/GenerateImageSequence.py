@@ -70,8 +70,19 @@ if __name__ == '__main__':
     parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
     parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
     parser.add_argument("-np", "--nproc", type=int, default=1, help="The number of processors to use.")
+    parser.add_argument("-nt", "--threads", type=int, default=None, help="The number of render threads (per process).")
     parser.add_argument("-orig","--origin",help="The location of the origin. Array floats in kpc.",nargs="+",default=None)
     parser.add_argument("-cam","--camera",help="The location of the camera (az,elev).",nargs="+",default=None)
+    parser.add_argument("-sweep","--sweep",help="Render a camera sweep. List of az,elev pairs (i.e. 0,0 45,0 90,0).",nargs="+",default=None)
+    parser.add_argument("-cube","--cube",action="store_true",help="Also write the image arrays to an HDF5 sequence cube.")
+    parser.add_argument("-fast","--fast",action="store_true",help="Write the frames with the fast (matplotlib free) writer.")
+    parser.add_argument("-movie","--movie",action="store_true",help="Stream the frames into a movie instead of writing PNGs.")
+    parser.add_argument("-redo","--redo",action="store_true",help="Render every output again, even if it's already finished.")
+    parser.add_argument("-gn","--global_norm",action="store_true",help="Use the same color limits for every frame.")
+    parser.add_argument("-gnp","--global_norm_percentiles",nargs=2,type=float,default=None,help="Percentiles (lower upper) for the shared color limits. Implies -gn.")
+    parser.add_argument("-tmin", "--tmin", type=float, default=None, help="The minimum output time (Gyr) to include.")
+    parser.add_argument("-tmax", "--tmax", type=float, default=None, help="The maximum output time (Gyr) to include.")
+    parser.add_argument("-stride", "--stride", type=int, default=None, help="Only use every n-th output.")
     args = parser.parse_args()
 
     # Setup
@@ -101,6 +112,15 @@ if __name__ == '__main__':
 
     view_params = {"center":origin,"angles":camera}
 
+    if args.sweep:
+        # Each of the sweep entries should be an az,elev pair.
+        sweep = [[float(val) for val in angle.split(",")] for angle in args.sweep]
+
+        if any(len(angle) != 2 for angle in sweep):
+            raise ValueError("Each of the args.sweep values should have the form az,elev.")
+    else:
+        sweep = None
+
     if args.vbounds != None:
         vmin, vmax = tuple([float(j) for j in args.vbounds])
     else:
@@ -129,6 +149,11 @@ if __name__ == '__main__':
     else:
         contour_kwargs = None # This won't even make it into the command.
 
+    if args.global_norm_percentiles:
+        global_norm = tuple(args.global_norm_percentiles)
+    else:
+        global_norm = args.global_norm
+
     cmap = cm.get_cmap(args.colormap)
 
     if not (args.simulation_name or args.simulation_directory):
@@ -162,7 +187,17 @@ if __name__ == '__main__':
         "units": args.units,
         "time_units": args.time_units,
         "view_kwargs":view_params,
-        "contour_kwargs":contour_kwargs
+        "angles":sweep,
+        "contour_kwargs":contour_kwargs,
+        "tmin": args.tmin,
+        "tmax": args.tmax,
+        "stride": args.stride,
+        "threads": args.threads,
+        "cube": args.cube,
+        "fast": args.fast,
+        "global_norm": global_norm,
+        "movie": args.movie,
+        "resume": (False if args.redo else None)
     }
     kwargs = {key: value for key, value in kwargs.items() if value != None}
     # Running
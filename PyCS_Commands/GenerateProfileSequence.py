@@ -78,6 +78,10 @@ if __name__ == '__main__':
     parser.add_argument("-LL","--L_label",help="The label for the Lambda function",default=None)
     parser.add_argument("-orig","--origin",help="The location of the origin. Array floats in kpc.",nargs="+",default=None)
     parser.add_argument("-cam","--camera",help="The location of the camera (az,elev).",nargs="+",default=None)
+    parser.add_argument("-tmin", "--tmin", type=float, default=None, help="The minimum output time (Gyr) to include.")
+    parser.add_argument("-tmax", "--tmax", type=float, default=None, help="The maximum output time (Gyr) to include.")
+    parser.add_argument("-stride", "--stride", type=int, default=None, help="Only use every n-th output.")
+    parser.add_argument("-redo", "--redo", action="store_true", help="Plot every output again, even if it's already finished.")
     #- Operations args -#
     parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
     parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
@@ -178,7 +182,11 @@ if __name__ == '__main__':
         "Lambda_label":args.L_label,
         "ylims": ylims,
         "view_kwargs":view_params,
-        "mode":("line" if args.line_profile else "shell")
+        "mode":("line" if args.line_profile else "shell"),
+        "tmin": args.tmin,
+        "tmax": args.tmax,
+        "stride": args.stride,
+        "resume": (False if args.redo else None)
     }
 
     kwargs = {key: value for key, value in removable_kwargs.items() if value != None}
@@ -60,6 +60,7 @@ if __name__ == '__main__':
     parser.add_argument("-i", "--integrate", help="Average through the slice", action="store_true")
     parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
     parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
+    parser.add_argument("-nt", "--threads", type=int, default=None, help="The number of render threads (per process).")
     parser.add_argument("-w", "--width", help="The width of the region.", default=None)
     parser.add_argument("-orig","--origin",help="The location of the origin. Array floats in kpc.",nargs="+",default=None)
     parser.add_argument("-cam","--camera",help="The location of the camera (az,elev).",nargs="+",default=None)
@@ -160,7 +161,8 @@ if __name__ == '__main__':
         "resolution": args.resolution,
         "units": args.units,
         "time_units": args.time_units,
-        "colors": colors
+        "colors": colors,
+        "threads": args.threads
     }
     kwargs = {key: value for key, value in kwargs.items() if value != None}
     # PLOTTING
@@ -13,7 +13,7 @@ sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
 import argparse
 from PyCS_Core.Configuration import read_config, _configuration_path
 from PyCS_Core.Logging import set_log, log_print
-from PyCS_Analysis.Images import make_plot
+from PyCS_Analysis.Images import make_plot, make_plot_sweep
 from PyCS_Analysis.Analysis_Utils import SnapView
 from PyCS_Core.PyCS_Errors import *
 import pathlib as pt
@@ -80,6 +80,9 @@ if __name__ == '__main__':
     #- Camera / View Options -#
     parser.add_argument("-orig","--origin",help="The location of the origin. Array floats in kpc.",nargs="+",default=None)
     parser.add_argument("-cam","--camera",help="The location of the camera (az,elev).",nargs="+",default=None)
+    parser.add_argument("-sweep","--sweep",help="Render a camera sweep. List of az,elev pairs (i.e. 0,0 45,0 90,0).",nargs="+",default=None)
+    parser.add_argument("-np", "--nproc", type=int, default=1, help="The number of processors to use for a sweep.")
+    parser.add_argument("-nt", "--threads", type=int, default=None, help="The number of render threads (per process).")
     parser.add_argument("-w", "--width", help="The width of the region.", default=None)
     args = parser.parse_args()
 
@@ -137,6 +140,15 @@ if __name__ == '__main__':
 
     view_params = {"center":origin,"angles":camera}
 
+    if args.sweep:
+        # Each of the sweep entries should be an az,elev pair.
+        sweep = [[float(val) for val in angle.split(",")] for angle in args.sweep]
+
+        if any(len(angle) != 2 for angle in sweep):
+            raise ValueError("Each of the args.sweep values should have the form az,elev.")
+    else:
+        sweep = None
+
 
     # Further argument management
     #------------------------------------------------------------------------------------------------------------------#
@@ -168,7 +180,7 @@ if __name__ == '__main__':
 
     # Making sure saving works
     ########################################################################################################################
-    if args.save:  # we need to save
+    if args.save or sweep:  # we need to save (sweeps are always saved)
         end_file = os.path.join(CONFIG["system"]["directories"]["figures_directory"], simulation_name,
                                 "%s-(I-%s)" % (args.qty, "True"), datetime.now().strftime('%m-%d-%Y_%H-%M-%S'),
                                 "Image_%s.png" % args.ns)
@@ -193,10 +205,15 @@ if __name__ == '__main__':
         "resolution": args.resolution,
         "units": args.units,
         "time_units": args.time_units,
-        "contour_kwargs": contour_kwargs
+        "contour_kwargs": contour_kwargs,
+        "threads": args.threads
     }
     kwargs = {key: value for key, value in kwargs.items() if value != None}
     # PLOTTING
     ########################################################################################################################
-    make_plot(simSnap, args.qty, save=args.save, end_file=end_file, log=args.logarithmic, av_z=args.integrate,
-              title=args.title, width=args.width, families=families, **kwargs)
+    if sweep:
+        make_plot_sweep(simSnap, args.qty, sweep, end_file, nproc=args.nproc, log=args.logarithmic, av_z=args.integrate,
+                        title=args.title, width=args.width, families=families, **kwargs)
+    else:
+        make_plot(simSnap, args.qty, save=args.save, end_file=end_file, log=args.logarithmic, av_z=args.integrate,
+                  title=args.title, width=args.width, families=families, **kwargs)
@@ -0,0 +1,103 @@
+"""
+
+        Command for redrawing an image sequence from the image cache with new plot settings.
+
+"""
+
+import os
+import pathlib as pt
+import sys
+
+# adding the system path to allow us to import the important modules
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[1]))
+import argparse
+from PyCS_Core.Configuration import read_config, _configuration_path
+from PyCS_Core.Logging import set_log, log_print
+import pathlib as pt
+from colorama import Fore, Style
+from matplotlib.pyplot import cm
+from PyCS_Core.PyCS_Errors import *
+from PyCS_Analysis.Images import restyle_image_sequence
+import warnings
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ Setup ----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_location = "PyCS_Commands"
+_filename = pt.Path(__file__).name.replace(".py", "")
+_dbg_string = "%s:%s:" % (_location, _filename)
+CONFIG = read_config(_configuration_path)
+# - managing warnings -#
+if not CONFIG["system"]["logging"]["warnings"]:
+    warnings.filterwarnings('ignore')
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ MAIN -----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+if __name__ == '__main__':
+    # Argument Parsing
+    ########################################################################################################################
+    parser = argparse.ArgumentParser()  # setting up the command line argument parser
+    parser.add_argument("directory", help="The directory of the image sequence to restyle.")
+    parser.add_argument("-od", "--output_directory", default=None, help="The directory to write the restyled frames to.")
+    parser.add_argument("-v", "--vbounds", nargs="+", help="The colorbounds if desired.", default=None)
+    parser.add_argument("-t", "--title", help="The title to add to the plot.")
+    parser.add_argument("-tu", "--time_units", help="The time units to use in the output.")
+    parser.add_argument("-log", "--logarithmic", action="store_true", help="Use a logarithmic plotting profile.")
+    parser.add_argument("-lin", "--linear", action="store_true", help="Use a linear plotting profile.")
+    parser.add_argument("-cmap", "--colormap", default=None, help="The colormap to use.")
+    parser.add_argument("-nc", "--no_contours", action="store_true", help="Drop the contours.")
+    parser.add_argument("-fast", "--fast", action="store_true", help="Write the frames with the fast (matplotlib free) writer.")
+    parser.add_argument("-c_lvls", "--contour_levels", nargs="+", default=None, help="The levels to set the contours at.")
+    parser.add_argument("-c_nlvl", "--contour_nlevels", type=int, default=None, help="The number of contour levels.")
+    parser.add_argument("-c_log", "--contour_log", action="store_true", help="Use logarithmically spaced levels?")
+    parser.add_argument("-c_color", "--contour_color", default=None, help="The color to use for the contours.")
+    parser.add_argument("-o", "--output_type", type=str, default="FILE", help="The type of output to use for logging.")
+    parser.add_argument("-l", "--logging_level", type=int, default=10, help="The level of logging to use.")
+    args = parser.parse_args()
+
+    # Setup
+    ########################################################################################################################
+    set_log(_filename, output_type=args.output_type, level=args.logging_level)
+    cdbg_string = Fore.CYAN + Style.BRIGHT + _dbg_string + Style.RESET_ALL + " [" + Fore.GREEN + "Command Wizard" + Style.RESET_ALL + "]"
+    # ArgCHECK
+    ########################################################################################################################
+    if not os.path.isdir(args.directory):
+        raise OSError("%s: The sequence directory %s doesn't exist." % (cdbg_string, args.directory))
+
+    if args.logarithmic and args.linear:
+        raise ValueError("%s: Only one of -log / -lin can be used." % cdbg_string)
+
+    if args.vbounds != None:
+        vmin, vmax = tuple([float(j) for j in args.vbounds])
+    else:
+        vmin, vmax = None, None
+
+    log = (True if args.logarithmic else (False if args.linear else None))
+
+    contour_kwargs = {
+        "contours": not args.no_contours,
+        "levels": ([float(level) for level in args.contour_levels] if args.contour_levels else None),
+        "nlevels": args.contour_nlevels,
+        "log": (True if args.contour_log else None),
+        "color": args.contour_color
+    }
+    contour_kwargs = {key: value for key, value in contour_kwargs.items() if value != None}
+
+    kwargs = {
+        "vmin": vmin,
+        "vmax": vmax,
+        "log": log,
+        "cmap": (cm.get_cmap(args.colormap) if args.colormap else None),
+        "title": args.title,
+        "time_units": args.time_units,
+        "fast": args.fast
+    }
+    kwargs = {key: value for key, value in kwargs.items() if value != None}
+
+    # Running
+    ########################################################################################################################
+    failed = restyle_image_sequence(args.directory, output_directory=args.output_directory,
+                                    contour_kwargs=contour_kwargs, **kwargs)
+
+    if len(failed):
+        log_print("%s frames were no longer cached: %s." % (len(failed), failed), _dbg_string, "warning")
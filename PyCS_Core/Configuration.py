@@ -18,6 +18,9 @@ with open(os.path.join(str(pt.Path(os.path.realpath(__file__)).parents[0]).repla
     ### Reading the CONFIG file from the installation ticket.
     _configuration_path = os.path.join(file.read(), "bin", "configs", "CONFIG.ini")
 
+# The packaged configuration files; their values are the defaults of settings missing from an older installation.
+_install_configs_path = os.path.join(str(pt.Path(os.path.realpath(__file__)).parents[0]), "installConfigs")
+
 # Setting up the debug strings #
 _location = "PyCS_Core"
 _filename = pt.Path(__file__).name.replace(".py", "")
@@ -27,14 +30,37 @@ _dbg_string = "%s:%s" % (_location, _filename)
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # -------------------------------------------------------FUNCTIONS ------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def fill_defaults(config_dict: dict, defaults: dict) -> dict:
+    """
+    Adds every setting of ``defaults`` which is missing from ``config_dict`` (recursively). Settings which are present
+    are never changed.
+    :param config_dict: The configuration dictionary (altered in place).
+    :param defaults: The default configuration dictionary.
+    :return: The configuration dictionary.
+    """
+    for key, value in defaults.items():
+        if key not in config_dict:
+            config_dict[key] = value
+        elif isinstance(value, dict) and isinstance(config_dict[key], dict):
+            fill_defaults(config_dict[key], value)
+
+    return config_dict
+
+
 def read_config(configuration_path: str) -> dict:
     """
-    Grabbing the configuration system from the configuration file path.
+    Grabbing the configuration system from the configuration file path. Settings which were added to the packaged
+    configuration file after the installation are filled in with their packaged defaults.
     :return: The configuration dictionary
     """
     ### reading the TOML string ###
     config_dict = tml.load(configuration_path)
 
+    ### Filling in settings missing from older installations ###
+    default_path = os.path.join(_install_configs_path, pt.Path(configuration_path).name)
+    if os.path.isfile(default_path) and os.path.abspath(default_path) != os.path.abspath(configuration_path):
+        fill_defaults(config_dict, tml.load(default_path))
+
     #
     #       Post Processing...
     #
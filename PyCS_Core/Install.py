@@ -117,6 +117,19 @@ install_files = {"files": {
         "files":None,
         "setting_name": "datasets_directory"
     },
+    "Cache": {
+        "files": {
+            "snapshots": {
+                "files": None,
+                "setting_name": None
+            },
+            "images": {
+                "files": None,
+                "setting_name": None
+            }
+        },
+        "setting_name": "cache_directory"
+    },
     "DUMPS": {
         "files": None,
         "setting_name": "unit_test_dump"
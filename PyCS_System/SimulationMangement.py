@@ -17,9 +17,11 @@ description=
 output_location=
 ...
 """
+from contextlib import contextmanager
 from datetime import datetime
 import os
 import pathlib as pt
+import re
 import sys
 
 # adding the system path to allow us to import the important modules
@@ -29,6 +31,11 @@ import toml
 import warnings
 from tqdm import tqdm
 
+try:
+    import fcntl
+except ImportError:  # non-POSIX systems; logs are written without a lock.
+    fcntl = None
+
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------ Setup ----------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -43,10 +50,152 @@ if not CONFIG["system"]["logging"]["warnings"]:
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # -------------------------------------------------- Fixed Variables ----------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_output_pattern = re.compile(r"^output_(\d+)$")  # matches RAMSES output directories.
+_index_filename = "snapshot_index.log"  # The name of the snapshot index inside of the simulation directory.
+_manifest_filename = "sequence_manifest.log"  # The name of the manifest inside of a sequence directory.
+_seconds_per_Gyr = 3.15576e16
+_cm_per_kpc = 3.0856775814913673e21
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # --------------------------------------------------- Functions ---------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def read_ramses_info(output_directory):
+    """
+    Reads the ``info_XXXXX.txt`` file of a RAMSES output without loading any of the simulation data.
+
+    Parameters
+    ----------
+    output_directory: The path to the ``output_XXXXX`` directory.
+
+    Returns: dict of the ``key = value`` entries in the file header. Numerical values are converted to float / int.
+    -------
+
+    """
+    output_number = pt.Path(output_directory).name.replace("output_", "")
+    info = {}
+
+    with open(os.path.join(output_directory, "info_%s.txt" % output_number), "r") as file:
+        for line in file:
+            if "ordering type" in line:
+                # The domain decomposition table follows this line; we have everything we need.
+                break
+            elif "=" not in line:
+                continue
+
+            key, value = [item.strip() for item in line.split("=", 1)]
+            try:
+                info[key] = (int(value) if value.lstrip("-").isdigit() else float(value))
+            except ValueError:
+                info[key] = value
+
+    return info
+
+
+def read_ramses_header(output_directory):
+    """
+    Reads the particle counts from the ``header_XXXXX.txt`` file of a RAMSES output. Both the legacy format
+    (``Total number of dark matter particles``) and the newer family table format are supported.
+
+    Parameters
+    ----------
+    output_directory: The path to the ``output_XXXXX`` directory.
+
+    Returns: dict of particle counts keyed by family name (``dm``, ``star``, ``sink``, ...).
+    -------
+
+    """
+    output_number = pt.Path(output_directory).name.replace("output_", "")
+    header_path = os.path.join(output_directory, "header_%s.txt" % output_number)
+    counts = {}
+
+    if not os.path.isfile(header_path):
+        return counts
+
+    with open(header_path, "r") as file:
+        lines = [line.strip() for line in file]
+
+    for id, line in enumerate(lines):
+        if line.startswith("Particle fields"):
+            break
+        elif line.startswith("Total number of") and id + 1 < len(lines) and lines[id + 1].isdigit():
+            # Legacy format: the count is on the following line.
+            family = line.replace("Total number of", "").replace("particles", "").strip()
+            counts[{"": "total", "dark matter": "dm"}.get(family, family)] = int(lines[id + 1])
+        elif len(line.split()) == 2 and line.split()[1].isdigit() and not line.startswith("#"):
+            # Family table format: <family> <count>
+            family, count = line.split()
+            counts[{"DM": "dm"}.get(family, family)] = int(count)
+
+    return counts
+
+
+def count_outputs(simulation_directory):
+    """
+    Counts the ``output_XXXXX`` directories of a simulation without reading (or writing) its ``SnapshotIndex``.
+
+    Parameters
+    ----------
+    simulation_directory: The simulation directory.
+
+    Returns: The number of outputs or ``"N.A."`` if the directory doesn't exist.
+    -------
+
+    """
+    try:
+        return len([directory for directory in os.listdir(simulation_directory) if _output_pattern.match(directory)])
+    except (FileNotFoundError, NotADirectoryError):
+        return "N.A."
+
+
+@contextmanager
+def locked(path):
+    """
+    Holds an exclusive lock on ``<path>.lock`` for the duration of the ``with`` block, so that several processes can
+    update the same log without losing each other's entries.
+
+    Parameters
+    ----------
+    path: The path of the log to lock. If ``None`` (or the lock can't be created), nothing is locked.
+
+    Returns: None
+    -------
+
+    """
+    try:
+        file = (open("%s.lock" % path, "a") if (path and fcntl) else None)
+    except OSError:
+        file = None
+
+    try:
+        if file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        yield
+    finally:
+        if file:
+            fcntl.flock(file, fcntl.LOCK_UN)
+            file.close()
+
+
+def dump_log(log: dict, path):
+    """
+    Writes ``log`` to ``path`` atomically: the log is written to a temporary file of this process and then moved into
+    place, so readers never see a half written log.
+
+    Parameters
+    ----------
+    log: The log dictionary.
+    path: The path to write to.
+
+    Returns: None
+    -------
+
+    """
+    temporary_path = "%s.%s.tmp" % (path, os.getpid())
+
+    with open(temporary_path, "w") as file:
+        toml.dump(log, file)
+    os.replace(temporary_path, path)
+
 
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ----------------------------------------------------- Classes ---------------------------------------------------------#
@@ -204,12 +353,7 @@ class SimulationLog(ItemLog):
                 # cycle through all of the data and pull things in #
                 if "SimulationLocation" in data:
                     # let's check for outputs #
-                    try:
-                        n_outputs = len([dir for dir in os.listdir(data["SimulationLocation"]) if "output" in dir])
-                    except FileNotFoundError:
-                        n_outputs = "N.A."
-
-                    self.log[entry]["n_ouputs"] = n_outputs
+                    self.log[entry]["n_ouputs"] = count_outputs(data["SimulationLocation"])
 
             self._write()
 
@@ -425,6 +569,340 @@ class ICLog(ItemLog):
         return SimulationLog(path=os.path.join(CONFIG["system"]["directories"]["bin_directory"],
                                                "IC_Logs",
                                                "IC_log.log"))
+
+
+class SnapshotIndex(ItemLog):
+    """
+    Header-only index of the outputs of a single simulation. Each entry is keyed by the output directory name and
+    records the physical time, box size, code units and particle counts parsed from the RAMSES ``info`` and ``header``
+    files, so that outputs can be listed and selected without ever calling ``pyn.load``.
+
+    The index is stored as ``snapshot_index.log`` inside of the simulation directory and is updated incrementally the
+    first time it is used: only outputs which are new (or whose info file has changed) are parsed. Updates are made
+    under a lock and the file is replaced atomically, so several processes can share the index of a simulation.
+
+    Notes
+    -----
+    Times are stored in Gyr and box sizes in kpc. Times assume a non-cosmological run (``time * unit_t``); the
+    expansion factor is recorded as ``aexp`` for completeness.
+    """
+    cdbg_string = "%sSnapshotIndex:" % _dbg_string
+
+    def __init__(self, simulation_directory, path=None):
+        """
+        Initializes the SnapshotIndex object. Nothing is parsed or written until the index is first used.
+
+        Parameters
+        ----------
+        simulation_directory: The simulation directory containing the ``output_XXXXX`` directories.
+        path: The path to the index file. Defaults to ``<simulation_directory>/snapshot_index.log``.
+        """
+        self.simulation_directory = simulation_directory
+        self._updated = False
+
+        if not path:
+            path = os.path.join(simulation_directory, _index_filename)
+
+        # Loading the existing index if there is one
+        ################################################################################################################
+        if os.path.isfile(path):
+            ItemLog.__init__(self, path=path)
+        else:
+            ItemLog.__init__(self, path=None)
+            self.path = (path if os.access(simulation_directory, os.W_OK) else None)
+
+    def __repr__(self):
+        return "<SnapshotIndex of %s (%s outputs)>" % (self.simulation_directory, len(self))
+
+    def __len__(self):
+        self._refresh()
+        return len(self.log)
+
+    def __getitem__(self, item):
+        self._refresh()
+        return self.log[item]
+
+    def __contains__(self, item):
+        self._refresh()
+        return item in self.log
+
+    def keys(self):
+        self._refresh()
+        return self.log.keys()
+
+    def _refresh(self):
+        """Updates the index the first time it is used."""
+        if not self._updated:
+            self.update()
+
+    @staticmethod
+    def load(simulation_directory):
+        """
+        Loads the index for ``simulation_directory``. The index is brought up to date the first time it is used.
+
+        Parameters
+        ----------
+        simulation_directory: The simulation directory to index.
+
+        Returns: The SnapshotIndex.
+        -------
+
+        """
+        return SnapshotIndex(simulation_directory)
+
+    def update(self):
+        """
+        Adds any new outputs to the index and removes any which no longer exist. Outputs which don't yet have an info
+        file (i.e. are still being written) are skipped until the next update.
+
+        Returns: None
+        -------
+
+        """
+        self._updated = True
+
+        # Finding outputs on disk
+        ################################################################################################################
+        try:
+            output_directories = [directory for directory in os.listdir(self.simulation_directory) if
+                                  _output_pattern.match(directory)]
+        except FileNotFoundError:
+            output_directories = []
+
+        with locked(self.path):
+            # - Another process may have updated the index since it was read -#
+            if self.path and os.path.isfile(self.path):
+                try:
+                    self.log = toml.load(self.path)
+                except (OSError, toml.TomlDecodeError):
+                    pass
+
+            changed = False
+
+            # - Removing outputs which have been deleted -#
+            for output in [key for key in self.log if key not in output_directories]:
+                del self.log[output]
+                changed = True
+
+            # Parsing new outputs
+            ############################################################################################################
+            for output in output_directories:
+                output_path = os.path.join(self.simulation_directory, output)
+                info_path = os.path.join(output_path, "info_%s.txt" % output.replace("output_", ""))
+
+                try:
+                    modified = os.path.getmtime(info_path)
+                except OSError:
+                    continue  # the output is incomplete.
+
+                if output in self.log and self.log[output]["modified"] == modified:
+                    continue
+
+                try:
+                    info = read_ramses_info(output_path)
+                    entry = {
+                        "output_number": int(output.replace("output_", "")),
+                        "modified"     : modified,
+                        "time"         : info["time"] * info["unit_t"] / _seconds_per_Gyr,
+                        "aexp"         : info.get("aexp", 1.0),
+                        "boxsize"      : info["boxlen"] * info["unit_l"] / _cm_per_kpc,
+                        "unit_l"       : info["unit_l"],
+                        "unit_d"       : info["unit_d"],
+                        "unit_t"       : info["unit_t"],
+                        "ncpu"         : info.get("ncpu", 0),
+                        "levelmin"     : info.get("levelmin", 0),
+                        "levelmax"     : info.get("levelmax", 0),
+                        "particles"    : read_ramses_header(output_path)
+                    }
+                except (OSError, KeyError, ValueError):
+                    continue
+
+                self.log[output] = entry
+                changed = True
+
+            if changed and self.path:
+                try:
+                    dump_log(self.log, self.path)
+                except OSError:
+                    pass  # The index simply stays in memory.
+
+    def outputs(self):
+        """
+        Returns: The indexed output directory names sorted by output number.
+        -------
+
+        """
+        return sorted(self.keys(), key=lambda output: self.log[output]["output_number"])
+
+    def select(self, tmin=None, tmax=None, stride=1):
+        """
+        Selects outputs by physical time and stride.
+
+        Parameters
+        ----------
+        tmin: The minimum time (Gyr). Defaults to no minimum.
+        tmax: The maximum time (Gyr). Defaults to no maximum.
+        stride: Only every ``stride``-th output (after the time cut) is returned.
+
+        Returns: list of output directory names sorted by output number.
+        -------
+
+        """
+        selected = [output for output in self.outputs() if
+                    (tmin is None or self.log[output]["time"] >= tmin) and
+                    (tmax is None or self.log[output]["time"] <= tmax)]
+
+        return selected[::(int(stride) if stride else 1)]
+
+
+class SequenceManifest(ItemLog):
+    """
+    Manifest of the finished frames of a sequence (images, profiles, ...). Each entry is keyed by the output directory
+    name and records the ``modified`` stamp of the output (see ``SnapshotIndex``) and the frame files written for it.
+    An output is pending if it isn't in the manifest, if it has been rewritten since, or if any of its frames are missing
+    from the sequence directory; re-running a sequence only renders the pending outputs.
+
+    The ``Sequence`` entry holds the settings of the sequence. The manifest is stored as ``sequence_manifest.log``
+    inside of the sequence directory. Every change is made under a lock on the latest copy on disk (see ``locked``)
+    and written atomically (see ``dump_log``), so concurrent runs keep each other's entries and an interrupted run can't
+    leave it half written.
+    """
+    cdbg_string = "%sSequenceManifest:" % _dbg_string
+
+    def __init__(self, sequence_directory, path=None):
+        """
+        Initializes the SequenceManifest object.
+
+        Parameters
+        ----------
+        sequence_directory: The directory of the sequence.
+        path: The path to the manifest. Defaults to ``<sequence_directory>/sequence_manifest.log``.
+        """
+        self.sequence_directory = sequence_directory
+
+        if not path:
+            path = os.path.join(sequence_directory, _manifest_filename)
+
+        if os.path.isfile(path):
+            ItemLog.__init__(self, path=path)
+        else:
+            ItemLog.__init__(self, path=None)
+            self.path = path
+
+    def __repr__(self):
+        return "<SequenceManifest of %s (%s outputs)>" % (self.sequence_directory, len(self.outputs()))
+
+    def _write(self):
+        if self.path:
+            dump_log(self.log, self.path)
+
+    def _update(self, change):
+        """
+        Applies ``change`` (a function of the log) to the latest copy of the manifest on disk and writes it back.
+        """
+        with locked(self.path):
+            # - Another process may have updated the manifest since it was read -#
+            if self.path and os.path.isfile(self.path):
+                try:
+                    self.log = toml.load(self.path)
+                except (OSError, toml.TomlDecodeError):
+                    pass
+
+            change(self.log)
+            self._write()
+
+    @property
+    def settings(self) -> dict:
+        """
+        The settings of the sequence (i.e. its parameters and color limits).
+        """
+        return self.log.get("Sequence", {})
+
+    def describe(self, **settings):
+        """
+        Adds ``settings`` to the ``Sequence`` entry. ``None`` values are removed.
+
+        Returns: None
+        -------
+
+        """
+        def change(log):
+            entry = dict(log.get("Sequence", {}), **settings)
+            log["Sequence"] = {key: value for key, value in entry.items() if value is not None}
+
+        self._update(change)
+
+    def outputs(self):
+        """
+        Returns: The completed output directory names sorted by output number.
+        -------
+
+        """
+        return sorted([key for key in self.keys() if _output_pattern.match(key)],
+                      key=lambda output: self.log[output]["output_number"])
+
+    def pending(self, index, outputs: list) -> list:
+        """
+        Selects the outputs which still have to be rendered.
+
+        Parameters
+        ----------
+        index: The ``SnapshotIndex`` of the simulation.
+        outputs: The outputs of the sequence.
+
+        Returns: list of the pending outputs (in the order of ``outputs``).
+        -------
+
+        """
+        return [output for output in outputs if
+                output not in self.log or
+                self.log[output]["modified"] != index[output]["modified"] or
+                not all(os.path.isfile(os.path.join(self.sequence_directory, frame)) for frame in
+                        self.log[output]["frames"])]
+
+    def complete(self, index, frames: dict):
+        """
+        Records finished outputs.
+
+        Parameters
+        ----------
+        index: The ``SnapshotIndex`` of the simulation.
+        frames: ``{output: [frame files]}``.
+
+        Returns: None
+        -------
+
+        """
+        entries = {output: {
+            "output_number": index[output]["output_number"],
+            "modified"     : index[output]["modified"],
+            "frames"       : [pt.Path(file).name for file in files],
+            "completed"    : datetime.now().strftime('%m-%d-%Y_%H-%M-%S')
+        } for output, files in frames.items()}
+
+        self._update(lambda log: log.update(entries))
+
+    def clear(self, files: list = None):
+        """
+        Forgets every completed output (the settings are kept).
+
+        Parameters
+        ----------
+        files: Files built from the completed outputs (i.e. the sequence cube), which are removed with them.
+
+        Returns: None
+        -------
+
+        """
+        def change(log):
+            for output in [key for key in log if _output_pattern.match(key)]:
+                del log[output]
+
+            for file in (files if files else []):
+                if os.path.isfile(file):
+                    os.remove(file)
+
+        self._update(change)
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------- Main ----------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
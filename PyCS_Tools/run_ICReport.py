@@ -27,8 +27,8 @@ from PyCS_System.text_utils import file_select, print_title
 from PyCS_Analysis.Images import make_plot
 from PyCS_Analysis.Profiles import make_profile_plot, make_profiles_plot
 from PyCS_Analysis.Analysis_Utils import split_binary_collision, find_gas_COM
-from PyCS_Analysis.builtin_functions import dehnen_profile, dehnen_mass_profile, get_collision_parameters, find_rx, \
-    rho_critical
+from PyCS_Analysis.builtin_functions import dehnen_profile, dehnen_mass_profile, get_collision_parameters, \
+    find_overdensity_radii
 from colorama import Fore, Style
 import warnings
 
@@ -333,9 +333,11 @@ if __name__ == '__main__':
         print("%sGenerating collision data..." % fdbg_string, end="")
 
         # - grabbing the necessary data -#
-        # getting the critical radii
-        r_ns = [[find_rx(snap, p=p) for snap in binary_snapshots] for p in
-                [2500 * rho_critical, 1000 * rho_critical, 500 * rho_critical, 200 * rho_critical]]
+        # getting the critical radii (and masses), all four from a single pass over each cluster
+        overdensity_radii = [find_overdensity_radii(snap, overdensities=[2500, 1000, 500, 200]) for snap in
+                             binary_snapshots]
+        r_ns = [[pyn.array.SimArray(radii[i], radii.units) for radii, _ in overdensity_radii] for i in range(4)]
+        m_ns = [[pyn.array.SimArray(masses[i], masses.units) for _, masses in overdensity_radii] for i in range(4)]
         rs = [r[0] + r[1] for r in r_ns]
 
         relative_location = [binary_coms[1][i] - binary_coms[0][i] for i in range(3)]
@@ -369,10 +371,13 @@ if __name__ == '__main__':
         # Adding to report
         ################################################################################################################
         # - adding r_n values -#
-        for r_n, type in zip(r_ns, [2500, 1000, 500, 200]):
-            for cluster_id, r in zip(["1", "2"], r_n):
+        for r_n, m_n, type in zip(r_ns, m_ns, [2500, 1000, 500, 200]):
+            for cluster_id, r, m in zip(["1", "2"], r_n, m_n):
                 report_data["Cluster %s" % cluster_id]["r_%s" % type] = "%s %s" % (
                 np.round(r.in_units("kpc"), decimals=2), "kpc")
+                report_data["Cluster %s" % cluster_id]["M_%s" % type] = "%s %s" % (
+                    np.format_float_scientific(float(m.in_units(CONFIG["units"]["default_mass_unit"])), precision=3),
+                    CONFIG["units"]["default_mass_unit"])
 
         for event, type in zip(r_events, r_labels):
             report_data["General"]["Collision Time (r_%s)" % type] = str(
@@ -37,6 +37,36 @@ if not CONFIG["system"]["logging"]["warnings"]:
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 _pycs_head = str(pt.Path(os.path.realpath(__file__)).parents[1])
 commands_dict = {
+    "Convert Snapshots": {
+        "path": os.path.join(_pycs_head, "PyCS_Commands", "ConvertSnapshots.py"),
+        "desc": "Convert each snapshot into the aligned, physical-unit snapshot cache.",
+        "options": {
+            "-sim": ("", "", "The simulation name to use. Only one of -sim / -simdir is needed."),
+            "-simdir": ("", "", "The simulation directory."),
+            "-ow": ("False", "False", "True to convert outputs which are already cached."),
+            "-o": ("", "", "The logging output."),
+            "-l": ("", "", "The debugging level."),
+            "-np": ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use."),
+            "-tmin": ("", "", "The minimum output time (Gyr) to include."),
+            "-tmax": ("", "", "The maximum output time (Gyr) to include."),
+            "-stride": ("", "", "Only use every n-th output.")
+        },
+    },
+    "Run Product Pipeline": {
+        "path": os.path.join(_pycs_head, "PyCS_Commands", "RunPipeline.py"),
+        "desc": "Load each snapshot once and make every product declared in a pipeline file.",
+        "options": {
+            "-sim": ("", "", "The simulation name to use. Only one of -sim / -simdir is needed."),
+            "-simdir": ("", "", "The simulation directory."),
+            "-p": ("", "", "The pipeline file (defaults to bin/configs/pipeline_config.ini)."),
+            "-o": ("", "", "The logging output."),
+            "-l": ("", "", "The debugging level."),
+            "-np": ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use."),
+            "-tmin": ("", "", "The minimum output time (Gyr) to include."),
+            "-tmax": ("", "", "The maximum output time (Gyr) to include."),
+            "-stride": ("", "", "Only use every n-th output.")
+        },
+    },
     "Generate Halo Centers":{
         "path": os.path.join(_pycs_head,"PyCS_Commands","FindHaloCenters.py"),
         "desc": "Find the centers of the DM halos in each snapshot.",
@@ -49,7 +79,10 @@ commands_dict = {
             "-nc":("2","2","Number of halos to find."),
             "-o": ("", "", "The logging output."),
             "-l": ("", "", "The debugging level."),
-            "-np": ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use.")
+            "-np": ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use."),
+            "-tmin": ("", "", "The minimum output time (Gyr) to include."),
+            "-tmax": ("", "", "The maximum output time (Gyr) to include."),
+            "-stride": ("", "", "Only use every n-th output.")
         },
     },
     "Generate Image Sequence": {
@@ -91,7 +124,40 @@ commands_dict = {
             "-l": ("", "", "The debugging level."),
             "-np": ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use."),
             "-cam":("","","The camera location (az,elev)"),
-            "-orig":("","","The origin location (x,y,z)")
+            "-nt": ("", "", "The number of render threads (per process)."),
+            "-sweep":("","","A camera sweep; list of az,elev pairs."),
+            "-cube": ("", "", "Write the image arrays to an HDF5 sequence cube?"),
+            "-fast": ("", "", "Use the fast (matplotlib free) frame writer?"),
+            "-movie": ("", "", "Stream the frames into a movie instead of writing PNGs?"),
+            "-redo": ("", "", "Render every output again, even if it's already finished?"),
+            "-gn": ("", "", "Use the same color limits for every frame?"),
+            "-gnp": ("", "", "Percentiles for the shared color limits (should be a string 'lower upper')."),
+            "-orig":("","","The origin location (x,y,z)"),
+            "-tmin": ("", "", "The minimum output time (Gyr) to include."),
+            "-tmax": ("", "", "The maximum output time (Gyr) to include."),
+            "-stride": ("", "", "Only use every n-th output.")
+        }
+    },
+    "Restyle Image Sequence": {
+        "path": os.path.join(_pycs_head, "PyCS_Commands", "RestyleImageSequence.py"),
+        "desc": "Redraw an image sequence from the image cache with new colors, bounds or titles.",
+        "options": {
+            "directory": ("", "", "The directory of the image sequence."),
+            "-od": ("", "", "The output directory (defaults to a restyled sub-directory)."),
+            "-v": ("", "", "The output range boundaries. (should be a string 'vmin vmax'"),
+            "-t": ("", "", "The title to put on the simulation"),
+            "-tu": ("", "", "The time units to use in the simulation"),
+            "-log": ("", "", "Use a logarithmic colormap?"),
+            "-lin": ("", "", "Use a linear colormap?"),
+            "-cmap": ("", "", "The colormap to use for the plotting."),
+            "-nc": ("", "", "Drop the contours?"),
+            "-fast": ("", "", "Use the fast (matplotlib free) frame writer?"),
+            "-c_lvls": ("", "", "Contour levels."),
+            "-c_nlvl": ("", "", "Number of levels. Overriden by c_lvls"),
+            "-c_log": ("", "", "Logarithmic contours?"),
+            "-c_color": ("", "", "Contour colors."),
+            "-o": ("", "", "The logging output."),
+            "-l": ("", "", "The debugging level.")
         }
     },
     "Generate Profile Sequence":{
@@ -128,7 +194,11 @@ commands_dict = {
             "-l"     : ("", "", "The debugging level."),
             "-np"    : ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use."),
             "-cam":("","","The camera location (az,elev)"),
-            "-orig":("","","The origin location (x,y,z)")
+            "-orig":("","","The origin location (x,y,z)"),
+            "-tmin": ("", "", "The minimum output time (Gyr) to include."),
+            "-tmax": ("", "", "The maximum output time (Gyr) to include."),
+            "-stride": ("", "", "Only use every n-th output."),
+            "-redo": ("", "", "Plot every output again, even if it's already finished?")
         }
     },
     "Generate DM-Baryon Image Sequence": {
@@ -157,7 +227,12 @@ commands_dict = {
             "-l": ("", "", "The debugging level."),
             "-np": ("$SLURM_NTASKS", "$SLURM_NTASKS", "The number of processors to use."),
             "-cam":("","","The camera location (az,elev)"),
-            "-orig":("","","The origin location (x,y,z)")
+            "-nt": ("", "", "The number of render threads (per process)."),
+            "-orig":("","","The origin location (x,y,z)"),
+            "-tmin": ("", "", "The minimum output time (Gyr) to include."),
+            "-tmax": ("", "", "The maximum output time (Gyr) to include."),
+            "-stride": ("", "", "Only use every n-th output."),
+            "-movie": ("", "", "Stream the frames into a movie instead of writing PNGs?")
         }
     },
     "Plot Single Snapshot": {
@@ -200,6 +275,9 @@ commands_dict = {
             "-o": ("", "", "The logging output."),
             "-l": ("", "", "The debugging level."),
             "-cam":("","","The camera location (az,elev)"),
+            "-nt": ("", "", "The number of render threads (per process)."),
+            "-sweep":("","","A camera sweep; list of az,elev pairs."),
+            "-np": ("", "", "The number of processors to use for a sweep."),
             "-orig":("","","The origin location (x,y,z)")
         }
     },
@@ -268,11 +346,42 @@ commands_dict = {
             "-o": ("", "", "The logging output."),
             "-l": ("", "", "The debugging level."),
             "-cam":("","","The camera location (az,elev)"),
+            "-nt": ("", "", "The number of render threads (per process)."),
             "-orig":("","","The origin location (x,y,z)")
         }
     }
 }
 commands_dict_data = {
+    "Convert Snapshots": {
+        "path": os.path.join(_pycs_head, "PyCS_Commands", "ConvertSnapshots.py"),
+        "desc": "Convert each snapshot into the aligned, physical-unit snapshot cache.",
+        "options": {
+            "-sim": "s",
+            "-simdir": "s",
+            "-ow": "b",
+            "-o": "s",
+            "-l": "s",
+            "-np": "i",
+            "-tmin": "s",
+            "-tmax": "s",
+            "-stride": "i"
+        },
+    },
+    "Run Product Pipeline": {
+        "path": os.path.join(_pycs_head, "PyCS_Commands", "RunPipeline.py"),
+        "desc": "Load each snapshot once and make every product declared in a pipeline file.",
+        "options": {
+            "-sim": "s",
+            "-simdir": "s",
+            "-p": "s",
+            "-o": "s",
+            "-l": "s",
+            "-np": "i",
+            "-tmin": "s",
+            "-tmax": "s",
+            "-stride": "i"
+        },
+    },
     "Generate Halo Centers": {
         "path": os.path.join(_pycs_head, "PyCS_Commands", "FindHaloCenters.py"),
         "desc": "Find the centers of the DM halos in each snapshot.",
@@ -285,7 +394,10 @@ commands_dict_data = {
             "-nc": "i",
             "-o": "s",
             "-l": "s",
-            "-np": "i"
+            "-np": "i",
+            "-tmin": "s",
+            "-tmax": "s",
+            "-stride": "i"
         },
     },
     "Generate Image Sequence": {
@@ -318,7 +430,40 @@ commands_dict_data = {
             "-l": "s",
             "-np": "i",
             "-cam":"l",
-            "-orig":"l"
+            "-nt": "i",
+            "-sweep":"l",
+            "-cube": "b",
+            "-fast": "b",
+            "-movie": "b",
+            "-redo": "b",
+            "-gn": "b",
+            "-gnp": "l",
+            "-orig":"l",
+            "-tmin": "s",
+            "-tmax": "s",
+            "-stride": "i"
+        }
+    },
+    "Restyle Image Sequence": {
+        "path": os.path.join(_pycs_head, "PyCS_Commands", "RestyleImageSequence.py"),
+        "desc": "Redraw an image sequence from the image cache with new colors, bounds or titles.",
+        "options": {
+            "directory": "s",
+            "-od": "s",
+            "-v": "l",
+            "-t": "s",
+            "-tu": "s",
+            "-log": "b",
+            "-lin": "b",
+            "-cmap": "s",
+            "-nc": "b",
+            "-fast": "b",
+            "-c_lvls": "l",
+            "-c_nlvl": "i",
+            "-c_log": "b",
+            "-c_color": "s",
+            "-o": "s",
+            "-l": "s"
         }
     },
     "Generate Profile Sequence": {
@@ -355,7 +500,11 @@ commands_dict_data = {
             "-l"     :"s",
             "-np"    :"i",
             "-cam"   :"l",
-            "-orig"  :"l"
+            "-orig"  :"l",
+            "-tmin": "s",
+            "-tmax": "s",
+            "-stride": "i",
+            "-redo": "b"
         }
     },
     "Generate DM-Baryon Image Sequence": {
@@ -376,7 +525,12 @@ commands_dict_data = {
             "-c": "l",
             "-np": "i",
             "-cam"   :"l",
-            "-orig"  :"l"
+            "-nt": "i",
+            "-orig"  :"l",
+            "-tmin": "s",
+            "-tmax": "s",
+            "-stride": "i",
+            "-movie": "b"
         }
     },
     "Plot Single Snapshot": {
@@ -410,6 +564,9 @@ commands_dict_data = {
             "-o": "s",
             "-l": "s",
             "-cam"   :"l",
+            "-nt": "i",
+            "-sweep" :"l",
+            "-np"    :"i",
             "-orig"  :"l"
         }
     },
@@ -470,6 +627,7 @@ commands_dict_data = {
             "-o": "s",
             "-l": "s",
             "-cam"   :"l",
+            "-nt": "i",
             "-orig"  :"l"
         }
     }
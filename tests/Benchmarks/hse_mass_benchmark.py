@@ -0,0 +1,107 @@
+"""
+    Benchmark of the hydrostatic mass lookup against the previous ``np.piecewise`` implementation.
+
+    Both lookups evaluate the same binned masses on an increasing number of radii, and the results are checked to be
+    identical. The batched timings pass precomputed ``(r_vals, masses)`` bins to ``hydrostatic_mass_profiles``, so they
+    only cover the lookup: the binning of each snapshot (the profile) costs the same in both and isn't timed. Usage:
+
+        python hse_mass_benchmark.py [-b bins] [-r repeats]
+
+"""
+import os
+import pathlib as pt
+import sys
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[2]))
+import argparse
+import time
+from PyCS_Core.Logging import set_log
+from PyCS_Analysis.builtin_functions import evaluate_binned, smooth_func, hydrostatic_mass_profiles
+import numpy as np
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ---------------------------------------------------- setup ------------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+def make_bins(n_bins: int, seed: int = 0):
+    """
+    Builds synthetic bin radii and (noisy) hydrostatic masses.
+    """
+    rng = np.random.default_rng(seed)
+    r_vals = np.linspace(5, 5000, n_bins)
+    masses = 1e14 * (r_vals / (r_vals + 500)) ** 2 * rng.normal(1, 0.05, n_bins)
+    return r_vals, masses
+
+
+def piecewise_lookup(r_vals, masses):
+    """
+    The previous lookup: one boolean mask per bin on every evaluation.
+    """
+    r_index = lambda r: np.piecewise(r,
+                                     [(r >= r_vals[i]) & (r < r_vals[i + 1]) for i, rs in enumerate(r_vals[:-1])] + [
+                                         (r >= r_vals[-1])],
+                                     [int(i) for i in
+                                      list(range(len(r_vals)))])
+    return smooth_func(lambda r: masses[r_index(r).astype("int32")])
+
+
+def timed(function, r, repeats: int) -> float:
+    """
+    Returns the best wall time of ``repeats`` evaluations.
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(r)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ MAIN -----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--bins", type=int, default=500, help="The number of radial bins.")
+    parser.add_argument("-r", "--repeats", type=int, default=5, help="The number of timed repeats.")
+    args = parser.parse_args()
+    set_log(pt.Path(__file__).name.replace(".py", ""), output_type="STDOUT", level=40)  # errors only.
+
+    r_vals, masses = make_bins(args.bins)
+    old = piecewise_lookup(r_vals, masses)
+    new = smooth_func(lambda r: evaluate_binned(r_vals, masses, r))
+
+    print("Bins: %s" % args.bins)
+    print("\n%-10s%-16s%-18s%-10s" % ("radii", "piecewise [s]", "searchsorted [s]", "speedup"))
+
+    for n_r in [100, 1000, 10000]:
+        r = np.linspace(0, 6000, n_r)
+
+        if not np.array_equal(old(r), new(r)):
+            raise AssertionError("The lookups disagree for %s radii." % n_r)
+
+        t_old, t_new = timed(old, r, args.repeats), timed(new, r, args.repeats)
+        print("%-10s%-16.5f%-18.5f%-10.1f" % (n_r, t_old, t_new, t_old / t_new))
+
+    # Batched lookup of many snapshots (the bins are precomputed, see above)
+    # ------------------------------------------------------------------------------------------------------------------#
+    print("\nLookup only (precomputed bins):")
+    print("%-12s%-16s%-16s%-10s" % ("snapshots", "piecewise [s]", "batched [s]", "speedup"))
+    r = np.linspace(0, 6000, 1000)
+
+    for n_snapshots in [10, 100]:
+        stacks = np.vstack([make_bins(args.bins, seed)[1] for seed in range(n_snapshots)])
+
+        start = time.perf_counter()
+        for row in stacks:
+            piecewise_lookup(r_vals, row)(r)
+        t_old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = hydrostatic_mass_profiles([(r_vals, row) for row in stacks], r)
+        t_new = time.perf_counter() - start
+
+        if not np.array_equal(batched, evaluate_binned(r_vals, stacks, r)):
+            raise AssertionError("The batched lookup disagrees for %s snapshots." % n_snapshots)
+
+        print("%-12s%-16.5f%-16.5f%-10.1f" % (n_snapshots, t_old, t_new, t_old / t_new))
@@ -0,0 +1,125 @@
+"""
+    Benchmark of the image renderers against the number of render threads and processes.
+
+    Renders a synthetic snapshot with both renderers for 1,2,4,... threads (with the peak memory of the pycs renders,
+    which share one set of images between the threads), then renders a batch of frames with every (processes x threads)
+    split of the available cores. Usage:
+
+        python render_threads_benchmark.py [-n particles] [-r resolution] [-f frames]
+
+"""
+import os
+import pathlib as pt
+import sys
+
+sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[2]))
+import argparse
+import time
+import tracemalloc
+from PyCS_Core.Logging import set_log
+from PyCS_Analysis.SPH_utils import deposit_images
+from utils import run_task_queue
+import pynbody as pyn
+import numpy as np
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ---------------------------------------------------- setup ------------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+_width = "2000 kpc"
+_targets = [("gas", "rho", "Msol kpc^-2", False), ("gas", "temp", "K", True)]
+
+
+def make_snapshot(n_particles: int, seed: int = 0):
+    """
+    Builds a synthetic gas snapshot with a centrally concentrated distribution of particles.
+    """
+    rng = np.random.default_rng(seed)
+    snapshot = pyn.new(gas=n_particles)
+    snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 300, (n_particles, 3)), "kpc")
+    snapshot["vel"] = pyn.array.SimArray(np.zeros((n_particles, 3)), "km s^-1")
+    snapshot["mass"] = pyn.array.SimArray(np.full(n_particles, 1e8), "Msol")
+    snapshot["temp"] = pyn.array.SimArray(rng.uniform(1e6, 1e7, n_particles), "K")
+    snapshot["smooth"], snapshot["rho"]  # building the tree outside of the timings.
+    return snapshot
+
+
+def render(snapshot, renderer: str, resolution: int, threads: int) -> float:
+    """
+    Renders the targets once and returns the wall time.
+    """
+    start = time.perf_counter()
+
+    if renderer == "pycs":
+        deposit_images(snapshot, _targets, _width, resolution, threads=threads)
+    else:
+        for family, qty, units, av_z in _targets:
+            pyn.plot.sph.image(snapshot.g, qty=qty, units=units, av_z=av_z, width=_width, resolution=resolution,
+                               noplot=True, threaded=threads)
+
+    return time.perf_counter() - start
+
+
+def peak_memory(snapshot, resolution: int, threads: int) -> float:
+    """
+    Renders the targets once with the pycs renderer and returns the peak memory allocated during the render in MB.
+    """
+    tracemalloc.start()
+    deposit_images(snapshot, _targets, _width, resolution, threads=threads)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def render_frames(arg) -> float:
+    """
+    Task for the process benchmark: renders a number of frames of a fresh snapshot.
+    """
+    n_particles, resolution, threads, frames, seed = arg
+    snapshot = make_snapshot(n_particles, seed)
+    return sum(render(snapshot, "pycs", resolution, threads) for _ in range(frames))
+
+
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+# ------------------------------------------------------ MAIN -----------------------------------------------------------#
+# --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--particles", type=int, default=200000, help="The number of particles.")
+    parser.add_argument("-r", "--resolution", type=int, default=500, help="The image resolution.")
+    parser.add_argument("-f", "--frames", type=int, default=8, help="The number of frames in the process benchmark.")
+    args = parser.parse_args()
+    set_log(pt.Path(__file__).name.replace(".py", ""), output_type="STDOUT", level=40)  # errors only.
+
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    thread_counts = [2 ** i for i in range(int(np.log2(cores)) + 1)]
+    print("Cores: %s, particles: %s, resolution: %s" % (cores, args.particles, args.resolution))
+
+    # Thread scaling of a single render
+    # ------------------------------------------------------------------------------------------------------------------#
+    snapshot = make_snapshot(args.particles)
+    print("\n%-10s%-10s%-12s%-10s%-10s" % ("renderer", "threads", "time [s]", "speedup", "peak [MB]"))
+
+    for renderer in ["pycs", "pynbody"]:
+        base = None
+        for threads in thread_counts:
+            elapsed = min(render(snapshot, renderer, args.resolution, threads) for _ in range(3))
+            base = (base if base else elapsed)
+            peak = ("%.1f" % peak_memory(snapshot, args.resolution, threads) if renderer == "pycs" else "-")
+            print("%-10s%-10s%-12.3f%-10.2f%-10s" % (renderer, threads, elapsed, base / elapsed, peak))
+
+    # Processes x threads
+    # ------------------------------------------------------------------------------------------------------------------#
+    print("\n%-12s%-10s%-14s%-10s" % ("processes", "threads", "wall [s]", "frames/s"))
+
+    for threads in thread_counts:
+        nproc = max(cores // threads, 1)
+        tasks = [(args.particles, args.resolution, threads, 1, seed) for seed in range(args.frames)]
+
+        start = time.perf_counter()
+        run_task_queue(render_frames, tasks, nproc)
+        elapsed = time.perf_counter() - start
+        print("%-12s%-10s%-14.3f%-10.2f" % (nproc, threads, elapsed, args.frames / elapsed))
@@ -9,18 +9,38 @@ import sys
 
 sys.path.append(str(pt.Path(os.path.realpath(__file__)).parents[2]))
 import unittest
-from PyCS_Core.Configuration import read_config, _configuration_path
+from unittest import mock
+import threading
+import multiprocessing
+import time
+from PyCS_Core.Configuration import read_config, _configuration_path, fill_defaults
 from PyCS_Core.Logging import set_log, log_print
-from PyCS_System.SimulationMangement import SimulationLog
+from PyCS_Core.PyCS_Errors import SnapshotError
+from PyCS_System.SimulationMangement import SimulationLog, SnapshotIndex, SequenceManifest, read_ramses_info, \
+    read_ramses_header
 from PyCS_System.SpecConfigs import read_clustep_config,read_batch_config,read_RAMSES_config
-from PyCS_Analysis.Images import make_plot
-from PyCS_Analysis.Analysis_Utils import align_snapshot
+from PyCS_Analysis.Images import make_plot, make_plot_sweep, generate_image_array, generate_point_samples
+from PyCS_Analysis.Analysis_Utils import align_snapshot, SnapView, SnapshotPrefetcher, derive_fields, mark_modified, \
+    derived_fields, evaluate_chunked, get_view_matrix, get_snapshot_state, \
+    get_available_memory, get_profile, boltzmann, m_p, mass_fraction
+from PyCS_Analysis.Caching import write_snapshot_cache, load_snapshot_cache, get_cache_directory
+from PyCS_Analysis.plot_utils import apply_colormap, MovieStream
+from PyCS_Analysis.SPH_utils import deposit_images, sample_points
+from PyCS_Analysis.Cubes import write_cube_part, assemble_image_cube
+from PyCS_Analysis.ProfileSeries import ProfileSeries, write_series_part, assemble_profile_series
+from utils import run_task_queue
+from PyCS_Analysis.builtin_functions import evaluate_binned, hydrostatic_mass_profiles, find_overdensity_radii, \
+    rho_critical
 from PyCS_Analysis.Images import __quantities as image_quantities
 from PyCS_Analysis.Profiles import __quantities as profile_quantities
 from PyCS_Analysis.Profiles import make_profile_plot
+import shutil
+import tempfile
 import warnings
+import numpy as np
 import pynbody as pyn
 import matplotlib.pyplot as plt
+from matplotlib.colors import Normalize, LogNorm
 from datetime import datetime
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ---------------------------------------------------- setup ------------------------------------------------------------#
@@ -40,6 +60,24 @@ if not os.path.exists(os.path.join(_utest_path,"testlogs",report_directory)):
     pt.Path(os.path.join(_utest_path,"testlogs",report_directory)).mkdir(parents=True)
 
 
+def _queue_task(task):
+    """
+    Task of ``TestSystem.test_task_queue``. ``task = (kind, value, directory)``: ``"ok"`` doubles the value, ``"flaky"``
+    fails on its first attempt, ``"error"`` always raises and ``"die"`` kills the worker.
+    """
+    kind, value, directory = task
+
+    if kind == "flaky" and not os.path.exists(os.path.join(directory, str(value))):
+        open(os.path.join(directory, str(value)), "w").close()
+        raise RuntimeError("The first attempt of %s." % value)
+    elif kind == "error":
+        raise ValueError("Task %s always fails." % value)
+    elif kind == "die":
+        os._exit(3)
+
+    return 2 * value
+
+
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------ Tests ----------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -53,6 +91,7 @@ class TestCore(unittest.TestCase):
 
     *  ``test_config``: Tests that the configuration file can be read.
     *  ``test_logging``: Check that the logging module can be set up.
+    *  ``test_config_defaults``: Check that settings missing from an installation are filled in.
     """
     cdbg_string = "%sTestCore:" % _dbg_string
 
@@ -97,6 +136,30 @@ class TestCore(unittest.TestCase):
             raise AssertionError("%sFailed to read configuration file at %s." % (fdbg_string, _configuration_path))
 
 
+    def test_config_defaults(self):
+        """
+        Settings missing from an (older) installation are filled in from the defaults; existing settings are kept.
+        Returns: None
+        -------
+
+        """
+        fdbg_string = "%stest_config_defaults: " % TestCore.cdbg_string
+        print("\n%sRunning..." % fdbg_string)
+
+        config = {"analysis": {"cache": {"use_snapshot_cache": False}}, "units": {"default_length_unit": "kpc"}}
+        defaults = {"analysis": {"cache": {"use_snapshot_cache": True, "snapshot_dtype": "float32"}, "hse": {"a": 1}},
+                    "units": {"default_length_unit": "Mpc"}}
+        fill_defaults(config, defaults)
+
+        assert config["analysis"]["cache"] == {"use_snapshot_cache": False, "snapshot_dtype": "float32"}, \
+            "%sFailed to fill a missing setting: %s" % (fdbg_string, config)
+        assert config["analysis"]["hse"] == {"a": 1}, "%sFailed to fill a missing section." % fdbg_string
+        assert config["units"]["default_length_unit"] == "kpc", "%sOverwrote an installed setting." % fdbg_string
+
+        # - The installed configuration has every packaged setting -#
+        assert "snapshot_dtype" in CONFIG["analysis"]["cache"], "%sThe packaged defaults weren't read." % fdbg_string
+
+
 class TestSystem(unittest.TestCase):
     """
     **TestSystem**: Tests the ``PyCS.System`` module for basic loading capacities.
@@ -109,6 +172,9 @@ class TestSystem(unittest.TestCase):
     * ``test_RAMSES_config``: Tests the loading of the ramses configuration file.
     * ``test_batch_config``: Same as above, for batch config.
     * ``test_CLUSTEP_config``: Same as above, for clustep config.
+    * ``test_snapshot_index``: Tests the RAMSES header parsers and the ``SnapshotIndex`` built from them.
+    * ``test_task_queue``: Checks that ``run_task_queue`` retries failed tasks and reports the ones which keep failing.
+    * ``test_sequence_manifest``: Checks that a ``SequenceManifest`` resumes a sequence and keeps concurrent updates.
     """
     cdbg_string = "%sTestSystem:" % _dbg_string
 
@@ -219,8 +285,198 @@ class TestSystem(unittest.TestCase):
         # --------------------------------------------------------------------------------------------------------------#
         log_print("Passed TestSystem.test_CLUSTEP_config...", fdbg_string, "debug")
     
+    def test_snapshot_index(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_snapshot_index: " % TestSystem.cdbg_string
+        log_print("Running TestSystem.test_snapshot_index...", fdbg_string, "debug")
+        print("\n%sRunning..." % fdbg_string)
+
+        # Writing two fake RAMSES outputs (legacy and family table headers)
+        # --------------------------------------------------------------------------------------------------------------#
+        with tempfile.TemporaryDirectory() as simulation_directory:
+            headers = {
+                1: "Total number of particles\n3000\nTotal number of dark matter particles\n2000\n"
+                   "Total number of star particles\n1000\nParticle fields\npos vel mass\n",
+                2: "#     Family     Count\n     DM     2000\n     star     1000\n     sink     0\n"
+                   "Particle fields\npos vel mass\n"
+            }
+            for number, header in headers.items():
+                output_directory = os.path.join(simulation_directory, "output_%05d" % number)
+                os.mkdir(output_directory)
+
+                with open(os.path.join(output_directory, "info_%05d.txt" % number), "w") as file:
+                    file.write("ncpu        =          4\nlevelmin    =          7\nlevelmax    =         12\n"
+                               "boxlen      =  0.100000000000000E+01\ntime        =  0.%s00000000000000E+00\n"
+                               "aexp        =  0.100000000000000E+01\nunit_l      =  0.308567758149137E+25\n"
+                               "unit_d      =  0.677025430198932E-22\nunit_t      =  0.470430312423675E+15\n\n"
+                               "ordering type=hilbert\n   DOMAIN   ind_min   ind_max\n" % number)
+                with open(os.path.join(output_directory, "header_%05d.txt" % number), "w") as file:
+                    file.write(header)
+
+            # Parsers
+            # ----------------------------------------------------------------------------------------------------------#
+            info = read_ramses_info(os.path.join(simulation_directory, "output_00001"))
+            assert info["ncpu"] == 4 and info["levelmax"] == 12, "%sFailed to parse integers: %s" % (fdbg_string, info)
+            assert abs(info["time"] - 0.1) < 1e-12, "%sFailed to parse the time: %s" % (fdbg_string, info["time"])
+            assert "DOMAIN" not in str(info), "%sParsed past the ordering table." % fdbg_string
+
+            for number in headers:
+                counts = read_ramses_header(os.path.join(simulation_directory, "output_%05d" % number))
+                assert counts["dm"] == 2000 and counts["star"] == 1000, "%sWrong counts for output %s: %s" % (
+                    fdbg_string, number, counts)
+
+            # The index
+            # ----------------------------------------------------------------------------------------------------------#
+            index_path = os.path.join(simulation_directory, "snapshot_index.log")
+            index = SnapshotIndex.load(simulation_directory)
+            assert not os.path.isfile(index_path), "%sThe index was written before it was used." % fdbg_string
+
+            assert index.outputs() == ["output_00001", "output_00002"], "%sWrong outputs %s." % (
+                fdbg_string, index.outputs())
+            assert os.path.isfile(index_path), "%sThe index wasn't written." % fdbg_string
+            assert abs(index["output_00002"]["boxsize"] - 1000) < 1e-6, "%sWrong box size %s." % (
+                fdbg_string, index["output_00002"]["boxsize"])
+            assert index.select(tmin=index["output_00002"]["time"]) == ["output_00002"], "%sWrong time selection." % fdbg_string
+
+            # - A second index reads the file back -#
+            assert SnapshotIndex.load(simulation_directory)["output_00001"] == index["output_00001"]
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestSystem.test_snapshot_index...", fdbg_string, "debug")
+
+    def test_task_queue(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_task_queue: " % TestSystem.cdbg_string
+        log_print("Running TestSystem.test_task_queue...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # Running the queue
+        # --------------------------------------------------------------------------------------------------------------#
+        with tempfile.TemporaryDirectory() as directory:
+            tasks = [("ok", 0, directory), ("flaky", 1, directory), ("error", 2, directory), ("ok", 3, directory),
+                     ("die", 4, directory), ("ok", 5, directory)]
+            completed, reported = {}, {}
+
+            results, failures = run_task_queue(_queue_task, tasks, 2, max_tasks_per_child=2, retries=1,
+                                               callback=completed.__setitem__, error_callback=reported.__setitem__)
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        assert results == [0, 2, None, 6, None, 10], "%sWrong results %s." % (fdbg_string, results)
+        assert completed == {0: 0, 1: 2, 3: 6, 5: 10}, "%sWrong callbacks %s." % (fdbg_string, completed)
+        assert sorted(failures) == [2, 4], "%sWrong failures %s." % (fdbg_string, failures)
+        assert failures == reported, "%sDidn't report every failure." % fdbg_string
+        assert "always fails" in failures[2], "%sLost the traceback." % fdbg_string
+        assert "exited with code 3" in failures[4], "%sDidn't report the dead worker." % fdbg_string
+
+        # - Every worker was joined -#
+        assert not [process for process in multiprocessing.active_children()], "%sLeft workers behind." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestSystem.test_task_queue...", fdbg_string, "debug")
+
+    def test_sequence_manifest(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_sequence_manifest: " % TestSystem.cdbg_string
+        log_print("Running TestSystem.test_sequence_manifest...", fdbg_string, "debug")
+        print("\n%sRunning..." % fdbg_string)
+
+        # Writing three fake RAMSES outputs
+        # --------------------------------------------------------------------------------------------------------------#
+        with tempfile.TemporaryDirectory() as simulation_directory, tempfile.TemporaryDirectory() as sequence_directory:
+            for number in [1, 2, 3]:
+                output_directory = os.path.join(simulation_directory, "output_%05d" % number)
+                os.mkdir(output_directory)
+
+                with open(os.path.join(output_directory, "info_%05d.txt" % number), "w") as file:
+                    file.write("ncpu        =          4\nboxlen      =  0.100000000000000E+01\n"
+                               "time        =  0.%s00000000000000E+00\nunit_l      =  0.308567758149137E+25\n"
+                               "unit_d      =  0.677025430198932E-22\nunit_t      =  0.470430312423675E+15\n" % number)
+                with open(os.path.join(output_directory, "header_%05d.txt" % number), "w") as file:
+                    file.write("Total number of particles\n0\n")
+
+            index = SnapshotIndex.load(simulation_directory)
+            outputs = index.outputs()
+            frames = {output: ["Image_%s.png" % output.replace("output_", "")] for output in outputs}
+
+            # Resuming
+            # ----------------------------------------------------------------------------------------------------------#
+            manifest = SequenceManifest(sequence_directory)
+            manifest.describe(qty="rho", vmin=1.0)
+            assert manifest.pending(index, outputs) == outputs, "%sA new sequence has finished outputs." % fdbg_string
+
+            for output in outputs[:2]:
+                pt.Path(os.path.join(sequence_directory, frames[output][0])).touch()
+            manifest.complete(index, {output: frames[output] for output in outputs[:2]})
+
+            resumed = SequenceManifest(sequence_directory)
+            assert resumed.pending(index, outputs) == outputs[2:], "%sWrong pending outputs %s." % (
+                fdbg_string, resumed.pending(index, outputs))
+            assert resumed.settings == {"qty": "rho", "vmin": 1.0}, "%sLost the settings %s." % (
+                fdbg_string, resumed.settings)
+
+            # - an output whose frame is gone is pending again -#
+            os.remove(os.path.join(sequence_directory, frames[outputs[0]][0]))
+            assert resumed.pending(index, outputs) == [outputs[0], outputs[2]], "%sMissed a deleted frame." % fdbg_string
+
+            # Concurrent updates
+            # ----------------------------------------------------------------------------------------------------------#
+            #  Both manifests were read before either update; neither may drop the other's entries.
+            #
+            resumed.complete(index, {outputs[2]: frames[outputs[2]]})
+            resumed.describe(vmax=2.0)
+            manifest.complete(index, {outputs[0]: frames[outputs[0]]})
+
+            assert SequenceManifest(sequence_directory).outputs() == outputs, "%sLost a concurrent update." % fdbg_string
+
+            # Clearing
+            # ----------------------------------------------------------------------------------------------------------#
+            cube_path = os.path.join(sequence_directory, "rho_cube.h5")
+            pt.Path(cube_path).touch()
+            manifest.clear(files=[cube_path])
+
+            cleared = SequenceManifest(sequence_directory)
+            assert not cleared.outputs() and not os.path.isfile(cube_path), "%sFailed to clear the sequence." % (
+                fdbg_string)
+            assert cleared.settings == {"qty": "rho", "vmin": 1.0, "vmax": 2.0}, "%sLost the settings %s." % (
+                fdbg_string, cleared.settings)
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestSystem.test_sequence_manifest...", fdbg_string, "debug")
+
+
 class TestAnalysis(unittest.TestCase):
-    """"""
+    """
+    **TestAnalysis**: Tests the ``PyCS_Analysis`` module.
+
+    -----------------------------
+
+    **Tests**:
+
+    * ``test_images``: Renders every image quantity from the test simulation.
+    * ``test_profiles``: Plots every profile quantity from the test simulation.
+    * ``test_snapshot_cache``: Writes a snapshot to the snapshot cache and reads it back.
+    * ``test_derived_fields``: Checks that derived fields are memoized until one of their inputs is modified.
+    * ``test_evaluate_chunked``: Compares the chunked derived fields with their formulas evaluated in one go.
+    * ``test_view``: Checks that positions read through a ``SnapView`` are in its view.
+    * ``test_plot_sweep``: Checks that the workers of a parallel camera sweep don't move the shared particles.
+    * ``test_prefetch_memory``: Checks that ``SnapshotPrefetcher`` doesn't read ahead without available memory.
+    * ``test_renderer``: Compares the ``pycs`` renderer with ``pynbody``.
+    * ``test_apply_colormap``: Compares the look up table colormapping with ``Colormap.__call__``.
+    * ``test_profile_cache``: Checks that cached profiles are only binned again once their binning is modified.
+    * ``test_point_samples``: Compares point samples with the image pixels centered on the same points.
+    * ``test_evaluate_binned``: Compares the binned hydrostatic mass lookup with ``np.piecewise``.
+    * ``test_movie_stream``: Checks that a ``MovieStream`` writes out of order frames in order, spilling to disk.
+    * ``test_profile_series``: Writes profiles to a ``ProfileSeries`` and reads them back in time order.
+    * ``test_sequence_rerun``: Checks that rerunning a sequence doesn't duplicate cube frames or series rows.
+    * ``test_overdensity_radii``: Finds the overdensity radii of a singular isothermal sphere.
+    """
     cdbg_string = "%sTestAnalysis: "%_dbg_string
     def setUp(self) -> None:
         """
@@ -289,6 +545,774 @@ class TestAnalysis(unittest.TestCase):
             make_profile_plot(snapshot,quantity,save=True,end_file=output_path)
 
 
+    def test_snapshot_cache(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_snapshot_cache: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_snapshot_cache...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        if get_cache_directory() is None:
+            self.skipTest("There is no cache directory configured.")
+
+        # Building a small snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(0)
+        snapshot = pyn.new(gas=200, dm=100)
+        snapshot.properties["time"], snapshot.properties["boxsize"] = pyn.units.Unit("1 Gyr"), pyn.units.Unit(
+            "5000 kpc")
+        snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 500, (300, 3)), "kpc")
+        snapshot["vel"] = pyn.array.SimArray(rng.normal(0, 100, (300, 3)), "km s^-1")
+        snapshot["mass"] = pyn.array.SimArray(rng.uniform(1, 2, 300), "Msol")
+        snapshot.gas["rho"] = pyn.array.SimArray(rng.uniform(1, 2, 200), "Msol kpc^-3")
+
+        with tempfile.TemporaryDirectory() as simulation_directory:
+            snapshot_path = os.path.join(simulation_directory, "output_00001")
+            os.mkdir(snapshot_path)
+            with open(os.path.join(snapshot_path, "info_00001.txt"), "w") as file:
+                file.write("time = 1.0\n")
+
+            cache_path = write_snapshot_cache(snapshot, snapshot_path,
+                                              fields={"gas": ["pos", "vel", "mass", "rho"], "dm": ["pos", "mass"]},
+                                              dtype="float64")
+
+            try:
+                # Round trip of a single family with declared fields
+                # ------------------------------------------------------------------------------------------------------#
+                cached = load_snapshot_cache(snapshot_path, families=["gas"], fields=["mass"])
+
+                assert [family.name for family in cached.families()] == ["gas"], "%sLoaded undeclared families." % (
+                    fdbg_string)
+                assert "rho" not in cached.keys(), "%sOpened an undeclared field up front." % fdbg_string
+                assert np.array_equal(cached["pos"], snapshot.gas["pos"]), "%sThe positions differ." % fdbg_string
+                assert np.array_equal(cached["rho"], snapshot.gas["rho"]), "%sThe lazy field differs." % fdbg_string
+                assert str(cached["rho"].units) == str(snapshot.gas["rho"].units), "%sLost the units." % fdbg_string
+
+                base = cached["pos"]
+                while base.base is not None and not isinstance(base, np.memmap):
+                    base = base.base
+                assert isinstance(base, np.memmap), "%sThe positions were copied out of the cache." % fdbg_string
+
+                # - Writing to the snapshot doesn't alter the cache -#
+                cached["pos"] -= 1
+                assert np.array_equal(load_snapshot_cache(snapshot_path, families=["gas"])["pos"],
+                                      snapshot.gas["pos"]), "%sWrote through to the cache." % fdbg_string
+
+                # Every family
+                # ------------------------------------------------------------------------------------------------------#
+                cached = load_snapshot_cache(snapshot_path)
+                assert np.array_equal(cached["mass"], snapshot["mass"]), "%sThe masses differ." % fdbg_string
+                assert np.array_equal(cached.dm["pos"], snapshot.dm["pos"]), "%sThe dm positions differ." % (
+                    fdbg_string)
+
+                # - Several families share one contiguous array, so they are copied out of the cache -#
+                base = cached["pos"]
+                while base.base is not None and not isinstance(base, np.memmap):
+                    base = base.base
+                assert not isinstance(base, np.memmap), "%sMapped the arrays of several families." % fdbg_string
+
+                # Rewriting the cache while it is open
+                # ------------------------------------------------------------------------------------------------------#
+                cached = load_snapshot_cache(snapshot_path, families=["dm"])
+                positions = np.array(cached["pos"])
+                snapshot["pos"] += 1
+                write_snapshot_cache(snapshot, snapshot_path, fields={"gas": ["pos"], "dm": ["pos", "mass"]},
+                                     dtype="float64")
+                snapshot["pos"] -= 1
+                assert np.array_equal(cached["pos"], positions), "%sRewrote an open array in place." % fdbg_string
+                assert not [file for file in os.listdir(os.path.join(cache_path, "dm")) if file.endswith(".tmp")], (
+                        "%sLeft temporary files in the cache." % fdbg_string)
+            finally:
+                shutil.rmtree(cache_path)
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_snapshot_cache...", fdbg_string, "debug")
+
+
+    def test_derived_fields(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_derived_fields: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_derived_fields...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # Building a small snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(4)
+        snapshot = pyn.new(gas=100, dm=50)
+        snapshot.gas["rho"] = pyn.array.SimArray(rng.uniform(1e4, 1e5, 100), "Msol kpc^-3")
+        snapshot.gas["temp"] = pyn.array.SimArray(rng.uniform(1e7, 1e8, 100), "K")
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        function = mock.Mock(wraps=derived_fields["entropy"]["function"])
+
+        with mock.patch.dict(derived_fields["entropy"], {"function": function}):
+            derive_fields(snapshot, ["entropy", "rho"])
+            assert function.call_count == 1, "%sDidn't compute the entropy." % fdbg_string
+            entropy = snapshot.gas["entropy"].copy()
+
+            # - Memoized, also for a request on a sub-snapshot -#
+            derive_fields(snapshot.gas, ["entropy"])
+            assert function.call_count == 1, "%sRecomputed an up to date field." % fdbg_string
+
+            # - Modifying an input -#
+            snapshot.gas["temp"] *= 2
+            mark_modified(snapshot, ["temp"])
+            derive_fields(snapshot, ["entropy"])
+            assert function.call_count == 2, "%sKept a stale field." % fdbg_string
+            assert np.allclose(snapshot.gas["entropy"], 2 * entropy), "%sThe recomputed field is wrong." % fdbg_string
+
+            # - Modifying an unrelated field -#
+            mark_modified(snapshot, ["vel"])
+            derive_fields(snapshot, ["entropy"])
+            assert function.call_count == 2, "%sRecomputed after an unrelated change." % fdbg_string
+
+            # - Deleting the field -#
+            del snapshot.gas["entropy"]
+            derive_fields(snapshot, ["entropy"])
+            assert function.call_count == 3, "%sDidn't recompute a deleted field." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_derived_fields...", fdbg_string, "debug")
+
+
+    def test_evaluate_chunked(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_evaluate_chunked: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_evaluate_chunked...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # Building a small snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(5)
+        snapshot = pyn.new(gas=1000)
+        snapshot.gas["rho"] = pyn.array.SimArray(rng.uniform(1e4, 1e5, 1000), "Msol kpc^-3")
+        snapshot.gas["temp"] = pyn.array.SimArray(rng.uniform(1e7, 1e8, 1000), "K")
+        snapshot.gas["p"] = pyn.array.SimArray(rng.uniform(1e-12, 1e-11, 1000), "Pa")
+        snapshot.gas["vel"] = pyn.array.SimArray(rng.normal(0, 1000, (1000, 3)), "km s^-1")
+
+        # - The formulas evaluated in one go -#
+        gas = snapshot.gas
+        n_e = gas["rho"].in_units("g cm^-3") / (1.252 * 1.67262192369e-24)
+        expected = {
+            "entropy"    : float(boltzmann.in_units("keV K^-1")) * gas["temp"].in_units("K") * n_e ** (-2 / 3),
+            "mach"       : np.sqrt(np.sum(gas["vel"].in_units("m s^-1") ** 2, axis=1) * gas["rho"].in_units(
+                "kg m^-3") / ((5 / 3) * gas["p"].in_units("Pa"))),
+            "sound_speed": np.sqrt((5 / 3) * gas["p"].in_units("Pa") / gas["rho"].in_units("kg m^-3")) / 1e3,
+            "xray"       : 3.0e-27 * np.sqrt(gas["temp"].in_units("K")) * (
+                    gas["rho"].in_units("kg cm^-3") / float(m_p.in_units("kg") * mass_fraction)) ** 2
+        }
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        # - 1000 cells in chunks of 64, so the last chunk is a partial one -#
+        with mock.patch("PyCS_Analysis.Analysis_Utils.evaluate_chunked",
+                        lambda *args: evaluate_chunked(*args, chunk_size=64, dtype="float64")):
+            derive_fields(snapshot, list(expected))
+
+        for qty, values in expected.items():
+            assert str(gas[qty].units) == str(pyn.units.Unit(derived_fields[qty]["unit"] or "1")), (
+                    "%sWrong units of %s." % (fdbg_string, qty))
+            assert np.allclose(gas[qty], values, rtol=1e-6), "%sThe chunked %s differs." % (fdbg_string, qty)
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_evaluate_chunked...", fdbg_string, "debug")
+
+
+    def test_view(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_view: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_view...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # Two copies of the same snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(1)
+        snapshot, reference = pyn.new(gas=100, dm=50), pyn.new(gas=100, dm=50)
+        snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 500, (150, 3)), "kpc")
+        snapshot["vel"] = pyn.array.SimArray(rng.normal(0, 100, (150, 3)), "km s^-1")
+        reference["pos"], reference["vel"] = snapshot["pos"].copy(), snapshot["vel"].copy()
+        original, original_dm = snapshot["pos"].copy(), snapshot.dm["pos"].copy()
+        snapshot["r"]  # a derived array which has to be recomputed once the view is applied.
+
+        # - The view through the SnapView -#
+        view = SnapView(families=["gas"])
+        view.snapshot = snapshot
+        view["center"] = pyn.array.SimArray([100, 200, 0], "kpc")
+        view["angles"] = [30, 60]
+
+        # - The same view applied directly with pynbody -#
+        reference["pos"] -= pyn.array.SimArray([100, 200, 0], "kpc")
+        reference.rotate_z(-30)
+        reference.rotate_x(-60)
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        viewed = view.snapshot
+        assert np.allclose(viewed.gas["pos"], reference.gas["pos"]), "%sThe positions aren't in the view." % fdbg_string
+        assert np.allclose(viewed.gas["vel"], reference.gas["vel"]), "%sThe velocities aren't in the view." % (
+            fdbg_string)
+        assert np.allclose(viewed.gas["r"], np.linalg.norm(reference.gas["pos"], axis=1)), "%sStale radii." % (
+            fdbg_string)
+        assert np.allclose(viewed.dm["pos"], original_dm), "%sMoved an undeclared family." % fdbg_string
+
+        # - Reading again doesn't move anything -#
+        assert np.allclose(view.snapshot.gas["pos"], reference.gas["pos"]), "%sMoved the view twice." % fdbg_string
+
+        # Velocities which are loaded after the view was applied
+        # --------------------------------------------------------------------------------------------------------------#
+        unloaded = pyn.new(gas=100, dm=50)
+        unloaded["pos"] = original.copy()
+        del unloaded["vel"]
+
+        def load_array(array_name, fam=None):
+            if array_name != "vel":
+                raise OSError("%s can't be loaded." % array_name)
+            unloaded["vel"] = pyn.array.SimArray(reference["vel"].copy(), "km s^-1")
+
+            # - Undoing the view of the reference so that the "loaded" velocities are in the original frame -#
+            unloaded["vel"] = np.matmul(unloaded["vel"], get_view_matrix([30, 60]))
+
+        unloaded._load_array = load_array
+        view = SnapView(families=["gas"])
+        view.snapshot = unloaded
+        view["center"] = pyn.array.SimArray([100, 200, 0], "kpc")
+        view["angles"] = [30, 60]
+        assert np.allclose(view.snapshot.gas["pos"], reference.gas["pos"]), "%sThe positions aren't in the view." % (
+            fdbg_string)
+
+        assert "vel" not in unloaded.keys(), "%sLoaded the velocities to move them." % fdbg_string
+        assert np.allclose(unloaded.gas["vel"], reference.gas["vel"]), "%sThe loaded velocities aren't in the view." % (
+            fdbg_string)
+        assert np.allclose(unloaded.dm["vel"], np.matmul(reference.dm["vel"], get_view_matrix([30, 60]))), (
+                "%sRotated the velocities of an undeclared family." % fdbg_string)
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_view...", fdbg_string, "debug")
+
+
+    def test_plot_sweep(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_plot_sweep: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_plot_sweep...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # A small snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(2)
+        snapshot = pyn.new(gas=500)
+        snapshot.properties["time"] = pyn.units.Unit("1 Gyr")
+        snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 100, (500, 3)), "kpc")
+        snapshot["mass"] = pyn.array.SimArray(np.full(500, 1e8), "Msol")
+        snapshot["smooth"] = pyn.array.SimArray(rng.uniform(20, 60, 500), "kpc")
+        snapshot["rho"] = pyn.array.SimArray(rng.uniform(1e3, 2e3, 500), "Msol kpc^-3")
+
+        view = SnapView()
+        view.snapshot = snapshot
+        view["center"] = pyn.array.SimArray([10, 0, 0], "kpc")
+        view["angles"] = [10, 20]
+        positions = np.array(view.snapshot["pos"])
+        generations = dict(get_snapshot_state(snapshot)["generations"])
+
+        # Sweeping with 2 workers
+        # --------------------------------------------------------------------------------------------------------------#
+        #  The forked workers can't write to the parent's particles, so each render checks the particles it inherited.
+        #
+        image = pyn.plot.sph.image
+
+        def checked_image(*args, **kwargs):
+            assert np.array_equal(snapshot["pos"], positions), "%sA worker moved the shared particles." % fdbg_string
+            assert get_snapshot_state(snapshot)["generations"] == generations, "%sA worker modified a field." % (
+                fdbg_string)
+            return image(*args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(sys.modules["PyCS_Analysis.Images"].CONFIG["Visualization"]["Images"],
+                                {"renderer": "pynbody"}), \
+                mock.patch("pynbody.plot.sph.image", checked_image):
+            files = make_plot_sweep(snapshot, "rho", [[0, 0], [45, 0], [90, 30], [180, 60]],
+                                    os.path.join(directory, "sweep.png"), nproc=2, families=["gas"], width="600 kpc",
+                                    resolution=32)
+
+            assert all(os.path.isfile(file) for file in files), "%sDidn't write every angle." % fdbg_string
+
+        assert np.array_equal(snapshot["pos"], positions), "%sMoved the particles of the parent." % fdbg_string
+        assert get_snapshot_state(snapshot)["generations"] == generations, "%sModified a field of the parent." % (
+            fdbg_string)
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_plot_sweep...", fdbg_string, "debug")
+
+
+    def test_prefetch_memory(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_prefetch_memory: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_prefetch_memory...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # Counting the snapshots in memory
+        # --------------------------------------------------------------------------------------------------------------#
+        def run(available):
+            """Iterates over 4 fake snapshots of 100 bytes and returns the most which were ever held at once."""
+            lock, held = threading.Lock(), {"now": 0, "max": 0}
+
+            def load(prefetcher, path):
+                with lock:
+                    held["now"] += 1
+                    held["max"] = max(held["max"], held["now"])
+                prefetcher._last_size = 100
+                return path
+
+            with mock.patch.object(SnapshotPrefetcher, "_load", load), \
+                    mock.patch("PyCS_Analysis.Analysis_Utils.get_available_memory", return_value=available):
+                for path, snapshot in SnapshotPrefetcher(["a", "b", "c", "d"], depth=1):
+                    time.sleep(0.2)  # the "processing" of the snapshot.
+                    with lock:
+                        held["now"] -= 1
+
+            return held["max"]
+
+        assert run(available=10 ** 6) == 2, "%sDidn't read ahead with plenty of memory." % fdbg_string
+        assert run(available=10) == 1, "%sRead ahead without the memory for it." % fdbg_string
+
+        # The available memory counts the reclaimable page cache
+        # --------------------------------------------------------------------------------------------------------------#
+        meminfo = "MemTotal:       16000000 kB\nMemFree:           10000 kB\nMemAvailable:    8000000 kB\n"
+        sysconf = {"SC_AVPHYS_PAGES": 2500, "SC_PAGE_SIZE": 4096}.__getitem__  # i.e. MemFree.
+
+        with mock.patch("builtins.open", mock.mock_open(read_data=meminfo)), mock.patch("os.sysconf", sysconf):
+            assert get_available_memory() == 8000000 * 1024, "%sUsed the free memory." % fdbg_string
+
+        with mock.patch("builtins.open", mock.mock_open(read_data=meminfo.replace("MemAvailable", "Other"))), \
+                mock.patch("os.sysconf", sysconf):
+            assert get_available_memory() == 2500 * 4096, "%sDidn't fall back to sysconf." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_prefetch_memory...", fdbg_string, "debug")
+
+    def test_renderer(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_renderer: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_renderer...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # A small snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(1)
+        snapshot = pyn.new(gas=2000)
+        snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 100, (2000, 3)), "kpc")
+        snapshot["mass"] = pyn.array.SimArray(np.full(2000, 1e8), "Msol")
+        snapshot["smooth"] = pyn.array.SimArray(rng.uniform(20, 60, 2000), "kpc")
+        snapshot["rho"] = pyn.array.SimArray(rng.uniform(1e3, 2e3, 2000), "Msol kpc^-3")
+        snapshot["temp"] = pyn.array.SimArray(rng.uniform(1e6, 1e7, 2000), "K")
+
+        # Comparing the pycs renderer to pyn.plot.sph.image
+        # --------------------------------------------------------------------------------------------------------------#
+        #  The pycs averages are density weighted (the av_z=True of pynbody 1), which is av_z="rho" in every version.
+        #
+        for target in [("gas", "rho", "Msol kpc^-2", False),  # projected
+                       ("gas", "rho", "Msol kpc^-3", False),  # slice
+                       ("gas", "temp", "K", False),  # slice
+                       ("gas", "temp", "K", True)]:  # av_z
+            image = np.asarray(deposit_images(snapshot, [target], "600 kpc", 64)[target])
+            reference = np.asarray(pyn.plot.sph.image(snapshot.gas, qty=target[1], units=target[2],
+                                                      av_z=("rho" if target[3] else False), width="600 kpc",
+                                                      resolution=64, noplot=True, threaded=False))
+
+            assert image.shape == reference.shape, "%s%s has the wrong shape." % (fdbg_string, str(target))
+            assert np.all(np.abs(image - reference) <= 0.05 * np.amax(reference)), "%s%s disagrees with pynbody." % (
+                fdbg_string, str(target))
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_renderer...", fdbg_string, "debug")
+
+    def test_apply_colormap(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_apply_colormap: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_apply_colormap...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # An image with values outside of the limits and bad pixels
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(3)
+        array = 10 ** rng.uniform(-1, 4, (128, 128))
+        array[0, :10], array[1, :10], array[2, :10] = 0, -1, np.nan
+
+        # Comparing with matplotlib
+        # --------------------------------------------------------------------------------------------------------------#
+        for cmap, log, norm in [("viridis", False, Normalize(1, 1e3)), ("inferno", True, LogNorm(1, 1e3))]:
+            pixels = apply_colormap(array, cmap, 1, 1e3, log=log)
+            reference = plt.get_cmap(cmap)(norm(array), bytes=True)
+
+            assert pixels.shape == reference.shape and pixels.dtype == reference.dtype, "%sWrong pixel array." % (
+                fdbg_string)
+
+            # - Values which fall exactly on the edge of a color may round to either side of it -#
+            mismatched = np.any(pixels != reference, axis=-1)
+            assert np.mean(mismatched) < 1e-3, "%s%s pixels differ for %s." % (fdbg_string, np.sum(mismatched), cmap)
+            assert np.array_equal(pixels[:3, :10], reference[:3, :10]), "%sThe bad or clipped pixels differ for %s." % (
+                fdbg_string, cmap)
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_apply_colormap...", fdbg_string, "debug")
+
+    def test_profile_cache(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_profile_cache: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_profile_cache...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # A small snapshot
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(6)
+        snapshot = pyn.new(gas=1000)
+        snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 100, (1000, 3)), "kpc")
+        snapshot["mass"] = pyn.array.SimArray(rng.uniform(1, 2, 1000), "Msol")
+        snapshot.gas["rho"] = pyn.array.SimArray(rng.uniform(1e4, 1e5, 1000), "Msol kpc^-3")
+        snapshot.gas["temp"] = pyn.array.SimArray(rng.uniform(1e7, 1e8, 1000), "K")
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        profile = get_profile(snapshot, "gas", ndim=3, nbins=10)
+        temperature = np.array(profile["temp"])
+
+        # - Deriving a new field doesn't throw the binning away -#
+        derive_fields(snapshot, ["entropy"])
+        assert get_profile(snapshot, "gas", ndim=3, nbins=10) is profile, "%sBinned again for a new field." % (
+            fdbg_string)
+        entropy = np.array(profile["entropy"])
+
+        # - Modifying a field only drops the quantities binned from it -#
+        snapshot.gas["temp"] *= 2
+        mark_modified(snapshot, ["temp"])
+        derive_fields(snapshot, ["entropy"])
+        assert get_profile(snapshot, "gas", ndim=3, nbins=10) is profile, "%sBinned again for a quantity." % (
+            fdbg_string)
+        assert np.allclose(profile["temp"], 2 * temperature), "%sKept a stale quantity." % fdbg_string
+        assert np.allclose(profile["entropy"], 2 * entropy), "%sKept a stale derived quantity." % fdbg_string
+
+        # - Other kwargs and modified masses are binned again -#
+        assert get_profile(snapshot, "gas", ndim=3, nbins=20) is not profile, "%sIgnored the kwargs." % fdbg_string
+
+        snapshot["mass"] *= 2
+        mark_modified(snapshot, ["mass"])
+        assert get_profile(snapshot, "gas", ndim=3, nbins=10) is not profile, "%sKept a stale binning." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_profile_cache...", fdbg_string, "debug")
+
+    def test_point_samples(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_point_samples: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_point_samples...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # A small snapshot and the pixel centers of a 64x64 image
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(3)
+        snapshot = pyn.new(gas=2000)
+        snapshot["pos"] = pyn.array.SimArray(rng.normal(0, 100, (2000, 3)), "kpc")
+        snapshot["mass"] = pyn.array.SimArray(np.full(2000, 1e8), "Msol")
+        snapshot["smooth"] = pyn.array.SimArray(rng.uniform(20, 60, 2000), "kpc")
+        snapshot["rho"] = pyn.array.SimArray(rng.uniform(1e3, 2e3, 2000), "Msol kpc^-3")
+        snapshot["temp"] = pyn.array.SimArray(rng.uniform(1e6, 1e7, 2000), "K")
+
+        centers = -300 + (np.arange(64) + 0.5) * (600 / 64)
+        x, y = np.meshgrid(centers, centers)
+        points = pyn.array.SimArray(np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1), "kpc")
+
+        # Comparing the samples to the pixels
+        # --------------------------------------------------------------------------------------------------------------#
+        for target in [("gas", "rho", "Msol kpc^-2", False),  # projected
+                       ("gas", "rho", "Msol kpc^-3", False),  # slice
+                       ("gas", "temp", "K", False),  # slice
+                       ("gas", "temp", "K", True)]:  # av_z
+            image = np.asarray(deposit_images(snapshot, [target], "600 kpc", 64)[target])
+            samples = np.asarray(sample_points(snapshot, [target], points)[target]).reshape(image.shape)
+
+            assert np.all(np.abs(samples - image) <= 0.01 * np.amax(image)), "%s%s disagrees with the image." % (
+                fdbg_string, str(target))
+
+        # - the public wrappers (the image is rendered by the configured renderer) -#
+        image = np.asarray(generate_image_array(snapshot, "rho", families=["gas"], units="Msol kpc^-3",
+                                                width="600 kpc", resolution=64))
+        samples = np.asarray(generate_point_samples(snapshot, "rho", points, families=["gas"],
+                                                    units="Msol kpc^-3")).reshape(image.shape)
+
+        assert np.all(np.abs(samples - image) <= 0.05 * np.amax(image)), "%sThe samples disagree with the image." % (
+            fdbg_string)
+
+        # - a snapshot without any of the families of the quantity -#
+        dark = pyn.new(dm=10)
+        dark["pos"] = pyn.array.SimArray(np.zeros((10, 3)), "kpc")
+
+        with self.assertRaises(SnapshotError):
+            generate_point_samples(dark, "rho", points[:3])
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_point_samples...", fdbg_string, "debug")
+
+    def test_evaluate_binned(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_evaluate_binned: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_evaluate_binned...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # The previous np.piecewise lookup
+        # --------------------------------------------------------------------------------------------------------------#
+        rng = np.random.default_rng(2)
+        r_vals = np.sort(rng.uniform(5, 5000, 50))
+        masses = rng.uniform(1e13, 1e14, (3, 50))
+        r = np.concatenate([np.linspace(0, 6000, 500), r_vals])  # including the bin radii themselves.
+
+        r_index = lambda x: np.piecewise(x, [(x >= r_vals[i]) & (x < r_vals[i + 1]) for i in range(len(r_vals) - 1)] +
+                                         [(x >= r_vals[-1])], list(range(len(r_vals))))
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        for row in masses:
+            assert np.array_equal(evaluate_binned(r_vals, row, r), row[r_index(r).astype("int32")]), \
+                "%sThe lookup disagrees with np.piecewise." % fdbg_string
+
+        assert np.array_equal(evaluate_binned(r_vals, masses, r), np.vstack([evaluate_binned(r_vals, row, r) for
+                                                                             row in masses])), \
+            "%sThe batched lookup disagrees with the single lookups." % fdbg_string
+        assert np.array_equal(hydrostatic_mass_profiles([(r_vals, row) for row in masses], r, interpolate=False),
+                              evaluate_binned(r_vals, masses, r)), "%sThe precomputed bins weren't used." % fdbg_string
+
+        # - the interpolation passes through the bins -#
+        interpolated = evaluate_binned(r_vals, masses[0], r_vals, interpolate=True)
+        assert np.allclose(interpolated, masses[0]), "%sThe interpolation misses the bins." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_evaluate_binned...", fdbg_string, "debug")
+
+    def test_movie_stream(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_movie_stream: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_movie_stream...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # A stream of 8 frames which doesn't need ffmpeg
+        # --------------------------------------------------------------------------------------------------------------#
+        written = []
+        frame = lambda index: np.full((4, 4, 3), index, dtype="uint8")
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch("shutil.which", return_value="ffmpeg"), \
+                mock.patch.object(MovieStream, "_write", lambda stream, pixels: written.append(int(pixels[0, 0, 0]))):
+            stream = MovieStream(os.path.join(directory, "movie.mp4"), ["frame_%s" % i for i in range(8)])
+            stream._limit = 2  # i.e. CONFIG["Visualization"]["Movies"]["buffer"].
+
+            # - Frames held back until the frames before them arrive; the third one is spilled to disk -#
+            for index in [3, 5, 4, 3]:
+                stream.add("frame_%s" % index, frame(index))
+
+            assert written == [], "%sWrote a frame out of order." % fdbg_string
+            assert stream._held == 2, "%sHeld %s frames in memory." % (fdbg_string, stream._held)
+            assert len(os.listdir(stream._spill_directory)) == 1, "%sDidn't spill the third frame." % fdbg_string
+
+            stream.skip("frame_1")
+            stream.add("frame_0", frame(0))
+            assert written == [0], "%sDidn't write the first frame at once." % fdbg_string
+
+            stream.add("frame_2", frame(2))
+            assert written == [0, 2, 3, 4, 5], "%sWrote %s." % (fdbg_string, written)
+            assert not os.listdir(stream._spill_directory), "%sLeft a spilled frame behind." % fdbg_string
+
+            # - Repeated frames are ignored and an arrived frame can't be skipped -#
+            stream.add("frame_2", frame(2))
+            stream.add("frame_7", frame(7))
+            stream.skip("frame_7")
+
+            spill_directory = stream._spill_directory
+            stream.close()
+
+            assert written == [0, 2, 3, 4, 5, 7], "%sWrote %s." % (fdbg_string, written)
+            assert not os.path.exists(spill_directory), "%sLeft the spill directory behind." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_movie_stream...", fdbg_string, "debug")
+
+    def test_profile_series(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_profile_series: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_profile_series...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # Profiles of 3 outputs
+        # --------------------------------------------------------------------------------------------------------------#
+        edges = np.linspace(0, 1000, 11)
+        records = {"output_%05d" % i: {"time": time, "bin_edges": edges * (i + 1), "values": np.arange(10.0) * (i + 1),
+                                       "units": "K", "length_units": "kpc"} for i, time in enumerate([2.0, 1.0, 3.0])}
+        group = ProfileSeries.get_group("temp", "gas", "abc")
+
+        with tempfile.TemporaryDirectory() as directory:
+            # - Appended directly, then through the parts of a sequence; output_00001 is written twice -#
+            series = ProfileSeries(os.path.join(directory, "profile_series.h5"))
+            series.append(group, records["output_00000"], output="output_00000", attributes={"nbins": 10})
+            series.append(group, records["output_00001"], output="output_00001")
+
+            for output in ["output_00001", "output_00002"]:
+                write_series_part(directory, output, records[output])
+
+            series = assemble_profile_series(directory, series.path, group)
+            series_data = series.read(group)
+
+            # Checks
+            # ----------------------------------------------------------------------------------------------------------#
+            assert series.keys() == [group] and series.find("temp", "gas") == [group], "%sWrong groups %s." % (
+                fdbg_string, series.keys())
+            assert list(series_data["outputs"]) == ["output_00001", "output_00000", "output_00002"], (
+                    "%sWrong rows %s." % (fdbg_string, series_data["outputs"]))
+            assert np.array_equal(series_data["time"], [1.0, 2.0, 3.0]), "%sNot in time order." % fdbg_string
+
+            for row, output in enumerate(series_data["outputs"]):
+                assert np.allclose(series_data["values"][row], records[output]["values"]), "%sWrong values." % (
+                    fdbg_string)
+                assert np.allclose(series_data["bin_edges"][row], records[output]["bin_edges"]), "%sWrong bins." % (
+                    fdbg_string)
+
+            assert series_data["attributes"]["units"] == "K" and series_data["attributes"]["nbins"] == 10, (
+                    "%sLost the attributes." % fdbg_string)
+            assert np.array_equal(series.read(group, rows=slice(-1, None))["time"], [3.0]), "%sWrong rows." % (
+                fdbg_string)
+            assert not os.path.exists(os.path.join(directory, ".series_parts")), "%sLeft the parts." % fdbg_string
+
+            # - A profile with another binning doesn't fit -#
+            with self.assertRaises(ValueError):
+                series.append(group, dict(records["output_00000"], bin_edges=np.linspace(0, 1, 6),
+                                          values=np.zeros(5)), output="output_00003")
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_profile_series...", fdbg_string, "debug")
+
+    def test_sequence_rerun(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_sequence_rerun: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_sequence_rerun...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        rng = np.random.default_rng(4)
+        outputs = ["output_%05d" % number for number in range(1, 6)]
+        images = {output: rng.uniform(0, 1, (16, 16)).astype("float32") for output in outputs}
+
+        with tempfile.TemporaryDirectory() as sequence_directory:
+            # The sequence cube
+            # ----------------------------------------------------------------------------------------------------------#
+            cube_path = os.path.join(sequence_directory, "rho_cube.h5")
+
+            for _ in range(2):  # the second run renders every output again.
+                for number, output in enumerate(outputs[1:], 2):
+                    write_cube_part(sequence_directory, output, images[output], 0.1 * number)
+                cube = assemble_image_cube(sequence_directory, cube_path, attributes={"qty": "rho"})
+
+            assert cube.outputs == outputs[1:], "%sThe rerun duplicated frames: %s." % (fdbg_string, cube.outputs)
+
+            # - a missing earlier frame is inserted in time order -#
+            write_cube_part(sequence_directory, outputs[0], images[outputs[0]], 0.1)
+            cube = assemble_image_cube(sequence_directory, cube_path)
+
+            assert cube.outputs == outputs and np.all(np.diff(cube.times) > 0), "%sThe frames are out of order." % (
+                fdbg_string)
+            assert all(np.array_equal(cube.frame(i), images[output]) for i, output in enumerate(outputs)), \
+                "%sThe frames don't match their outputs." % fdbg_string
+
+            # The profile series
+            # ----------------------------------------------------------------------------------------------------------#
+            series = ProfileSeries(os.path.join(sequence_directory, "profile_series.h5"))
+            group = series.get_group("rho", "gas", "key")
+
+            for _ in range(2):
+                for number, output in enumerate(outputs, 1):
+                    series.append(group, {"time": 0.1 * number, "bin_edges": np.arange(17), "values": images[output][0],
+                                          "units": "Msol kpc^-3", "length_units": "kpc"}, output=output)
+
+            record = series.read(group)
+            assert list(record["outputs"]) == outputs, "%sThe rerun duplicated rows: %s." % (
+                fdbg_string, record["outputs"])
+            assert np.array_equal(record["values"], np.vstack([images[output][0] for output in outputs])), \
+                "%sThe rows don't match their outputs." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_sequence_rerun...", fdbg_string, "debug")
+
+    def test_overdensity_radii(self):
+        # Debugging
+        # --------------------------------------------------------------------------------------------------------------#
+        fdbg_string = "%stest_overdensity_radii: " % TestAnalysis.cdbg_string
+        log_print("Running TestAnalysis.test_overdensity_radii...", fdbg_string, "debug")
+        print("%sRunning..." % fdbg_string)
+
+        # A singular isothermal sphere off the origin, with a dense gas core
+        # --------------------------------------------------------------------------------------------------------------#
+        #  rho = A / r^2 gives M(<r) = 4 pi A r and a mean enclosed density of 3 A / r^2, so r_x = sqrt(3 A / (x rho_c)).
+        #  The particles are uniform in radius (dM/dr is constant).
+        #
+        rng = np.random.default_rng(5)
+        n, radius, total_mass = 100000, 5000.0, 1e15
+        amplitude = total_mass / (4 * np.pi * radius)
+        center = np.array([300.0, -200.0, 100.0])
+
+        directions = rng.normal(0, 1, (n, 3))
+        directions /= np.linalg.norm(directions, axis=1)[:, None]
+
+        snapshot = pyn.new(dm=n, gas=1000)
+        snapshot.dm["pos"] = pyn.array.SimArray(center + radius * rng.uniform(0, 1, n)[:, None] * directions, "kpc")
+        snapshot.dm["mass"] = pyn.array.SimArray(np.full(n, total_mass / n), "Msol")
+        snapshot.gas["pos"] = pyn.array.SimArray(center + rng.normal(0, 10, (1000, 3)), "kpc")
+        snapshot.gas["mass"] = pyn.array.SimArray(np.full(1000, 1e12), "Msol")
+
+        overdensities = np.array([2500, 1000, 500, 200])
+        expected = np.sqrt(3 * amplitude / (overdensities * float(rho_critical.in_units("Msol kpc^-3"))))
+
+        # Checks
+        # --------------------------------------------------------------------------------------------------------------#
+        radii, masses = find_overdensity_radii(snapshot, overdensities=overdensities, families=["dm"],
+                                               center=pyn.array.SimArray(center, "kpc"))
+
+        assert np.allclose(radii.in_units("kpc"), expected, rtol=0.02), "%sWrong radii %s (expected %s)." % (
+            fdbg_string, radii.in_units("kpc"), expected)
+        assert np.allclose(masses.in_units("Msol"), 4 * np.pi * amplitude * expected, rtol=0.02), \
+            "%sWrong masses %s." % (fdbg_string, masses.in_units("Msol"))
+
+        # - the gas core only adds mass, so every radius of all of the families is larger -#
+        all_radii, _ = find_overdensity_radii(snapshot, overdensities=overdensities,
+                                              center=pyn.array.SimArray(center, "kpc"))
+        assert np.all(all_radii.in_units("kpc") > radii.in_units("kpc")), "%sThe families were ignored." % fdbg_string
+
+        # Finishing
+        # --------------------------------------------------------------------------------------------------------------#
+        log_print("Passed TestAnalysis.test_overdensity_radii...", fdbg_string, "debug")
+
+
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
 # ------------------------------------------------------ Main -----------------------------------------------------------#
 # --|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--|--#
@@ -1,6 +1,10 @@
 """
 Basic utils to be used.
 """
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from collections import deque
+import traceback
 
 
 def split(a, n):
@@ -12,3 +16,145 @@ def split(a, n):
     """
     k, m = divmod(len(a), n)
     return [a[i * k + min(i, m):(i + 1) * k + min(i + 1, m)] for i in range(n)]
+
+
+def chunk(a, size):
+    """
+    Splits a list into contiguous chunks of (at most) ``size`` items.
+    @param a: The list of items
+    @param size: The number of items in each chunk.
+    @return: List of returned lists separating a.
+    """
+    size = max(int(size), 1)
+    return [a[i:i + size] for i in range(0, len(a), size)]
+
+
+def _task_worker(function, connection, star):
+    """
+    Worker loop for ``run_task_queue``. Receives one task at a time until it is sent ``None``.
+    """
+    while True:
+        try:
+            task = connection.recv()
+        except (EOFError, OSError):
+            # - The queue was closed without sending None (i.e. the parent died) -#
+            break
+
+        if task is None:
+            break
+
+        try:
+            connection.send(("done", (function(*task) if star else function(task))))
+        except Exception:
+            connection.send(("failed", traceback.format_exc()))
+
+
+def run_task_queue(function, tasks, nproc, max_tasks_per_child=None, retries=0, star=False, callback=None,
+                   error_callback=None):
+    """
+    Dynamic multiprocessing task queue. Each task is handed to the next free worker, so slow tasks don't hold up the
+    rest of the queue. Workers are replaced after ``max_tasks_per_child`` tasks, and a worker which dies (i.e. is killed
+    by the OOM killer) only loses its current task, which is retried like any other failure. Workers are not daemonic,
+    so tasks may start processes of their own (i.e. ``ncores`` in ``find_halo_centers``), and every retired or dead
+    worker is joined.
+    @param function: The (picklable) function to call on each task.
+    @param tasks: The list of tasks. Each task is passed to the function as its only argument (or unpacked if star).
+    @param nproc: The number of worker processes.
+    @param max_tasks_per_child: The number of tasks a worker completes before it is replaced. None for no limit.
+    @param retries: The number of times a failed task is retried.
+    @param star: True to call function(*task) instead of function(task).
+    @param callback: Called (in this process) as callback(index, result) as soon as each task completes.
+    @param error_callback: Called (in this process) as error_callback(index, message) as soon as a task has failed on
+        every attempt.
+    @return: (results, failures). results is the list of return values in the order of the tasks (None for the failed
+        tasks) and failures is a dict {task index: error message} of the tasks which failed on every attempt.
+    """
+    pending = deque(range(len(tasks)))
+    attempts = [0] * len(tasks)
+    results = [None] * len(tasks)
+    failures = {}
+    workers = {}  # connection -> [process, current task index, number of completed tasks]
+
+    def start_worker():
+        parent_connection, child_connection = mp.Pipe()
+        process = mp.Process(target=_task_worker, args=(function, child_connection, star), daemon=False)
+        process.start()
+        child_connection.close()
+        workers[parent_connection] = [process, None, 0]
+
+    def stop_worker(connection):
+        process = workers.pop(connection)[0]
+        try:
+            connection.send(None)
+        except (OSError, ValueError):
+            pass
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        connection.close()
+
+    def fail(index, message):
+        attempts[index] += 1
+        if attempts[index] <= retries:
+            pending.append(index)
+        else:
+            failures[index] = message
+
+            if error_callback:
+                error_callback(index, message)
+
+    try:
+        while True:
+            busy = [connection for connection, worker in workers.items() if worker[1] is not None]
+
+            # - Topping up the pool and handing out the pending tasks -#
+            while len(workers) < min(nproc, len(pending) + len(busy)):
+                start_worker()
+
+            for connection, worker in workers.items():
+                if worker[1] is None and pending:
+                    worker[1] = pending.popleft()
+                    connection.send(tasks[worker[1]])
+
+            busy = [connection for connection, worker in workers.items() if worker[1] is not None]
+
+            if not busy:
+                break
+
+            # - Waiting for results or for a worker to die -#
+            wait(busy + [workers[connection][0].sentinel for connection in busy])
+
+            for connection in busy:
+                process, index, completed = workers[connection]
+
+                try:
+                    if not connection.poll():
+                        if process.is_alive():
+                            continue
+                        raise EOFError
+                    status, value = connection.recv()
+                except (EOFError, OSError):
+                    process.join()
+                    fail(index, "The worker %s exited with code %s." % (process.name, process.exitcode))
+                    workers.pop(connection)
+                    connection.close()
+                    continue
+
+                if status == "done":
+                    results[index] = value
+
+                    if callback:
+                        callback(index, value)
+                else:
+                    fail(index, value)
+
+                workers[connection][1:] = [None, completed + 1]
+
+                if max_tasks_per_child and completed + 1 >= max_tasks_per_child:
+                    stop_worker(connection)
+    finally:
+        for connection in list(workers):
+            stop_worker(connection)
+
+    return results, failures